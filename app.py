@@ -1,6 +1,8 @@
 import streamlit as st
 from modules.utils import init_session_state
 from modules.database import init_db
+from modules.metrics import start_metrics_server
+from modules.retention import start_retention_scheduler
 from views.user import user_workflow
 from views.volunteer import volunteer_login_workflow, volunteer_registration_workflow
 
@@ -9,6 +11,12 @@ def main():
     # Initialize database
     init_db()
 
+    # Expose /metrics for Prometheus when METRICS_PORT is set
+    start_metrics_server()
+
+    # Archive old reports and compact the database in the background
+    start_retention_scheduler()
+
     st.title("Disaster Management Application")
 
     # Sidebar navigation
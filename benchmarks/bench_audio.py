@@ -0,0 +1,133 @@
+"""Silence removed and transcription speedup from audio preprocessing
+
+Voice notes are synthesized as bursts of voiced sound separated by pauses,
+with silence before and after, and written as 44.1 kHz stereo WAV. The
+simulated transcriber costs a fixed latency plus a time per audio second,
+like the remote Whisper API. The raw file is sent in one call, and the
+preprocessed chunks are sent in parallel. With --asr, the local ASR pipeline
+(ASR_MODEL) is timed on the raw file and on the chunks instead.
+
+Usage:
+    python -m benchmarks.bench_audio --notes 5 --seconds 120 --speech-ratio 0.4
+    python -m benchmarks.bench_audio --file voice_note.mp3 --asr
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+import numpy as np
+
+def synthesize_note(seconds: float, speech_ratio: float, rng: random.Random, rate: int = 44100) -> np.ndarray:
+    """Stereo signal of voiced bursts (harmonics with a syllable envelope) over a faint noise floor"""
+    total = int(seconds * rate)
+    signal = np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0, 0.002, total).astype(np.float32)
+    lead = rng.uniform(0.05, 0.15) * (1 - speech_ratio)
+    position, end = lead * seconds, seconds * (1 - lead)
+    speech_left = seconds * speech_ratio
+    while speech_left > 0 and position < end:
+        burst = min(rng.uniform(1.0, 6.0), speech_left, end - position)
+        t = np.arange(int(burst * rate)) / rate
+        pitch = rng.uniform(100, 220)
+        voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+        envelope = np.abs(np.sin(2 * np.pi * 3.0 * t))
+        start = int(position * rate)
+        signal[start:start + len(t)] += (0.3 * voiced * envelope).astype(np.float32)
+        speech_left -= burst
+        position += burst + rng.uniform(0.8, 4.0) * (1 - speech_ratio) / max(speech_ratio, 0.05)
+    return np.stack([signal, signal * 0.9], axis=1)
+
+def simulated_transcriber(latency: float, per_audio_second: float):
+    """Transcription cost of a remote model: a round trip plus time proportional to the audio length"""
+    def transcribe(seconds: float) -> str:
+        time.sleep(latency + per_audio_second * seconds)
+        return "words"
+    return transcribe
+
+def bench_file(path: str, transcribe, asr: bool) -> Dict:
+    """Time raw and preprocessed transcription of one file"""
+    import soundfile as sf
+    from modules.audio import SAMPLE_RATE, preprocess_audio, transcribe_chunks
+    if asr:
+        from modules.processing import transcribe_files
+
+    started = time.perf_counter()
+    chunks, stats = preprocess_audio(path)
+    preprocess_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if asr:
+        transcribe_files([path])
+    else:
+        transcribe(sf.info(path).duration)
+    raw_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if asr:
+        if chunks:
+            transcribe_files([{"raw": chunk, "sampling_rate": SAMPLE_RATE} for chunk in chunks])
+    else:
+        transcribe_chunks(chunks, lambda chunk: transcribe(len(chunk) / SAMPLE_RATE))
+    chunked_seconds = time.perf_counter() - started
+
+    return {
+        **stats,
+        "preprocess_s": round(preprocess_seconds, 3),
+        "raw_transcribe_s": round(raw_seconds, 3),
+        "preprocessed_transcribe_s": round(chunked_seconds, 3),
+        "speedup": round(raw_seconds / (preprocess_seconds + chunked_seconds), 2)
+    }
+
+def run(notes: int, seconds: float, speech_ratio: float, files: List[str], asr: bool,
+        latency: float, per_audio_second: float, seed: int) -> Dict:
+    """Benchmark the given files, or synthetic notes when there are none"""
+    import soundfile as sf
+
+    transcribe = simulated_transcriber(latency, per_audio_second)
+    rng = random.Random(seed)
+    workdir = tempfile.mkdtemp(prefix="bench_audio_")
+    try:
+        if not files:
+            for i in range(notes):
+                path = os.path.join(workdir, f"note{i}.wav")
+                sf.write(path, synthesize_note(seconds, speech_ratio, rng), 44100)
+                files.append(path)
+        # librosa compiles and loads its kernels on first use, once per process
+        from modules.audio import preprocess_audio
+        started = time.perf_counter()
+        preprocess_audio(files[0])
+        warmup_seconds = time.perf_counter() - started
+        results = [bench_file(path, transcribe, asr) for path in files]
+    finally:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+    return {
+        "transcriber": "asr_pipeline" if asr else {"latency_s": latency, "per_audio_second_s": per_audio_second},
+        "warmup_s": round(warmup_seconds, 3),
+        "files": results,
+        "input_seconds": round(sum(r["input_seconds"] for r in results), 2),
+        "removed_seconds": round(sum(r["removed_seconds"] for r in results), 2),
+        "median_speedup": round(statistics.median(r["speedup"] for r in results), 2)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file", action="append", default=[], help="Benchmark this audio file (repeatable)")
+    parser.add_argument("--notes", type=int, default=5, help="Synthetic notes when no --file is given")
+    parser.add_argument("--seconds", type=float, default=120)
+    parser.add_argument("--speech-ratio", type=float, default=0.4)
+    parser.add_argument("--asr", action="store_true", help="Time the local ASR pipeline instead of the simulation")
+    parser.add_argument("--latency", type=float, default=0.3, help="Simulated round trip per call (s)")
+    parser.add_argument("--per-audio-second", type=float, default=0.05, help="Simulated cost per audio second (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.notes, args.seconds, args.speech_ratio, args.file, args.asr,
+                         args.latency, args.per_audio_second, args.seed), indent=2))
+
+if __name__ == "__main__":
+    main()
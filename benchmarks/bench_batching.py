@@ -0,0 +1,121 @@
+"""Throughput and latency of micro-batched inference under concurrency
+
+Usage:
+    python -m benchmarks.bench_batching --task synthetic --concurrency 1 4 16 64
+    python -m benchmarks.bench_batching --task extract --waits 0 5 10 20
+    python -m benchmarks.bench_batching --task classify --clip-model openai/clip-vit-base-patch32
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from typing import Callable, Dict, List
+from config import config
+from modules.batching import MicroBatcher
+from benchmarks.synthetic import generate_emergency_text
+
+def synthetic_model(overhead_ms: float, per_item_ms: float) -> Callable[[List], List]:
+    """A batch function costing a fixed per-call overhead plus a per-item cost.
+
+    Calls are serialized, like forward passes that each already use every
+    CPU core, so concurrent unbatched callers queue behind one another.
+    """
+    lock = threading.Lock()
+
+    def batch_fn(items):
+        with lock:
+            time.sleep((overhead_ms + per_item_ms * len(items)) / 1000)
+        return [len(item) for item in items]
+    return batch_fn
+
+def load_task(task: str, clip_model: str = None) -> Callable[[List], List]:
+    """The real batch function for a task (with a stub spaCy pipeline for extract)"""
+    if task == "synthetic":
+        return synthetic_model(overhead_ms=8.0, per_item_ms=0.5)
+    from modules import models, processing
+
+    if task == "extract":
+        from benchmarks.bench_suite import stub_nlp
+        models.models["nlp"] = stub_nlp()
+        models.get_nlp.cache_clear()
+        return processing.extract_entities_batch
+    if clip_model:
+        config["CLIP_MODEL"] = clip_model
+    return processing.classify_texts
+
+def run_point(batch_fn: Callable, texts: List[str], concurrency: int, requests: int,
+              wait_ms: float, max_batch: int) -> Dict:
+    """Have concurrency threads send requests items each, batched unless wait_ms is None"""
+    batcher = MicroBatcher(batch_fn, max_batch, wait_ms / 1000) if wait_ms is not None else None
+    latencies = []
+    lock = threading.Lock()
+    start = threading.Barrier(concurrency + 1)
+
+    def client(seed):
+        rng = random.Random(seed)
+        own = []
+        start.wait()
+        for _ in range(requests):
+            text = rng.choice(texts)
+            began = time.perf_counter()
+            if batcher:
+                batcher(text)
+            else:
+                batch_fn([text])
+            own.append(time.perf_counter() - began)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    latencies.sort()
+    result = {
+        "concurrency": concurrency,
+        "mode": "unbatched" if batcher is None else f"batched_{wait_ms:g}ms",
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2)
+    }
+    if batcher:
+        result["mean_batch"] = round(batcher.stats["items"] / max(batcher.stats["batches"], 1), 2)
+    return result
+
+def run(task: str, concurrency: List[int], waits: List[float], requests: int, max_batch: int,
+        clip_model: str = None) -> Dict:
+    """Sweep concurrency levels for the unbatched path and each batching window"""
+    batch_fn = load_task(task, clip_model)
+    rng = random.Random(0)
+    texts = [generate_emergency_text(rng)[0] for _ in range(200)]
+    batch_fn(texts[:2])  # load the model outside the measurements
+
+    points = []
+    for level in concurrency:
+        points.append(run_point(batch_fn, texts, level, requests, None, max_batch))
+        for wait_ms in waits:
+            points.append(run_point(batch_fn, texts, level, requests, wait_ms, max_batch))
+    return {"task": task, "max_batch": max_batch, "requests_per_client": requests, "points": points}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--task", choices=["synthetic", "extract", "classify"], default="synthetic")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 64])
+    parser.add_argument("--waits", nargs="+", type=float, default=[0, 5, 10, 20],
+                        help="Batching windows to compare, in milliseconds")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per client thread")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--clip-model", default=None)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.task, args.concurrency, args.waits, args.requests, args.max_batch,
+                         args.clip_model), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Columnar snapshot export time, size and analytical scan speed against SQLite
+
+A synthetic database is exported in full, then again after new reports
+arrive (the incremental run only writes those). Loading the emergency table
+and aggregating it by type and severity is timed on the live database
+(SELECT * into Python rows, and GROUP BY in SQL) and on the snapshot with
+pyarrow.
+
+Usage:
+    python -m benchmarks.bench_export --scale medium --format parquet
+    python -m benchmarks.bench_export --scale small --format arrow --new 5000
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import Dict
+from config import config
+from benchmarks.bench_suite import SCALES
+from benchmarks.synthetic import build_dataset, generate_emergencies
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def timed(func) -> float:
+    started = time.perf_counter()
+    func()
+    return round(time.perf_counter() - started, 3)
+
+def run(scale: str, file_format: str, new: int) -> Dict:
+    """Benchmark in a temporary directory"""
+    from modules.export import export_snapshots, open_snapshot
+
+    emergencies, resources, volunteers = SCALES[scale]
+    workdir = tempfile.mkdtemp(prefix="bench_export_")
+    db_path, out = os.path.join(workdir, "bench.db"), os.path.join(workdir, "exports")
+    config["EXPORT_FORMAT"] = file_format
+    try:
+        build_dataset(db_path, emergencies, resources, volunteers, cluster=False)
+        started = time.perf_counter()
+        full = export_snapshots(db_path=db_path, directory=out)
+        full_seconds = time.perf_counter() - started
+
+        conn = sqlite3.connect(db_path)
+        conn.executemany(
+            '''INSERT INTO emergency (location, latitude, longitude, text, timestamp, emergency_type, confidence, severity)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            generate_emergencies(new, "clustered", days=1, seed=7)
+        )
+        conn.commit()
+        started = time.perf_counter()
+        incremental = export_snapshots(db_path=db_path, directory=out)
+        incremental_seconds = time.perf_counter() - started
+
+        dataset = open_snapshot("emergency", out)
+        scans = {
+            "sqlite_select_all_s": timed(lambda: conn.execute("SELECT * FROM emergency").fetchall()),
+            "snapshot_read_all_s": timed(lambda: dataset.to_table()),
+            "sqlite_group_by_s": timed(lambda: conn.execute(
+                "SELECT emergency_type, severity, COUNT(*), AVG(confidence) FROM emergency GROUP BY 1, 2").fetchall()),
+            "snapshot_group_by_s": timed(lambda: dataset.to_table(columns=["emergency_type", "severity", "confidence"])
+                                         .group_by(["emergency_type", "severity"])
+                                         .aggregate([("confidence", "count"), ("confidence", "mean")]))
+        }
+        conn.close()
+        return {
+            "scale": scale,
+            "format": file_format,
+            "db_bytes": os.path.getsize(db_path),
+            "snapshot_bytes": directory_bytes(out),
+            "full_export_s": round(full_seconds, 3),
+            "full_rows": {table: result["rows"] for table, result in full.items()},
+            "new_reports": new,
+            "incremental_export_s": round(incremental_seconds, 3),
+            "incremental_rows": {table: result["rows"] for table, result in incremental.items()},
+            "snapshot_rows": dataset.count_rows(),
+            **scans
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--new", type=int, default=1000, help="Reports added before the incremental export")
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.scale, args.format, args.new), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark batch geocoding against a local fake geocoder
+
+Usage:
+    python -m benchmarks.bench_geocode --count 2000 --unique 500 --latency 0.05 --qps 100
+"""
+import argparse
+import json
+import random
+import time
+import zlib
+from modules.geospatial import batch_get_lat_lon
+
+def make_fake_geocoder(latency: float, failure_rate: float = 0.0, seed: int = 0):
+    """Build a geocoder that sleeps like a network call and returns stable coordinates"""
+    rng = random.Random(seed)
+
+    def geocode(location_name):
+        time.sleep(latency)
+        if rng.random() < failure_rate:
+            raise ConnectionError("Simulated geocoder failure")
+        h = zlib.crc32(location_name.lower().encode())
+        return (h % 18000) / 100 - 90, (h // 18000 % 36000) / 100 - 180
+
+    return geocode
+
+def run(count: int, unique: int, latency: float, qps: float, workers: int, failure_rate: float) -> dict:
+    """Geocode count inputs drawn from unique names, sequentially and in batch"""
+    rng = random.Random(42)
+    names = [f"Place {i}" for i in range(unique)]
+    inputs = [rng.choice(names) for _ in range(count)]
+    geocoder = make_fake_geocoder(latency, failure_rate)
+
+    # Baseline: one blocking call per distinct name (duplicates are free at best)
+    started = time.perf_counter()
+    for name in names:
+        try:
+            geocoder(name)
+        except ConnectionError:
+            pass
+    sequential = time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = batch_get_lat_lon(inputs, geocoder=geocoder, max_workers=workers, qps=qps,
+                                retries=2, backoff=0.01, use_cache=False)
+    batch = time.perf_counter() - started
+
+    statuses = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    return {
+        "inputs": count,
+        "unique": unique,
+        "latency_s": latency,
+        "qps": qps,
+        "workers": workers,
+        "sequential_s": round(sequential, 3),
+        "batch_s": round(batch, 3),
+        "speedup": round(sequential / batch, 2) if batch else None,
+        "statuses": statuses
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--unique", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--qps", type=float, default=100)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.count, args.unique, args.latency, args.qps,
+                         args.workers, args.failure_rate), indent=2))
+
+if __name__ == "__main__":
+    main()
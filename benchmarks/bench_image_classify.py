@@ -0,0 +1,121 @@
+"""Latency and agreement of CLIP zero-shot image classification versus captioning
+
+Each photo is prepared as it is for a report, then classified two ways: the
+caption path (BLIP API caption, then CLIP text classification of the
+caption) and the direct path (one CLIP forward pass over the image). Photos
+in a directory named after an EMERGENCY_LABELS entry (for example
+photos/flood/*.jpg) also count towards each path's accuracy.
+
+Usage:
+    python -m benchmarks.bench_image_classify --dir photos
+    python -m benchmarks.bench_image_classify --file fire.jpg --backends torch int8 onnx --no-caption
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from benchmarks.bench_inference import latency_summary
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+def collect_photos(directory: Optional[str], files: List[str]) -> List[Tuple[str, Optional[str]]]:
+    """(path, expected label) pairs; the label is the parent directory's name when it is a known type"""
+    from modules.processing import EMERGENCY_LABELS
+
+    paths = list(files)
+    if directory:
+        for root, _, names in os.walk(directory):
+            paths.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith(IMAGE_EXTENSIONS))
+    labelled = []
+    for path in paths:
+        label = os.path.basename(os.path.dirname(os.path.abspath(path))).replace("_", " ").lower()
+        labelled.append((path, label if label in EMERGENCY_LABELS else None))
+    return labelled
+
+def caption_path(images: List[bytes]) -> Tuple[List[str], List[float]]:
+    """Labels and per-image seconds of caption, then text classification"""
+    from modules.processing import caption_image, classify_texts
+
+    labels, times = [], []
+    for data in images:
+        started = time.perf_counter()
+        caption = caption_image(data)
+        labels.append(classify_texts([caption])[0][0] if caption else "unknown")
+        times.append(time.perf_counter() - started)
+    return labels, times
+
+def clip_path(images: List[bytes], backend: str, batch_size: int) -> Dict:
+    """Labels, per-image seconds and batched throughput of direct CLIP classification"""
+    from modules import models
+    from modules.processing import classify_images
+
+    models.models["clip_image_encoder"] = None
+    models.get_clip_image_encoder.cache_clear()
+    started = time.perf_counter()
+    models.models["clip_image_encoder"] = models.ClipImageEncoder(backend=backend)
+    load_seconds = time.perf_counter() - started
+    classify_images(images[:1])
+
+    labels, times = [], []
+    for data in images:
+        started = time.perf_counter()
+        labels.append(classify_images([data])[0][0])
+        times.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        classify_images(images[i:i + batch_size])
+    throughput = len(images) / (time.perf_counter() - started)
+    return {"load_s": round(load_seconds, 2), "labels": labels, "times": times,
+            "batched_images_per_s": round(throughput, 1)}
+
+def accuracy(labels: List[str], expected: List[Optional[str]]) -> Optional[float]:
+    pairs = [(label, truth) for label, truth in zip(labels, expected) if truth]
+    return round(sum(label == truth for label, truth in pairs) / len(pairs), 4) if pairs else None
+
+def run(photos: List[Tuple[str, Optional[str]]], backends: List[str], caption: bool, batch_size: int) -> Dict:
+    """Benchmark both paths over the photos"""
+    from modules.imaging import prepare_image
+
+    images = []
+    for path, _ in photos:
+        with open(path, "rb") as f:
+            images.append(prepare_image(f.read())["model_bytes"])
+    expected = [label for _, label in photos]
+    result = {"photos": len(images), "labelled": sum(label is not None for label in expected)}
+
+    caption_labels = None
+    if caption:
+        caption_labels, times = caption_path(images)
+        result["caption"] = {**latency_summary(times), "accuracy": accuracy(caption_labels, expected)}
+
+    for backend in backends:
+        clip = clip_path(images, backend, batch_size)
+        entry = {
+            "load_s": clip["load_s"],
+            **latency_summary(clip["times"]),
+            "batched_images_per_s": clip["batched_images_per_s"],
+            "accuracy": accuracy(clip["labels"], expected)
+        }
+        if caption_labels:
+            entry["agreement_with_caption"] = round(
+                sum(a == b for a, b in zip(clip["labels"], caption_labels)) / len(images), 4
+            )
+        result[f"clip_{backend}"] = entry
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", help="Photos, optionally in subdirectories named after emergency types")
+    parser.add_argument("--file", action="append", default=[], help="Benchmark this photo (repeatable)")
+    parser.add_argument("--backends", nargs="+", default=["torch"], choices=["torch", "int8", "onnx"])
+    parser.add_argument("--no-caption", action="store_true", help="Skip the BLIP API (no agreement figures)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args(argv)
+    photos = collect_photos(args.dir, args.file)
+    if not photos:
+        parser.error("no photos: give --dir or --file")
+    print(json.dumps(run(photos, args.backends, not args.no_caption, args.batch_size), indent=2))
+
+if __name__ == "__main__":
+    main()
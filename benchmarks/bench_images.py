@@ -0,0 +1,134 @@
+"""Upload size, preprocessing time and duplicate detection for report photos
+
+Synthetic phone photos (12 MP JPEG at quality 95, with an EXIF orientation
+tag) are prepared for captioning. The original and the model-sized copy are
+compared by bytes and by simulated caption latency: the upload at the given
+uplink bandwidth plus a fixed model time. Re-encoded, resized and brightened
+copies of each photo are hashed to check that they stay within
+IMAGE_DUPLICATE_DISTANCE of the original while different photos do not.
+
+Usage:
+    python -m benchmarks.bench_images --photos 10 --uplink-mbps 2
+    python -m benchmarks.bench_images --file photo.jpg --file other.jpg
+"""
+import argparse
+import io
+import json
+import random
+import statistics
+import time
+from typing import Dict, List
+import numpy as np
+
+def synthesize_photo(rng: random.Random, width: int = 4032, height: int = 3024, quality: int = 95) -> bytes:
+    """Camera-like JPEG: a sky gradient, random blocks and sensor noise, tagged as rotated"""
+    from PIL import Image, ImageDraw
+
+    rows = np.linspace(rng.uniform(80, 200), rng.uniform(20, 120), height)[:, None, None]
+    base = np.broadcast_to(rows * np.array([0.6, 0.8, 1.0]), (height, width, 3)).copy()
+    image = Image.fromarray(base.astype(np.uint8))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randint(8, 20)):
+        x, y = rng.randrange(width), rng.randrange(height // 3, height)
+        w, h = rng.randint(width // 20, width // 4), rng.randint(height // 20, height // 3)
+        draw.rectangle([x, y, x + w, y + h], fill=tuple(rng.randrange(256) for _ in range(3)))
+    noise = np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0, 6, (height, width, 3))
+    image = Image.fromarray(np.clip(np.asarray(image) + noise, 0, 255).astype(np.uint8))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, exif=exif)
+    return buffer.getvalue()
+
+def variants(data: bytes) -> Dict[str, bytes]:
+    """Copies of a photo as it might arrive again in another report"""
+    from PIL import Image, ImageEnhance, ImageOps
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+    copies = {
+        "reencoded_q60": image,
+        "half_size": image.resize((image.width // 2, image.height // 2)),
+        "brighter": ImageEnhance.Brightness(image).enhance(1.15)
+    }
+    encoded = {}
+    for name, copy in copies.items():
+        buffer = io.BytesIO()
+        copy.save(buffer, format="JPEG", quality=60)
+        encoded[name] = buffer.getvalue()
+    return encoded
+
+def bench_photo(data: bytes, uplink_mbps: float, model_seconds: float) -> Dict:
+    """Bytes sent and simulated caption latency with and without preprocessing"""
+    from modules.imaging import prepare_image
+
+    started = time.perf_counter()
+    prepared = prepare_image(data)
+    prepare_seconds = time.perf_counter() - started
+
+    def upload(size: int) -> float:
+        return size * 8 / (uplink_mbps * 1e6)
+
+    raw_latency = upload(len(data)) + model_seconds
+    prepared_latency = prepare_seconds + upload(len(prepared["model_bytes"])) + model_seconds
+    return {
+        "original_bytes": len(data),
+        "model_bytes": len(prepared["model_bytes"]),
+        "thumbnail_bytes": len(prepared["thumbnail"]),
+        "prepare_s": round(prepare_seconds, 4),
+        "raw_latency_s": round(raw_latency, 3),
+        "prepared_latency_s": round(prepared_latency, 3),
+        "phash": prepared["phash"]
+    }
+
+def run(photos: int, files: List[str], uplink_mbps: float, model_seconds: float, seed: int) -> Dict:
+    """Benchmark the given files, or synthetic photos when there are none"""
+    from modules.imaging import hamming, prepare_image
+    from config import config
+
+    rng = random.Random(seed)
+    if files:
+        originals = []
+        for path in files:
+            with open(path, "rb") as f:
+                originals.append(f.read())
+    else:
+        originals = [synthesize_photo(rng) for _ in range(photos)]
+
+    results = [bench_photo(data, uplink_mbps, model_seconds) for data in originals]
+
+    same = {}
+    for data, result in zip(originals, results):
+        for name, copy in variants(data).items():
+            same.setdefault(name, []).append(hamming(result["phash"], prepare_image(copy)["phash"]))
+    different = [hamming(a["phash"], b["phash"]) for i, a in enumerate(results) for b in results[i + 1:]]
+    threshold = config.get("IMAGE_DUPLICATE_DISTANCE", 6)
+
+    return {
+        "photos": len(results),
+        "uplink_mbps": uplink_mbps,
+        "model_s": model_seconds,
+        "median_original_bytes": int(statistics.median(r["original_bytes"] for r in results)),
+        "median_model_bytes": int(statistics.median(r["model_bytes"] for r in results)),
+        "median_thumbnail_bytes": int(statistics.median(r["thumbnail_bytes"] for r in results)),
+        "median_prepare_s": round(statistics.median(r["prepare_s"] for r in results), 4),
+        "median_raw_latency_s": round(statistics.median(r["raw_latency_s"] for r in results), 3),
+        "median_prepared_latency_s": round(statistics.median(r["prepared_latency_s"] for r in results), 3),
+        "duplicate_distance": {name: max(distances) for name, distances in same.items()},
+        "duplicates_found": sum(d <= threshold for distances in same.values() for d in distances),
+        "duplicates_expected": sum(len(distances) for distances in same.values()),
+        "min_distance_between_photos": min(different) if different else None,
+        "false_duplicates": sum(d <= threshold for d in different)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file", action="append", default=[], help="Benchmark this photo (repeatable)")
+    parser.add_argument("--photos", type=int, default=10, help="Synthetic photos when no --file is given")
+    parser.add_argument("--uplink-mbps", type=float, default=2.0, help="Simulated upload bandwidth")
+    parser.add_argument("--model-seconds", type=float, default=0.5, help="Simulated captioning time")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.photos, args.file, args.uplink_mbps, args.model_seconds, args.seed), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Accuracy versus latency of the CLIP and BART inference backends
+
+Usage:
+    python -m benchmarks.bench_inference --backends torch int8 onnx --texts 200 --documents 5
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from typing import Dict, List
+from benchmarks.synthetic import generate_emergency_text
+
+def rouge_l(candidate: str, reference: str) -> float:
+    """ROUGE-L F1 of two texts over lowercase word tokens"""
+    a, b = candidate.lower().split(), reference.lower().split()
+    if not a or not b:
+        return 0.0
+    previous = [0] * (len(b) + 1)
+    for word in a:
+        current = [0]
+        for j, other in enumerate(b):
+            current.append(previous[j] + 1 if word == other else max(previous[j + 1], current[j]))
+        previous = current
+    lcs = previous[-1]
+    if not lcs:
+        return 0.0
+    precision, recall = lcs / len(a), lcs / len(b)
+    return 2 * precision * recall / (precision + recall)
+
+def latency_summary(times: List[float]) -> Dict:
+    times = sorted(times)
+    return {
+        "mean_ms": round(statistics.fmean(times) * 1000, 2),
+        "p50_ms": round(times[len(times) // 2] * 1000, 2),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 2)
+    }
+
+def classification_benchmark(backend: str, texts: List[str], expected: List[str]) -> Dict:
+    """Label synthetic reports one at a time, as process_text does"""
+    from modules.models import ClipTextEncoder
+    from modules.processing import EMERGENCY_LABELS
+
+    started = time.perf_counter()
+    encode = ClipTextEncoder(backend=backend)
+    load_seconds = time.perf_counter() - started
+    labels = encode(list(EMERGENCY_LABELS))
+
+    predictions, times = [], []
+    for text in texts:
+        started = time.perf_counter()
+        predictions.append(EMERGENCY_LABELS[int((labels @ encode([text])[0]).argmax())])
+        times.append(time.perf_counter() - started)
+    return {
+        "load_s": round(load_seconds, 2),
+        "accuracy": round(sum(p == e for p, e in zip(predictions, expected)) / len(expected), 4),
+        **latency_summary(times),
+        "predictions": predictions
+    }
+
+def summarization_benchmark(backend: str, documents: List[str], num_beams: int, max_length: int) -> Dict:
+    """Summarize situation reports with the same settings as generate_summary"""
+    from modules.models import load_summarizer
+
+    started = time.perf_counter()
+    tokenizer, model = load_summarizer(backend=backend)
+    load_seconds = time.perf_counter() - started
+
+    summaries, times = [], []
+    for document in documents:
+        started = time.perf_counter()
+        inputs = tokenizer.encode("summarize: " + document, return_tensors="pt", max_length=1024, truncation=True)
+        ids = model.generate(inputs, max_length=max_length, min_length=50, length_penalty=2.0,
+                             num_beams=num_beams, early_stopping=True)
+        summaries.append(tokenizer.decode(ids[0], skip_special_tokens=True))
+        times.append(time.perf_counter() - started)
+    return {"load_s": round(load_seconds, 2), **latency_summary(times), "summaries": summaries}
+
+def make_documents(count: int, reports: int = 25, seed: int = 0) -> List[str]:
+    """Situation reports made of many short synthetic emergency reports"""
+    rng = random.Random(seed)
+    return [
+        " ".join(f"{generate_emergency_text(rng)[0]} in sector {rng.randint(1, 40)}." for _ in range(reports))
+        for _ in range(count)
+    ]
+
+def run(backends: List[str], texts: int, documents: int, num_beams: int, max_length: int, seed: int) -> Dict:
+    """Compare each backend with the first one (the reference, normally torch)"""
+    rng = random.Random(seed)
+    samples = [generate_emergency_text(rng) for _ in range(texts)]
+    report_texts, expected = [s[0] for s in samples], [s[1] for s in samples]
+    docs = make_documents(documents, seed=seed)
+
+    results = {"classification": {}, "summarization": {}}
+    reference = {}
+    for backend in backends:
+        if texts:
+            outcome = classification_benchmark(backend, report_texts, expected)
+            predictions = outcome.pop("predictions")
+            reference.setdefault("predictions", predictions)
+            outcome["agreement_with_reference"] = round(
+                sum(p == r for p, r in zip(predictions, reference["predictions"])) / len(predictions), 4
+            )
+            results["classification"][backend] = outcome
+        if documents:
+            outcome = summarization_benchmark(backend, docs, num_beams, max_length)
+            summaries = outcome.pop("summaries")
+            reference.setdefault("summaries", summaries)
+            outcome["rouge_l_vs_reference"] = round(
+                statistics.fmean(rouge_l(s, r) for s, r in zip(summaries, reference["summaries"])), 4
+            )
+            results["summarization"][backend] = outcome
+    results["reference"] = backends[0]
+    results["settings"] = {"texts": texts, "documents": documents, "num_beams": num_beams, "max_length": max_length}
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", choices=["torch", "int8", "onnx"], default=["torch", "int8", "onnx"])
+    parser.add_argument("--texts", type=int, default=200, help="Reports to classify (0 to skip)")
+    parser.add_argument("--documents", type=int, default=5, help="Documents to summarize (0 to skip)")
+    parser.add_argument("--num-beams", type=int, default=4)
+    parser.add_argument("--max-length", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.backends, args.texts, args.documents, args.num_beams,
+                         args.max_length, args.seed), indent=2))
+
+if __name__ == "__main__":
+    main()
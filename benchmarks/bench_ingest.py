@@ -0,0 +1,121 @@
+"""Load test emergency ingestion with many concurrent submitters
+
+Usage:
+    python -m benchmarks.bench_ingest --submitters 64 --reports 20 --db /tmp/bench_ingest.db
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from config import config
+from modules.database import init_db, execute_insert
+from modules.clustering import prepare_assignment
+from modules.ingest import WriteQueue, insert_emergency
+
+def percentile(values, q: float):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+def make_reports(count: int, seed: int = 0):
+    """Reports scattered over a city so that some of them cluster into incidents"""
+    rng = random.Random(seed)
+    return [
+        (f"Sector {rng.randint(1, 50)}", 19.0 + rng.random() * 0.2, 72.8 + rng.random() * 0.2,
+         rng.choice(["Building collapsed, people trapped", "Flooding on the main road",
+                     "Fire in a residential block", "Injured person needs an ambulance"]))
+        for _ in range(count)
+    ]
+
+def direct_insert(location, lat, lon, text, cluster):
+    """One connection and one commit per report (WRITE_BATCHING off)"""
+    eid = execute_insert(
+        "INSERT INTO emergency (location, latitude, longitude, text) VALUES (?, ?, ?, ?)",
+        (location, lat, lon, text)
+    )
+    if eid and cluster:
+        from modules.clustering import assign_incident
+        assign_incident(eid, location, lat, lon, text)
+    if eid is None:
+        raise RuntimeError("insert failed")
+    return eid
+
+def run(mode: str, submitters: int, reports: int, db_path: str, cluster: bool) -> dict:
+    """Have each submitter thread insert its reports back to back and time every insert"""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    config["DB_PATH"] = db_path
+    init_db(db_path)
+
+    write_queue = WriteQueue(db_path) if mode == "batched" else None
+    latencies, errors = [], []
+    results_lock = threading.Lock()
+    start = threading.Barrier(submitters + 1)
+
+    def submitter(index):
+        own_latencies, own_errors = [], 0
+        start.wait()
+        for location, lat, lon, text in make_reports(reports, seed=index):
+            began = time.perf_counter()
+            try:
+                if write_queue:
+                    # Clustering's similarity and labelling run in the submitter, as in ingest_emergency
+                    scores, label = prepare_assignment(location, lat, lon, text) if cluster else ({}, location)
+                    write_queue.submit(insert_emergency, location, lat, lon, text, cluster=cluster,
+                                       scores=scores, label=label).result()
+                else:
+                    direct_insert(location, lat, lon, text, cluster)
+            except Exception:
+                own_errors += 1
+            own_latencies.append(time.perf_counter() - began)
+        with results_lock:
+            latencies.extend(own_latencies)
+            errors.append(own_errors)
+
+    threads = [threading.Thread(target=submitter, args=(i,)) for i in range(submitters)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    if write_queue:
+        write_queue.close()
+
+    result = {
+        "mode": mode,
+        "submitters": submitters,
+        "inserts": len(latencies),
+        "errors": sum(errors),
+        "seconds": round(elapsed, 3),
+        "inserts_per_second": round(len(latencies) / elapsed) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2)
+    }
+    if write_queue:
+        result["batches"] = write_queue.stats["batches"]
+        result["largest_batch"] = write_queue.stats["largest_batch"]
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submitters", type=int, default=64)
+    parser.add_argument("--reports", type=int, default=20, help="Reports per submitter")
+    parser.add_argument("--db", default="bench_ingest.db")
+    parser.add_argument("--mode", choices=["direct", "batched", "both"], default="both")
+    parser.add_argument("--no-cluster", action="store_true", help="Skip incident clustering")
+    args = parser.parse_args(argv)
+
+    modes = ["direct", "batched"] if args.mode == "both" else [args.mode]
+    print(json.dumps([run(mode, args.submitters, args.reports, args.db, not args.no_cluster)
+                      for mode in modes], indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Entity ruler pattern count versus compile, load and extraction time
+
+Synthetic place names are added as phrase patterns (the gazetteer path) on
+top of the built-in token patterns. For each pattern count the pipeline is
+compiled to disk, loaded back, and timed on single texts (nlp(text)) and on
+nlp.pipe with each worker process count.
+
+Usage:
+    python -m benchmarks.bench_patterns --counts 0 1000 10000 100000 --n-process 1 2 4
+    python -m benchmarks.bench_patterns --base en_core_web_sm --counts 0 10000
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+from benchmarks.bench_inference import latency_summary
+from benchmarks.synthetic import generate_emergency_text
+
+SYLLABLES = ["ba", "ra", "pur", "na", "gar", "ko", "li", "shi", "dev", "ma", "ta", "van", "ga", "dhi", "pa", "la"]
+
+def place_names(count: int, seed: int = 0) -> List[str]:
+    """Distinct made-up place names of one or two words"""
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+        names.add(word if rng.random() < 0.7 else f"{word} {rng.choice(['Nagar', 'Colony', 'Village'])}")
+    return sorted(names)
+
+def texts_mentioning(names: List[str], count: int, seed: int = 0) -> List[str]:
+    """Synthetic reports, each naming one of the places when there are any"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        text = generate_emergency_text(rng)[0]
+        texts.append(f"{text} in {rng.choice(names)}" if names else text)
+    return texts
+
+def run_point(base: str, count: int, texts: int, n_process: List[int], workdir: str) -> Dict:
+    """Compile, load and time a pipeline with count phrase patterns"""
+    import spacy
+    from modules.entity_patterns import build_pipeline
+    from modules.models import ENTITY_PATTERNS
+
+    names = place_names(count)
+    patterns = list(ENTITY_PATTERNS) + [{"label": "GPE", "pattern": name} for name in names]
+    sample = texts_mentioning(names, texts)
+    path = f"{workdir}/patterns-{count}"
+
+    started = time.perf_counter()
+    build_pipeline(base, patterns).to_disk(path)
+    compile_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    nlp = spacy.load(path)
+    load_seconds = time.perf_counter() - started
+
+    times, found = [], 0
+    for text in sample:
+        started = time.perf_counter()
+        doc = nlp(text)
+        times.append(time.perf_counter() - started)
+        found += any(ent.label_ == "GPE" for ent in doc.ents)
+
+    pipe = {}
+    for processes in n_process:
+        started = time.perf_counter()
+        for _ in nlp.pipe(sample, n_process=processes, batch_size=max(1, len(sample) // (processes * 4))):
+            pass
+        pipe[f"n_process_{processes}_docs_per_s"] = round(len(sample) / (time.perf_counter() - started), 1)
+
+    return {
+        "phrase_patterns": count,
+        "compile_s": round(compile_seconds, 3),
+        "load_s": round(load_seconds, 3),
+        "place_recall": round(found / len(sample), 4) if names else None,
+        **latency_summary(times),
+        **pipe
+    }
+
+def run(base: str, counts: List[int], texts: int, n_process: List[int]) -> Dict:
+    """Benchmark every pattern count in a temporary directory"""
+    workdir = tempfile.mkdtemp(prefix="bench_patterns_")
+    try:
+        points = [run_point(base, count, texts, n_process, workdir) for count in counts]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"base": base, "texts": texts, "points": points}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base", default="blank:en", help="spaCy model, or blank:<lang> for tokenizer only")
+    parser.add_argument("--counts", nargs="+", type=int, default=[0, 1000, 10000, 100000])
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--n-process", nargs="+", type=int, default=[1, 2, 4])
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.base, args.counts, args.texts, args.n_process), indent=2))
+
+if __name__ == "__main__":
+    main()
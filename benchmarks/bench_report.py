@@ -0,0 +1,83 @@
+"""End-to-end latency of analyzing a report with text, voice and image inputs
+
+The model calls made by modules.report are replaced by sleeps of the given
+lengths (transcription, captioning, classification, entity extraction), so
+the result shows how the orchestration overlaps them. Each report is
+analyzed with REPORT_PARALLEL off (one call after another) and on, and
+compared with the slowest single input.
+
+Usage:
+    python -m benchmarks.bench_report --reports 20
+    python -m benchmarks.bench_report --transcribe-ms 2500 --caption-ms 1200 --classify-ms 150 --extract-ms 80
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Dict
+
+def simulate(ms: float, result):
+    """A model call that takes ms milliseconds and returns result"""
+    def call(*args, **kwargs):
+        time.sleep(ms / 1000)
+        return result
+    return call
+
+def install_simulation(transcribe_ms: float, caption_ms: float, classify_ms: float, extract_ms: float):
+    """Point modules.report at simulated model calls"""
+    from modules import report
+
+    report.transcribe_audio = simulate(transcribe_ms, "people trapped after the flood")
+    report.english_speech_to_text = simulate(0, "")
+    report.caption_image = simulate(caption_ms, "a flooded street with cars under water")
+    report.process_text = simulate(classify_ms, ("flood", 0.31))
+    report.extract_entities = simulate(extract_ms, {"victim_condition": ["trapped"]})
+
+def time_report(inputs: Dict, parallel: bool) -> float:
+    """Seconds to analyze one report"""
+    from config import config
+    from modules.report import analyze_report
+
+    config["REPORT_PARALLEL"] = parallel
+    started = time.perf_counter()
+    analyze_report(inputs)
+    return time.perf_counter() - started
+
+def run(reports: int, transcribe_ms: float, caption_ms: float, classify_ms: float, extract_ms: float) -> Dict:
+    """Median sequential and parallel latency over reports runs"""
+    from config import config
+
+    install_simulation(transcribe_ms, caption_ms, classify_ms, extract_ms)
+    # Image preprocessing is benchmarked by bench_images; here the bytes go straight to the caption call
+    config["IMAGE_PREPROCESSING"] = False
+    inputs = {"text": "Water rising fast near the school", "voice": "note.wav", "image": b"photo"}
+    branches = {
+        "text": classify_ms + extract_ms,
+        "voice": transcribe_ms + classify_ms + extract_ms,
+        "image": caption_ms + classify_ms
+    }
+    sequential = [time_report(inputs, False) for _ in range(reports)]
+    parallel = [time_report(inputs, True) for _ in range(reports)]
+    return {
+        "reports": reports,
+        "branch_ms": branches,
+        "sum_of_branches_ms": sum(branches.values()),
+        "slowest_branch_ms": max(branches.values()),
+        "sequential_ms": round(statistics.median(sequential) * 1000, 1),
+        "parallel_ms": round(statistics.median(parallel) * 1000, 1),
+        "speedup": round(statistics.median(sequential) / statistics.median(parallel), 2)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports", type=int, default=10)
+    parser.add_argument("--transcribe-ms", type=float, default=2000)
+    parser.add_argument("--caption-ms", type=float, default=1000)
+    parser.add_argument("--classify-ms", type=float, default=100)
+    parser.add_argument("--extract-ms", type=float, default=60)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.reports, args.transcribe_ms, args.caption_ms, args.classify_ms, args.extract_ms),
+                     indent=2))
+
+if __name__ == "__main__":
+    main()
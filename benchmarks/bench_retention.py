@@ -0,0 +1,112 @@
+"""Nearest-report query time and database size before and after retention
+
+A database is filled with reports spread over --days of history. The
+nearest-emergency and nearest-incident queries are timed without a time
+bound, with one (NEARBY_MAX_AGE_HOURS), and again after reports older than
+--retention-days have been archived and the file vacuumed.
+
+Usage:
+    python -m benchmarks.bench_retention --emergencies 200000 --days 365 --retention-days 30
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Dict
+from config import config
+from benchmarks.bench_suite import measure
+from benchmarks.synthetic import build_dataset, generate_emergencies, sample_points
+
+def fill(db_path: str, emergencies: int, days: float, distribution: str, cluster: bool) -> Dict:
+    """Synthetic database whose reports span days"""
+    info = build_dataset(db_path, emergencies=0, resources=0, volunteers=0, distribution=distribution, cluster=False)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executemany(
+            '''INSERT INTO emergency (location, latitude, longitude, text, timestamp, emergency_type, confidence, severity)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            generate_emergencies(emergencies, distribution, days=days)
+        )
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    if cluster:
+        from modules.clustering import rebuild_incidents
+        info["incidents"] = rebuild_incidents(similarity=lambda a, b: 0.0)["incidents"]
+    return info
+
+def query_times(points, since_hours, repeat: int) -> Dict:
+    from modules import database
+
+    state = {"i": 0}
+
+    def point():
+        state["i"] = (state["i"] + 1) % len(points)
+        return points[state["i"]]
+
+    return {
+        "nearest_emergencies": measure(lambda: database.get_nearest_emergencies(
+            *point(), max_km=10, limit=10, since_hours=since_hours), repeat),
+        "nearest_incidents": measure(lambda: database.get_nearest_incidents(
+            *point(), max_km=10, limit=10, since_hours=since_hours), repeat)
+    }
+
+def run(emergencies: int, days: float, retention_days: float, max_age_hours: float, distribution: str,
+        cluster: bool, repeat: int) -> Dict:
+    """Benchmark in a temporary directory"""
+    from modules import retention
+
+    workdir = tempfile.mkdtemp(prefix="bench_retention_")
+    db_path, archive_path = os.path.join(workdir, "hot.db"), os.path.join(workdir, "archive.db")
+    previous = config.get("DB_PATH")
+    config["DB_PATH"] = db_path
+    try:
+        fill(db_path, emergencies, days, distribution, cluster)
+        points = sample_points(200, distribution)
+        result = {
+            "emergencies": emergencies,
+            "history_days": days,
+            "retention_days": retention_days,
+            "before": {
+                "db_bytes": os.path.getsize(db_path),
+                "unbounded": query_times(points, None, repeat),
+                "bounded": query_times(points, max_age_hours, repeat)
+            }
+        }
+        started = time.perf_counter()
+        moved = retention.archive_old_reports(retention_days, archive_path=archive_path)
+        archive_seconds = time.perf_counter() - started
+        retention.analyze()
+        result["archive"] = {**moved, "seconds": round(archive_seconds, 3)}
+        result["vacuum"] = retention.vacuum(min_free_ratio=0)
+        result["after"] = {
+            **retention.status(archive_path=archive_path),
+            "unbounded": query_times(points, None, repeat),
+            "bounded": query_times(points, max_age_hours, repeat)
+        }
+        result["after"].pop("last_runs")
+    finally:
+        config["DB_PATH"] = previous
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emergencies", type=int, default=100000)
+    parser.add_argument("--days", type=float, default=365, help="History the reports are spread over")
+    parser.add_argument("--retention-days", type=float, default=30)
+    parser.add_argument("--max-age-hours", type=float, default=72, help="Time bound of the bounded queries")
+    parser.add_argument("--distribution", default="clustered")
+    parser.add_argument("--no-cluster", action="store_true", help="Skip grouping reports into incidents")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.emergencies, args.days, args.retention_days, args.max_age_hours,
+                         args.distribution, not args.no_cluster, args.repeat), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Routing cost and the effect of travel-time ranking on a synthetic city
+
+The city is a --size x --size street grid (100 m blocks, a 60 km/h arterial
+every 10th street, 25 km/h elsewhere) split by a river that only --bridges
+streets cross. The benchmark reports the graph build, point-to-point
+searches with Dijkstra against A* with the landmark bound, and how often
+re-ranking the --candidates nearest resources by travel time changes the
+first result and how much time that saves. It then closes one bridge and
+measures the detour.
+
+Usage:
+    python -m benchmarks.bench_routing --size 200 --resources 400 --queries 200
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+from config import config
+
+# Grid spacing in degrees of latitude (about 100 m)
+SPACING = 0.0009
+
+def grid_city(size: int, bridges: int, lat0: float = 19.0, lon0: float = 72.8):
+    """Ways (id, tags, [(node id, lat, lon)]) of a street grid with a river down the middle"""
+    lon_spacing = SPACING / math.cos(math.radians(lat0))
+    river = size // 2
+    bridge_rows = {size * (i + 1) // (bridges + 1) for i in range(bridges)}
+
+    def node(row, col):
+        return (row * size + col, lat0 + row * SPACING, lon0 + col * lon_spacing)
+
+    def tags(index):
+        return {"highway": "primary" if index % 10 == 0 else "residential"}
+
+    ways, way_id = [], 0
+    for row in range(size):
+        # Streets stop at the river except where a bridge carries them across
+        spans = [(0, size)] if row in bridge_rows else [(0, river), (river, size)]
+        for start, stop in spans:
+            way_id += 1
+            ways.append((way_id, tags(row), [node(row, col) for col in range(start, stop)]))
+    for col in range(size):
+        way_id += 1
+        ways.append((way_id, tags(col), [node(row, col) for row in range(size)]))
+    return ways, bridge_rows, lon_spacing
+
+def random_point(rng: random.Random, size: int, lon_spacing: float, lat0: float = 19.0, lon0: float = 72.8):
+    return lat0 + rng.uniform(0, size - 1) * SPACING, lon0 + rng.uniform(0, size - 1) * lon_spacing
+
+def point_to_point(graph, pairs: List) -> Dict:
+    """Settled nodes and latency of Dijkstra and ALT A* over the same node pairs"""
+    from modules.routing import search
+
+    results = {name: {"ms": [], "settled": []} for name in ("dijkstra", "alt")}
+    mismatches = 0
+    for source, target in pairs:
+        times = {}
+        for name, heuristic in (("dijkstra", None), ("alt", graph.heuristic(target))):
+            started = time.perf_counter()
+            settled, _ = search(graph.forward, {source: 0}, {target}, heuristic)
+            results[name]["ms"].append((time.perf_counter() - started) * 1000)
+            results[name]["settled"].append(len(settled))
+            times[name] = settled.get(target)
+        mismatches += times["dijkstra"] != times["alt"]
+    summary = {
+        name: {
+            "median_ms": round(statistics.median(values["ms"]), 2),
+            "median_settled": int(statistics.median(values["settled"]))
+        }
+        for name, values in results.items()
+    }
+    summary["travel_time_mismatches"] = mismatches
+    return summary
+
+def rerank_effect(points: List, resources: List[Dict], candidates: int, max_km: float) -> Dict:
+    """How often travel time changes the first of the nearest resources, and the time it saves"""
+    from modules.routing import rerank_by_travel_time
+    from modules.utils import haversine
+
+    changed, saved, latencies, compared = 0, [], [], 0
+    for lat, lon in points:
+        nearest = sorted(
+            ({**r, "distance": haversine(lat, lon, r["latitude"], r["longitude"])} for r in resources),
+            key=lambda r: r["distance"]
+        )
+        nearest = [r for r in nearest if r["distance"] <= max_km][:candidates]
+        if not nearest:
+            continue
+        started = time.perf_counter()
+        ranked = rerank_by_travel_time(lat, lon, nearest)
+        latencies.append((time.perf_counter() - started) * 1000)
+        straight = next(r for r in ranked if r["resourceid"] == nearest[0]["resourceid"])
+        if ranked[0].get("travel_ms") is None or straight.get("travel_ms") is None:
+            continue
+        compared += 1
+        if ranked[0]["resourceid"] != straight["resourceid"]:
+            changed += 1
+            saved.append((straight["travel_ms"] - ranked[0]["travel_ms"]) / 60000)
+    return {
+        "queries": compared,
+        "first_result_changed": round(changed / compared, 3) if compared else None,
+        "median_minutes_saved_when_changed": round(statistics.median(saved), 2) if saved else 0,
+        "median_rerank_ms": round(statistics.median(latencies), 2) if latencies else None
+    }
+
+def run(size: int, bridges: int, resources: int, queries: int, candidates: int, landmarks: int, seed: int) -> Dict:
+    """Benchmark in a temporary directory"""
+    from modules import routing
+    from modules.database import init_db, add_road_block
+
+    rng = random.Random(seed)
+    workdir = tempfile.mkdtemp(prefix="bench_routing_")
+    previous = {key: config.get(key) for key in ("DB_PATH", "ROAD_GRAPH_PATH")}
+    config["DB_PATH"] = os.path.join(workdir, "bench.db")
+    config["ROAD_GRAPH_PATH"] = os.path.join(workdir, "roads.npz")
+    try:
+        init_db(config["DB_PATH"])
+        ways, bridge_rows, lon_spacing = grid_city(size, bridges)
+        result = {"grid": f"{size}x{size}", "bridges": bridges,
+                  "build": routing.write_graph(ways, config["ROAD_GRAPH_PATH"], landmarks)}
+        started = time.perf_counter()
+        graph = routing.get_road_graph()
+        result["build"]["load_seconds"] = round(time.perf_counter() - started, 3)
+
+        pairs = [(rng.randrange(graph.nodes), rng.randrange(graph.nodes)) for _ in range(queries)]
+        result["point_to_point"] = point_to_point(graph, pairs)
+
+        places = [{"resourceid": i, "latitude": lat, "longitude": lon}
+                  for i, (lat, lon) in enumerate(random_point(rng, size, lon_spacing) for _ in range(resources))]
+        points = [random_point(rng, size, lon_spacing) for _ in range(queries)]
+        result["rerank"] = rerank_effect(points, places, candidates, max_km=size * 0.1)
+
+        # Close the first bridge: trips across the river detour to the next one
+        bridge = min(bridge_rows)
+        river_lat, river_lon = 19.0 + bridge * SPACING, 72.8 + (size // 2 - 0.5) * lon_spacing
+        west = (river_lat, river_lon - 5 * lon_spacing)
+        east = (river_lat, river_lon + 5 * lon_spacing)
+        before = routing.route(*west, *east)
+        add_road_block(river_lat, river_lon, 80, "Bridge flooded")
+        routing.refresh_blocks()
+        started = time.perf_counter()
+        after = routing.route(*west, *east)
+        result["blocked_bridge"] = {
+            "blocked_edges": len(routing.closed_edges(graph)),
+            "minutes_before": round(before["travel_ms"] / 60000, 2) if before else None,
+            "minutes_after": round(after["travel_ms"] / 60000, 2) if after else None,
+            "refresh_and_route_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+    finally:
+        config.update(previous)
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=150, help="Streets per side of the grid")
+    parser.add_argument("--bridges", type=int, default=2)
+    parser.add_argument("--resources", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--candidates", type=int, default=30, help="Straight-line candidates re-ranked per query")
+    parser.add_argument("--landmarks", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.size, args.bridges, args.resources, args.queries, args.candidates,
+                         args.landmarks, args.seed), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""Repeatable benchmarks for the request path, with JSON results for comparing commits
+
+Usage:
+    python -m benchmarks.bench_suite run --scale small --out results.json
+    python -m benchmarks.bench_suite compare baseline.json results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+from config import config
+from benchmarks.synthetic import CENTERS, build_dataset, sample_points, generate_emergency_text
+
+# Dataset sizes (emergencies, resources, volunteers)
+SCALES = {
+    "small": (2000, 500, 100),
+    "medium": (50000, 10000, 1000),
+    "large": (500000, 50000, 5000)
+}
+
+def measure(func: Callable, repeat: int = 50, warmup: int = 3) -> Dict:
+    """Call func repeatedly and summarize its wall time in milliseconds"""
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    return {
+        "runs": repeat,
+        "mean_ms": round(statistics.fmean(times), 4),
+        "p50_ms": round(times[len(times) // 2], 4),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 4),
+        "min_ms": round(times[0], 4)
+    }
+
+def cycle(items: List) -> Callable:
+    """Return a function that yields the items in turn, forever"""
+    state = {"i": 0}
+
+    def next_item():
+        item = items[state["i"] % len(items)]
+        state["i"] += 1
+        return item
+    return next_item
+
+def database_benchmarks(points: List, volunteer_ids: List[int], repeat: int) -> Dict:
+    """Spatial lookups, the volunteer dashboard and the admin dashboard queries"""
+    from modules import database
+
+    point = cycle(points)
+    volunteer = cycle(volunteer_ids)
+    return {
+        "db.get_nearest_emergencies": measure(lambda: database.get_nearest_emergencies(*point()), repeat),
+        "db.get_nearest_incidents": measure(lambda: database.get_nearest_incidents(*point()), repeat),
+        "db.get_nearest_resources": measure(lambda: database.get_nearest_resources(*point()), repeat),
+        "db.get_volunteer_dashboard": measure(lambda: database.get_volunteer_dashboard(volunteer()), repeat),
+        "db.count_rows": measure(lambda: [database.count_rows(t) for t in
+                                          ("emergency", "resource", "volunteer", "incident")], repeat),
+        "db.get_emergency_trend": measure(database.get_emergency_trend, repeat),
+        "db.get_emergency_type_counts": measure(database.get_emergency_type_counts, repeat),
+        "db.query_emergencies": measure(lambda: database.query_emergencies(["fire"], ["critical"], 24), repeat),
+        "db.search_emergencies": measure(lambda: database.search_emergencies("trapped school"), repeat),
+        "db.get_incidents": measure(database.get_incidents, max(5, repeat // 10)),
+        "db.get_resources": measure(lambda: database.get_resources(with_creator=True), max(5, repeat // 10)),
+        "db.get_volunteers": measure(database.get_volunteers, max(5, repeat // 10)),
+        "db.get_resource_counts_by_volunteer": measure(database.get_resource_counts_by_volunteer, repeat)
+    }
+
+def map_benchmarks(points: List, repeat: int) -> Dict:
+    """Folium map construction and HTML rendering for the volunteer and admin map sizes"""
+    from modules import database
+    from modules.geospatial import create_emergency_map, map_html
+
+    lat, lon = points[0]
+    nearby = (database.get_nearest_resources(lat, lon), database.get_nearest_incidents(lat, lon))
+    overview = (database.get_resources()[:1000], database.get_incidents(limit=1000))
+    results = {}
+    for label, (resources, incidents) in (("nearby", nearby), ("overview", overview)):
+        results[f"map.build.{label}"] = measure(
+            lambda: create_emergency_map(lat, lon, resources=resources, emergencies=incidents),
+            max(3, repeat // 10)
+        )
+        m = create_emergency_map(lat, lon, resources=resources, emergencies=incidents)
+        results[f"map.render.{label}"] = measure(lambda: map_html(m), max(3, repeat // 10))
+        results[f"map.render.{label}"]["markers"] = len(resources) + len(incidents)
+    return results
+
+def stub_nlp():
+    """A blank English pipeline with the app's entity patterns (no statistical model download)"""
+    import spacy
+    from modules.models import ENTITY_PATTERNS
+
+    nlp = spacy.blank("en")
+    nlp.add_pipe("entity_ruler").add_patterns(ENTITY_PATTERNS)
+    return nlp
+
+def nlp_benchmarks(repeat: int, clip_model: Optional[str] = None) -> Dict:
+    """Entity extraction with a stub spaCy pipeline, and CLIP text classification with a small model"""
+    from modules import models
+    from modules.processing import extract_entities, process_text
+
+    rng = random.Random(0)
+    texts = cycle([generate_emergency_text(rng)[0] for _ in range(100)])
+    results = {}
+
+    models.models["nlp"] = stub_nlp()
+    models.get_nlp.cache_clear()
+    results["nlp.extract_entities.stub"] = measure(lambda: extract_entities(texts()), repeat)
+
+    if clip_model:
+        previous = config.get("CLIP_MODEL")
+        config["CLIP_MODEL"] = clip_model
+        try:
+            results["clip.process_text"] = measure(lambda: process_text(texts()), max(3, repeat // 10), warmup=1)
+            results["clip.process_text"]["model"] = clip_model
+        finally:
+            config["CLIP_MODEL"] = previous
+    return results
+
+def external_benchmarks(repeat: int) -> Dict:
+    """Geocoding with a zero-latency stub geocoder: our own overhead around the network call"""
+    from benchmarks.bench_geocode import make_fake_geocoder
+    from modules.database import cache_locations
+    from modules.geospatial import batch_get_lat_lon, get_lat_lon
+
+    geocoder = make_fake_geocoder(latency=0.0)
+    names = [f"Place {i}" for i in range(200)]
+    cache_locations({name.lower(): geocoder(name) for name in names[:100]})
+    name = cycle(names[:100])
+    previous = config.get("GEOCODER_MODE")
+    config["GEOCODER_MODE"] = "online"
+    try:
+        return {
+            "geocode.get_lat_lon.cached": measure(lambda: get_lat_lon(name()), repeat),
+            "geocode.batch.stub": measure(
+                lambda: batch_get_lat_lon(names, geocoder=geocoder, qps=0, use_cache=True),
+                max(3, repeat // 10)
+            )
+        }
+    finally:
+        config["GEOCODER_MODE"] = previous
+
+def environment() -> Dict:
+    """What the numbers were measured on"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+def run_suite(scale: str = "small", distribution: str = "clustered", db_path: str = "bench_suite.db",
+              repeat: int = 50, groups: Optional[List[str]] = None, clip_model: Optional[str] = None,
+              seed: int = 0) -> Dict:
+    """Build the dataset and run the selected benchmark groups"""
+    groups = groups or ["db", "map", "nlp", "external"]
+    emergencies, resources, volunteers = SCALES[scale]
+    config["DB_PATH"] = db_path
+    config["DB_BACKEND"] = "sqlite"
+    config["WRITE_BATCHING"] = False
+    dataset = build_dataset(db_path, emergencies, resources, volunteers, distribution, seed)
+    points = sample_points(200, distribution, seed=seed + 100, center=CENTERS["mumbai"])
+    volunteer_ids = list(range(1, volunteers + 1))
+    random.Random(seed).shuffle(volunteer_ids)
+
+    results = {}
+    runners = {
+        "db": lambda: database_benchmarks(points, volunteer_ids[:200], repeat),
+        "map": lambda: map_benchmarks(points, repeat),
+        "nlp": lambda: nlp_benchmarks(repeat, clip_model),
+        "external": lambda: external_benchmarks(repeat)
+    }
+    skipped = {}
+    for group in groups:
+        try:
+            results.update(runners[group]())
+        except ImportError as e:
+            # Optional dependency (folium, spaCy, transformers) not installed here
+            skipped[group] = str(e)
+    return {
+        "environment": environment(),
+        "dataset": {**dataset, "scale": scale},
+        "results": results,
+        "skipped": skipped
+    }
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.2) -> List[Dict]:
+    """Compare p50 latencies of two result files; ratio above 1 + threshold is a regression"""
+    rows = []
+    for name, result in sorted(current["results"].items()):
+        before = baseline["results"].get(name)
+        if not before or not before["p50_ms"]:
+            continue
+        ratio = result["p50_ms"] / before["p50_ms"]
+        rows.append({
+            "benchmark": name,
+            "baseline_p50_ms": before["p50_ms"],
+            "current_p50_ms": result["p50_ms"],
+            "ratio": round(ratio, 3),
+            "status": "regression" if ratio > 1 + threshold else "improved" if ratio < 1 - threshold else "same"
+        })
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Build a synthetic dataset and run the benchmarks")
+    run.add_argument("--scale", choices=sorted(SCALES), default="small")
+    run.add_argument("--distribution", choices=["uniform", "clustered", "global"], default="clustered")
+    run.add_argument("--db", default="bench_suite.db")
+    run.add_argument("--repeat", type=int, default=50)
+    run.add_argument("--groups", nargs="+", choices=["db", "map", "nlp", "external"], default=None)
+    run.add_argument("--clip-model", default=None,
+                     help="Small CLIP checkpoint for process_text (skipped when not given)")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--out", default=None, help="Write the JSON results to this file")
+    cmp = sub.add_parser("compare", help="Compare two result files")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        rows = compare(baseline, current, args.threshold)
+        print(json.dumps(rows, indent=2))
+        sys.exit(1 if any(row["status"] == "regression" for row in rows) else 0)
+
+    report = run_suite(args.scale, args.distribution, args.db, args.repeat, args.groups,
+                       args.clip_model, args.seed)
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
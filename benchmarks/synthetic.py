@@ -0,0 +1,188 @@
+"""Synthetic emergencies, resources and volunteers for benchmarks
+
+Usage:
+    python -m benchmarks.synthetic --db bench.db --emergencies 100000 --resources 20000 --volunteers 2000
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Tuple
+from config import config
+from modules.utils import hash_password
+
+# Named areas points can be generated around (lat, lon)
+CENTERS = {
+    "mumbai": (19.076, 72.8777),
+    "delhi": (28.6139, 77.209),
+    "chennai": (13.0827, 80.2707),
+    "kolkata": (22.5726, 88.3639)
+}
+
+DISTRIBUTIONS = ("uniform", "clustered", "global")
+
+EMERGENCY_TEMPLATES = {
+    "fire": ["Fire in a {place}, {severity} smoke, people {condition}", "{severity} fire, {place} {damage}"],
+    "flood": ["Flood water rising near the {place}, residents {condition}", "{place} {damage} after {severity} flood"],
+    "earthquake": ["Earthquake, {place} {damage}, several people {condition}"],
+    "building collapse": ["{place} collapsed, people {condition}, {severity} damage"],
+    "medical emergency": ["Person {condition} outside the {place}, {severity} help needed"],
+    "landslide": ["Landslide blocked the road near the {place}, vehicles {condition}"]
+}
+PLACES = ["school", "market", "hospital", "railway station", "apartment block", "temple", "bridge", "bus depot"]
+SEVERITIES = ["minor", "major", "urgent", "severe", "critical"]
+CONDITIONS = ["injured", "trapped", "missing", "stuck", "unconscious"]
+DAMAGES = ["damaged", "destroyed", "flooded", "burned"]
+AMENITIES = ["Hospital", "Shelter", "Police Station", "Fire Station", "Food Bank", "Pharmacy", "Water Point"]
+SPECIALITIES = ["Medical", "Rescue", "Logistics", "Counselling", "Engineering", "Communications"]
+
+def generate_points(count: int, distribution: str = "clustered", center: Tuple[float, float] = CENTERS["mumbai"],
+                    spread_km: float = 25.0, hotspots: int = 8, seed: int = 0) -> Iterator[Tuple[float, float]]:
+    """Generate (lat, lon) points.
+
+    "uniform" spreads points over a square of side 2 * spread_km around the
+    center, "clustered" draws them around a few random hotspots inside that
+    square (like reports around disaster sites) and "global" over all land
+    latitudes.
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution: {distribution}")
+    rng = random.Random(seed)
+    lat0, lon0 = center
+    dlat = spread_km / 111.0
+    dlon = spread_km / (111.0 * max(math.cos(math.radians(lat0)), 0.01))
+    spots = [(lat0 + rng.uniform(-dlat, dlat), lon0 + rng.uniform(-dlon, dlon)) for _ in range(hotspots)]
+    for _ in range(count):
+        if distribution == "uniform":
+            yield lat0 + rng.uniform(-dlat, dlat), lon0 + rng.uniform(-dlon, dlon)
+        elif distribution == "clustered":
+            lat, lon = rng.choice(spots)
+            yield (max(-90.0, min(90.0, rng.gauss(lat, dlat / 20))),
+                   max(-180.0, min(180.0, rng.gauss(lon, dlon / 20))))
+        else:
+            yield rng.uniform(-60, 70), rng.uniform(-180, 180)
+
+def generate_emergency_text(rng: random.Random) -> Tuple[str, str, str]:
+    """Report text with its emergency type and severity"""
+    emergency_type = rng.choice(list(EMERGENCY_TEMPLATES))
+    severity = rng.choice(SEVERITIES)
+    text = rng.choice(EMERGENCY_TEMPLATES[emergency_type]).format(
+        place=rng.choice(PLACES), severity=severity,
+        condition=rng.choice(CONDITIONS), damage=rng.choice(DAMAGES)
+    )
+    return text[0].upper() + text[1:], emergency_type, severity
+
+def generate_emergencies(count: int, distribution: str, days: float = 7, seed: int = 0, **kwargs) -> Iterator[tuple]:
+    """Rows of (location, latitude, longitude, text, timestamp, emergency_type, confidence, severity)"""
+    rng = random.Random(seed + 1)
+    now = time.time()
+    for lat, lon in generate_points(count, distribution, seed=seed, **kwargs):
+        text, emergency_type, severity = generate_emergency_text(rng)
+        reported = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - rng.random() * days * 86400))
+        yield (f"Sector {rng.randint(1, 200)}", lat, lon, text, reported,
+               emergency_type, round(rng.uniform(0.3, 1.0), 3), severity)
+
+def generate_volunteers(count: int, distribution: str, seed: int = 0, **kwargs) -> Iterator[tuple]:
+    """Rows of (name, email, password_hash, location, latitude, longitude, speciality, phone)"""
+    rng = random.Random(seed + 2)
+    password_hash = hash_password("password")
+    for i, (lat, lon) in enumerate(generate_points(count, distribution, seed=seed + 2, **kwargs), start=1):
+        yield (f"Volunteer {i}", f"volunteer{i}@example.org", password_hash, f"Sector {rng.randint(1, 200)}",
+               lat, lon, rng.choice(SPECIALITIES), f"+91{rng.randint(7000000000, 9999999999)}")
+
+def generate_resources(count: int, distribution: str, volunteers: int, seed: int = 0, **kwargs) -> Iterator[tuple]:
+    """Rows of (amenity, name, latitude, longitude, created_by)"""
+    rng = random.Random(seed + 3)
+    for i, (lat, lon) in enumerate(generate_points(count, "uniform" if distribution == "clustered" else distribution,
+                                                   seed=seed + 3, **kwargs), start=1):
+        amenity = rng.choice(AMENITIES)
+        yield amenity, f"{amenity} {i}", lat, lon, rng.randint(1, volunteers) if volunteers else None
+
+def build_dataset(db_path: str, emergencies: int = 10000, resources: int = 2000, volunteers: int = 500,
+                  distribution: str = "clustered", seed: int = 0, cluster: bool = True, **kwargs) -> Dict:
+    """Create a fresh database at db_path filled with synthetic data.
+
+    Resources are always spread evenly (services cover the whole area) unless
+    the distribution is "global". With cluster, emergencies are grouped into
+    incidents the same way live reports are.
+    """
+    from modules.database import init_db
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    init_db(db_path)
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executemany(
+            '''INSERT INTO volunteer (name, email, password_hash, location, latitude, longitude, speciality, phone)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            generate_volunteers(volunteers, distribution, seed, **kwargs)
+        )
+        conn.executemany(
+            "INSERT INTO resource (amenity, name, latitude, longitude, created_by) VALUES (?, ?, ?, ?, ?)",
+            generate_resources(resources, distribution, volunteers, seed, **kwargs)
+        )
+        conn.executemany(
+            '''INSERT INTO emergency (location, latitude, longitude, text, timestamp, emergency_type, confidence, severity)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            generate_emergencies(emergencies, distribution, seed=seed, **kwargs)
+        )
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    loaded = time.perf_counter() - started
+
+    incidents = None
+    if cluster:
+        from modules.clustering import rebuild_incidents
+        previous = config.get("DB_PATH")
+        config["DB_PATH"] = db_path
+        try:
+            # Distance alone decides between candidates, keeping the dataset deterministic
+            incidents = rebuild_incidents(similarity=lambda a, b: 0.0)["incidents"]
+        finally:
+            config["DB_PATH"] = previous
+
+    return {
+        "db": db_path,
+        "distribution": distribution,
+        "seed": seed,
+        "emergencies": emergencies,
+        "resources": resources,
+        "volunteers": volunteers,
+        "incidents": incidents,
+        "load_seconds": round(loaded, 3),
+        "total_seconds": round(time.perf_counter() - started, 3)
+    }
+
+def sample_points(count: int, distribution: str, seed: int = 1, **kwargs) -> List[Tuple[float, float]]:
+    """Query points drawn from the same distribution as the data"""
+    return list(generate_points(count, distribution, seed=seed, **kwargs))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="bench.db")
+    parser.add_argument("--emergencies", type=int, default=10000)
+    parser.add_argument("--resources", type=int, default=2000)
+    parser.add_argument("--volunteers", type=int, default=500)
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="clustered")
+    parser.add_argument("--center", choices=sorted(CENTERS), default="mumbai")
+    parser.add_argument("--spread-km", type=float, default=25.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-cluster", action="store_true", help="Skip grouping emergencies into incidents")
+    args = parser.parse_args(argv)
+
+    print(json.dumps(build_dataset(args.db, args.emergencies, args.resources, args.volunteers,
+                                   args.distribution, args.seed, not args.no_cluster,
+                                   center=CENTERS[args.center], spread_km=args.spread_km), indent=2))
+
+if __name__ == "__main__":
+    main()
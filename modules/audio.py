@@ -0,0 +1,121 @@
+"""Audio preprocessing before transcription
+
+Voice notes are decoded block by block to 16 kHz mono, silence is removed
+with an energy-based voice activity detector, and the remaining speech is
+split on pauses into chunks of at most AUDIO_CHUNK_SECONDS. The chunks are
+transcribed in parallel and the texts are joined in order.
+"""
+import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+from config import config
+from modules.metrics import timer, increment
+
+SAMPLE_RATE = 16000
+
+def load_audio(path: str, sample_rate: int = SAMPLE_RATE, block_seconds: float = 10.0) -> np.ndarray:
+    """Decode an audio file to mono float32 at sample_rate.
+
+    Formats libsndfile reads (WAV, FLAC, OGG, MP3) are decoded in blocks and
+    downmixed as they are read, so only one mono copy of the signal is held.
+    Other formats go through librosa.load.
+    """
+    import librosa
+    import soundfile as sf
+
+    try:
+        info = sf.info(path)
+    except RuntimeError:
+        samples, _ = librosa.load(path, sr=sample_rate, mono=True)
+        return samples.astype(np.float32)
+    blocks = [
+        block.mean(axis=1)
+        for block in sf.blocks(path, blocksize=int(info.samplerate * block_seconds), dtype="float32", always_2d=True)
+    ]
+    samples = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+    if info.samplerate != sample_rate:
+        samples = librosa.resample(samples, orig_sr=info.samplerate, target_sr=sample_rate)
+    return samples.astype(np.float32)
+
+def speech_intervals(samples: np.ndarray, sample_rate: int = SAMPLE_RATE, top_db: float = None,
+                     min_silence: float = None, padding: float = 0.1) -> List[Tuple[int, int]]:
+    """(start, end) sample ranges of speech: frames within top_db of the loudest frame.
+
+    Pauses shorter than min_silence seconds are kept inside the surrounding
+    speech, and each range is padded so word edges are not clipped.
+    """
+    import librosa
+
+    top_db = config.get("AUDIO_VAD_TOP_DB", 35) if top_db is None else top_db
+    min_silence = config.get("AUDIO_MIN_SILENCE_SECONDS", 0.5) if min_silence is None else min_silence
+    if not len(samples):
+        return []
+    pad, gap = int(padding * sample_rate), int(min_silence * sample_rate)
+    merged = []
+    for start, end in librosa.effects.split(samples, top_db=top_db, frame_length=1024, hop_length=256):
+        start, end = max(0, int(start) - pad), min(len(samples), int(end) + pad)
+        if merged and start - merged[-1][1] < gap:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+def chunk_intervals(intervals: List[Tuple[int, int]], max_samples: int) -> List[List[Tuple[int, int]]]:
+    """Group consecutive speech ranges into chunks of at most max_samples of speech.
+
+    Chunks end at pauses; only a single range longer than max_samples is cut.
+    """
+    chunks, current, size = [], [], 0
+    for start, end in intervals:
+        while end - start > max_samples:
+            if current:
+                chunks.append(current)
+                current, size = [], 0
+            chunks.append([(start, start + max_samples)])
+            start += max_samples
+        if current and size + end - start > max_samples:
+            chunks.append(current)
+            current, size = [], 0
+        current.append((start, end))
+        size += end - start
+    if current:
+        chunks.append(current)
+    return chunks
+
+def preprocess_audio(path: str) -> Tuple[List[np.ndarray], Dict]:
+    """Speech chunks of an audio file (16 kHz mono), with the seconds of input and removed silence"""
+    with timer("audio.preprocess"):
+        samples = load_audio(path)
+        intervals = speech_intervals(samples)
+        max_samples = int(config.get("AUDIO_CHUNK_SECONDS", 30) * SAMPLE_RATE)
+        chunks = [np.concatenate([samples[start:end] for start, end in group])
+                  for group in chunk_intervals(intervals, max_samples)]
+    speech = sum(len(chunk) for chunk in chunks)
+    stats = {
+        "input_seconds": round(len(samples) / SAMPLE_RATE, 2),
+        "speech_seconds": round(speech / SAMPLE_RATE, 2),
+        "removed_seconds": round((len(samples) - speech) / SAMPLE_RATE, 2),
+        "chunks": len(chunks)
+    }
+    increment("audio.input_seconds", stats["input_seconds"])
+    increment("audio.removed_seconds", stats["removed_seconds"])
+    return chunks, stats
+
+def wav_bytes(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """Encode samples as 16-bit PCM WAV"""
+    import soundfile as sf
+
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+def transcribe_chunks(chunks: List[np.ndarray], transcribe: Callable[[np.ndarray], str],
+                      max_workers: int = None) -> str:
+    """Transcribe chunks concurrently and join the texts in order (if any chunk fails, its error is raised)"""
+    if not chunks:
+        return ""
+    max_workers = max_workers or config.get("AUDIO_MAX_WORKERS", 4)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+        texts = list(pool.map(transcribe, chunks))
+    return " ".join(text.strip() for text in texts if text and text.strip())
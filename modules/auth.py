@@ -1,5 +1,6 @@
 from twilio.rest import Client
 from config import config
+from modules.metrics import timer
 import streamlit as st
 
 def get_twilio_client():
@@ -10,11 +11,12 @@ def send_sms(to, message):
     """Send SMS using Twilio"""
     try:
         client = get_twilio_client()
-        msg = client.messages.create(
-            body=message,
-            from_=config["TWILIO_PHONE_NUMBER"],
-            to=to
-        )
+        with timer("twilio.sms"):
+            msg = client.messages.create(
+                body=message,
+                from_=config["TWILIO_PHONE_NUMBER"],
+                to=to
+            )
         return f"SMS sent successfully to {to}: {msg.sid}"
     except Exception as e:
         st.error(f"Error sending SMS: {e}")
@@ -0,0 +1,71 @@
+"""Backfill stored classification and entities for emergencies reported before they were persisted
+
+Usage:
+    python -m modules.backfill --batch-size 64
+    python -m modules.backfill --batch-size 2000 --n-process 4
+"""
+import argparse
+import json
+import time
+from typing import Callable, Dict, Optional
+from modules.database import (
+    get_unclassified_emergencies,
+    store_emergency_entities,
+    update_emergency_classification
+)
+
+def backfill_emergency_metadata(batch_size: int = 64, limit: Optional[int] = None,
+                                classify: Optional[Callable] = None,
+                                extract: Optional[Callable] = None, n_process: int = 1) -> Dict:
+    """Classify and extract entities for every emergency without a stored emergency_type.
+
+    Without a custom extract function, entities for each batch come from one
+    nlp.pipe call spread over n_process worker processes.
+    """
+    from modules.processing import process_text, extract_entities_batch, classify_severity
+
+    classify = classify or process_text
+
+    def extract_batch(texts):
+        if extract:
+            return [extract(text) for text in texts]
+        return extract_entities_batch(texts, n_process=n_process)
+
+    started = time.perf_counter()
+    processed = 0
+    last_eid = 0
+    while limit is None or processed < limit:
+        size = batch_size if limit is None else min(batch_size, limit - processed)
+        rows = get_unclassified_emergencies(last_eid, size)
+        if not rows:
+            break
+
+        updates, entities_by_eid = [], {}
+        texts = [row["text"] or "" for row in rows]
+        for row, text, entities in zip(rows, texts, extract_batch(texts)):
+            emergency_type, confidence = classify(text)
+            updates.append((emergency_type, confidence, classify_severity(entities), row["eid"]))
+            entities_by_eid[row["eid"]] = entities
+        update_emergency_classification(updates)
+        store_emergency_entities(entities_by_eid)
+
+        processed += len(rows)
+        last_eid = rows[-1]["eid"]
+
+    return {"processed": processed, "seconds": round(time.perf_counter() - started, 3)}
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Backfill emergency classification and entities")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--n-process", type=int, default=1,
+                        help="spaCy worker processes for entity extraction (use large batches)")
+    args = parser.parse_args(argv)
+
+    from modules.database import init_db
+    init_db()
+    print(json.dumps(backfill_emergency_metadata(args.batch_size, args.limit, n_process=args.n_process), indent=2))
+
+if __name__ == "__main__":
+    main()
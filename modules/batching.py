@@ -0,0 +1,92 @@
+"""Dynamic micro-batching of concurrent single-item model calls"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+_state = {
+    "batchers": {}
+}
+_lock = threading.Lock()
+
+class MicroBatcher:
+    """Coalesce concurrent calls into batched calls of batch_fn.
+
+    Callers submit one item and get a Future. A worker thread takes the first
+    waiting item, keeps collecting for up to max_wait seconds or until
+    max_batch items are queued, then calls batch_fn(items), which must return
+    one result per item in order. If batch_fn raises, every caller in that
+    batch gets the exception.
+    """
+
+    def __init__(self, batch_fn: Callable[[List], List], max_batch: int = 16, max_wait: float = 0.01,
+                 name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {"batches": 0, "items": 0, "largest_batch": 0}
+
+    def submit(self, item) -> Future:
+        """Queue one item for the next batch"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout: Optional[float] = None):
+        """Run one item through the next batch and wait for its result"""
+        return self.submit(item).result(timeout)
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _next_batch(self) -> List:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [(item, future) for item, future in self._next_batch()
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: batch function returned {len(results)} results "
+                                       f"for {len(batch)} items")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+def get_batcher(name: str, batch_fn: Callable[[List], List], max_batch: int = 16,
+                max_wait: float = 0.01) -> MicroBatcher:
+    """Get the process-wide batcher for a task, creating it on first use"""
+    with _lock:
+        batcher = _state["batchers"].get(name)
+        if batcher is None:
+            batcher = _state["batchers"][name] = MicroBatcher(batch_fn, max_batch, max_wait, name=name)
+        return batcher
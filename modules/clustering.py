@@ -0,0 +1,208 @@
+"""Incremental clustering of emergency reports into incidents
+
+Usage:
+    python -m modules.clustering rebuild
+"""
+import argparse
+import json
+import re
+import sqlite3
+import streamlit as st
+from typing import Callable, Dict, List, Optional, Tuple
+from config import config
+from modules.database import get_db_connection
+from modules.utils import bounding_box
+
+def text_similarity(text_a: str, text_b: str) -> float:
+    """Similarity of two reports from spaCy document vectors, or word overlap without them"""
+    try:
+        from modules.models import get_nlp
+        nlp = get_nlp()
+        doc_a, doc_b = nlp(text_a), nlp(text_b)
+        if doc_a.vector_norm and doc_b.vector_norm:
+            return float(doc_a.similarity(doc_b))
+    except Exception:
+        pass
+    words_a = set(re.findall(r"\w+", text_a.lower()))
+    words_b = set(re.findall(r"\w+", text_b.lower()))
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+def find_candidate_incidents(cur, lat: float, lon: float, reported_at: str,
+                             radius_km: float, window_hours: float) -> List[Dict]:
+    """Find incidents within radius_km of a point that were active within the time window"""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    cur.execute(
+        '''SELECT i.incident_id, i.latitude, i.longitude, i.report_count,
+            (SELECT e.text FROM incident_member m JOIN emergency e ON e.eid = m.eid
+             WHERE m.incident_id = i.incident_id ORDER BY e.eid DESC LIMIT 1) AS text,
+            HAVERSINE(?, ?, i.latitude, i.longitude) AS distance
+            FROM incident_rtree r
+            JOIN incident i ON i.incident_id = r.id
+            WHERE r.max_lat >= ? AND r.min_lat <= ?
+              AND r.max_lon >= ? AND r.min_lon <= ?
+              AND i.last_reported >= datetime(?, ?)
+              AND HAVERSINE(?, ?, i.latitude, i.longitude) <= ?
+            ORDER BY distance''',
+        (lat, lon, min_lat, max_lat, min_lon, max_lon,
+         reported_at, f"-{float(window_hours)} hours", lat, lon, radius_km)
+    )
+    return [dict(row) for row in cur.fetchall()]
+
+def _incident_label(location: str, lat: float, lon: float) -> str:
+    """Label a new incident with the nearest gazetteer place, else the reported location"""
+    try:
+        from modules.gazetteer import reverse_geocode
+        return reverse_geocode(round(lat, 4), round(lon, 4)) or location
+    except Exception:
+        return location
+
+def score_candidates(candidates: List[Dict], text: str, similarity: Callable) -> Dict[int, float]:
+    """Text similarity of a report to each candidate incident's latest report, by incident_id.
+
+    Only computed when there is a tie to break (several candidates and a text).
+    """
+    if len(candidates) < 2 or not text:
+        return {}
+    return {c["incident_id"]: similarity(text, c["text"] or "") for c in candidates}
+
+def choose_incident(candidates: List[Dict], text: str, similarity: Callable,
+                    scores: Optional[Dict[int, float]] = None) -> Optional[Dict]:
+    """Pick the incident a report joins from candidates ordered nearest first (None opens a new one).
+
+    scores holds similarities already computed by score_candidates; candidates
+    missing from it are scored here.
+    """
+    if len(candidates) > 1 and text:
+        scores = dict(scores or {})
+        for c in candidates:
+            if c["incident_id"] not in scores:
+                scores[c["incident_id"]] = similarity(text, c["text"] or "")
+        # Several incidents nearby: prefer the one whose latest report reads most alike
+        return max(candidates, key=lambda c: (scores[c["incident_id"]], -c["distance"]))
+    return candidates[0] if candidates else None
+
+def prepare_assignment(location: str, lat: float, lon: float, text: str,
+                       similarity: Optional[Callable] = None) -> Tuple[Dict[int, float], str]:
+    """Score the current candidate incidents and label a possible new one, before any write lock is held.
+
+    Returns (scores, label) for _assign; reading fails soft to ({}, location).
+    """
+    radius_km = config.get("INCIDENT_RADIUS_KM", 1.0)
+    window_hours = config.get("INCIDENT_WINDOW_HOURS", 6)
+    conn = None
+    try:
+        conn = get_db_connection()
+        candidates = find_candidate_incidents(conn.cursor(), lat, lon, "now", radius_km, window_hours)
+    except sqlite3.Error:
+        # The write that follows reports the error
+        candidates = []
+    finally:
+        if conn:
+            conn.close()
+    return score_candidates(candidates, text, similarity or text_similarity), _incident_label(location, lat, lon)
+
+def _assign(cur, eid: int, location: str, lat: float, lon: float, text: str, reported_at: str,
+            radius_km: float, window_hours: float, similarity: Callable,
+            scores: Optional[Dict[int, float]] = None, label: Optional[str] = None) -> int:
+    """Attach one stored emergency to a matching or new incident using an open cursor.
+
+    scores and label from prepare_assignment spare the similarity and
+    reverse-geocoding work while the cursor holds a write lock.
+    """
+    candidates = find_candidate_incidents(cur, lat, lon, reported_at, radius_km, window_hours)
+    best = choose_incident(candidates, text, similarity, scores)
+
+    if best is None:
+        cur.execute(
+            '''INSERT INTO incident (location, latitude, longitude, report_count, first_reported, last_reported)
+               VALUES (?, ?, ?, 1, ?, ?)''',
+            (label or _incident_label(location, lat, lon), lat, lon, reported_at, reported_at)
+        )
+        incident_id = cur.lastrowid
+    else:
+        incident_id = best["incident_id"]
+        n = best["report_count"]
+        # Move the centroid towards the new report
+        cur.execute(
+            '''UPDATE incident
+               SET latitude = ?, longitude = ?, report_count = report_count + 1,
+                   last_reported = MAX(last_reported, ?)
+               WHERE incident_id = ?''',
+            ((best["latitude"] * n + lat) / (n + 1), (best["longitude"] * n + lon) / (n + 1),
+             reported_at, incident_id)
+        )
+    cur.execute("INSERT OR REPLACE INTO incident_member (eid, incident_id) VALUES (?, ?)", (eid, incident_id))
+    return incident_id
+
+def assign_incident(eid: int, location: str, lat: float, lon: float, text: str,
+                    similarity: Optional[Callable] = None) -> Optional[int]:
+    """Attach a newly stored emergency to an existing incident or open a new one.
+
+    Incidents active within INCIDENT_WINDOW_HOURS whose centroid lies within
+    INCIDENT_RADIUS_KM are candidates; when several qualify, text similarity
+    to their latest report breaks the tie.
+    """
+    radius_km = config.get("INCIDENT_RADIUS_KM", 1.0)
+    window_hours = config.get("INCIDENT_WINDOW_HOURS", 6)
+    conn = None
+    incident_id = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT timestamp FROM emergency WHERE eid = ?", (eid,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        incident_id = _assign(cur, eid, location, lat, lon, text, row["timestamp"],
+                              radius_km, window_hours, similarity or text_similarity)
+        conn.commit()
+    except sqlite3.Error as e:
+        st.error(f"Database error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+    return incident_id
+
+def rebuild_incidents(similarity: Optional[Callable] = None) -> Dict:
+    """Cluster every emergency not yet in an incident, oldest first"""
+    radius_km = config.get("INCIDENT_RADIUS_KM", 1.0)
+    window_hours = config.get("INCIDENT_WINDOW_HOURS", 6)
+    conn = get_db_connection()
+    assigned = 0
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            '''SELECT e.eid, e.location, e.latitude, e.longitude, e.text, e.timestamp
+               FROM emergency e LEFT JOIN incident_member m ON m.eid = e.eid
+               WHERE m.eid IS NULL AND e.latitude IS NOT NULL AND e.longitude IS NOT NULL
+               ORDER BY e.timestamp, e.eid'''
+        )
+        pending = cur.fetchall()
+        for row in pending:
+            _assign(cur, row["eid"], row["location"], row["latitude"], row["longitude"], row["text"],
+                    row["timestamp"], radius_km, window_hours, similarity or text_similarity)
+            assigned += 1
+        conn.commit()
+        cur.execute("SELECT COUNT(*) FROM incident")
+        incidents = cur.fetchone()[0]
+    finally:
+        conn.close()
+    return {"assigned": assigned, "incidents": incidents}
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Cluster emergency reports into incidents")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="Cluster all emergencies that have no incident yet")
+    parser.parse_args(argv)
+
+    from modules.database import init_db
+    init_db()
+    print(json.dumps(rebuild_incidents(), indent=2))
+
+if __name__ == "__main__":
+    main()
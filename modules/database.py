@@ -1,19 +1,100 @@
+import functools
+import re
 import sqlite3
+import time
 import streamlit as st
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from config import config
-from modules.utils import haversine
+from modules.utils import haversine, bounding_box
+from modules.metrics import timer
+from modules import querylog
+
+# Tables with an R*Tree spatial index, mapped to their primary key column
+SPATIAL_TABLES = {
+    "emergency": "eid",
+    "resource": "resourceid",
+    "incident": "incident_id"
+}
+
+# Tables with an FTS5 full-text index, mapped to their primary key and indexed columns
+FTS_TABLES = {
+    "emergency": ("eid", ("text", "location"))
+}
+
+# Incident columns as shown to users: the incident plus the text of its latest report
+INCIDENT_COLUMNS = '''i.*,
+            i.last_reported AS timestamp,
+            (SELECT e.text FROM incident_member m JOIN emergency e ON e.eid = m.eid
+             WHERE m.incident_id = i.incident_id ORDER BY e.eid DESC LIMIT 1) AS text'''
+
+# Volunteer columns other than the password hash
+VOLUNTEER_COLUMNS = "id, name, email, location, latitude, longitude, speciality, phone, timestamp"
+
+# Tables recorded in the change feed, mapped to their primary key and the query reading changed rows
+CHANGE_TABLES = {
+    "emergency": ("eid", "SELECT * FROM emergency"),
+    "resource": ("resourceid", "SELECT * FROM resource"),
+    "incident": ("incident_id", f"SELECT {INCIDENT_COLUMNS} FROM incident i"),
+    "volunteer": ("id", f"SELECT {VOLUNTEER_COLUMNS} FROM volunteer")
+}
+
+# Secondary B-tree indexes per table (dropped and rebuilt around bulk loads)
+INDEXES = {
+    "emergency": {
+        "idx_emergency_timestamp": "CREATE INDEX IF NOT EXISTS idx_emergency_timestamp ON emergency (timestamp)",
+        "idx_emergency_type_time": "CREATE INDEX IF NOT EXISTS idx_emergency_type_time ON emergency (emergency_type, timestamp)",
+        "idx_emergency_severity_time": "CREATE INDEX IF NOT EXISTS idx_emergency_severity_time ON emergency (severity, timestamp)"
+    },
+    "emergency_entity": {
+        "idx_emergency_entity_eid": "CREATE INDEX IF NOT EXISTS idx_emergency_entity_eid ON emergency_entity (eid)",
+        "idx_emergency_entity_value": "CREATE INDEX IF NOT EXISTS idx_emergency_entity_value ON emergency_entity (label, value)"
+    },
+    "resource": {
+        "idx_resource_created_by": "CREATE INDEX IF NOT EXISTS idx_resource_created_by ON resource (created_by)",
+        "idx_resource_amenity": "CREATE INDEX IF NOT EXISTS idx_resource_amenity ON resource (amenity)"
+    },
+    "emergency_image": {
+        "idx_emergency_image_eid": "CREATE INDEX IF NOT EXISTS idx_emergency_image_eid ON emergency_image (eid)",
+        "idx_emergency_image_timestamp": "CREATE INDEX IF NOT EXISTS idx_emergency_image_timestamp ON emergency_image (timestamp)"
+    },
+    "incident": {
+        "idx_incident_last_reported": "CREATE INDEX IF NOT EXISTS idx_incident_last_reported ON incident (last_reported)",
+        "idx_incident_member_incident": "CREATE INDEX IF NOT EXISTS idx_incident_member_incident ON incident_member (incident_id)"
+    }
+}
+# Names of the functions below that are served by the configured storage backend
+STORAGE_CONTRACT = []
+
+def storage_backed(func):
+    """Serve a database function from the storage backend selected by DB_BACKEND.
+
+    The decorated body is the SQLite implementation; other backends provide a
+    method of the same name (see modules.storage).
+    """
+    operation = f"db.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with timer(operation):
+            if config.get("DB_BACKEND", "sqlite") == "sqlite":
+                return func(*args, **kwargs)
+            from modules.storage import get_storage
+            return getattr(get_storage(), func.__name__)(*args, **kwargs)
+    STORAGE_CONTRACT.append(func.__name__)
+    return wrapper
+
 '''
 def get_db_path():
     # This will use the DB path from secrets but make it work in Streamlit Cloud's writeable directory
     db_name = os.path.basename(st.secrets["database"]["DB_PATH"])
     return db_name
 '''
-def init_db():
+@storage_backed
+def init_db(db_path: str = None):
     """Initialize database with tables if they don't exist"""
     conn = None
     try:
-        conn = sqlite3.connect(config["DB_PATH"])
+        conn = sqlite3.connect(db_path or config["DB_PATH"])
         #conn = sqlite3.connect(get_db_path())
         cursor = conn.cursor()
 
@@ -24,6 +105,32 @@ def init_db():
                       latitude REAL,
                       longitude REAL,
                       text TEXT,
+                      timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                      emergency_type TEXT,
+                      confidence REAL,
+                      severity TEXT)''')
+        # Classification columns were added after the first release
+        add_missing_columns(cursor, "emergency", {
+            "emergency_type": "TEXT",
+            "confidence": "REAL",
+            "severity": "TEXT"
+        })
+
+        # Create table of entities extracted from each emergency report
+        cursor.execute('''CREATE TABLE IF NOT EXISTS emergency_entity
+                     (eid INTEGER,
+                      label TEXT,
+                      value TEXT)''')
+
+        # Create table of photos attached to reports (thumbnail and perceptual hash only)
+        cursor.execute('''CREATE TABLE IF NOT EXISTS emergency_image
+                     (image_id INTEGER PRIMARY KEY,
+                      eid INTEGER,
+                      phash INTEGER,
+                      width INTEGER,
+                      height INTEGER,
+                      original_bytes INTEGER,
+                      thumbnail BLOB,
                       timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
 
         # Create resource table
@@ -49,6 +156,82 @@ def init_db():
                       phone TEXT,
                       timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
 
+        # Create incident tables (clusters of reports of the same emergency)
+        cursor.execute('''CREATE TABLE IF NOT EXISTS incident
+                     (incident_id INTEGER PRIMARY KEY,
+                      location TEXT,
+                      latitude REAL,
+                      longitude REAL,
+                      report_count INTEGER DEFAULT 1,
+                      first_reported DATETIME DEFAULT CURRENT_TIMESTAMP,
+                      last_reported DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+
+        cursor.execute('''CREATE TABLE IF NOT EXISTS incident_member
+                     (eid INTEGER PRIMARY KEY,
+                      incident_id INTEGER)''')
+
+        # Create change feed table (one row per write to a CHANGE_TABLES table)
+        cursor.execute('''CREATE TABLE IF NOT EXISTS change_log
+                     (seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                      table_name TEXT,
+                      row_id INTEGER,
+                      op TEXT,
+                      timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+
+        # Create geocoding cache table
+        cursor.execute('''CREATE TABLE IF NOT EXISTS geocode_cache
+                     (query TEXT PRIMARY KEY,
+                      latitude REAL,
+                      longitude REAL,
+                      timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+
+        # Create first-aid guidance cache table (one canonical answer per disaster type and severity)
+        cursor.execute('''CREATE TABLE IF NOT EXISTS first_aid_guidance
+                     (disaster_type TEXT,
+                      severity TEXT,
+                      guidance TEXT,
+                      timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                      PRIMARY KEY (disaster_type, severity))''')
+
+        # Create table of when each periodic maintenance task last ran (modules.retention)
+        cursor.execute('''CREATE TABLE IF NOT EXISTS maintenance
+                     (task TEXT PRIMARY KEY,
+                      last_run DATETIME)''')
+
+        # Create table of roads closed by flooding or debris (modules.routing)
+        cursor.execute('''CREATE TABLE IF NOT EXISTS road_block
+                     (block_id INTEGER PRIMARY KEY,
+                      latitude REAL,
+                      longitude REAL,
+                      radius_m REAL,
+                      reason TEXT,
+                      created_by INTEGER,
+                      timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                      expires DATETIME)''')
+
+        # Create spatial and secondary indexes
+        for table, key in SPATIAL_TABLES.items():
+            is_new = not table_exists(cursor, f"{table}_rtree")
+            cursor.execute(spatial_index_ddl(table))
+            for statement in spatial_trigger_ddl(table, key):
+                cursor.execute(statement)
+            if is_new:
+                # Index rows that were stored before the spatial index existed
+                rebuild_spatial_index(cursor, table)
+        for table, (key, _) in CHANGE_TABLES.items():
+            for statement in change_trigger_ddl(table, key):
+                cursor.execute(statement)
+        for table in FTS_TABLES:
+            is_new = not table_exists(cursor, f"{table}_fts")
+            cursor.execute(fts_index_ddl(table))
+            for statement in fts_trigger_ddl(table):
+                cursor.execute(statement)
+            if is_new:
+                cursor.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+        for table_indexes in INDEXES.values():
+            for statement in table_indexes.values():
+                cursor.execute(statement)
+
         conn.commit()
     except sqlite3.Error as e:
         st.error(f"Database error: {e}")
@@ -56,9 +239,113 @@ def init_db():
         if conn:
             conn.close()
 
-def get_db_connection():
+def table_exists(cursor, name: str) -> bool:
+    """Check whether a table (or virtual table) exists"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cursor.fetchone() is not None
+
+def add_missing_columns(cursor, table: str, columns: Dict[str, str]):
+    """Add columns (name -> SQL type) that an existing table does not have yet"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, sql_type in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+
+def spatial_index_ddl(table: str) -> str:
+    """DDL for the R*Tree holding the bounding box of each row of a table"""
+    return f'''CREATE VIRTUAL TABLE IF NOT EXISTS {table}_rtree
+                  USING rtree(id, min_lat, max_lat, min_lon, max_lon)'''
+
+def spatial_trigger_ddl(table: str, key: str) -> List[str]:
+    """DDL for the triggers keeping a table's R*Tree in sync with its rows"""
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_rtree_ai AFTER INSERT ON {table}
+            WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+            BEGIN
+                INSERT INTO {table}_rtree (id, min_lat, max_lat, min_lon, max_lon)
+                VALUES (NEW.{key}, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_rtree_au AFTER UPDATE OF latitude, longitude ON {table}
+            BEGIN
+                DELETE FROM {table}_rtree WHERE id = OLD.{key};
+                INSERT INTO {table}_rtree (id, min_lat, max_lat, min_lon, max_lon)
+                SELECT NEW.{key}, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+                WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_rtree_ad AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM {table}_rtree WHERE id = OLD.{key};
+            END'''
+    ]
+
+def rebuild_spatial_index(cursor, table: str, after_id: int = 0):
+    """Add R*Tree entries for all rows of a table with a primary key above after_id"""
+    key = SPATIAL_TABLES[table]
+    cursor.execute(
+        f'''INSERT OR REPLACE INTO {table}_rtree (id, min_lat, max_lat, min_lon, max_lon)
+            SELECT {key}, latitude, latitude, longitude, longitude
+            FROM {table}
+            WHERE {key} > ? AND latitude IS NOT NULL AND longitude IS NOT NULL''',
+        (after_id,)
+    )
+
+def change_trigger_ddl(table: str, key: str) -> List[str]:
+    """DDL for the triggers appending a table's writes to the change feed"""
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_changes_{suffix} AFTER {event} ON {table}
+            BEGIN
+                INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', {ref}.{key}, '{op}');
+            END'''
+        for suffix, event, ref, op in (
+            ("ai", "INSERT", "NEW", "insert"),
+            ("au", "UPDATE", "NEW", "update"),
+            ("ad", "DELETE", "OLD", "delete")
+        )
+    ]
+
+def fts_index_ddl(table: str) -> str:
+    """DDL for the external-content FTS5 index over a table's text columns"""
+    key, columns = FTS_TABLES[table]
+    return f'''CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts
+                  USING fts5({", ".join(columns)}, content='{table}', content_rowid='{key}',
+                             tokenize='porter unicode61')'''
+
+def fts_trigger_ddl(table: str) -> List[str]:
+    """DDL for the triggers keeping a table's FTS5 index in sync with its rows"""
+    key, columns = FTS_TABLES[table]
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"NEW.{c}" for c in columns)
+    old_values = ", ".join(f"OLD.{c}" for c in columns)
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {table}_fts (rowid, {cols}) VALUES (NEW.{key}, {new_values});
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {cols}) VALUES ('delete', OLD.{key}, {old_values});
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF {cols} ON {table}
+            BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {cols}) VALUES ('delete', OLD.{key}, {old_values});
+                INSERT INTO {table}_fts (rowid, {cols}) VALUES (NEW.{key}, {new_values});
+            END'''
+    ]
+
+def rebuild_fts_index(cursor, table: str, after_id: int = 0):
+    """Add FTS5 entries for all rows of a table with a primary key above after_id"""
+    key, columns = FTS_TABLES[table]
+    cols = ", ".join(columns)
+    cursor.execute(
+        f'''INSERT INTO {table}_fts (rowid, {cols})
+            SELECT {key}, {cols} FROM {table} WHERE {key} > ?''',
+        (after_id,)
+    )
+
+def get_db_connection(db_path: str = None):
     """Get database connection with proper configuration"""
-    conn = sqlite3.connect(config["DB_PATH"], check_same_thread=False)
+    conn = sqlite3.connect(db_path or config["DB_PATH"], check_same_thread=False)
     conn.row_factory = sqlite3.Row
     conn.create_function("HAVERSINE", 4, haversine)
     return conn
@@ -67,16 +354,21 @@ def execute_query(query: str, params: tuple = (), commit: bool = True) -> List[D
     """Execute a database query with proper connection handling"""
     conn = None
     results = []
+    profiling = querylog.is_enabled()
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(query, params)
+        with timer("sqlite.execute_query"):
+            conn = get_db_connection()
+            cur = conn.cursor()
+            started = time.perf_counter()
+            cur.execute(query, params)
 
-        if query.strip().upper().startswith("SELECT"):
-            results = [dict(row) for row in cur.fetchall()]
+            if query.strip().upper().startswith("SELECT"):
+                results = [dict(row) for row in cur.fetchall()]
 
-        if commit:
-            conn.commit()
+            if commit:
+                conn.commit()
+            if profiling:
+                querylog.record_query(conn, query, params, len(results), time.perf_counter() - started)
     except sqlite3.Error as e:
         st.error(f"Database error: {e}")
         if conn and commit:
@@ -86,46 +378,472 @@ def execute_query(query: str, params: tuple = (), commit: bool = True) -> List[D
             conn.close()
     return results
 
-def add_emergency(location: str, lat: float, lon: float, text: str):
-    """Add new emergency to database"""
+def execute_insert(query: str, params: tuple = ()):
+    """Execute an INSERT and return the new row id (None on failure)"""
+    conn = None
+    row_id = None
+    try:
+        with timer("sqlite.execute_insert"):
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute(query, params)
+            conn.commit()
+            row_id = cur.lastrowid
+    except sqlite3.Error as e:
+        st.error(f"Database error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+    return row_id
+
+@storage_backed
+def add_emergency(location: str, lat: float, lon: float, text: str,
+                  emergency_type: Optional[str] = None, confidence: Optional[float] = None,
+                  severity: Optional[str] = None, entities: Optional[Dict[str, List[str]]] = None,
+                  cluster: bool = True):
+    """Add new emergency to database with its classification, and attach it to an incident"""
+    if config.get("WRITE_BATCHING", False):
+        from modules.ingest import ingest_emergency
+        return ingest_emergency(location, lat, lon, text, emergency_type, confidence, severity, entities, cluster)
+
+    eid = execute_insert(
+        '''INSERT INTO emergency (location, latitude, longitude, text, emergency_type, confidence, severity)
+           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+        (location, lat, lon, text, emergency_type, confidence, severity)
+    )
+    if eid and entities:
+        store_emergency_entities({eid: entities})
+    if eid and cluster:
+        from modules.clustering import assign_incident
+        assign_incident(eid, location, lat, lon, text)
+    return eid
+
+@storage_backed
+def get_cached_locations(queries: List[str]) -> Dict[str, tuple]:
+    """Get cached (lat, lon) for normalized location queries"""
+    cached = {}
+    queries = list(queries)
+    # Stay well below SQLite's bound parameter limit
+    for start in range(0, len(queries), 500):
+        batch = queries[start:start + 500]
+        rows = execute_query(
+            f'''SELECT query, latitude, longitude FROM geocode_cache
+                WHERE query IN ({", ".join("?" for _ in batch)})''',
+            tuple(batch),
+            commit=False
+        )
+        for row in rows:
+            cached[row["query"]] = (row["latitude"], row["longitude"])
+    return cached
+
+@storage_backed
+def cache_locations(locations: Dict[str, tuple]):
+    """Store geocoded (lat, lon) for normalized location queries"""
+    if not locations:
+        return
+    conn = None
+    try:
+        conn = get_db_connection()
+        conn.executemany(
+            '''INSERT OR REPLACE INTO geocode_cache (query, latitude, longitude)
+               VALUES (?, ?, ?)''',
+            [(query, lat, lon) for query, (lat, lon) in locations.items()]
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        st.error(f"Database error: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+@storage_backed
+def get_cached_guidance(disaster_type: str, severity: str, max_age_hours: float) -> Optional[str]:
+    """Get cached first-aid guidance no older than max_age_hours, or None"""
+    rows = execute_query(
+        '''SELECT guidance FROM first_aid_guidance
+           WHERE disaster_type = ? AND severity = ? AND timestamp >= datetime('now', ?)''',
+        (disaster_type, severity, f"-{int(max_age_hours * 3600)} seconds"),
+        commit=False
+    )
+    return rows[0]["guidance"] if rows else None
+
+@storage_backed
+def cache_guidance(disaster_type: str, severity: str, guidance: str):
+    """Store canonical first-aid guidance for a disaster type and severity"""
+    execute_query(
+        '''INSERT OR REPLACE INTO first_aid_guidance (disaster_type, severity, guidance)
+           VALUES (?, ?, ?)''',
+        (disaster_type, severity, guidance)
+    )
+
+def entity_rows(entities_by_eid: Dict[int, Dict[str, List[str]]]) -> List[tuple]:
+    """Flatten entities (eid -> {label: [values]}) into normalized emergency_entity rows"""
+    return [
+        (eid, label, value.strip().lower())
+        for eid, entities in entities_by_eid.items()
+        for label, values in entities.items()
+        for value in dict.fromkeys(values)
+    ]
+
+@storage_backed
+def store_emergency_entities(entities_by_eid: Dict[int, Dict[str, List[str]]]):
+    """Replace the stored entities of emergencies (eid -> {label: [values]})"""
+    rows = entity_rows(entities_by_eid)
+    conn = None
+    try:
+        conn = get_db_connection()
+        conn.executemany("DELETE FROM emergency_entity WHERE eid = ?", [(eid,) for eid in entities_by_eid])
+        conn.executemany("INSERT INTO emergency_entity (eid, label, value) VALUES (?, ?, ?)", rows)
+        conn.commit()
+    except sqlite3.Error as e:
+        st.error(f"Database error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+
+@storage_backed
+def get_unclassified_emergencies(after_eid: int = 0, limit: int = 64) -> List[Dict]:
+    """Get (eid, text) of emergencies without a stored emergency_type, oldest first after after_eid"""
+    return execute_query(
+        '''SELECT eid, text FROM emergency
+           WHERE emergency_type IS NULL AND eid > ?
+           ORDER BY eid LIMIT ?''',
+        (after_eid, limit),
+        commit=False
+    )
+
+@storage_backed
+def update_emergency_classification(rows: List[tuple]):
+    """Set (emergency_type, confidence, severity) for emergencies, given as (type, confidence, severity, eid)"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        conn.executemany(
+            '''UPDATE emergency SET emergency_type = ?, confidence = ?, severity = ?
+               WHERE eid = ?''',
+            rows
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        st.error(f"Database error: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+
+@storage_backed
+def append_emergency_text(eid: int, text: str):
+    """Add text to the end of a stored report (a photo description that arrived after it was submitted)"""
+    return execute_query("UPDATE emergency SET text = COALESCE(text, '') || ? WHERE eid = ?", (text, eid))
+
+@storage_backed
+def add_emergency_image(eid: int, phash: int, width: int, height: int, original_bytes: int, thumbnail: bytes):
+    """Attach a photo's thumbnail and perceptual hash to a report"""
+    return execute_insert(
+        '''INSERT INTO emergency_image (eid, phash, width, height, original_bytes, thumbnail)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        (eid, phash, width, height, original_bytes, thumbnail)
+    )
+
+@storage_backed
+def get_recent_image_hashes(hours: float = 72):
+    """Perceptual hashes of photos attached in the last hours, with their report"""
+    return execute_query(
+        '''SELECT i.eid, i.phash, e.location, e.timestamp
+           FROM emergency_image i JOIN emergency e ON e.eid = i.eid
+           WHERE i.timestamp >= datetime('now', ?)''',
+        (f"-{int(hours * 3600)} seconds",),
+        commit=False
+    )
+
+@storage_backed
+def get_emergency_images(limit: int = 12):
+    """Latest report photos (thumbnails) with their report"""
+    return execute_query(
+        '''SELECT i.image_id, i.eid, i.thumbnail, i.timestamp, e.location, e.emergency_type
+           FROM emergency_image i JOIN emergency e ON e.eid = i.eid
+           ORDER BY i.image_id DESC LIMIT ?''',
+        (limit,),
+        commit=False
+    )
+
+@storage_backed
+def query_emergencies(emergency_types: Optional[List[str]] = None, severities: Optional[List[str]] = None,
+                      since_hours: Optional[float] = None, entity: Optional[tuple] = None,
+                      limit: int = 1000):
+    """Filter emergencies on stored classification, e.g. critical floods in the last 6 hours.
+
+    entity is an optional (label, value) pair such as ("victim_condition", "trapped").
+    """
+    clauses, params = [], []
+    if emergency_types:
+        clauses.append(f"emergency_type IN ({', '.join('?' for _ in emergency_types)})")
+        params.extend(emergency_types)
+    if severities:
+        clauses.append(f"severity IN ({', '.join('?' for _ in severities)})")
+        params.extend(severities)
+    if since_hours is not None:
+        clauses.append("timestamp >= datetime('now', ?)")
+        params.append(f"-{float(since_hours)} hours")
+    if entity:
+        clauses.append('''eid IN (SELECT eid FROM emergency_entity WHERE label = ? AND value = ?)''')
+        params.extend([entity[0], entity[1].lower()])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return execute_query(
+        f"SELECT * FROM emergency {where} ORDER BY timestamp DESC LIMIT ?",
+        tuple(params) + (limit,)
+    )
+
+def fts_query(text: str) -> str:
+    """Turn free user input into a safe FTS5 query.
+
+    Words are matched as terms (the last one as a prefix, for search-as-you-type)
+    and "quoted text" as a phrase; FTS5 operators in the input are not interpreted.
+    """
+    tokens = re.findall(r'"[^"]+"|[^\s"]+', text)
+    terms = []
+    for i, token in enumerate(tokens):
+        phrase = token.startswith('"')
+        term = '"' + token.strip('"').replace('"', '""') + '"'
+        if i == len(tokens) - 1 and not phrase:
+            term += "*"
+        terms.append(term)
+    return " ".join(terms)
+
+@storage_backed
+def search_emergencies(text: str, limit: int = 20, offset: int = 0):
+    """Full-text search over emergency reports and locations, best matches first.
+
+    Each result carries a snippet with matching terms in **bold**.
+    """
+    query = fts_query(text)
+    if not query:
+        return []
+    return execute_query(
+        '''SELECT e.*,
+            snippet(emergency_fts, -1, '**', '**', '…', 16) AS snippet,
+            bm25(emergency_fts) AS rank
+            FROM emergency_fts
+            JOIN emergency e ON e.eid = emergency_fts.rowid
+            WHERE emergency_fts MATCH ?
+            ORDER BY rank
+            LIMIT ? OFFSET ?''',
+        (query, limit, offset)
+    )
+
+@storage_backed
+def get_emergency_type_counts():
+    """Count emergencies per stored emergency type"""
     return execute_query(
-        '''INSERT INTO emergency (location, latitude, longitude, text)
-           VALUES (?, ?, ?, ?)''',
-        (location, lat, lon, text)
+        '''SELECT COALESCE(emergency_type, 'unclassified') AS emergency_type, COUNT(*) AS count
+           FROM emergency
+           GROUP BY emergency_type
+           ORDER BY count DESC'''
     )
 
-def get_nearest_emergencies(user_lat: float, user_lon: float, max_km=10, limit=10):
-    """Get nearest emergencies to location"""
+def since_clause(column: str, since_hours: Optional[float]) -> Tuple[str, tuple]:
+    """SQL condition (with its parameters) keeping rows whose column is within since_hours of now"""
+    if since_hours is None:
+        return "", ()
+    return f"AND {column} >= datetime('now', ?)", (f"-{float(since_hours)} hours",)
+
+@storage_backed
+def get_nearest_emergencies(user_lat: float, user_lon: float, max_km=10, limit=10,
+                            since_hours: Optional[float] = None):
+    """Get nearest emergencies to location, optionally only those reported in the last since_hours"""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(user_lat, user_lon, max_km)
+    since, since_params = since_clause("e.timestamp", since_hours)
     return execute_query(
-        f'''SELECT *, 
-            HAVERSINE(?, ?, latitude, longitude) AS distance
-            FROM emergency
-            WHERE HAVERSINE(?, ?, latitude, longitude) <= ?
+        f'''SELECT e.*,
+            HAVERSINE(?, ?, e.latitude, e.longitude) AS distance
+            FROM emergency_rtree r
+            JOIN emergency e ON e.eid = r.id
+            WHERE r.max_lat >= ? AND r.min_lat <= ?
+              AND r.max_lon >= ? AND r.min_lon <= ?
+              AND HAVERSINE(?, ?, e.latitude, e.longitude) <= ?
+              {since}
             ORDER BY distance
             LIMIT ?''',
-        (user_lat, user_lon, user_lat, user_lon, max_km, limit)
+        (user_lat, user_lon, min_lat, max_lat, min_lon, max_lon,
+         user_lat, user_lon, max_km, *since_params, limit)
     )
 
-def add_resource(amenity: str, name: str, lat: float, lon: float, created_by: int):
-    """Add new resource to database"""
+@storage_backed
+def get_nearest_incidents(user_lat: float, user_lon: float, max_km=10, limit=10,
+                          since_hours: Optional[float] = None):
+    """Get nearest incidents to location, with the text of their latest report.
+
+    With since_hours, only incidents with a report in the last since_hours.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(user_lat, user_lon, max_km)
+    since, since_params = since_clause("i.last_reported", since_hours)
+    return execute_query(
+        f'''SELECT {INCIDENT_COLUMNS},
+            HAVERSINE(?, ?, i.latitude, i.longitude) AS distance
+            FROM incident_rtree r
+            JOIN incident i ON i.incident_id = r.id
+            WHERE r.max_lat >= ? AND r.min_lat <= ?
+              AND r.max_lon >= ? AND r.min_lon <= ?
+              AND HAVERSINE(?, ?, i.latitude, i.longitude) <= ?
+              {since}
+            ORDER BY distance
+            LIMIT ?''',
+        (user_lat, user_lon, min_lat, max_lat, min_lon, max_lon,
+         user_lat, user_lon, max_km, *since_params, limit)
+    )
+
+@storage_backed
+def get_incidents(limit: int = None):
+    """Get all incidents, most recently reported first"""
     return execute_query(
+        f'''SELECT {INCIDENT_COLUMNS}
+            FROM incident i
+            ORDER BY i.last_reported DESC
+            LIMIT ?''',
+        (limit if limit is not None else -1,)
+    )
+
+@storage_backed
+def get_latest_change_seq() -> int:
+    """Get the sequence number of the most recent write in the change feed"""
+    rows = execute_query("SELECT COALESCE(MAX(seq), 0) AS seq FROM change_log", commit=False)
+    return rows[0]["seq"] if rows else 0
+
+@storage_backed
+def get_changes_since(seq: int, tables: Optional[List[str]] = None, limit: int = 1000) -> Dict:
+    """Get writes made after seq, with the current version of each changed row.
+
+    Returns {"seq": new high-water mark, "changes": [...], "reset": bool}. Each
+    change has table, op ("insert", "update" or "delete"), row_id and row (None
+    for deletes); several writes to one row collapse into its latest state, with
+    op "insert" if the row was created since seq. Rows both created and deleted
+    since seq are left out.
+    "reset" is set after a bulk load or when more than limit writes are
+    pending, in which case callers should reload instead of patching.
+    """
+    tables = tables or list(CHANGE_TABLES)
+    log = execute_query(
+        f'''SELECT seq, table_name, row_id, op FROM change_log
+            WHERE seq > ? AND table_name IN ({", ".join("?" for _ in tables)})
+            ORDER BY seq
+            LIMIT ?''',
+        (seq, *tables, limit + 1),
+        commit=False
+    )
+    if not log:
+        return {"seq": seq, "changes": [], "reset": False}
+    if len(log) > limit or any(entry["op"] == "bulk" for entry in log):
+        return {"seq": get_latest_change_seq(), "changes": [], "reset": True}
+
+    latest, inserted = {}, set()
+    for entry in log:
+        latest[(entry["table_name"], entry["row_id"])] = entry
+        if entry["op"] == "insert":
+            inserted.add((entry["table_name"], entry["row_id"]))
+
+    rows = {}
+    for table in tables:
+        ids = [row_id for (t, row_id), entry in latest.items() if t == table and entry["op"] != "delete"]
+        if not ids:
+            continue
+        key, select = CHANGE_TABLES[table]
+        for row in execute_query(
+            f"SELECT * FROM ({select}) WHERE {key} IN ({', '.join('?' for _ in ids)})",
+            tuple(ids),
+            commit=False
+        ):
+            rows[(table, row[key])] = row
+
+    changes = []
+    for (table, row_id), entry in sorted(latest.items(), key=lambda item: item[1]["seq"]):
+        row = rows.get((table, row_id))
+        if row is None and (table, row_id) in inserted:
+            # Created and deleted since seq: the caller never saw the row
+            continue
+        if row is None:
+            op = "delete"
+        elif (table, row_id) in inserted:
+            op = "insert"
+        else:
+            op = "update"
+        changes.append({"seq": entry["seq"], "table": table, "op": op, "row_id": row_id, "row": row})
+    return {"seq": log[-1]["seq"], "changes": changes, "reset": False}
+
+@storage_backed
+def prune_change_log(keep_hours: float = 24, db_path: Optional[str] = None):
+    """Delete change feed entries older than keep_hours (errors are raised, for the maintenance task to retry)"""
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute(
+            "DELETE FROM change_log WHERE timestamp < datetime('now', ?)",
+            (f"{-float(keep_hours):+} hours",)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+@storage_backed
+def add_resource(amenity: str, name: str, lat: float, lon: float, created_by: int):
+    """Add new resource to database and return its id (None on failure)"""
+    if config.get("WRITE_BATCHING", False):
+        from modules.ingest import ingest_resource
+        return ingest_resource(amenity, name, lat, lon, created_by)
+
+    return execute_insert(
         '''INSERT INTO resource (amenity, name, latitude, longitude, created_by)
            VALUES (?, ?, ?, ?, ?)''',
         (amenity, name, lat, lon, created_by)
     )
 
+@storage_backed
 def get_nearest_resources(user_lat: float, user_lon: float, max_km=10, limit=10):
     """Get nearest resources to location"""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(user_lat, user_lon, max_km)
     return execute_query(
-        f'''SELECT *, 
-            HAVERSINE(?, ?, latitude, longitude) AS distance
-            FROM resource
-            WHERE HAVERSINE(?, ?, latitude, longitude) <= ?
+        '''SELECT res.*,
+            HAVERSINE(?, ?, res.latitude, res.longitude) AS distance
+            FROM resource_rtree r
+            JOIN resource res ON res.resourceid = r.id
+            WHERE r.max_lat >= ? AND r.min_lat <= ?
+              AND r.max_lon >= ? AND r.min_lon <= ?
+              AND HAVERSINE(?, ?, res.latitude, res.longitude) <= ?
             ORDER BY distance
             LIMIT ?''',
-        (user_lat, user_lon, user_lat, user_lon, max_km, limit)
+        (user_lat, user_lon, min_lat, max_lat, min_lon, max_lon,
+         user_lat, user_lon, max_km, limit)
+    )
+
+@storage_backed
+def add_road_block(lat: float, lon: float, radius_m: float, reason: str, created_by: Optional[int] = None,
+                   hours: Optional[float] = None):
+    """Close the roads within radius_m of a point, for hours (until removed when None)"""
+    return execute_insert(
+        '''INSERT INTO road_block (latitude, longitude, radius_m, reason, created_by, expires)
+           VALUES (?, ?, ?, ?, ?, CASE WHEN ? IS NULL THEN NULL ELSE datetime('now', ?) END)''',
+        (lat, lon, radius_m, reason, created_by, hours, f"{float(hours or 0):+} hours")
+    )
+
+@storage_backed
+def get_road_blocks():
+    """Road blocks that have not expired"""
+    return execute_query(
+        '''SELECT * FROM road_block
+           WHERE expires IS NULL OR expires > datetime('now')
+           ORDER BY block_id''',
+        commit=False
     )
 
+@storage_backed
+def remove_road_block(block_id: int):
+    """Reopen the roads of a road block"""
+    execute_query("DELETE FROM road_block WHERE block_id = ?", (block_id,))
+
+@storage_backed
 def register_volunteer(name: str, email: str, password: str, location: str,
                        lat: float, lon: float, speciality: str, phone: str):
     """Register new volunteer"""
@@ -159,6 +877,7 @@ def register_volunteer(name: str, email: str, password: str, location: str,
         return True, result[0]['id']
     return False, "Registration failed"
 
+@storage_backed
 def volunteer_login(email: str, password: str):
     """Login volunteer by email and password"""
     from modules.utils import hash_password
@@ -172,20 +891,15 @@ def volunteer_login(email: str, password: str):
         return False, "Invalid email or password"
     return True, volunteers[0]
 
+@storage_backed
 def get_volunteer_dashboard(volunteer_id: int):
-    """Get dashboard data for volunteer"""
+    """Get dashboard data for volunteer (nearby emergencies come from the live feed)"""
     # Get volunteer info
     volunteer = execute_query(
         'SELECT * FROM volunteer WHERE id = ?',
         (volunteer_id,)
     )[0]
 
-    # Get nearby emergencies
-    emergencies = get_nearest_emergencies(
-        volunteer['latitude'],
-        volunteer['longitude']
-    )
-
     # Get nearby resources
     resources = get_nearest_resources(
         volunteer['latitude'],
@@ -198,4 +912,54 @@ def get_volunteer_dashboard(volunteer_id: int):
         (volunteer_id,)
     )
 
-    return volunteer, emergencies, resources, my_resources
+    return volunteer, resources, my_resources
+
+@storage_backed
+def count_rows(table: str) -> int:
+    """Count the rows of emergency, resource, volunteer or incident"""
+    if table not in ("emergency", "resource", "volunteer", "incident"):
+        raise ValueError(f"Unknown table: {table}")
+    return execute_query(f"SELECT COUNT(*) as count FROM {table}")[0]["count"]
+
+@storage_backed
+def get_emergency_trend():
+    """Count emergencies per day"""
+    return execute_query('''
+        SELECT date(timestamp) as date, COUNT(*) as count
+        FROM emergency
+        GROUP BY date(timestamp)
+        ORDER BY date
+    ''')
+
+@storage_backed
+def get_resources(with_creator: bool = False):
+    """Get all resources, newest first, optionally with the name of the volunteer who added them"""
+    if not with_creator:
+        return execute_query("SELECT * FROM resource ORDER BY timestamp DESC")
+    return execute_query('''
+        SELECT r.*, v.name as added_by
+        FROM resource r
+        LEFT JOIN volunteer v ON r.created_by = v.id
+        ORDER BY r.timestamp DESC
+    ''')
+
+@storage_backed
+def get_volunteers():
+    """Get all volunteers, newest first (excluding password hash for security)"""
+    return execute_query('''
+        SELECT id, name, email, location, latitude, longitude, speciality, phone, timestamp
+        FROM volunteer
+        ORDER BY timestamp DESC
+    ''')
+
+@storage_backed
+def get_resource_counts_by_volunteer(limit: int = 10):
+    """Get the volunteers who added the most resources"""
+    return execute_query('''
+        SELECT v.name, COUNT(r.resourceid) as resource_count
+        FROM volunteer v
+        LEFT JOIN resource r ON v.id = r.created_by
+        GROUP BY v.id
+        ORDER BY resource_count DESC
+        LIMIT ?
+    ''', (limit,))
@@ -0,0 +1,258 @@
+"""Versioned entity pattern store, compiled into a spaCy pipeline on disk
+
+The entity patterns are ENTITY_PATTERNS (modules.models) plus the JSON lines
+files listed in ENTITY_PATTERN_FILES, one {"label": ..., "pattern": ...}
+object per line. Token patterns (lists) go to spaCy's entity ruler. Phrase
+patterns (strings, such as place names taken from the gazetteer) go to
+PhraseGazetteer, a phrase matcher that stores its patterns as lowercase
+token tuples. An entity ruler re-tokenizes every phrase each time a pipeline
+is loaded, while this table loads from JSON, so large gazetteers cost little
+at startup.
+
+The base model and both matchers are saved with nlp.to_disk under
+MODEL_CACHE_DIR, in a directory named after a hash of the patterns and
+settings. Every process loads that one prebuilt pipeline, and a changed
+pattern set compiles a new version.
+
+Usage:
+    python -m modules.entity_patterns from-gazetteer --min-population 50000 --out places.jsonl
+    python -m modules.entity_patterns compile
+    python -m modules.entity_patterns info
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional
+import spacy
+from spacy.language import Language
+from spacy.tokens import Doc, Span
+from config import config
+
+# Bumped when the compiled format of PhraseGazetteer changes
+GAZETTEER_FORMAT = 1
+
+class PhraseGazetteer:
+    """Case-insensitive phrase matcher for large name lists.
+
+    Each phrase is tokenized once, when it is added, and kept as its
+    tab-joined lowercase tokens, indexed by its first token. Matching takes the longest
+    phrase starting at each token. Matches never replace entities already
+    set by earlier components (the entity ruler) unless overwrite_ents is set.
+    """
+
+    def __init__(self, nlp: Language, name: str = "phrase_gazetteer", overwrite_ents: bool = False):
+        self.nlp = nlp
+        self.name = name
+        self.overwrite_ents = overwrite_ents
+        self.table = {}
+        self.max_length = 0
+
+    def __len__(self) -> int:
+        return sum(len(phrases) for phrases in self.table.values())
+
+    def _add(self, tokens: List[str], label: str, ent_id: str):
+        if tokens:
+            self.table.setdefault(tokens[0], {})["\t".join(tokens)] = [label, ent_id]
+            self.max_length = max(self.max_length, len(tokens))
+
+    def add_patterns(self, patterns: List[Dict]):
+        """Add {"label": ..., "pattern": "<phrase>", "id": ...} patterns"""
+        patterns = list(patterns)
+        docs = self.nlp.tokenizer.pipe(pattern["pattern"] for pattern in patterns)
+        for pattern, doc in zip(patterns, docs):
+            self._add([token.lower_ for token in doc], pattern["label"], pattern.get("id", ""))
+
+    def __call__(self, doc: Doc) -> Doc:
+        words = [token.lower_ for token in doc]
+        matches = []
+        start = 0
+        while start < len(words):
+            phrases = self.table.get(words[start])
+            length = 0
+            if phrases:
+                for size in range(min(self.max_length, len(words) - start), 0, -1):
+                    found = phrases.get("\t".join(words[start:start + size]))
+                    if found:
+                        length = size
+                        label, ent_id = found
+                        matches.append(Span(doc, start, start + size, label=label, span_id=ent_id))
+                        break
+            start += length or 1
+        if matches:
+            existing = [] if self.overwrite_ents else list(doc.ents)
+            taken = {i for span in existing for i in range(span.start, span.end)}
+            kept = [span for span in matches if not taken.intersection(range(span.start, span.end))]
+            if self.overwrite_ents:
+                kept += [span for span in doc.ents
+                         if not any(m.start < span.end and span.start < m.end for m in matches)]
+            doc.ents = sorted(existing + kept, key=lambda span: span.start)
+        return doc
+
+    def to_disk(self, path, exclude=()):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "phrases.json"), "w", encoding="utf-8") as f:
+            json.dump({"format": GAZETTEER_FORMAT, "max_length": self.max_length, "table": self.table},
+                      f, ensure_ascii=False)
+
+    def from_disk(self, path, exclude=()):
+        # The table is stored as it is used, so loading is a single json.load
+        with open(os.path.join(path, "phrases.json"), encoding="utf-8") as f:
+            data = json.load(f)
+        self.table, self.max_length = data["table"], data["max_length"]
+        return self
+
+@Language.factory("phrase_gazetteer", default_config={"overwrite_ents": False})
+def make_phrase_gazetteer(nlp: Language, name: str, overwrite_ents: bool) -> PhraseGazetteer:
+    return PhraseGazetteer(nlp, name, overwrite_ents)
+
+def read_pattern_file(path: str) -> List[Dict]:
+    """Read entity ruler patterns from a JSON lines file"""
+    patterns = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            pattern = json.loads(line)
+            if not isinstance(pattern.get("label"), str) or not isinstance(pattern.get("pattern"), (str, list)):
+                raise ValueError(f"{path}:{number}: expected {{\"label\": str, \"pattern\": str or list}}")
+            patterns.append(pattern)
+    return patterns
+
+def load_patterns(files: Optional[List[str]] = None) -> List[Dict]:
+    """The built-in patterns followed by those of every pattern file"""
+    from modules.models import ENTITY_PATTERNS
+
+    patterns = list(ENTITY_PATTERNS)
+    for path in config.get("ENTITY_PATTERN_FILES", []) if files is None else files:
+        patterns.extend(read_pattern_file(path))
+    return patterns
+
+def patterns_version(patterns: List[Dict], base_model: str, exclude: List[str]) -> str:
+    """Short hash identifying a compiled pipeline"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        "model": base_model,
+        "exclude": sorted(exclude),
+        "spacy": spacy.__version__,
+        "gazetteer_format": GAZETTEER_FORMAT
+    }, sort_keys=True).encode("utf-8"))
+    for pattern in patterns:
+        digest.update(json.dumps(pattern, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+def build_pipeline(base_model: str, patterns: List[Dict], exclude: List[str] = ()):
+    """Load the base model (or "blank:<lang>") and add the entity ruler and phrase gazetteer"""
+    if base_model.startswith("blank:"):
+        nlp = spacy.blank(base_model.split(":", 1)[1])
+    else:
+        nlp = spacy.load(base_model, exclude=list(exclude))
+    # Both run before the statistical NER, so that rule matches take precedence
+    before = "ner" if "ner" in nlp.pipe_names else None
+    tokens = [pattern for pattern in patterns if not isinstance(pattern["pattern"], str)]
+    if "entity_ruler" in nlp.pipe_names:
+        nlp.get_pipe("entity_ruler").add_patterns(tokens)
+    elif tokens:
+        nlp.add_pipe("entity_ruler", before=before).add_patterns(tokens)
+    phrases = [pattern for pattern in patterns if isinstance(pattern["pattern"], str)]
+    if phrases:
+        nlp.add_pipe("phrase_gazetteer", before=before).add_patterns(phrases)
+    return nlp
+
+def compile_pipeline(patterns: Optional[List[Dict]] = None, base_model: Optional[str] = None,
+                     exclude: Optional[List[str]] = None, force: bool = False) -> str:
+    """Save the base model with its entity ruler to disk, unless this version already is"""
+    from modules.models import model_cache_path
+
+    patterns = load_patterns() if patterns is None else patterns
+    base_model = base_model or config["SPACY_MODEL"]
+    exclude = config.get("SPACY_EXCLUDE", []) if exclude is None else exclude
+    path = model_cache_path(base_model, f"ruler-{patterns_version(patterns, base_model, exclude)}")
+    if os.path.isdir(path) and not force:
+        return path
+
+    staging = f"{path}.tmp{os.getpid()}"
+    build_pipeline(base_model, patterns, exclude).to_disk(staging)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    try:
+        os.replace(staging, path)
+    except OSError:
+        # Another process compiled the same version first
+        shutil.rmtree(staging, ignore_errors=True)
+    return path
+
+def load_pipeline(patterns: Optional[List[Dict]] = None, base_model: Optional[str] = None,
+                  exclude: Optional[List[str]] = None):
+    """Load the compiled pipeline for the current patterns, compiling it on first use"""
+    return spacy.load(compile_pipeline(patterns, base_model, exclude))
+
+def patterns_from_gazetteer(db_path: Optional[str] = None, min_population: int = 0,
+                            label: str = "GPE") -> Iterator[Dict]:
+    """Phrase patterns for the place names in the offline gazetteer, most populous first"""
+    conn = sqlite3.connect(db_path or config.get("GAZETTEER_DB", "gazetteer.db"))
+    try:
+        seen = set()
+        rows = conn.execute(
+            "SELECT id, name FROM place WHERE population >= ? ORDER BY population DESC",
+            (min_population,)
+        )
+        for place_id, name in rows:
+            if name.lower() not in seen:
+                seen.add(name.lower())
+                yield {"label": label, "pattern": name, "id": f"geonames:{place_id}"}
+    finally:
+        conn.close()
+
+def write_pattern_file(patterns: Iterator[Dict], path: str) -> int:
+    """Write patterns as JSON lines, returning how many were written"""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for pattern in patterns:
+            f.write(json.dumps(pattern, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Entity pattern store")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gazetteer = commands.add_parser("from-gazetteer", help="Write place names from the gazetteer as phrase patterns")
+    gazetteer.add_argument("--out", required=True)
+    gazetteer.add_argument("--db", default=None)
+    gazetteer.add_argument("--min-population", type=int, default=0)
+    gazetteer.add_argument("--label", default="GPE")
+
+    compile_command = commands.add_parser("compile", help="Compile the pipeline for the configured patterns")
+    compile_command.add_argument("--force", action="store_true")
+
+    commands.add_parser("info", help="Show the pattern count, version and compiled pipeline")
+    args = parser.parse_args(argv)
+
+    if args.command == "from-gazetteer":
+        count = write_pattern_file(patterns_from_gazetteer(args.db, args.min_population, args.label), args.out)
+        print(json.dumps({"patterns": count, "out": args.out}, indent=2))
+    elif args.command == "compile":
+        started = time.perf_counter()
+        path = compile_pipeline(force=args.force)
+        print(json.dumps({"path": path, "seconds": round(time.perf_counter() - started, 3)}, indent=2))
+    else:
+        from modules.models import model_cache_path
+
+        patterns = load_patterns()
+        version = patterns_version(patterns, config["SPACY_MODEL"], config.get("SPACY_EXCLUDE", []))
+        path = model_cache_path(config["SPACY_MODEL"], f"ruler-{version}")
+        print(json.dumps({
+            "patterns": len(patterns),
+            "phrase_patterns": sum(isinstance(p["pattern"], str) for p in patterns),
+            "version": version,
+            "path": path,
+            "compiled": os.path.isdir(path)
+        }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Incremental columnar snapshots of the SQLite database for offline analysis
+
+Usage:
+    python -m modules.export run [--full] [--tables emergency volunteer]
+    python -m modules.export status
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import shutil
+import sqlite3
+import time
+from bisect import bisect_right
+from typing import Dict, List, Optional, Set
+from config import config
+from modules.importer import parse_timestamp
+from modules.metrics import timer, increment
+
+# Exported tables: key used as the high-water mark, timestamp column partitioned by month (or None),
+# and the change feed table whose updates and deletes of a key rewrite its exported rows (or None)
+EXPORT_TABLES = {
+    "emergency": ("eid", "timestamp", "emergency"),
+    # Entities are replaced together with their report's classification
+    "emergency_entity": ("eid", None, "emergency"),
+    "resource": ("resourceid", "timestamp", "resource"),
+    "volunteer": ("id", "timestamp", "volunteer"),
+    "incident": ("incident_id", "first_reported", "incident")
+}
+
+# Never leave the live database, whatever the table
+EXCLUDED_COLUMNS = {"password_hash"}
+
+# Declared SQLite column types mapped to Arrow type names
+ARROW_TYPES = {
+    "INTEGER": "int64",
+    "REAL": "float64",
+    "TEXT": "string",
+    "DATETIME": "timestamp",
+    "BLOB": "binary"
+}
+
+FILE_EXTENSIONS = {"parquet": "parquet", "arrow": "arrow"}
+
+PART_FILE = re.compile(r"part-(\d+)\.(parquet|arrow)")
+
+def export_dir() -> str:
+    return config.get("EXPORT_DIR", "exports")
+
+def read_manifest(directory: Optional[str] = None) -> Dict:
+    """The per-table high-water marks of earlier runs"""
+    path = os.path.join(directory or export_dir(), "manifest.json")
+    if not os.path.exists(path):
+        return {"tables": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def write_manifest(manifest: Dict, directory: Optional[str] = None):
+    directory = directory or export_dir()
+    path = os.path.join(directory, "manifest.json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def table_schema(conn, table: str):
+    """Arrow schema of the exported columns of a table"""
+    import pyarrow as pa
+
+    fields = []
+    for _, name, declared, *_ in conn.execute(f"PRAGMA table_info({table})"):
+        if name in EXCLUDED_COLUMNS:
+            continue
+        arrow_type = ARROW_TYPES.get((declared or "").upper(), "string")
+        fields.append(pa.field(name, pa.timestamp("s") if arrow_type == "timestamp" else pa.type_for_alias(arrow_type)))
+    return pa.schema(fields)
+
+def table_source(conn, table: str, names: List[str]) -> str:
+    """FROM clause reading a table's live rows and, when the archive database is attached, its archived rows"""
+    columns = ", ".join(names)
+    attached = any(row[1] == "archive" for row in conn.execute("PRAGMA database_list"))
+    if not attached or not conn.execute(
+            "SELECT 1 FROM archive.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+        return table
+    # Columns added since the last archive run are null for archived rows
+    archived = {row[1] for row in conn.execute(f"PRAGMA archive.table_info({table})")}
+    archive_columns = ", ".join(name if name in archived else f"NULL AS {name}" for name in names)
+    return f"(SELECT {columns} FROM main.{table} UNION ALL SELECT {archive_columns} FROM archive.{table})"
+
+def normalize_time(value) -> Optional[str]:
+    """A stored time as UTC "YYYY-MM-DD HH:MM:SS", or None if missing or unreadable"""
+    try:
+        return parse_timestamp(value)
+    except ValueError:
+        return None
+
+def partition_of(value) -> str:
+    """Hive partition of a row by the month of its timestamp"""
+    return f"month={(normalize_time(value) or 'unknown')[:7]}"
+
+def to_table(rows: List[tuple], schema):
+    """Arrow table of SQLite rows, with timestamps parsed (null if unreadable)"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    arrays = []
+    for i, field in enumerate(schema):
+        values = [row[i] for row in rows]
+        if pa.types.is_timestamp(field.type):
+            values = [normalize_time(value) for value in values]
+            arrays.append(pc.strptime(pa.array(values, pa.string()), "%Y-%m-%d %H:%M:%S", "s", error_is_null=True))
+        else:
+            arrays.append(pa.array(values, field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def write_file(table, path: str, file_format: str):
+    """Write an Arrow table atomically as Parquet or Arrow IPC"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    staging = f"{path}.tmp"
+    if file_format == "arrow":
+        import pyarrow as pa
+
+        with pa.OSFile(staging, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, staging, compression=config.get("EXPORT_COMPRESSION", "zstd"))
+    os.replace(staging, path)
+
+def export_table(conn, table: str, after_key: int, directory: str, file_format: str, batch_rows: int) -> Dict:
+    """Write rows with key above after_key as part files, one per month partition and batch"""
+    key, partition_column, _ = EXPORT_TABLES[table]
+    schema = table_schema(conn, table)
+    names = ", ".join(schema.names)
+    source = table_source(conn, table, schema.names)
+    extension = FILE_EXTENSIONS[file_format]
+    last_key, rows_written, files = after_key, 0, 0
+    while True:
+        # Batches end on a key boundary, so rows sharing a key (an emergency's entities) stay together
+        rows = conn.execute(
+            f'''SELECT {names} FROM {source}
+                WHERE {key} > ? AND {key} <= (SELECT MAX({key}) FROM
+                    (SELECT {key} FROM {source} WHERE {key} > ? ORDER BY {key} LIMIT ?))
+                ORDER BY {key}''',
+            (last_key, last_key, batch_rows)
+        ).fetchall()
+        if not rows:
+            break
+        key_index = schema.names.index(key)
+        partitions = {}
+        if partition_column:
+            index = schema.names.index(partition_column)
+            for row in rows:
+                partitions.setdefault(partition_of(row[index]), []).append(row)
+        else:
+            partitions[""] = rows
+        for partition, partition_rows in partitions.items():
+            first = partition_rows[0][key_index]
+            path = os.path.join(directory, table, partition, f"part-{first:012d}.{extension}")
+            write_file(to_table(partition_rows, schema), path, file_format)
+            files += 1
+        last_key = rows[-1][key_index]
+        rows_written += len(rows)
+    return {"last_key": last_key, "rows": rows_written, "files": files}
+
+def part_files(directory: str, table: str) -> Dict[str, List[tuple]]:
+    """Part files of a table's snapshot by partition directory, as (first key, path) in key order"""
+    root = os.path.join(directory, table)
+    files = {}
+    for path, _, names in os.walk(root):
+        for name in names:
+            match = PART_FILE.fullmatch(name)
+            if match:
+                files.setdefault(path, []).append((int(match.group(1)), os.path.join(path, name)))
+    return {path: sorted(parts) for path, parts in files.items()}
+
+def changed_keys(conn, change_table: str, after_seq: int, up_to_seq: int) -> Optional[Set[int]]:
+    """Keys updated or deleted in the change feed within (after_seq, up_to_seq], or None if it was pruned past after_seq"""
+    oldest = conn.execute("SELECT MIN(seq) FROM change_log").fetchone()[0]
+    if up_to_seq > after_seq and (oldest is None or oldest > after_seq + 1):
+        return None
+    rows = conn.execute(
+        '''SELECT DISTINCT row_id FROM change_log
+           WHERE seq > ? AND seq <= ? AND table_name = ? AND op IN ('update', 'delete')''',
+        (after_seq, up_to_seq, change_table)
+    )
+    return {row_id for row_id, in rows}
+
+def rewrite_changed(conn, table: str, keys: Set[int], last_key: int, directory: str, file_format: str) -> int:
+    """Rewrite the part files covering any of keys from the current rows, returning how many changed.
+
+    In its partition, a part file holds every row with a key from its first key
+    up to the next part file's first key (or last_key, the high-water mark), and
+    a row never changes partition, so re-reading that key range reproduces the
+    file up to date. This includes rows stored later under a key that was
+    already exported (entities a backfill adds to an old report); those below a
+    partition's first part file get a part file of their own.
+    """
+    key, partition_column, _ = EXPORT_TABLES[table]
+    schema = table_schema(conn, table)
+    names = ", ".join(schema.names)
+    source = table_source(conn, table, schema.names)
+    key_index = schema.names.index(key)
+    # Keys above the high-water mark are appended by export_table
+    keys = sorted(k for k in keys if k <= last_key)
+    files = part_files(directory, table)
+
+    # Key ranges to re-read, as (partition directory, first key, last key, part file or None)
+    ranges = set()
+    for path, parts in files.items():
+        firsts = [first for first, _ in parts]
+        for i in {bisect_right(firsts, k) for k in keys}:
+            if i:
+                ranges.add((path, firsts[i - 1], firsts[i] - 1 if i < len(firsts) else last_key, parts[i - 1][1]))
+    below_first = {}
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        for row_key, value in conn.execute(
+            f"SELECT {key}, {partition_column or 'NULL'} FROM {source} WHERE {key} IN ({', '.join('?' for _ in chunk)})",
+            chunk
+        ):
+            path = os.path.join(directory, table, partition_of(value)) if partition_column else os.path.join(directory, table)
+            parts = files.get(path)
+            if not parts or row_key < parts[0][0]:
+                below_first[path] = min(row_key, below_first.get(path, row_key))
+    for path, first in below_first.items():
+        parts = files.get(path)
+        ranges.add((path, first, parts[0][0] - 1 if parts else last_key, None))
+
+    rewritten = 0
+    for path, first, last, part in sorted(ranges, key=lambda r: r[:3]):
+        rows = conn.execute(
+            f"SELECT {names} FROM {source} WHERE {key} >= ? AND {key} <= ? ORDER BY {key}",
+            (first, last)
+        ).fetchall()
+        if partition_column:
+            index = schema.names.index(partition_column)
+            partition = os.path.basename(path)
+            rows = [row for row in rows if partition_of(row[index]) == partition]
+        if rows:
+            # Named after its first remaining key, so a rewrite that stops half way is simply repeated
+            write_file(to_table(rows, schema), os.path.join(path, f"part-{rows[0][key_index]:012d}.{FILE_EXTENSIONS[file_format]}"),
+                       file_format)
+        if part and (not rows or rows[0][key_index] != first):
+            os.remove(part)
+        if rows or part:
+            rewritten += 1
+    return rewritten
+
+def export_snapshots(tables: Optional[List[str]] = None, full: bool = False, db_path: Optional[str] = None,
+                     directory: Optional[str] = None, archive_path: Optional[str] = None) -> Dict:
+    """Append rows added since the last export of each table and rewrite rows changed since (everything with full)"""
+    directory = directory or export_dir()
+    file_format = config.get("EXPORT_FORMAT", "parquet")
+    if file_format not in FILE_EXTENSIONS:
+        raise ValueError(f"Unknown EXPORT_FORMAT: {file_format}")
+    batch_rows = config.get("EXPORT_BATCH_ROWS", 100000)
+    manifest = read_manifest(directory)
+    if manifest.get("format", file_format) != file_format:
+        # Never mix formats in one snapshot
+        full, tables = True, None
+    os.makedirs(directory, exist_ok=True)
+
+    # Read-only, so an export never blocks writers (WAL) or changes the database
+    path = os.path.abspath(db_path or config["DB_PATH"])
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    results = {}
+    try:
+        # Reports moved to the archive (modules.retention) stay in the snapshot
+        archive_path = os.path.abspath(archive_path or config.get("ARCHIVE_DB_PATH", "archive.db"))
+        if os.path.exists(archive_path):
+            conn.execute("ATTACH DATABASE ? AS archive", (f"file:{archive_path}?mode=ro",))
+        # Changes up to here are covered by this run; later ones are picked up by the next
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        for table in tables or list(EXPORT_TABLES):
+            if table not in EXPORT_TABLES:
+                raise ValueError(f"Unknown export table: {table}")
+            change_table = EXPORT_TABLES[table][2]
+            state = manifest["tables"].get(table, {})
+            keys = set()
+            if not full and state and change_table:
+                keys = changed_keys(conn, change_table, state["seq"], seq) if "seq" in state else None
+            if full or keys is None:
+                shutil.rmtree(os.path.join(directory, table), ignore_errors=True)
+                state = {}
+            started = time.perf_counter()
+            with timer(f"export.{table}"):
+                rewritten = rewrite_changed(conn, table, keys, state.get("last_key", 0), directory, file_format) if keys else 0
+                result = export_table(conn, table, state.get("last_key", 0), directory, file_format, batch_rows)
+            increment("export.rows", result["rows"])
+            result["rewritten_files"] = rewritten
+            manifest["tables"][table] = {
+                "last_key": result["last_key"],
+                "seq": seq,
+                "rows": state.get("rows", 0) + result["rows"],
+                "exported_at": datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            manifest["format"] = file_format
+            write_manifest(manifest, directory)
+            results[table] = {**result, "seconds": round(time.perf_counter() - started, 3)}
+    finally:
+        conn.close()
+    return results
+
+def open_snapshot(table: str, directory: Optional[str] = None):
+    """A pyarrow dataset over a table's snapshot (month is a partition column where there is one)"""
+    import pyarrow.dataset as ds
+
+    directory = directory or export_dir()
+    file_format = read_manifest(directory).get("format", config.get("EXPORT_FORMAT", "parquet"))
+    return ds.dataset(os.path.join(directory, table), format="ipc" if file_format == "arrow" else "parquet",
+                      partitioning="hive")
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Columnar snapshots for offline analysis")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_command = commands.add_parser("run", help="Export rows added since the last run")
+    run_command.add_argument("--full", action="store_true", help="Rewrite the snapshot from scratch")
+    run_command.add_argument("--tables", nargs="+", choices=sorted(EXPORT_TABLES))
+    commands.add_parser("status", help="Show the high-water mark and row count of each table")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        print(json.dumps(export_snapshots(args.tables, args.full), indent=2))
+    else:
+        print(json.dumps(read_manifest(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""First-aid guidance: one shared Gemini client, streamed output and a guidance cache
+
+Answers start from the offline knowledge base (modules.first_aid_kb) and are
+enriched by the model, depending on FIRST_AID_SOURCE. Common model requests
+(a known disaster type, with no victim details that call for tailored
+advice) are answered from canonical guidance cached per (disaster type,
+severity) for FIRST_AID_CACHE_HOURS. Only unusual reports send their context
+to the model. Set FIRST_AID_MODEL to "stub" to use StubModel, a
+local stand-in with the same interface, instead of Gemini.
+"""
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+from config import config
+from modules.metrics import timer, increment, observe, is_enabled
+
+_state = {
+    "model": None
+}
+_lock = threading.Lock()
+
+# Other names for the disaster types the text classifier assigns
+DISASTER_ALIASES = {
+    "wildfire": "fire",
+    "house fire": "fire",
+    "quake": "earthquake",
+    "flooding": "flood",
+    "flash flood": "flood",
+    "hurricane": "cyclone",
+    "typhoon": "cyclone",
+    "road accident": "car accident",
+    "traffic accident": "car accident",
+    "mudslide": "landslide",
+    "collapsed building": "building collapse"
+}
+
+class StubChunk:
+    """One piece of a StubModel response"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+class StubModel:
+    """Deterministic local stand-in for genai.GenerativeModel.
+
+    Answers every prompt with a fixed template, streamed word by word with
+    delay seconds between chunks. Prompts are kept in calls.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = []
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        self.calls.append(prompt)
+        text = (f"First-aid guidance (stub model).\n\n1. Move to safety and call emergency services.\n"
+                f"2. Check for injuries and give basic first aid.\n3. Follow official instructions.\n\n"
+                f"Prompt: {prompt}")
+        if not stream:
+            return StubChunk(text)
+        return self._stream(text)
+
+    def _stream(self, text: str) -> Iterator[StubChunk]:
+        for word in re.findall(r"\S+\s*", text):
+            if self.delay:
+                time.sleep(self.delay)
+            yield StubChunk(word)
+
+def get_model():
+    """The process-wide first-aid model, configured on first use"""
+    with _lock:
+        if _state["model"] is None:
+            if config.get("FIRST_AID_MODEL") == "stub":
+                _state["model"] = StubModel()
+            else:
+                import google.generativeai as genai
+
+                genai.configure(api_key=config["GEMINI_API_KEY"])
+                _state["model"] = genai.GenerativeModel(config.get("FIRST_AID_MODEL") or config["GEMINI_MODEL"])
+        return _state["model"]
+
+def set_model(model):
+    """Replace the first-aid model (None to load the configured one again)"""
+    with _lock:
+        _state["model"] = model
+
+def normalize_disaster_type(disaster_type: Optional[str]) -> str:
+    """Lowercase, strip punctuation and resolve aliases ("Hurricane!" -> "cyclone")"""
+    name = " ".join(re.sub(r"[^\w\s]", " ", str(disaster_type or "").lower()).split())
+    return DISASTER_ALIASES.get(name, name)
+
+def needs_context(disaster_type: str, entities: Optional[Dict[str, List[str]]] = None) -> bool:
+    """Whether a request needs an answer tailored to its report rather than canonical guidance"""
+    from modules.processing import EMERGENCY_LABELS
+
+    if disaster_type not in EMERGENCY_LABELS:
+        return True
+    fields = config.get("FIRST_AID_CONTEXT_ENTITIES", ["victim_condition"])
+    return any((entities or {}).get(field) for field in fields)
+
+def canonical_prompt(disaster_type: str, severity: str) -> str:
+    """Prompt for the cached guidance of a disaster type and severity"""
+    level = f"{severity} " if severity else ""
+    return (f"What are the first-aid measures for a {level}{disaster_type}? "
+            f"Give short, general steps that apply to most people affected.")
+
+def context_prompt(disaster_type: str, input_text: str, severity: str) -> str:
+    """Prompt for guidance tailored to one report"""
+    level = f" (severity: {severity})" if severity else ""
+    return f"What are the first-aid measures for a {disaster_type}{level}? Context provided: {input_text}"
+
+def generate(prompt: str) -> Iterator[str]:
+    """Stream the model's answer to a prompt as text chunks"""
+    started = time.perf_counter()
+    first = True
+    with timer("gemini.first_aid"):
+        for chunk in get_model().generate_content(prompt, stream=True):
+            if first and is_enabled():
+                observe("gemini.first_aid.first_chunk", time.perf_counter() - started)
+            first = False
+            if chunk.text:
+                yield chunk.text
+
+def model_guidance(disaster_type: str, input_text: str, severity: str = "",
+                   entities: Optional[Dict[str, List[str]]] = None) -> Iterator[str]:
+    """Stream guidance from the model, or from the guidance cache when the request is a common one"""
+    from modules.database import get_cached_guidance, cache_guidance
+
+    name = normalize_disaster_type(disaster_type)
+    if needs_context(name, entities):
+        increment("first_aid.contextual")
+        yield from generate(context_prompt(disaster_type, input_text, severity))
+        return
+
+    cached = get_cached_guidance(name, severity, config.get("FIRST_AID_CACHE_HOURS", 24 * 7))
+    if cached:
+        increment("first_aid.cache_hit")
+        yield cached
+        return
+    increment("first_aid.cache_miss")
+    chunks = []
+    for chunk in generate(canonical_prompt(name, severity)):
+        chunks.append(chunk)
+        yield chunk
+    # Only complete answers are cached
+    cache_guidance(name, severity, "".join(chunks))
+
+def stream_guidance(disaster_type: str, input_text: str, severity: Optional[str] = None,
+                    entities: Optional[Dict[str, List[str]]] = None) -> Iterator[str]:
+    """Stream first-aid guidance from the sources selected by FIRST_AID_SOURCE.
+
+    "local" answers from the offline knowledge base only, "enrich" (the
+    default) answers from it at once and then adds the model's guidance, and
+    "model" asks the model first. The knowledge base answers whenever the
+    model cannot.
+    """
+    from modules.first_aid_kb import local_guidance
+
+    source = config.get("FIRST_AID_SOURCE", "enrich")
+    severity = (severity or "").lower()
+
+    def local():
+        return local_guidance(normalize_disaster_type(disaster_type), input_text, severity, entities)
+
+    if source in ("local", "enrich"):
+        yield local()
+        if source == "local":
+            return
+        heading = "\n\n---\n\n**More guidance**\n\n"
+    else:
+        heading = ""
+
+    started = False
+    try:
+        for chunk in model_guidance(disaster_type, input_text, severity, entities):
+            if not started:
+                yield heading
+                started = True
+            yield chunk
+    except Exception:
+        increment("first_aid.model_error")
+        if source == "model":
+            yield ("\n\n" if started else "") + "_The AI service is unavailable; showing offline guidance._\n\n" + local()
@@ -0,0 +1,369 @@
+"""Offline first-aid knowledge base with BM25 retrieval
+
+Answers are built from ARTICLES alone, so guidance is available in a few
+milliseconds with no network access. The article for the report's disaster
+type comes first, followed by the injury topics that best match the report
+text.
+"""
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+from config import config
+from modules.metrics import timer
+
+_state = {
+    "index": None
+}
+_lock = threading.Lock()
+
+# Disaster articles are tagged with the disaster types they answer (the text
+# classifier's labels and the entity ruler's EMERGENCY_TYPE terms); injury
+# topics have no types and are found by retrieval.
+ARTICLES = [
+    {
+        "title": "Fire",
+        "types": ["fire"],
+        "keywords": "fire smoke flames burning blaze wildfire house fire",
+        "steps": [
+            "Get everyone out and stay out; call emergency services once you are safe.",
+            "Stay low under the smoke and cover your nose and mouth with a cloth.",
+            "Feel doors with the back of your hand before opening them; use another exit if a door is hot.",
+            "If clothing catches fire: stop, drop to the ground, cover your face and roll.",
+            "Cool burns under cool running water for at least 20 minutes; do not use ice, butter or creams.",
+            "Move people with smoke exposure into fresh air and watch their breathing."
+        ]
+    },
+    {
+        "title": "Earthquake",
+        "types": ["earthquake"],
+        "keywords": "earthquake quake tremor shaking aftershock",
+        "steps": [
+            "During shaking: drop, cover your head and neck under sturdy furniture, and hold on.",
+            "Stay away from windows, shelves and outside walls; do not run outside while shaking.",
+            "After shaking stops, check yourself and others for injuries before moving.",
+            "Expect aftershocks; leave damaged buildings and keep clear of walls, power lines and glass.",
+            "Do not light flames; if you smell gas, open windows, leave and report it.",
+            "Do not move seriously injured people unless they are in immediate danger."
+        ]
+    },
+    {
+        "title": "Flood",
+        "types": ["flood"],
+        "keywords": "flood flooding water rising flash flood submerged inundated",
+        "steps": [
+            "Move to higher ground immediately and call emergency services.",
+            "Never walk, swim or drive through flood water: 15 cm can knock you down and 30 cm can float a car.",
+            "Stay away from power lines and electrical equipment in or near water.",
+            "If trapped in a building, go to the highest floor (not a closed attic) and signal for help.",
+            "Wash skin that touched flood water with soap and clean water; keep wounds clean and covered.",
+            "Drink only bottled or boiled water until the supply is declared safe."
+        ]
+    },
+    {
+        "title": "Car accident",
+        "types": ["car accident"],
+        "keywords": "car accident crash collision vehicle road traffic",
+        "steps": [
+            "Make the scene safe: hazard lights on, engines off, warn oncoming traffic.",
+            "Call emergency services and give the exact location and number of injured.",
+            "Do not move injured people unless there is fire or other immediate danger; keep the head and neck still.",
+            "Check breathing; if someone is unresponsive and not breathing normally, start CPR.",
+            "Press firmly on heavy bleeding with a clean cloth.",
+            "Keep casualties warm and reassured until help arrives."
+        ]
+    },
+    {
+        "title": "Building collapse",
+        "types": ["building collapse"],
+        "keywords": "building collapse collapsed structure rubble debris trapped",
+        "steps": [
+            "Call emergency services; do not enter unstable structures yourself.",
+            "If you are trapped: cover your mouth, avoid kicking up dust, and tap on pipes or walls so rescuers can hear you.",
+            "Shout only as a last resort, as it makes you inhale dust.",
+            "Treat reachable casualties for bleeding and keep them still and warm.",
+            "Do not pull out people pinned for a long time without rescuers; releasing a crush can be dangerous.",
+            "Watch for gas leaks, fire and further collapse."
+        ]
+    },
+    {
+        "title": "Cyclone, hurricane or tornado",
+        "types": ["cyclone", "hurricane", "tornado"],
+        "keywords": "cyclone hurricane typhoon tornado storm wind twister storm surge",
+        "steps": [
+            "Shelter in a small interior room on the lowest floor, away from windows.",
+            "Protect your head and neck with your arms, a mattress or blankets.",
+            "Stay inside until officials say it is safe; the calm eye of a storm is not the end.",
+            "After the storm, avoid fallen power lines, flood water and damaged buildings.",
+            "Treat cuts from flying debris: clean, cover and watch for infection.",
+            "Use generators only outdoors to avoid carbon monoxide poisoning."
+        ]
+    },
+    {
+        "title": "Tsunami",
+        "types": ["tsunami"],
+        "keywords": "tsunami wave sea receding coastal",
+        "steps": [
+            "After strong coastal shaking or a sudden drop in the sea, move inland or to high ground at once.",
+            "Do not wait for an official warning and do not go to the shore to watch.",
+            "Stay away from the coast until officials say it is safe; more waves can follow for hours.",
+            "If caught in water, grab something that floats.",
+            "Treat people rescued from water for drowning and hypothermia."
+        ]
+    },
+    {
+        "title": "Landslide",
+        "types": ["landslide"],
+        "keywords": "landslide mudslide mudflow rockfall slope debris flow",
+        "steps": [
+            "Move away from the path of the slide, to the side rather than downhill.",
+            "Listen for rumbling, cracking trees or boulders; leave at once if you hear them.",
+            "Stay away from the slide area afterwards; further slides are common.",
+            "Do not enter the slide to reach trapped people; guide rescuers to them.",
+            "Treat casualties for bleeding, fractures and crush injuries."
+        ]
+    },
+    {
+        "title": "Medical emergency",
+        "types": ["medical emergency"],
+        "keywords": "medical emergency collapsed ill sick seizure chest pain stroke",
+        "steps": [
+            "Call emergency services and describe the symptoms.",
+            "Check for danger, then check whether the person responds and is breathing normally.",
+            "If they are not breathing normally, start CPR and send someone for a defibrillator (AED).",
+            "If they are breathing but unresponsive, place them in the recovery position.",
+            "For chest pain, keep them seated and calm; for a stroke (face drooping, arm weakness, slurred speech) note the time symptoms started.",
+            "Do not give food or drink to someone who is drowsy or may need surgery."
+        ]
+    },
+    {
+        "title": "Severe bleeding",
+        "types": [],
+        "keywords": "bleeding blood wound cut laceration hemorrhage injured injury",
+        "steps": [
+            "Press firmly on the wound with a clean cloth or dressing and keep pressing.",
+            "If blood soaks through, add more layers on top; do not remove the first.",
+            "Raise the injured limb if that does not cause pain.",
+            "For life-threatening limb bleeding that pressure cannot stop, apply a tourniquet above the wound if you are trained.",
+            "Keep the person lying down and warm to reduce shock."
+        ]
+    },
+    {
+        "title": "Burns",
+        "types": [],
+        "keywords": "burn burns burned scald blister skin fire heat",
+        "steps": [
+            "Cool the burn under cool running water for at least 20 minutes.",
+            "Remove jewellery and clothing near the burn unless stuck to the skin.",
+            "Cover loosely with cling film or a clean non-fluffy dressing.",
+            "Do not apply ice, butter, ointments or burst blisters.",
+            "Get medical help for burns larger than the person's hand, or on the face, hands, feet or genitals."
+        ]
+    },
+    {
+        "title": "Unresponsive and not breathing (CPR)",
+        "types": [],
+        "keywords": "unconscious unresponsive not breathing stopped breathing no pulse cpr cardiac arrest heart attack",
+        "steps": [
+            "Call emergency services and put the phone on speaker.",
+            "Push hard and fast in the centre of the chest: 100 to 120 compressions a minute, 5 to 6 cm deep.",
+            "If trained, give 2 rescue breaths after every 30 compressions; otherwise keep doing compressions.",
+            "Use an AED as soon as one arrives and follow its instructions.",
+            "Continue until the person breathes normally or help takes over."
+        ]
+    },
+    {
+        "title": "Unresponsive but breathing",
+        "types": [],
+        "keywords": "unconscious unresponsive breathing recovery position fainted",
+        "steps": [
+            "Place the person on their side in the recovery position with the head tilted back.",
+            "Keep checking that they are breathing normally.",
+            "Do not give anything to eat or drink.",
+            "If breathing stops, start CPR."
+        ]
+    },
+    {
+        "title": "Fractures",
+        "types": [],
+        "keywords": "fracture broken bone limb arm leg deformed injured injury",
+        "steps": [
+            "Keep the injured part still in the position you found it.",
+            "Support it with padding, clothing or a sling.",
+            "Do not try to straighten a deformed limb.",
+            "Cover open wounds over a fracture with a clean dressing.",
+            "Suspect a spinal injury after falls or crashes: keep the head and neck still."
+        ]
+    },
+    {
+        "title": "Trapped or crushed",
+        "types": [],
+        "keywords": "trapped stuck pinned crushed crush rubble debris missing",
+        "steps": [
+            "Call emergency services and tell them someone is trapped.",
+            "Do not put yourself in danger or try to lift heavy debris on your own.",
+            "Talk to the trapped person, keep them calm and note how long they have been trapped.",
+            "If a crush lasted more than 15 minutes, leave release to rescuers if possible.",
+            "Treat reachable bleeding and keep the person warm."
+        ]
+    },
+    {
+        "title": "Drowning",
+        "types": [],
+        "keywords": "drowning drowned water swept submerged swimming rescued",
+        "steps": [
+            "Do not enter the water unless trained; reach or throw something that floats.",
+            "Once out of the water, check breathing.",
+            "If not breathing normally, give 5 rescue breaths then start CPR.",
+            "Remove wet clothes and keep the person warm.",
+            "Everyone rescued from drowning needs a medical check, even if they seem well."
+        ]
+    },
+    {
+        "title": "Smoke inhalation",
+        "types": [],
+        "keywords": "smoke inhalation breathing coughing fumes gas carbon monoxide",
+        "steps": [
+            "Move the person to fresh air.",
+            "Loosen tight clothing and help them sit upright if breathing is difficult.",
+            "Get medical help for hoarseness, soot around the mouth or nose, or confusion.",
+            "If they become unresponsive and stop breathing normally, start CPR."
+        ]
+    },
+    {
+        "title": "Hypothermia",
+        "types": [],
+        "keywords": "hypothermia cold shivering wet freezing exposure",
+        "steps": [
+            "Move the person to a warm, dry place and remove wet clothing.",
+            "Warm the body core first with blankets; cover the head.",
+            "Give warm sweet drinks if they are fully alert.",
+            "Do not rub the limbs or use direct heat such as hot water bottles on the skin."
+        ]
+    },
+    {
+        "title": "Shock",
+        "types": [],
+        "keywords": "shock pale clammy weak dizzy faint rapid pulse injured",
+        "steps": [
+            "Lay the person down and raise their legs if no injury prevents it.",
+            "Treat the cause, such as bleeding.",
+            "Keep them warm and calm, and loosen tight clothing.",
+            "Do not give food or drink."
+        ]
+    },
+    {
+        "title": "Electric shock",
+        "types": [],
+        "keywords": "electric shock electrocution power line live wire electrical",
+        "steps": [
+            "Do not touch the person until the power is off; stay 10 metres from fallen high-voltage lines.",
+            "Once safe, check breathing and start CPR if needed.",
+            "Cool any burns with running water.",
+            "Everyone who has had an electric shock needs a medical check."
+        ]
+    },
+    {
+        "title": "Head injury",
+        "types": [],
+        "keywords": "head injury concussion skull knocked unconscious confused vomiting",
+        "steps": [
+            "Keep the person still and press on any scalp bleeding with a clean cloth.",
+            "Assume a neck injury if they fell or were in a crash.",
+            "Watch for drowsiness, vomiting, confusion or unequal pupils and get medical help if they appear.",
+            "Do not leave them alone for the first 24 hours."
+        ]
+    }
+]
+
+# General guidance when nothing in ARTICLES matches
+GENERAL_STEPS = [
+    "Make sure you are safe before helping others.",
+    "Call emergency services and give your exact location.",
+    "Check whether injured people respond and are breathing; start CPR if they are not breathing normally.",
+    "Stop heavy bleeding with firm pressure, and keep casualties warm and still."
+]
+
+TOKEN_PATTERN = re.compile(r"[a-z]+")
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is",
+             "it", "my", "of", "on", "or", "our", "the", "their", "there", "to", "was", "we", "were",
+             "with", "text", "description", "voice", "transcription", "image"}
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords, with plural "s" stripped"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(str(text).lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+class BM25Index:
+    """Okapi BM25 over tokenized documents, with an inverted index for scoring"""
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lengths = [len(doc) for doc in documents]
+        self.average_length = sum(self.lengths) / max(len(documents), 1)
+        self.postings = defaultdict(list)
+        for doc_id, doc in enumerate(documents):
+            for term, count in Counter(doc).items():
+                self.postings[term].append((doc_id, count))
+        total = len(documents)
+        self.idf = {term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for term, postings in self.postings.items()}
+
+    def search(self, query: List[str], limit: int = 5) -> List[Tuple[float, int]]:
+        """Best (score, document id) pairs for the query terms, highest first"""
+        scores = defaultdict(float)
+        for term in set(query):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, count in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / self.average_length)
+                scores[doc_id] += idf * count * (self.k1 + 1) / (count + norm)
+        return sorted(((score, doc_id) for doc_id, score in scores.items()), reverse=True)[:limit]
+
+def get_index() -> BM25Index:
+    """BM25 index over ARTICLES, built on first use"""
+    with _lock:
+        if _state["index"] is None:
+            # Steps mention many conditions in passing, so only titles and keywords are indexed
+            _state["index"] = BM25Index([tokenize(f"{article['title']} {article['keywords']}") for article in ARTICLES])
+        return _state["index"]
+
+def format_article(title: str, steps: List[str]) -> str:
+    """Markdown for one article"""
+    return f"**{title}**\n\n" + "\n".join(f"{i}. {step}" for i, step in enumerate(steps, 1))
+
+def find_articles(disaster_type: str, input_text: str = "",
+                  entities: Optional[Dict[str, List[str]]] = None, related: Optional[int] = None) -> List[Dict]:
+    """The article for a (normalized) disaster type, then the best matching other articles"""
+    related = config.get("FIRST_AID_KB_RELATED", 2) if related is None else related
+    chosen = [article for article in ARTICLES if disaster_type in article["types"]]
+    terms = [disaster_type, input_text] + [item for items in (entities or {}).values() for item in items]
+    for _, doc_id in get_index().search(tokenize(" ".join(terms)), limit=related + len(chosen) + 1):
+        if len(chosen) >= related + 1:
+            break
+        if ARTICLES[doc_id] not in chosen:
+            chosen.append(ARTICLES[doc_id])
+    return chosen
+
+def local_guidance(disaster_type: str, input_text: str = "", severity: Optional[str] = None,
+                   entities: Optional[Dict[str, List[str]]] = None) -> str:
+    """First-aid guidance from the knowledge base alone"""
+    with timer("first_aid.local"):
+        articles = find_articles(disaster_type, input_text, entities)
+        parts = []
+        if severity in ("critical", "severe", "urgent"):
+            parts.append("**Call emergency services now.**")
+        if articles:
+            parts.extend(format_article(article["title"], article["steps"]) for article in articles)
+        else:
+            parts.append(format_article("General first aid", GENERAL_STEPS))
+        return "\n\n".join(parts)
@@ -0,0 +1,279 @@
+"""Offline geocoding from a local gazetteer (GeoNames dump) indexed in SQLite
+
+Usage:
+    python -m modules.gazetteer build cities500.txt --out gazetteer.db
+    python -m modules.gazetteer lookup "Navi Mumbai"
+    python -m modules.gazetteer stats
+"""
+import argparse
+import difflib
+import json
+import os
+import re
+import resource
+import sqlite3
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import config
+
+# Column positions in GeoNames geoname dumps (allCountries.txt, cities500.txt, ...)
+GEONAMES_COLUMNS = {
+    "id": 0,
+    "name": 1,
+    "asciiname": 2,
+    "alternatenames": 3,
+    "latitude": 4,
+    "longitude": 5,
+    "feature_class": 6,
+    "country": 8,
+    "population": 14
+}
+
+_state = {
+    "conn": None,
+    "path": None,
+    "open_seconds": None
+}
+_lock = threading.Lock()
+
+def normalize_name(name: str) -> str:
+    """Fold case, accents and punctuation so that "São Paulo" matches "sao paulo" """
+    decomposed = unicodedata.normalize("NFKD", str(name))
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", stripped.casefold()).split())
+
+def read_geonames(path: str, min_population: int = 0,
+                  feature_classes: Tuple[str, ...] = ("P", "A")) -> Iterator[tuple]:
+    """Stream (id, name, country, lat, lon, population, keys) from a GeoNames dump"""
+    cols = GEONAMES_COLUMNS
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) <= cols["population"]:
+                continue
+            if feature_classes and fields[cols["feature_class"]] not in feature_classes:
+                continue
+            population = int(fields[cols["population"]] or 0)
+            if population < min_population:
+                continue
+            names = [fields[cols["name"]], fields[cols["asciiname"]]]
+            names += [n for n in fields[cols["alternatenames"]].split(",") if n]
+            keys = {normalize_name(n) for n in names} - {""}
+            yield (int(fields[cols["id"]]), fields[cols["name"]], fields[cols["country"]],
+                   float(fields[cols["latitude"]]), float(fields[cols["longitude"]]),
+                   population, keys)
+
+def build_gazetteer(source_path: str, out_path: Optional[str] = None, min_population: int = 0,
+                    chunk_size: int = 50000) -> Dict:
+    """Build the SQLite gazetteer index from a GeoNames dump"""
+    out_path = out_path or config.get("GAZETTEER_DB", "gazetteer.db")
+    if os.path.exists(out_path):
+        os.remove(out_path)
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(out_path, isolation_level=None)
+    places = names = 0
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("BEGIN")
+        conn.execute('''CREATE TABLE place
+                     (id INTEGER PRIMARY KEY,
+                      name TEXT,
+                      country TEXT,
+                      latitude REAL,
+                      longitude REAL,
+                      population INTEGER)''')
+        conn.execute('''CREATE TABLE place_name
+                     (key TEXT,
+                      place_id INTEGER,
+                      population INTEGER)''')
+
+        place_rows, name_rows = [], []
+        for place_id, name, country, lat, lon, population, keys in read_geonames(source_path, min_population):
+            place_rows.append((place_id, name, country, lat, lon, population))
+            name_rows.extend((key, place_id, population) for key in keys)
+            if len(place_rows) >= chunk_size:
+                conn.executemany("INSERT INTO place VALUES (?, ?, ?, ?, ?, ?)", place_rows)
+                conn.executemany("INSERT INTO place_name VALUES (?, ?, ?)", name_rows)
+                places += len(place_rows)
+                names += len(name_rows)
+                place_rows, name_rows = [], []
+        conn.executemany("INSERT INTO place VALUES (?, ?, ?, ?, ?, ?)", place_rows)
+        conn.executemany("INSERT INTO place_name VALUES (?, ?, ?)", name_rows)
+        places += len(place_rows)
+        names += len(name_rows)
+
+        # Exact and prefix lookups walk this index; most populous place wins
+        conn.execute("CREATE INDEX idx_place_name_key ON place_name (key, population DESC)")
+        # Trigram index over distinct keys for typo-tolerant matching
+        conn.execute("CREATE VIRTUAL TABLE place_fts USING fts5(key, tokenize = 'trigram')")
+        conn.execute("INSERT INTO place_fts (key) SELECT DISTINCT key FROM place_name")
+        # Spatial index for reverse geocoding
+        conn.execute("CREATE VIRTUAL TABLE place_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)")
+        conn.execute('''INSERT INTO place_rtree
+                        SELECT id, latitude, latitude, longitude, longitude FROM place''')
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    return {
+        "places": places,
+        "names": names,
+        "seconds": round(time.perf_counter() - started, 3),
+        "file_bytes": os.path.getsize(out_path)
+    }
+
+def get_gazetteer_connection() -> Optional[sqlite3.Connection]:
+    """Open the gazetteer index once per process (read-only, memory-mapped)"""
+    path = config.get("GAZETTEER_DB", "gazetteer.db")
+    with _lock:
+        if _state["conn"] is None or _state["path"] != path:
+            if not os.path.exists(path):
+                return None
+            started = time.perf_counter()
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size = {int(config.get('GAZETTEER_MMAP_BYTES', 268435456))}")
+            # Touch the name index so the first real lookup is already warm
+            conn.execute("SELECT key FROM place_name ORDER BY key LIMIT 1").fetchall()
+            _state.update(conn=conn, path=path, open_seconds=time.perf_counter() - started)
+            offline_geocode.cache_clear()
+            reverse_geocode.cache_clear()
+        return _state["conn"]
+
+def _query(sql: str, params: tuple) -> List[tuple]:
+    """Run a read query on the shared gazetteer connection"""
+    conn = get_gazetteer_connection()
+    if conn is None:
+        return []
+    with _lock:
+        return conn.execute(sql, params).fetchall()
+
+def _exact(key: str) -> Optional[tuple]:
+    rows = _query(
+        '''SELECT p.latitude, p.longitude FROM place_name n JOIN place p ON p.id = n.place_id
+           WHERE n.key = ? ORDER BY n.population DESC LIMIT 1''',
+        (key,)
+    )
+    return rows[0] if rows else None
+
+def _prefix(key: str) -> Optional[tuple]:
+    rows = _query(
+        '''SELECT p.latitude, p.longitude FROM place_name n JOIN place p ON p.id = n.place_id
+           WHERE n.key >= ? AND n.key < ? ORDER BY n.population DESC LIMIT 1''',
+        (key, key + "\U0010ffff")
+    )
+    return rows[0] if rows else None
+
+def _fuzzy(key: str, cutoff: float) -> Optional[tuple]:
+    if len(key) < 3:
+        return None
+    trigrams = {key[i:i + 3] for i in range(len(key) - 2)}
+    match = " OR ".join('"' + t.replace('"', '""') + '"' for t in trigrams)
+    candidates = [row[0] for row in _query(
+        "SELECT key FROM place_fts WHERE place_fts MATCH ? ORDER BY rank LIMIT 100",
+        (match,)
+    )]
+    best = difflib.get_close_matches(key, candidates, n=1, cutoff=cutoff)
+    return _exact(best[0]) if best else None
+
+@lru_cache(maxsize=4096)
+def offline_geocode(location_name: str, fuzzy_cutoff: float = 0.8) -> Tuple[Optional[float], Optional[float]]:
+    """Geocode a location name from the local gazetteer.
+
+    Tries an exact match on any known name, then a prefix match, then a
+    trigram fuzzy match, on the full query and then on each comma separated
+    part ("Andheri, Mumbai, India" falls back to "Mumbai"). Returns
+    (None, None) when nothing matches or no gazetteer is installed.
+    """
+    parts = [normalize_name(p) for p in str(location_name).split(",")]
+    # A query of punctuation alone normalizes to "", which would prefix-match every place
+    keys = [key for key in [normalize_name(location_name)] + parts if key]
+    if not keys:
+        return None, None
+    for lookup in (_exact, _prefix):
+        for key in keys:
+            found = lookup(key)
+            if found:
+                return found
+    for key in keys:
+        found = _fuzzy(key, fuzzy_cutoff)
+        if found:
+            return found
+    return None, None
+
+@lru_cache(maxsize=4096)
+def reverse_geocode(lat: float, lon: float, max_km: float = 25) -> Optional[str]:
+    """Name the gazetteer place nearest to a point, or None if none is within max_km"""
+    from modules.utils import bounding_box, haversine
+
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, max_km)
+    try:
+        rows = _query(
+            '''SELECT p.name, p.country, p.latitude, p.longitude, p.population
+               FROM place_rtree r JOIN place p ON p.id = r.id
+               WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?''',
+            (min_lat, max_lat, min_lon, max_lon)
+        )
+    except sqlite3.OperationalError:
+        # Index built before reverse geocoding was supported
+        return None
+    best = None
+    for name, country, place_lat, place_lon, population in rows:
+        distance = haversine(lat, lon, place_lat, place_lon)
+        if distance <= max_km and (best is None or distance < best[0]):
+            best = (distance, f"{name}, {country}" if country else name)
+    return best[1] if best else None
+
+def gazetteer_stats() -> Dict:
+    """Report size, startup time and memory use of the loaded gazetteer"""
+    conn = get_gazetteer_connection()
+    if conn is None:
+        return {"loaded": False, "path": config.get("GAZETTEER_DB", "gazetteer.db")}
+    with _lock:
+        places = conn.execute("SELECT COUNT(*) FROM place").fetchone()[0]
+        names = conn.execute("SELECT COUNT(*) FROM place_name").fetchone()[0]
+        mmap_bytes = conn.execute("PRAGMA mmap_size").fetchone()[0]
+    return {
+        "loaded": True,
+        "path": _state["path"],
+        "places": places,
+        "names": names,
+        "file_bytes": os.path.getsize(_state["path"]),
+        "mmap_bytes": mmap_bytes,
+        "open_seconds": round(_state["open_seconds"], 4),
+        # ru_maxrss is reported in kilobytes on Linux
+        "process_max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "cache": offline_geocode.cache_info()._asdict()
+    }
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Offline gazetteer geocoder")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Index a GeoNames dump")
+    build.add_argument("source")
+    build.add_argument("--out", default=None)
+    build.add_argument("--min-population", type=int, default=0)
+    lookup = sub.add_parser("lookup", help="Geocode names from the index")
+    lookup.add_argument("names", nargs="+")
+    sub.add_parser("stats", help="Show index statistics")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        print(json.dumps(build_gazetteer(args.source, args.out, args.min_population), indent=2))
+    elif args.command == "lookup":
+        for name in args.names:
+            started = time.perf_counter()
+            lat, lon = offline_geocode(name)
+            print(f"{name}: {lat}, {lon} ({(time.perf_counter() - started) * 1000:.3f} ms)")
+    else:
+        print(json.dumps(gazetteer_stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
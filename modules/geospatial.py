@@ -1,25 +1,161 @@
 import requests
+import threading
+import time
 import folium
 import streamlit as st
+import streamlit.components.v1 as components
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 from streamlit_folium import folium_static
 from config import config
+from modules.metrics import timed, increment
+
+OPENCAGE_URL = "https://api.opencagedata.com/geocode/v1/json"
+
+class GeocodingError(Exception):
+    """Raised when the geocoding service fails (as opposed to finding no match)"""
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls at least 1/qps seconds apart"""
+
+    def __init__(self, qps: Optional[float]):
+        self.interval = 1.0 / qps if qps else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller may issue the next call"""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def normalize_location(location_name: str) -> str:
+    """Normalize a location query for caching and deduplication"""
+    return " ".join(str(location_name).lower().split())
+
+@timed("opencage.geocode")
+def opencage_geocode(location_name):
+    """Look up a location with OpenCage, returning (None, None) when nothing matches"""
+    response = requests.get(
+        OPENCAGE_URL,
+        params={"q": location_name, "key": config["OPENCAGE_API_KEY"], "limit": 1},
+        timeout=10
+    )
+    data = response.json()
+    code = data.get("status", {}).get("code", response.status_code)
+    if code != 200:
+        raise GeocodingError(f"OpenCage returned status {code}")
+    if data["results"]:
+        geometry = data["results"][0]["geometry"]
+        return geometry["lat"], geometry["lng"]
+    return None, None
 
 def get_lat_lon(location_name):
-    """Get latitude and longitude from location name using OpenCage Geocoder"""
-    url = f'https://api.opencagedata.com/geocode/v1/json?q={location_name}&key={config["OPENCAGE_API_KEY"]}'
-    try:
-        response = requests.get(url)
-        data = response.json()
-        if data['status']['code'] == 200 and data['results']:
-            lat = data['results'][0]['geometry']['lat']
-            lon = data['results'][0]['geometry']['lng']
+    """Get latitude and longitude from location name.
+
+    GEOCODER_MODE selects the source: "online" (OpenCage only), "fallback"
+    (OpenCage, then the local gazetteer when it fails or finds nothing),
+    "offline_first" (gazetteer, then OpenCage) or "offline" (gazetteer only).
+    """
+    from modules.database import get_cached_locations, cache_locations
+    from modules.gazetteer import offline_geocode
+
+    mode = config.get("GEOCODER_MODE", "online")
+    if mode in ("offline", "offline_first"):
+        lat, lon = offline_geocode(location_name)
+        if lat is not None or mode == "offline":
             return lat, lon
-        else:
-            return None, None
+
+    query = normalize_location(location_name)
+    cached = get_cached_locations([query])
+    if query in cached:
+        increment("geocode.cache_hit")
+        return cached[query]
+    increment("geocode.cache_miss")
+    try:
+        lat, lon = opencage_geocode(location_name)
+        if lat is not None and lon is not None:
+            cache_locations({query: (lat, lon)})
+        elif mode == "fallback":
+            return offline_geocode(location_name)
+        return lat, lon
     except Exception as e:
+        if mode == "fallback":
+            lat, lon = offline_geocode(location_name)
+            if lat is not None:
+                return lat, lon
         st.error(f"Geocoding error: {e}")
         return None, None
 
+def batch_get_lat_lon(locations: List[str], geocoder: Optional[Callable] = None,
+                      max_workers: Optional[int] = None, qps: Optional[float] = None,
+                      retries: int = 3, backoff: float = 0.5, use_cache: bool = True) -> List[Dict]:
+    """Geocode many location names at once.
+
+    Inputs are deduplicated after normalization and looked up in the local
+    cache; only the misses are sent to the geocoder, concurrently but no
+    faster than qps. Returns one dict per input, in input order, with
+    latitude, longitude and a status of "cached", "ok", "not_found",
+    "invalid" or "error".
+    """
+    geocoder = geocoder or opencage_geocode
+    max_workers = max_workers or config.get("GEOCODER_MAX_WORKERS", 4)
+    qps = qps if qps is not None else config.get("GEOCODER_QPS", 1)
+
+    queries = [normalize_location(name) if name and str(name).strip() else None for name in locations]
+    # Keep the first spelling of each query to send to the geocoder
+    unique = {}
+    for name, query in zip(locations, queries):
+        if query is not None and query not in unique:
+            unique[query] = str(name).strip()
+
+    outcomes = {}
+    if use_cache and unique:
+        from modules.database import get_cached_locations
+        for query, (lat, lon) in get_cached_locations(list(unique)).items():
+            outcomes[query] = {"latitude": lat, "longitude": lon, "status": "cached", "error": None}
+
+    limiter = RateLimiter(qps)
+
+    def resolve(query):
+        error = None
+        for attempt in range(retries + 1):
+            limiter.wait()
+            try:
+                lat, lon = geocoder(unique[query])
+                status = "ok" if lat is not None and lon is not None else "not_found"
+                return query, {"latitude": lat, "longitude": lon, "status": status, "error": None}
+            except Exception as e:
+                error = str(e)
+                if attempt < retries:
+                    time.sleep(backoff * (2 ** attempt))
+        return query, {"latitude": None, "longitude": None, "status": "error", "error": error}
+
+    misses = [query for query in unique if query not in outcomes]
+    if misses:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for query, outcome in executor.map(resolve, misses):
+                outcomes[query] = outcome
+
+        if use_cache:
+            from modules.database import cache_locations
+            cache_locations({
+                query: (outcomes[query]["latitude"], outcomes[query]["longitude"])
+                for query in misses if outcomes[query]["status"] == "ok"
+            })
+
+    invalid = {"latitude": None, "longitude": None, "status": "invalid", "error": "Empty location"}
+    return [
+        {"location": name, **(outcomes[query] if query is not None else invalid)}
+        for name, query in zip(locations, queries)
+    ]
+
+@timed("map.build")
 def create_emergency_map(lat, lon, resources=None, emergencies=None, center_label="Your Location"):
     """Create a Folium map with emergency information and resources"""
     # Create map centered at the given coordinates
@@ -38,18 +174,20 @@ def create_emergency_map(lat, lon, resources=None, emergencies=None, center_labe
         for res in resources:
             folium.Marker(
                 [res["latitude"], res["longitude"]],
-                popup=f"<b>{res['name']}</b><br>Type: {res['amenity']}<br>Distance: {res['distance']:.2f} km",
+                popup=f"<b>{res['name']}</b><br>Type: {res['amenity']}"
+                      f"{'<br>Distance: %.2f km' % res['distance'] if res.get('distance') is not None else ''}"
+                      f"{'<br>Travel time: %.0f min' % (res['travel_ms'] / 60000) if res.get('travel_ms') is not None else ''}",
                 tooltip=f"{res['name']} ({res['amenity']})",
                 icon=folium.Icon(color="green", icon="plus")
             ).add_to(m)
 
-            # Add a line connecting center to resource
+            # Add the road route to the resource, or a straight line without one
             folium.PolyLine(
-                locations=[[lat, lon], [res["latitude"], res["longitude"]]],
-                weight=2,
+                locations=res.get("route") or [[lat, lon], [res["latitude"], res["longitude"]]],
+                weight=3 if res.get("route") else 2,
                 color="green",
                 opacity=0.7,
-                dash_array="5"
+                dash_array=None if res.get("route") else "5"
             ).add_to(m)
 
     # Add emergency markers if provided
@@ -57,15 +195,19 @@ def create_emergency_map(lat, lon, resources=None, emergencies=None, center_labe
         for emerg in emergencies:
             folium.Marker(
                 [emerg["latitude"], emerg["longitude"]],
-                popup=f"<b>Emergency at {emerg['location']}</b><br>Distance: {emerg['distance']:.2f} km<br>Report: {emerg['text'][:100]}...",
+                popup=f"<b>Emergency at {emerg['location']}</b>"
+                      f"{'<br>Distance: %.2f km' % emerg['distance'] if emerg.get('distance') is not None else ''}"
+                      f"{'<br>Travel time: %.0f min' % (emerg['travel_ms'] / 60000) if emerg.get('travel_ms') is not None else ''}"
+                      f"{'<br>Reports: ' + str(emerg['report_count']) if emerg.get('report_count', 1) > 1 else ''}"
+                      f"<br>Report: {(emerg['text'] or '')[:100]}...",
                 tooltip=f"Emergency: {emerg['location']}",
                 icon=folium.Icon(color="red", icon="exclamation-sign")
             ).add_to(m)
 
-            # Add a line connecting center to emergency
+            # Add the road route to the emergency, or a straight line without one
             folium.PolyLine(
-                locations=[[lat, lon], [emerg["latitude"], emerg["longitude"]]],
-                weight=2,
+                locations=emerg.get("route") or [[lat, lon], [emerg["latitude"], emerg["longitude"]]],
+                weight=3 if emerg.get("route") else 2,
                 color="red",
                 opacity=0.7
             ).add_to(m)
@@ -84,6 +226,16 @@ def create_emergency_map(lat, lon, resources=None, emergencies=None, center_labe
 
     return m
 
+@timed("map.display")
 def display_map(m):
     """Display the Folium map in Streamlit"""
     folium_static(m)
+
+@timed("map.render")
+def map_html(m):
+    """Render a Folium map to standalone HTML that can be cached across reruns"""
+    return m.get_root().render()
+
+def display_map_html(html, height=500):
+    """Display pre-rendered map HTML in Streamlit"""
+    components.html(html, height=height)
@@ -0,0 +1,97 @@
+"""Image preprocessing before captioning, display and storage
+
+Uploaded photos are decoded once (JPEGs at reduced scale through Pillow's
+draft mode), rotated upright from their EXIF orientation, and re-encoded
+without metadata. Three outputs come from one upload: a copy for the
+captioning model, sized to its input resolution (IMAGE_MODEL_SIZE); a
+small thumbnail for dashboards; and a 64-bit difference hash (dHash) that
+matches re-encoded, resized or lightly edited copies of the same photo
+across reports.
+"""
+import io
+from typing import Dict, Iterable, List, Tuple
+from config import config
+from modules.metrics import timer
+
+HASH_MASK = (1 << 64) - 1
+
+def open_image(data: bytes, min_side: int):
+    """Decode an image upright in RGB, letting JPEG decoding skip detail below min_side pixels"""
+    from PIL import Image, ImageOps
+
+    image = Image.open(io.BytesIO(data))
+    if image.format == "JPEG":
+        # Scale down by up to 8x during decoding, keeping both sides at least min_side
+        scale = min(image.size) / min_side
+        if scale > 1:
+            image.draft("RGB", (int(image.size[0] / scale), int(image.size[1] / scale)))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+def upright_size(data: bytes) -> Tuple[int, int]:
+    """Full-resolution (width, height) as displayed, read from the header only"""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    # EXIF orientations 5-8 are rotated by 90 degrees
+    return (height, width) if image.getexif().get(0x0112) in (5, 6, 7, 8) else (width, height)
+
+def fit_shorter_side(image, size: int):
+    """Downscale so the shorter side is size pixels (never upscale)"""
+    from PIL import Image
+
+    width, height = image.size
+    scale = size / min(width, height)
+    if scale >= 1:
+        return image
+    return image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+def encode_jpeg(image, quality: int) -> bytes:
+    """Encode as optimized JPEG; nothing from the original (EXIF, GPS, ICC) is carried over"""
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+def dhash(image, size: int = 8) -> int:
+    """64-bit difference hash as a signed integer (fits SQLite and BIGINT columns)"""
+    from PIL import Image
+
+    pixels = list(image.convert("L").resize((size + 1, size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left, right = pixels[row * (size + 1) + col], pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two hashes"""
+    return bin((a ^ b) & HASH_MASK).count("1")
+
+def prepare_image(data: bytes) -> Dict:
+    """Model-sized JPEG, thumbnail and perceptual hash of an uploaded image"""
+    model_size = config.get("IMAGE_MODEL_SIZE", 384)
+    with timer("image.prepare"):
+        width, height = upright_size(data)
+        image = open_image(data, model_size)
+        model_image = fit_shorter_side(image, model_size)
+        thumbnail = model_image.copy()
+        thumbnail.thumbnail((config.get("IMAGE_THUMBNAIL_SIZE", 256),) * 2)
+        prepared = {
+            "model_bytes": encode_jpeg(model_image, config.get("IMAGE_JPEG_QUALITY", 85)),
+            "thumbnail": encode_jpeg(thumbnail, 75),
+            "phash": dhash(model_image),
+            "width": width,
+            "height": height,
+            "original_bytes": len(data)
+        }
+    return prepared
+
+def find_duplicates(phash: int, candidates: Iterable[Dict], max_distance: int = None) -> List[Tuple[int, Dict]]:
+    """(distance, row) for candidate rows whose "phash" is within max_distance bits, closest first"""
+    max_distance = config.get("IMAGE_DUPLICATE_DISTANCE", 6) if max_distance is None else max_distance
+    matches = [(hamming(phash, row["phash"]), row) for row in candidates]
+    return sorted((match for match in matches if match[0] <= max_distance), key=lambda match: match[0])
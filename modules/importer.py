@@ -0,0 +1,343 @@
+"""Bulk import of resources and emergencies from CSV, GeoJSON and OSM extracts
+
+Usage:
+    python -m modules.importer hospitals.csv --table resource --amenity Hospital
+    python -m modules.importer shelters.geojsonseq --table resource
+    python -m modules.importer reports.geojson --table emergency
+"""
+import argparse
+import csv
+import datetime
+import json
+import math
+import os
+import sqlite3
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from config import config
+from modules.database import (
+    SPATIAL_TABLES,
+    FTS_TABLES,
+    CHANGE_TABLES,
+    INDEXES,
+    spatial_trigger_ddl,
+    rebuild_spatial_index,
+    change_trigger_ddl,
+    fts_trigger_ddl,
+    rebuild_fts_index
+)
+
+# Columns written for each importable table
+IMPORT_COLUMNS = {
+    "resource": ("amenity", "name", "latitude", "longitude", "created_by"),
+    "emergency": ("location", "latitude", "longitude", "text", "timestamp")
+}
+
+LATITUDE_FIELDS = ("latitude", "lat", "y")
+LONGITUDE_FIELDS = ("longitude", "lon", "lng", "long", "x")
+LINE_DELIMITED_EXTENSIONS = (".geojsonl", ".geojsonseq", ".geojsons", ".ndjson", ".jsonl")
+# Epoch values this large are milliseconds (as seconds they would be past the year 5000)
+EPOCH_MILLISECONDS = 1e11
+
+def detect_format(path: str) -> str:
+    """Guess the input format from the file extension"""
+    lower = path.lower()
+    if lower.endswith(".osm.pbf") or lower.endswith(".pbf"):
+        return "osm"
+    if lower.endswith(LINE_DELIMITED_EXTENSIONS):
+        return "geojsonseq"
+    if lower.endswith((".geojson", ".json")):
+        return "geojson"
+    return "csv"
+
+def read_csv(path: str) -> Iterator[Dict]:
+    """Stream rows of a CSV file as dictionaries"""
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield row
+
+def _geometry_point(geometry: Optional[Dict]) -> Tuple[Optional[float], Optional[float]]:
+    """Get a representative (lat, lon) for a GeoJSON geometry (centroid of its vertices)"""
+    if not geometry or "coordinates" not in geometry:
+        return None, None
+    if geometry.get("type") == "Point":
+        lon, lat = geometry["coordinates"][:2]
+        return lat, lon
+
+    # Average the vertices of lines and polygons (e.g. OSM hospital outlines)
+    total_lat = total_lon = 0.0
+    count = 0
+    stack = [geometry["coordinates"]]
+    while stack:
+        item = stack.pop()
+        if item and isinstance(item[0], (int, float)):
+            total_lon += item[0]
+            total_lat += item[1]
+            count += 1
+        else:
+            stack.extend(item)
+    if not count:
+        return None, None
+    return total_lat / count, total_lon / count
+
+def _feature_row(feature: Dict) -> Dict:
+    """Flatten a GeoJSON feature into its properties plus latitude/longitude"""
+    row = dict(feature.get("properties") or {})
+    # osmium exports nest OSM tags under a "tags" property
+    if isinstance(row.get("tags"), dict):
+        row = {**row.pop("tags"), **row}
+    row["latitude"], row["longitude"] = _geometry_point(feature.get("geometry"))
+    return row
+
+def read_geojson(path: str) -> Iterator[Dict]:
+    """Read the features of a GeoJSON FeatureCollection"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    features = data.get("features", []) if data.get("type") == "FeatureCollection" else [data]
+    for feature in features:
+        yield _feature_row(feature)
+
+def read_geojsonseq(path: str) -> Iterator[Dict]:
+    """Stream features of a line-delimited GeoJSON file (RFC 8142 or one feature per line)"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip().lstrip("\x1e")
+            if line:
+                yield _feature_row(json.loads(line))
+
+def read_osm(path: str) -> Iterator[Dict]:
+    """Stream tagged nodes and ways of an OSM PBF extract as it is read (requires pyosmium 3.7+)"""
+    import osmium
+
+    # with_locations() fills in the coordinates of way nodes
+    for obj in osmium.FileProcessor(path, osmium.osm.NODE | osmium.osm.WAY).with_locations():
+        if "amenity" not in obj.tags:
+            continue
+        if obj.is_node():
+            yield {**dict(obj.tags), "latitude": obj.location.lat, "longitude": obj.location.lon}
+            continue
+        points = [(nd.lat, nd.lon) for nd in obj.nodes if nd.location.valid()]
+        if points:
+            yield {
+                **dict(obj.tags),
+                "latitude": sum(p[0] for p in points) / len(points),
+                "longitude": sum(p[1] for p in points) / len(points)
+            }
+
+READERS = {
+    "csv": read_csv,
+    "geojson": read_geojson,
+    "geojsonseq": read_geojsonseq,
+    "osm": read_osm
+}
+
+def _first(row: Dict, fields: Iterable[str]):
+    """Get the first non-empty value among candidate field names"""
+    for field in fields:
+        value = row.get(field)
+        if value not in (None, ""):
+            return value
+    return None
+
+def validate_coordinates(lat, lon) -> Optional[Tuple[float, float]]:
+    """Return (lat, lon) as floats, or None if missing, non-finite or out of range"""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (math.isfinite(lat) and math.isfinite(lon)):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+def _from_epoch(value: float) -> datetime.datetime:
+    """UTC datetime of Unix epoch seconds or milliseconds"""
+    if not math.isfinite(value):
+        raise ValueError(f"Invalid epoch time: {value}")
+    if abs(value) >= EPOCH_MILLISECONDS:
+        value /= 1000
+    try:
+        return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+    except (OverflowError, OSError) as e:
+        raise ValueError(f"Invalid epoch time: {value}") from e
+
+def parse_timestamp(value, date_format: Optional[str] = None) -> Optional[str]:
+    """Normalize an imported time to UTC "YYYY-MM-DD HH:MM:SS" like CURRENT_TIMESTAMP (None if missing).
+
+    Accepts ISO 8601 (times without an offset are taken as UTC), Unix epoch
+    seconds or milliseconds, and date_format (a strptime pattern) for other
+    layouts such as "%d/%m/%Y". Raises ValueError for anything else.
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid time: {value!r}")
+    if isinstance(value, (int, float)):
+        parsed = _from_epoch(float(value))
+    else:
+        text = str(value).strip()
+        parsed = None
+        if date_format:
+            try:
+                parsed = datetime.datetime.strptime(text, date_format)
+            except ValueError:
+                pass
+        if parsed is None:
+            try:
+                parsed = datetime.datetime.fromisoformat(text[:-1] + "+00:00" if text.endswith("Z") else text)
+            except ValueError:
+                try:
+                    parsed = _from_epoch(float(text))
+                except ValueError:
+                    raise ValueError(f"Invalid time: {value!r}") from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+def to_record(table: str, row: Dict, amenity: Optional[str] = None,
+              created_by: Optional[int] = None, date_format: Optional[str] = None) -> Optional[tuple]:
+    """Map a parsed row onto the insert columns of a table, or None if invalid"""
+    coordinates = validate_coordinates(_first(row, LATITUDE_FIELDS), _first(row, LONGITUDE_FIELDS))
+    if coordinates is None:
+        return None
+    lat, lon = coordinates
+
+    if table == "resource":
+        kind = amenity or _first(row, ("amenity", "type", "healthcare", "emergency"))
+        name = _first(row, ("name", "name:en", "official_name"))
+        if not kind:
+            return None
+        return (str(kind), str(name) if name else str(kind), lat, lon, created_by)
+
+    try:
+        # A report whose time cannot be read is skipped rather than stamped with the import time
+        timestamp = parse_timestamp(_first(row, ("timestamp", "time", "date")), date_format)
+    except ValueError:
+        return None
+    location = _first(row, ("location", "address", "place", "name"))
+    text = _first(row, ("text", "description", "report"))
+    return (str(location) if location else f"{lat:.5f}, {lon:.5f}", lat, lon,
+            str(text) if text else "", timestamp)
+
+def chunked(records: Iterable, size: int) -> Iterator[List]:
+    """Split an iterable into lists of at most size items"""
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def bulk_import(path: str, table: str = "resource", fmt: Optional[str] = None,
+                chunk_size: int = 50000, amenity: Optional[str] = None,
+                created_by: Optional[int] = None, db_path: Optional[str] = None,
+                date_format: Optional[str] = None) -> Dict:
+    """Load a file into the resource or emergency table in a single transaction.
+
+    Triggers and secondary indexes on the target table are dropped for the
+    duration of the load and rebuilt once at the end, so the per-row cost is a
+    plain B-tree append. Emergency times are normalized with parse_timestamp.
+    Returns counts of inserted and skipped rows.
+    """
+    if table not in IMPORT_COLUMNS:
+        raise ValueError(f"Unsupported table: {table}")
+    fmt = fmt or detect_format(path)
+    if fmt not in READERS:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    columns = IMPORT_COLUMNS[table]
+    placeholders = ", ".join("COALESCE(?, CURRENT_TIMESTAMP)" if c == "timestamp" else "?" for c in columns)
+    insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    key = SPATIAL_TABLES[table]
+
+    started = time.perf_counter()
+    inserted = skipped = 0
+    conn = sqlite3.connect(db_path or config["DB_PATH"], isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -262144")  # 256 MB
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # Defer index maintenance until all rows are in
+            for suffix in ("ai", "au", "ad"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {table}_rtree_{suffix}")
+                cursor.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{suffix}")
+                cursor.execute(f"DROP TRIGGER IF EXISTS {table}_changes_{suffix}")
+            for name in INDEXES.get(table, {}):
+                cursor.execute(f"DROP INDEX IF EXISTS {name}")
+            cursor.execute(f"SELECT COALESCE(MAX({key}), 0) FROM {table}")
+            last_id = cursor.fetchone()[0]
+
+            for chunk in chunked(READERS[fmt](path), chunk_size):
+                records = [to_record(table, row, amenity, created_by, date_format) for row in chunk]
+                valid = [record for record in records if record is not None]
+                skipped += len(records) - len(valid)
+                cursor.executemany(insert_sql, valid)
+                inserted += len(valid)
+
+            rebuild_spatial_index(cursor, table, after_id=last_id)
+            for statement in spatial_trigger_ddl(table, key):
+                cursor.execute(statement)
+            if table in FTS_TABLES:
+                rebuild_fts_index(cursor, table, after_id=last_id)
+                for statement in fts_trigger_ddl(table):
+                    cursor.execute(statement)
+            # One marker instead of a change per row; live views reload on it
+            cursor.execute(
+                "INSERT INTO change_log (table_name, row_id, op) VALUES (?, NULL, 'bulk')",
+                (table,)
+            )
+            for statement in change_trigger_ddl(table, CHANGE_TABLES[table][0]):
+                cursor.execute(statement)
+            for statement in INDEXES.get(table, {}).values():
+                cursor.execute(statement)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute(f"ANALYZE {table}")
+    finally:
+        conn.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "table": table,
+        "format": fmt,
+        "inserted": inserted,
+        "skipped": skipped,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(inserted / seconds) if seconds else inserted
+    }
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Bulk import resources or emergencies")
+    parser.add_argument("path", help="CSV, GeoJSON, line-delimited GeoJSON or OSM PBF file")
+    parser.add_argument("--table", choices=sorted(IMPORT_COLUMNS), default="resource")
+    parser.add_argument("--format", dest="fmt", choices=sorted(READERS), default=None,
+                        help="Input format (guessed from the extension by default)")
+    parser.add_argument("--amenity", default=None, help="Amenity type for every imported resource")
+    parser.add_argument("--created-by", type=int, default=None, help="Volunteer id to attribute resources to")
+    parser.add_argument("--date-format", default=None,
+                        help="strptime pattern for report times that are not ISO 8601 or epoch, e.g. %%d/%%m/%%Y")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--db", default=None, help="Database path (defaults to DB_PATH from config)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        parser.error(f"File not found: {args.path}")
+
+    from modules.database import init_db
+    init_db(args.db)
+    stats = bulk_import(args.path, table=args.table, fmt=args.fmt, chunk_size=args.chunk_size,
+                        amenity=args.amenity, created_by=args.created_by, db_path=args.db,
+                        date_format=args.date_format)
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    main()
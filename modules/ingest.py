@@ -0,0 +1,243 @@
+"""Single-writer ingestion queue that group-commits concurrent inserts
+
+With WRITE_BATCHING enabled, add_emergency and add_resource hand their rows to
+one writer thread instead of each opening a connection and committing on its
+own. The writer takes everything that queued up while the previous commit was
+running (up to WRITE_BATCH_SIZE inserts) and writes it in one transaction, so
+a surge of reports costs one fsync per batch and never fights over the lock.
+Incident clustering's text similarity and reverse geocoding run in the
+submitting thread before a report is queued, so the writer only runs SQL.
+"""
+import queue
+import sqlite3
+import threading
+import time
+import streamlit as st
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional
+from config import config
+from modules.database import get_db_connection, entity_rows
+
+_state = {
+    "queue": None
+}
+_lock = threading.Lock()
+
+class IngestQueueFull(Exception):
+    """Raised when the write queue stays full for longer than the submit timeout"""
+
+def _unscored(text_a: str, text_b: str) -> float:
+    """Similarity for incidents that appeared after a report was scored: rank them by distance only"""
+    return 0.0
+
+def insert_emergency(cur, location: str, lat: float, lon: float, text: str,
+                     emergency_type: Optional[str] = None, confidence: Optional[float] = None,
+                     severity: Optional[str] = None, entities: Optional[Dict[str, List[str]]] = None,
+                     cluster: bool = True, scores: Optional[Dict[int, float]] = None,
+                     label: Optional[str] = None) -> int:
+    """Insert an emergency, its entities and its incident assignment using an open cursor.
+
+    scores and label come from clustering.prepare_assignment, run before queueing.
+    """
+    cur.execute(
+        '''INSERT INTO emergency (location, latitude, longitude, text, emergency_type, confidence, severity)
+           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+        (location, lat, lon, text, emergency_type, confidence, severity)
+    )
+    eid = cur.lastrowid
+    if entities:
+        cur.executemany("INSERT INTO emergency_entity (eid, label, value) VALUES (?, ?, ?)",
+                        entity_rows({eid: entities}))
+    if cluster:
+        from modules.clustering import _assign
+
+        cur.execute("SELECT timestamp FROM emergency WHERE eid = ?", (eid,))
+        _assign(cur, eid, location, lat, lon, text, cur.fetchone()["timestamp"],
+                config.get("INCIDENT_RADIUS_KM", 1.0), config.get("INCIDENT_WINDOW_HOURS", 6),
+                _unscored, scores or {}, label or location)
+    return eid
+
+def insert_resource(cur, amenity: str, name: str, lat: float, lon: float, created_by: int) -> int:
+    """Insert a resource using an open cursor"""
+    cur.execute(
+        '''INSERT INTO resource (amenity, name, latitude, longitude, created_by)
+           VALUES (?, ?, ?, ?, ?)''',
+        (amenity, name, lat, lon, created_by)
+    )
+    return cur.lastrowid
+
+class WriteQueue:
+    """Bounded queue of inserts drained by one writer thread into group commits.
+
+    submit() returns a Future per insert that resolves to the insert's result
+    (e.g. the new row id) once its batch has committed, or to the exception
+    that insert raised. A failing insert is rolled back to its own savepoint
+    and does not affect the rest of the batch. When max_pending inserts are
+    already waiting, submit() blocks for up to submit_timeout seconds and then
+    raises IngestQueueFull, pushing back on callers instead of growing without
+    bound.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_batch: int = 500, max_pending: int = 10000,
+                 linger: float = 0.0, submit_timeout: float = 5.0):
+        self.db_path = db_path or config["DB_PATH"]
+        self.max_batch = max_batch
+        self.linger = linger
+        self.submit_timeout = submit_timeout
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {"batches": 0, "writes": 0, "failed": 0, "largest_batch": 0}
+
+    def submit(self, op: Callable, *args, **kwargs) -> Future:
+        """Queue op(cursor, *args, **kwargs) for the next group commit"""
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put((op, args, kwargs, future), timeout=self.submit_timeout)
+        except queue.Full:
+            raise IngestQueueFull(f"Write queue full ({self._queue.maxsize} pending inserts)")
+        return future
+
+    def close(self, timeout: Optional[float] = None):
+        """Commit everything already queued, then stop the writer thread.
+
+        Waits up to timeout seconds (submit_timeout when None) for room to queue
+        the stop request, raising IngestQueueFull if none frees up.
+        """
+        if self._thread is not None:
+            try:
+                self._queue.put(None, timeout=self.submit_timeout if timeout is None else timeout)
+            except queue.Full:
+                raise IngestQueueFull(f"Write queue full ({self._queue.maxsize} pending inserts), writer not stopped")
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+                self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = get_db_connection(self.db_path)
+        conn.isolation_level = None
+        # WAL lets readers keep going while a batch commits; one fsync per batch at checkpoints
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(config.get('WRITE_BUSY_TIMEOUT_MS', 5000))}")
+        return conn
+
+    def _next_batch(self) -> Optional[List]:
+        """Block for one insert, then take whatever else is waiting (None means stop)"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.linger
+        while batch[-1] is not None and len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch = self._next_batch()
+                stop = batch[-1] is None
+                items = [item for item in batch if item is not None]
+                if items:
+                    self._commit(conn, items)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, items: List):
+        """Write one batch in a single transaction and resolve its futures"""
+        outcomes = []
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            for op, args, kwargs, future in items:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cur.execute("SAVEPOINT ingest_item")
+                try:
+                    outcomes.append((future, op(cur, *args, **kwargs), None))
+                    cur.execute("RELEASE ingest_item")
+                except Exception as e:
+                    cur.execute("ROLLBACK TO ingest_item")
+                    cur.execute("RELEASE ingest_item")
+                    outcomes.append((future, None, e))
+            cur.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            self.stats["failed"] += len(items)
+            return
+
+        self.stats["batches"] += 1
+        self.stats["writes"] += len(outcomes)
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(items))
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                self.stats["failed"] += 1
+                future.set_exception(error)
+
+def get_write_queue() -> WriteQueue:
+    """Get the process-wide write queue for DB_PATH"""
+    with _lock:
+        if _state["queue"] is None or _state["queue"].db_path != config["DB_PATH"]:
+            _state["queue"] = WriteQueue(
+                max_batch=config.get("WRITE_BATCH_SIZE", 500),
+                max_pending=config.get("WRITE_QUEUE_SIZE", 10000),
+                linger=config.get("WRITE_BATCH_DELAY_MS", 0) / 1000
+            )
+        return _state["queue"]
+
+def _wait(op: Callable, *args):
+    """Queue a write, wait for its commit and report failures like execute_query.
+
+    None always means nothing was written, so callers can safely offer a retry.
+    """
+    try:
+        future = get_write_queue().submit(op, *args)
+    except IngestQueueFull:
+        st.error("The system is receiving too many reports right now. Please try again in a moment.")
+        return None
+    try:
+        try:
+            return future.result(timeout=config.get("WRITE_RESULT_TIMEOUT", 30))
+        except FutureTimeoutError:
+            if future.cancel():
+                # Still queued: the writer skips cancelled writes, so a retry cannot duplicate it
+                st.error("Saving is taking longer than expected. Please try again.")
+                return None
+            # Its batch is already being written: wait for the outcome rather than guess it
+            return future.result()
+    except sqlite3.Error as e:
+        st.error(f"Database error: {e}")
+    return None
+
+def ingest_emergency(location: str, lat: float, lon: float, text: str,
+                     emergency_type: Optional[str] = None, confidence: Optional[float] = None,
+                     severity: Optional[str] = None, entities: Optional[Dict[str, List[str]]] = None,
+                     cluster: bool = True) -> Optional[int]:
+    """Add an emergency through the write queue and return its id (None on failure)"""
+    scores, label = {}, location
+    if cluster:
+        from modules.clustering import prepare_assignment
+        scores, label = prepare_assignment(location, lat, lon, text)
+    return _wait(insert_emergency, location, lat, lon, text, emergency_type, confidence,
+                 severity, entities, cluster, scores, label)
+
+def ingest_resource(amenity: str, name: str, lat: float, lon: float, created_by: int) -> Optional[int]:
+    """Add a resource through the write queue and return its id (None on failure)"""
+    return _wait(insert_resource, amenity, name, lat, lon, created_by)
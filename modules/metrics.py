@@ -0,0 +1,226 @@
+"""Lightweight timers, counters and latency histograms for hot paths
+
+Instrumentation is off unless METRICS_ENABLED is set; while off, timed() and
+timer() cost a single flag check. Collected metrics are available as
+Prometheus text (prometheus_text, dump_metrics, or an HTTP endpoint on
+METRICS_PORT) and in the admin dashboard's Metrics tab.
+"""
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from config import config
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PREFIX = "disaster"
+
+_state = {
+    "enabled": bool(config.get("METRICS_ENABLED", False)),
+    "server": None
+}
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+class Histogram:
+    """Latency distribution of one operation in fixed buckets"""
+    __slots__ = ("buckets", "count", "total", "errors", "max")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.max = 0.0
+
+    def observe(self, seconds: float, error: bool = False):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.errors += error
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket holding it"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+def is_enabled() -> bool:
+    """Whether instrumentation is collecting"""
+    return _state["enabled"]
+
+def set_enabled(enabled: bool):
+    """Turn collection on or off at runtime"""
+    _state["enabled"] = bool(enabled)
+
+def reset():
+    """Forget everything collected so far"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+def observe(operation: str, seconds: float, error: bool = False):
+    """Record one timed call of an operation"""
+    with _lock:
+        histogram = _histograms.get(operation)
+        if histogram is None:
+            histogram = _histograms[operation] = Histogram()
+        histogram.observe(seconds, error)
+
+def increment(event: str, value: float = 1):
+    """Add to an event counter (no-op while disabled)"""
+    if not _state["enabled"]:
+        return
+    with _lock:
+        _counters[event] = _counters.get(event, 0) + value
+
+@contextmanager
+def timer(operation: str):
+    """Time the enclosed block; an exception escaping it counts as an error"""
+    if not _state["enabled"]:
+        yield
+        return
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe(operation, time.perf_counter() - started, error)
+
+def timed(operation: Optional[str] = None):
+    """Decorator timing every call of a function (named module.function by default)"""
+    def decorate(func):
+        name = operation or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state["enabled"]:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                observe(name, time.perf_counter() - started, True)
+                raise
+            observe(name, time.perf_counter() - started)
+            return result
+        return wrapper
+    return decorate
+
+def snapshot() -> List[Dict]:
+    """Per-operation summary, slowest total time first"""
+    with _lock:
+        items = list(_histograms.items())
+    rows = [
+        {
+            "operation": name,
+            "count": h.count,
+            "errors": h.errors,
+            "total_s": round(h.total, 3),
+            "mean_ms": round(h.total / h.count * 1000, 2) if h.count else 0.0,
+            "p50_ms": round(h.quantile(0.5) * 1000, 2),
+            "p95_ms": round(h.quantile(0.95) * 1000, 2),
+            "p99_ms": round(h.quantile(0.99) * 1000, 2),
+            "max_ms": round(h.max * 1000, 2)
+        }
+        for name, h in items
+    ]
+    return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+def counters() -> Dict[str, float]:
+    """Current value of every event counter"""
+    with _lock:
+        return dict(_counters)
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_text() -> str:
+    """Render all metrics in the Prometheus text exposition format"""
+    with _lock:
+        histograms = {name: (list(h.buckets), h.count, h.total, h.errors) for name, h in _histograms.items()}
+        events = dict(_counters)
+
+    lines = [
+        f"# HELP {PREFIX}_operation_seconds Latency of instrumented operations",
+        f"# TYPE {PREFIX}_operation_seconds histogram"
+    ]
+    for name, (buckets, count, total, _) in sorted(histograms.items()):
+        label = f'operation="{_label(name)}"'
+        cumulative = 0
+        for bound, n in zip(BUCKETS, buckets):
+            cumulative += n
+            lines.append(f'{PREFIX}_operation_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'{PREFIX}_operation_seconds_bucket{{{label},le="+Inf"}} {count}')
+        lines.append(f"{PREFIX}_operation_seconds_sum{{{label}}} {total:.6f}")
+        lines.append(f"{PREFIX}_operation_seconds_count{{{label}}} {count}")
+
+    lines.append(f"# HELP {PREFIX}_operation_errors_total Instrumented calls that raised")
+    lines.append(f"# TYPE {PREFIX}_operation_errors_total counter")
+    for name, (_, _, _, errors) in sorted(histograms.items()):
+        lines.append(f'{PREFIX}_operation_errors_total{{operation="{_label(name)}"}} {errors}')
+
+    lines.append(f"# HELP {PREFIX}_events_total Counted events")
+    lines.append(f"# TYPE {PREFIX}_events_total counter")
+    for name, value in sorted(events.items()):
+        lines.append(f'{PREFIX}_events_total{{event="{_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+def dump_metrics(path: Optional[str] = None) -> str:
+    """Write the Prometheus text to a file (e.g. for node_exporter's textfile collector)"""
+    path = path or config.get("METRICS_FILE", "metrics.prom")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+    return path
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves /metrics for Prometheus scrapes"""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port: Optional[int] = None, host: Optional[str] = None):
+    """Serve /metrics from a background thread once per process (no-op without a port)"""
+    port = port or config.get("METRICS_PORT")
+    if not port:
+        return None
+    with _lock:
+        if _state["server"] is None:
+            try:
+                server = ThreadingHTTPServer((host or config.get("METRICS_HOST", "127.0.0.1"), int(port)),
+                                             MetricsHandler)
+            except OSError:
+                # Another process (e.g. a second Streamlit worker) already serves this port
+                return None
+            threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+            _state["server"] = server
+        return _state["server"]
@@ -0,0 +1,169 @@
+"""Shared inference server: one copy of each model per host
+
+Every Streamlit process that sets MODEL_SERVER_URL sends classify,
+classify_image, extract, summarize and transcribe calls here instead of
+loading the models itself. Concurrent requests for the same task are
+coalesced into batched forward passes.
+
+Usage:
+    python -m modules.model_server --port 8765 --preload classify extract
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from config import config
+from modules.batching import MicroBatcher
+from modules import processing
+
+def _decode_image(data: bytes) -> bytes:
+    """Check that uploaded bytes are an image Pillow can read (raises otherwise)"""
+    from PIL import Image
+
+    Image.open(io.BytesIO(data)).verify()
+    return data
+
+def _decode_audio(data: bytes, suffix: str = None) -> Dict:
+    """Decode uploaded audio to a waveform for the ASR pipeline (raises if it cannot be decoded)"""
+    from modules.audio import SAMPLE_RATE, load_audio
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix or ".wav") as f:
+        f.write(data)
+    try:
+        return {"raw": load_audio(f.name), "sampling_rate": SAMPLE_RATE}
+    finally:
+        os.unlink(f.name)
+
+def _decode_payload(task: str, payload: Dict) -> Dict:
+    """Decode a request's base64 upload before it joins a batch, so a bad one fails only its own request"""
+    if task == "classify_image":
+        return {"image": _decode_image(base64.b64decode(payload["image"], validate=True))}
+    if task == "transcribe":
+        return {"audio": _decode_audio(base64.b64decode(payload["audio"], validate=True), payload.get("suffix"))}
+    return payload
+
+def create_batchers() -> Dict[str, MicroBatcher]:
+    """One batcher per task; summarization and ASR batches stay small (long sequences)"""
+    max_batch = config.get("MODEL_SERVER_MAX_BATCH", 16)
+    max_wait = config.get("MODEL_SERVER_BATCH_WAIT_MS", 10) / 1000
+    return {
+        "classify": MicroBatcher(
+            lambda payloads: [{"label": label, "confidence": confidence} for label, confidence
+                              in processing.classify_texts([p["text"] for p in payloads])],
+            max_batch, max_wait, name="classify"
+        ),
+        "classify_image": MicroBatcher(
+            lambda payloads: [{"label": label, "confidence": confidence} for label, confidence
+                              in processing.classify_images([p["image"] for p in payloads])],
+            max_batch, max_wait, name="classify_image"
+        ),
+        "extract": MicroBatcher(
+            lambda payloads: [{"entities": entities} for entities
+                              in processing.extract_entities_batch([p["text"] for p in payloads])],
+            max_batch, max_wait, name="extract"
+        ),
+        "summarize": MicroBatcher(
+            lambda payloads: [{"summary": summary} for summary
+                              in processing.summarize_texts([p["text"] for p in payloads])],
+            min(max_batch, 4), max_wait, name="summarize"
+        ),
+        "transcribe": MicroBatcher(
+            lambda payloads: [{"text": text} for text in processing.transcribe_files([p["audio"] for p in payloads])],
+            min(max_batch, 4), max_wait, name="transcribe"
+        )
+    }
+
+# Field each task needs in its JSON payload
+REQUIRED_FIELDS = {
+    "classify": "text",
+    "classify_image": "image",
+    "extract": "text",
+    "summarize": "text",
+    "transcribe": "audio"
+}
+
+# Sample inputs that make each task load its model
+WARMUP = {
+    "classify": {"text": "fire in a building"},
+    "extract": {"text": "Flood in Mumbai, two people trapped"},
+    "summarize": {"text": "A flood hit the city. Several roads are closed and people were evacuated."}
+}
+
+class ModelRequestHandler(BaseHTTPRequestHandler):
+    """POST /<task> with a JSON payload; GET /health for batching statistics"""
+    batchers: Dict[str, MicroBatcher] = {}
+
+    def _send(self, status: int, body: Dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send(404, {"error": "Not found"})
+            return
+        self._send(200, {"status": "ok", "batches": {name: b.stats for name, b in self.batchers.items()}})
+
+    def do_POST(self):
+        batcher = self.batchers.get(self.path.strip("/"))
+        if batcher is None:
+            self._send(404, {"error": f"Unknown task: {self.path}"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            self._send(400, {"error": "Invalid JSON"})
+            return
+        # Reject bad payloads here so they cannot fail a whole batch
+        task = self.path.strip("/")
+        field = REQUIRED_FIELDS[task]
+        if not isinstance(payload, dict) or not isinstance(payload.get(field), str):
+            self._send(400, {"error": f"Missing field: {field}"})
+            return
+        try:
+            payload = _decode_payload(task, payload)
+        except Exception as e:
+            self._send(400, {"error": f"Invalid {field}: {e}"})
+            return
+        try:
+            self._send(200, batcher(payload, timeout=config.get("MODEL_SERVER_TIMEOUT", 300)))
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(host: str = "127.0.0.1", port: int = 8765, preload: List[str] = ()):
+    """Run the inference server until interrupted"""
+    ModelRequestHandler.batchers = create_batchers()
+    for task in preload:
+        ModelRequestHandler.batchers[task](WARMUP[task])
+    server = ThreadingHTTPServer((host, port), ModelRequestHandler)
+    server.daemon_threads = True
+    print(f"Model server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Shared inference server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--preload", nargs="*", choices=sorted(WARMUP), default=[],
+                        help="Load these models before accepting requests")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.preload)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
+import os
 import streamlit as st
 from functools import lru_cache
-import spacy
+from typing import List, Optional, Tuple
+import numpy as np
 from config import config
+from modules.metrics import timer
+
+# INFERENCE_BACKEND values: full-precision PyTorch, dynamically int8-quantized
+# PyTorch, or ONNX Runtime (int8 CLIP text encoder, exported BART)
+INFERENCE_BACKENDS = ("torch", "int8", "onnx")
 
 # Global variables for models and processors
 models = {
@@ -10,45 +17,52 @@ models = {
     "nlp": None,
     "entity_ruler": None,
     "clip_model": None,
-    "clip_processor": None
+    "clip_processor": None,
+    "clip_text_encoder": None,
+    "clip_image_encoder": None,
+    "asr": None
 }
 
+# Rule-based entities recognised on top of the statistical NER (more can be added
+# through ENTITY_PATTERN_FILES, see modules.entity_patterns)
+ENTITY_PATTERNS = [
+    {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "earthquake"}]},
+    {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "fire"}]},
+    {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "flood"}]},
+    {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "hurricane"}]},
+    {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "tornado"}]},
+    {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "tsunami"}]},
+    {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "landslide"}]},
+    {"label": "SEVERITY", "pattern": [{"lower": "critical"}]},
+    {"label": "SEVERITY", "pattern": [{"lower": "severe"}]},
+    {"label": "SEVERITY", "pattern": [{"lower": "urgent"}]},
+    {"label": "SEVERITY", "pattern": [{"lower": "major"}]},
+    {"label": "SEVERITY", "pattern": [{"lower": "minor"}]},
+    {"label": "VICTIM_CONDITION", "pattern": [{"lower": "injured"}]},
+    {"label": "VICTIM_CONDITION", "pattern": [{"lower": "unconscious"}]},
+    {"label": "VICTIM_CONDITION", "pattern": [{"lower": "stuck"}]},
+    {"label": "VICTIM_CONDITION", "pattern": [{"lower": "trapped"}]},
+    {"label": "VICTIM_CONDITION", "pattern": [{"lower": "missing"}]},
+    {"label": "DAMAGE", "pattern": [{"lower": "collapsed"}]},
+    {"label": "DAMAGE", "pattern": [{"lower": "destroyed"}]},
+    {"label": "DAMAGE", "pattern": [{"lower": "damaged"}]},
+    {"label": "DAMAGE", "pattern": [{"lower": "flooded"}]},
+    {"label": "DAMAGE", "pattern": [{"lower": "burned"}]}
+]
+
 @lru_cache(maxsize=1)
 def get_nlp():
     """Lazy load spaCy NLP model"""
     if models["nlp"] is None:
         st.info("Loading language model... This may take a moment.")
-        models["nlp"] = spacy.load(config["SPACY_MODEL"])
-
-        # Add entity ruler if not already present
-        if "entity_ruler" not in [pipe for pipe, _ in models["nlp"].pipeline]:
-            ruler = models["nlp"].add_pipe("entity_ruler", before="ner")
-            patterns = [
-                {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "earthquake"}]},
-                {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "fire"}]},
-                {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "flood"}]},
-                {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "hurricane"}]},
-                {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "tornado"}]},
-                {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "tsunami"}]},
-                {"label": "EMERGENCY_TYPE", "pattern": [{"lower": "landslide"}]},
-                {"label": "SEVERITY", "pattern": [{"lower": "critical"}]},
-                {"label": "SEVERITY", "pattern": [{"lower": "severe"}]},
-                {"label": "SEVERITY", "pattern": [{"lower": "urgent"}]},
-                {"label": "SEVERITY", "pattern": [{"lower": "major"}]},
-                {"label": "SEVERITY", "pattern": [{"lower": "minor"}]},
-                {"label": "VICTIM_CONDITION", "pattern": [{"lower": "injured"}]},
-                {"label": "VICTIM_CONDITION", "pattern": [{"lower": "unconscious"}]},
-                {"label": "VICTIM_CONDITION", "pattern": [{"lower": "stuck"}]},
-                {"label": "VICTIM_CONDITION", "pattern": [{"lower": "trapped"}]},
-                {"label": "VICTIM_CONDITION", "pattern": [{"lower": "missing"}]},
-                {"label": "DAMAGE", "pattern": [{"lower": "collapsed"}]},
-                {"label": "DAMAGE", "pattern": [{"lower": "destroyed"}]},
-                {"label": "DAMAGE", "pattern": [{"lower": "damaged"}]},
-                {"label": "DAMAGE", "pattern": [{"lower": "flooded"}]},
-                {"label": "DAMAGE", "pattern": [{"lower": "burned"}]}
-            ]
-            ruler.add_patterns(patterns)
-            models["entity_ruler"] = ruler
+        from modules.entity_patterns import load_pipeline
+
+        with timer("model.load.spacy"):
+            # The model with its entity ruler is compiled once per pattern version (modules.entity_patterns);
+            # components extract_entities does not need can be excluded (SPACY_EXCLUDE) to speed up CPU inference
+            models["nlp"] = load_pipeline()
+        if "entity_ruler" in models["nlp"].pipe_names:
+            models["entity_ruler"] = models["nlp"].get_pipe("entity_ruler")
     return models["nlp"]
 
 @lru_cache(maxsize=1)
@@ -56,17 +70,277 @@ def get_tokenizer_and_summarization_model():
     """Lazy load summarization model and tokenizer"""
     if models["tokenizer"] is None or models["summarization"] is None:
         st.info("Loading summarization model... This may take a moment.")
-        from transformers import BartTokenizer, BartForConditionalGeneration
-        models["tokenizer"] = BartTokenizer.from_pretrained(config["SUMMARIZATION_MODEL"])
-        models["summarization"] = BartForConditionalGeneration.from_pretrained(config["SUMMARIZATION_MODEL"])
+        with timer("model.load.bart"):
+            models["tokenizer"], models["summarization"] = load_summarizer()
     return models["tokenizer"], models["summarization"]
 
+@lru_cache(maxsize=1)
+def get_asr_pipeline():
+    """Lazy load the speech recognition pipeline"""
+    if models["asr"] is None:
+        import torch
+        from transformers import pipeline
+
+        with timer("model.load.asr"):
+            models["asr"] = pipeline(
+                task="automatic-speech-recognition",
+                model=config["ASR_MODEL"],
+                device="cuda:0" if torch.cuda.is_available() else "cpu"
+            )
+    return models["asr"]
+
 @lru_cache(maxsize=1)
 def get_clip_model_and_processor():
     """Lazy load CLIP model and processor"""
     if models["clip_model"] is None or models["clip_processor"] is None:
         st.info("Loading CLIP model... This may take a moment.")
         from transformers import CLIPProcessor, CLIPModel
-        models["clip_model"] = CLIPModel.from_pretrained(config["CLIP_MODEL"])
-        models["clip_processor"] = CLIPProcessor.from_pretrained(config["CLIP_MODEL"])
+        with timer("model.load.clip"):
+            models["clip_model"] = CLIPModel.from_pretrained(config["CLIP_MODEL"])
+            models["clip_processor"] = CLIPProcessor.from_pretrained(config["CLIP_MODEL"])
     return models["clip_model"], models["clip_processor"]
+
+def inference_backend(backend: Optional[str] = None) -> str:
+    """The configured inference backend, validated"""
+    backend = backend or config.get("INFERENCE_BACKEND", "torch")
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND: {backend}")
+    return backend
+
+def model_cache_path(model_name: str, variant: str) -> str:
+    """Where an exported or quantized copy of a model is kept between runs"""
+    root = config.get("MODEL_CACHE_DIR", "model_cache")
+    os.makedirs(root, exist_ok=True)
+    return os.path.join(root, f"{model_name.replace('/', '--')}-{variant}")
+
+def quantize_int8(model):
+    """Dynamically quantize the Linear layers of a PyTorch model to int8 (CPU inference)"""
+    import torch
+    return torch.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+def load_cached_int8(model_name: str, model_class, variant: str = "int8-state.pt"):
+    """Load an int8-quantized model from the cache, quantizing and saving its weights on first use"""
+    import torch
+
+    path = model_cache_path(model_name, variant)
+    if os.path.exists(path):
+        # Only the quantized weights are stored, and read back with weights_only, so a file
+        # placed in MODEL_CACHE_DIR cannot run code; the module is rebuilt from the model config
+        model = quantize_int8(model_class(model_class.config_class.from_pretrained(model_name)))
+        model.load_state_dict(torch.load(path, weights_only=True))
+        return model.eval()
+    model = quantize_int8(model_class.from_pretrained(model_name))
+    torch.save(model.state_dict(), f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    return model
+
+class ClipTextEncoder:
+    """CLIP text tower mapping texts to L2-normalized embeddings on one inference backend"""
+
+    def __init__(self, model_name: Optional[str] = None, backend: Optional[str] = None):
+        from transformers import CLIPTokenizer, CLIPTextModelWithProjection
+
+        self.model_name = model_name or config["CLIP_MODEL"]
+        self.backend = inference_backend(backend)
+        self.tokenizer = CLIPTokenizer.from_pretrained(self.model_name)
+        self.session = None
+        self.model = None
+        if self.backend == "onnx":
+            self.session = self._onnx_session()
+        elif self.backend == "int8":
+            self.model = load_cached_int8(self.model_name, CLIPTextModelWithProjection)
+        else:
+            self.model = CLIPTextModelWithProjection.from_pretrained(self.model_name).eval()
+
+    def _onnx_session(self):
+        """Export the text tower to ONNX and quantize it to int8 once, then open it with ONNX Runtime"""
+        import onnxruntime as ort
+
+        path = model_cache_path(self.model_name, "text-int8.onnx")
+        if not os.path.exists(path):
+            import torch
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            from transformers import CLIPTextModelWithProjection
+
+            model = CLIPTextModelWithProjection.from_pretrained(self.model_name).eval()
+
+            class TextEmbeddings(torch.nn.Module):
+                def __init__(self, clip):
+                    super().__init__()
+                    self.clip = clip
+
+                def forward(self, input_ids, attention_mask):
+                    return self.clip(input_ids=input_ids, attention_mask=attention_mask).text_embeds
+
+            sample = self.tokenizer(["a photo of a fire"], return_tensors="pt", padding=True)
+            fp32_path = model_cache_path(self.model_name, "text-fp32.onnx")
+            torch.onnx.export(
+                TextEmbeddings(model),
+                (sample["input_ids"], sample["attention_mask"]),
+                fp32_path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["text_embeds"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "text_embeds": {0: "batch"}
+                },
+                opset_version=14
+            )
+            quantize_dynamic(fp32_path, f"{path}.tmp", weight_type=QuantType.QInt8)
+            os.replace(f"{path}.tmp", path)
+            os.remove(fp32_path)
+
+        options = ort.SessionOptions()
+        threads = config.get("ONNX_THREADS")
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch of texts, one normalized row per text"""
+        if self.session is not None:
+            inputs = self.tokenizer(list(texts), return_tensors="np", padding=True, truncation=True)
+            embeddings = self.session.run(["text_embeds"], {
+                "input_ids": inputs["input_ids"].astype(np.int64),
+                "attention_mask": inputs["attention_mask"].astype(np.int64)
+            })[0]
+        else:
+            import torch
+            inputs = self.tokenizer(list(texts), return_tensors="pt", padding=True, truncation=True)
+            with torch.inference_mode():
+                embeddings = self.model(**inputs).text_embeds.numpy()
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+class ClipImageEncoder:
+    """CLIP vision tower mapping images to L2-normalized embeddings on one inference backend"""
+
+    def __init__(self, model_name: Optional[str] = None, backend: Optional[str] = None):
+        from transformers import CLIPImageProcessor, CLIPVisionModelWithProjection
+
+        self.model_name = model_name or config["CLIP_MODEL"]
+        self.backend = inference_backend(backend)
+        self.processor = CLIPImageProcessor.from_pretrained(self.model_name)
+        self.session = None
+        self.model = None
+        if self.backend == "onnx":
+            self.session = self._onnx_session()
+        elif self.backend == "int8":
+            self.model = load_cached_int8(self.model_name, CLIPVisionModelWithProjection,
+                                          variant="vision-int8-state.pt")
+        else:
+            self.model = CLIPVisionModelWithProjection.from_pretrained(self.model_name).eval()
+
+    def _onnx_session(self):
+        """Export the vision tower to ONNX and quantize it to int8 once, then open it with ONNX Runtime"""
+        import onnxruntime as ort
+
+        path = model_cache_path(self.model_name, "vision-int8.onnx")
+        if not os.path.exists(path):
+            import torch
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            from transformers import CLIPVisionModelWithProjection
+
+            model = CLIPVisionModelWithProjection.from_pretrained(self.model_name).eval()
+
+            class ImageEmbeddings(torch.nn.Module):
+                def __init__(self, clip):
+                    super().__init__()
+                    self.clip = clip
+
+                def forward(self, pixel_values):
+                    return self.clip(pixel_values=pixel_values).image_embeds
+
+            size = self.processor.crop_size["height"]
+            fp32_path = model_cache_path(self.model_name, "vision-fp32.onnx")
+            torch.onnx.export(
+                ImageEmbeddings(model),
+                (torch.zeros(1, 3, size, size),),
+                fp32_path,
+                input_names=["pixel_values"],
+                output_names=["image_embeds"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+                opset_version=14
+            )
+            quantize_dynamic(fp32_path, f"{path}.tmp", weight_type=QuantType.QInt8)
+            os.replace(f"{path}.tmp", path)
+            os.remove(fp32_path)
+
+        options = ort.SessionOptions()
+        threads = config.get("ONNX_THREADS")
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, images: List) -> np.ndarray:
+        """Embed a batch of RGB PIL images, one normalized row per image"""
+        if self.session is not None:
+            pixels = self.processor(images=list(images), return_tensors="np")["pixel_values"]
+            embeddings = self.session.run(["image_embeds"], {"pixel_values": pixels.astype(np.float32)})[0]
+        else:
+            import torch
+            pixels = self.processor(images=list(images), return_tensors="pt")["pixel_values"]
+            with torch.inference_mode():
+                embeddings = self.model(pixel_values=pixels).image_embeds.numpy()
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+@lru_cache(maxsize=1)
+def get_clip_text_encoder() -> ClipTextEncoder:
+    """Lazy load the CLIP text encoder on the configured INFERENCE_BACKEND"""
+    if models["clip_text_encoder"] is None:
+        st.info("Loading CLIP model... This may take a moment.")
+        with timer("model.load.clip"):
+            models["clip_text_encoder"] = ClipTextEncoder()
+    return models["clip_text_encoder"]
+
+@lru_cache(maxsize=1)
+def get_clip_image_encoder() -> ClipImageEncoder:
+    """Lazy load the CLIP image encoder on the configured INFERENCE_BACKEND"""
+    if models["clip_image_encoder"] is None:
+        st.info("Loading CLIP image model... This may take a moment.")
+        with timer("model.load.clip_image"):
+            models["clip_image_encoder"] = ClipImageEncoder()
+    return models["clip_image_encoder"]
+
+@lru_cache(maxsize=1)
+def get_clip_logit_scale() -> float:
+    """CLIP's learned temperature, exp(logit_scale), read from the checkpoint (or CLIP_LOGIT_SCALE)"""
+    if config.get("CLIP_LOGIT_SCALE"):
+        return float(config["CLIP_LOGIT_SCALE"])
+    try:
+        from safetensors import safe_open
+        from transformers.utils import cached_file
+
+        # Only the one scalar is read; the towers are loaded without it
+        with safe_open(cached_file(config["CLIP_MODEL"], "model.safetensors"), framework="np") as weights:
+            return float(np.exp(weights.get_tensor("logit_scale")))
+    except Exception:
+        # OpenAI's checkpoints trained the scale up to its clamp of 100
+        return 100.0
+
+@lru_cache(maxsize=16)
+def get_clip_label_embeddings(labels: Tuple[str, ...]) -> np.ndarray:
+    """Embeddings of a fixed label set, computed once per process"""
+    return get_clip_text_encoder()(list(labels))
+
+def load_summarizer(model_name: Optional[str] = None, backend: Optional[str] = None):
+    """Load the BART tokenizer and a model with generate() on the given inference backend"""
+    from transformers import BartTokenizer, BartForConditionalGeneration
+
+    model_name = model_name or config["SUMMARIZATION_MODEL"]
+    backend = inference_backend(backend)
+    tokenizer = BartTokenizer.from_pretrained(model_name)
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+        path = model_cache_path(model_name, "onnx")
+        if os.path.isdir(path):
+            model = ORTModelForSeq2SeqLM.from_pretrained(path)
+        else:
+            model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True)
+            model.save_pretrained(path)
+    elif backend == "int8":
+        model = load_cached_int8(model_name, BartForConditionalGeneration)
+    else:
+        model = BartForConditionalGeneration.from_pretrained(model_name).eval()
+    return tokenizer, model
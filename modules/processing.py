@@ -1,54 +1,125 @@
+import base64
+import numpy as np
 import requests
-import torch
 import PyPDF2
 import streamlit as st
 from config import config, headers
+from modules.metrics import timer, timed
 import tempfile
 import os
 
-def transcribe_audio(audio_path):
-    """Transcribe audio using Hugging Face Whisper model"""
+def run_batched(task, batch_fn, item):
+    """Run one item through batch_fn, coalesced with concurrent callers when INFERENCE_BATCHING is on"""
+    if not config.get("INFERENCE_BATCHING", False):
+        return batch_fn([item])[0]
+    from modules.batching import get_batcher
+
+    # The batch worker has no Streamlit session, so models are loaded here, where their
+    # loading messages reach the caller (the loaders are cached: later calls return at once)
+    load_batch_models(task)
+    batcher = get_batcher(task, batch_fn, config.get("INFERENCE_MAX_BATCH", 16),
+                          config.get("INFERENCE_BATCH_WAIT_MS", 10) / 1000)
+    return batcher(item)
+
+def model_server_request(task, payload):
+    """Run an inference task on the shared model server (MODEL_SERVER_URL)"""
+    with timer(f"model_server.{task}"):
+        response = requests.post(
+            f"{config['MODEL_SERVER_URL'].rstrip('/')}/{task}",
+            json=payload,
+            timeout=config.get("MODEL_SERVER_TIMEOUT", 300)
+        )
+        response.raise_for_status()
+        return response.json()
+
+def audio_chunks(audio_path):
+    """Speech chunks of an audio file when AUDIO_PREPROCESSING is on, else None (use the file as is)"""
+    if not config.get("AUDIO_PREPROCESSING", True):
+        return None
+    from modules.audio import preprocess_audio
+
+    try:
+        chunks, _ = preprocess_audio(audio_path)
+        return chunks
+    except Exception:
+        # Undecodable here; the transcription service may still accept the file
+        return None
+
+def whisper_api_transcribe(audio_data):
+    """Transcribe (and translate to English) audio bytes with the Hugging Face Whisper API (raises if it fails)"""
     API_URL = f"https://api-inference.huggingface.co/models/{config['WHISPER_MODEL']}"
+    payload = {"options": {"task": "translate"}}
+    with timer("hf.whisper"):
+        response = requests.post(API_URL, headers=headers, data=audio_data, json=payload)
+    if response.status_code != 200:
+        raise requests.HTTPError(f"Whisper API returned {response.status_code}", response=response)
+    return response.json()["text"]
+
+def transcribe_audio(audio_path):
+    """Transcribe audio using Hugging Face Whisper model ("" if any chunk fails, for the local ASR to take over)"""
     try:
+        chunks = audio_chunks(audio_path)
+        if chunks is not None:
+            from modules.audio import transcribe_chunks, wav_bytes
+
+            return transcribe_chunks(chunks, lambda chunk: whisper_api_transcribe(wav_bytes(chunk)))
         with open(audio_path, "rb") as f:
-            audio_data = f.read()
-        payload = {"options": {"task": "translate"}}
-        response = requests.post(API_URL, headers=headers, data=audio_data, json=payload)
-        if response.status_code == 200:
-            return response.json()["text"]
-        else:
-            return ""
+            return whisper_api_transcribe(f.read())
+    except requests.RequestException:
+        # A transcript with a chunk missing would read as complete; english_speech_to_text runs instead
+        return ""
     except Exception as e:
         st.error(f"Transcription error: {e}")
         return ""
 
+def transcribe_files(file_paths):
+    """Transcribe (and translate to English) audio files, or {"raw", "sampling_rate"} arrays, in one ASR pipeline call"""
+    from modules.models import get_asr_pipeline
+
+    with timer("asr.transcribe"):
+        results = get_asr_pipeline()(
+            list(file_paths),
+            batch_size=len(file_paths),
+            generate_kwargs={"task": "translate"}  # Forces English output
+        )
+    return [result["text"] for result in results]
+
 def english_speech_to_text(file_path):
     """Convert audio file to text using ASR"""
-    from transformers import pipeline
     try:
-        device = "cuda:0" if torch.cuda.is_available() else "cpu"
-        model_asr = pipeline(
-            task="automatic-speech-recognition",
-            model=config["ASR_MODEL"],
-            device=device
-        )
-        result = model_asr(
-            file_path,
-            generate_kwargs={"task": "translate"}  # Forces English output
-        )
-        return result["text"]
+        chunks = audio_chunks(file_path)
+        if config.get("MODEL_SERVER_URL"):
+            from modules.audio import transcribe_chunks, wav_bytes
+
+            def transcribe_remote(data, suffix=".wav"):
+                audio = base64.b64encode(data).decode("ascii")
+                return model_server_request("transcribe", {"audio": audio, "suffix": suffix})["text"]
+
+            if chunks is not None:
+                # Concurrent requests are batched together by the server
+                return transcribe_chunks(chunks, lambda chunk: transcribe_remote(wav_bytes(chunk)))
+            with open(file_path, "rb") as f:
+                return transcribe_remote(f.read(), os.path.splitext(file_path)[1])
+        if chunks is not None:
+            if not chunks:
+                return ""
+            from modules.audio import SAMPLE_RATE
+
+            # All chunks go through the pipeline as one batch
+            texts = transcribe_files([{"raw": chunk, "sampling_rate": SAMPLE_RATE} for chunk in chunks])
+            return " ".join(text.strip() for text in texts if text.strip())
+        return transcribe_files([file_path])[0]
     except Exception as e:
         st.error(f"Speech-to-text error: {e}")
         return ""
 
-def process_image(image_path):
-    """Process image using BLIP model"""
+def caption_image(image_data):
+    """Caption image bytes using BLIP model"""
     API_URL = f"https://api-inference.huggingface.co/models/{config['BLIP_MODEL']}"
     try:
-        with open(image_path, "rb") as f:
-            image_data = f.read()
-        response = requests.post(API_URL, headers=headers, data=image_data)
-        response.raise_for_status()
+        with timer("hf.blip"):
+            response = requests.post(API_URL, headers=headers, data=image_data)
+            response.raise_for_status()
         result = response.json()
         if isinstance(result, list) and result and 'generated_text' in result[0]:
             return result[0]['generated_text']
@@ -58,33 +129,119 @@ def process_image(image_path):
         st.error(f"Image processing error: {e}")
         return ""
 
+def process_image(image_path):
+    """Process image using BLIP model, sending a copy sized to the model's input"""
+    try:
+        with open(image_path, "rb") as f:
+            image_data = f.read()
+        if config.get("IMAGE_PREPROCESSING", True):
+            from modules.imaging import prepare_image
+            image_data = prepare_image(image_data)["model_bytes"]
+    except Exception as e:
+        st.error(f"Image processing error: {e}")
+        return ""
+    return caption_image(image_data)
+
+# Emergency types process_text chooses between
+EMERGENCY_LABELS = ("fire", "earthquake", "flood", "car accident", "building collapse",
+                    "cyclone", "landslide", "medical emergency")
+
+def label_probabilities(similarities):
+    """Softmax over the labels of CLIP cosine similarities, scaled by CLIP's logit_scale as in training"""
+    from modules.models import get_clip_logit_scale
+
+    logits = similarities * get_clip_logit_scale()
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+def image_label_prompts():
+    """EMERGENCY_LABELS as captions: zero-shot image classification matches photos against captions"""
+    prompt = config.get("CLIP_IMAGE_PROMPT", "a photo of a {}")
+    return tuple(prompt.format(label) for label in EMERGENCY_LABELS)
+
+def load_batch_models(task):
+    """Load the models a batched task (run_batched) uses"""
+    from modules.models import get_clip_image_encoder, get_clip_label_embeddings, get_nlp
+
+    if task == "classify":
+        get_clip_label_embeddings(EMERGENCY_LABELS)
+    elif task == "classify_image":
+        get_clip_image_encoder()
+        get_clip_label_embeddings(image_label_prompts())
+    elif task == "extract":
+        get_nlp()
+
+def classify_texts(texts):
+    """Label texts with their closest EMERGENCY_LABELS entry in one CLIP forward pass"""
+    from modules.models import get_clip_text_encoder, get_clip_label_embeddings
+
+    encode = get_clip_text_encoder()
+    label_features = get_clip_label_embeddings(EMERGENCY_LABELS)
+    with timer("clip.classify_text"):
+        input_features = encode(list(texts))
+    # Rows are normalized, so the dot product is the cosine similarity; confidences are label
+    # probabilities so that they compare with classify_images' (raw cosines do not)
+    probabilities = label_probabilities(input_features @ label_features.T)
+    best = probabilities.argmax(axis=1)
+    return [(EMERGENCY_LABELS[i], float(probabilities[row, i])) for row, i in enumerate(best)]
+
 def process_text(text_input):
     """Process text using CLIP model"""
-    text_options = ["fire", "earthquake", "flood", "car accident", "building collapse",
-                   "cyclone", "landslide", "medical emergency"]
     try:
-        from transformers import CLIPProcessor, CLIPModel
-
-        model = CLIPModel.from_pretrained(config["CLIP_MODEL"])
-        processor = CLIPProcessor.from_pretrained(config["CLIP_MODEL"])
-
-        inputs = processor(text=text_options, return_tensors="pt", padding=True)
-        text_features = model.get_text_features(**inputs)
-        input_text = processor(text=[text_input], return_tensors="pt", padding=True)
-        input_features = model.get_text_features(**input_text)
-        similarities = torch.nn.functional.cosine_similarity(input_features, text_features, dim=1)
-        predicted_label = text_options[similarities.argmax().item()]
-        return predicted_label, similarities.max().item()
+        if config.get("MODEL_SERVER_URL"):
+            result = model_server_request("classify", {"text": text_input})
+            return result["label"], result["confidence"]
+        return run_batched("classify", classify_texts, text_input)
     except Exception as e:
         st.error(f"Text processing error: {e}")
         return "unknown", 0.0
 
+def classify_images(images):
+    """Label images (encoded bytes) with their closest EMERGENCY_LABELS entry in one CLIP forward pass"""
+    from modules.imaging import open_image
+    from modules.models import get_clip_image_encoder, get_clip_label_embeddings
+
+    encode = get_clip_image_encoder()
+    label_features = get_clip_label_embeddings(image_label_prompts())
+    with timer("clip.classify_image"):
+        # CLIP sees 224 px crops, so JPEGs are decoded at reduced scale
+        input_features = encode([open_image(data, 224) for data in images])
+    probabilities = label_probabilities(input_features @ label_features.T)
+    best = probabilities.argmax(axis=1)
+    return [(EMERGENCY_LABELS[i], float(probabilities[row, i])) for row, i in enumerate(best)]
+
+def classify_image(image_data):
+    """Classify an image's emergency type directly with CLIP, without captioning it first"""
+    try:
+        if config.get("MODEL_SERVER_URL"):
+            image = base64.b64encode(image_data).decode("ascii")
+            result = model_server_request("classify_image", {"image": image})
+            return result["label"], result["confidence"]
+        return run_batched("classify_image", classify_images, image_data)
+    except Exception as e:
+        st.error(f"Image classification error: {e}")
+        return "unknown", 0.0
+
+@timed("spacy.extract_entities")
 def extract_entities(text):
     """Extract entities from text using spaCy"""
+    if config.get("MODEL_SERVER_URL"):
+        try:
+            return model_server_request("extract", {"text": text})["entities"]
+        except (requests.RequestException, KeyError, ValueError) as e:
+            st.error(f"Entity extraction error: {e}")
+            return {}
+    return run_batched("extract", extract_entities_batch, text)
+
+def extract_entities_batch(texts, n_process=1, batch_size=64):
+    """Extract entities from many texts with one nlp.pipe call (across n_process worker processes)"""
     from modules.models import get_nlp
 
-    nlp = get_nlp()
-    doc = nlp(text)
+    return [entities_from_doc(doc) for doc in get_nlp().pipe(texts, n_process=n_process, batch_size=batch_size)]
+
+def entities_from_doc(doc):
+    """Group the entities of a spaCy Doc by the labels the app uses"""
     entities = {
         "location": [],
         "date": [],
@@ -108,10 +265,31 @@ def extract_entities(text):
             entities["location"].append(ent.text)
     return entities
 
-def generate_summary(pdf_path):
-    """Generate summary from PDF using BART model"""
+# Severity terms recognised by the entity ruler, least to most severe
+SEVERITY_LEVELS = ["minor", "major", "urgent", "severe", "critical"]
+
+def classify_severity(entities):
+    """Get the highest severity mentioned in extracted entities, or None"""
+    mentioned = [s.lower() for s in entities.get("severity", []) if s.lower() in SEVERITY_LEVELS]
+    if not mentioned:
+        return None
+    return max(mentioned, key=SEVERITY_LEVELS.index)
+
+def summarize_texts(texts):
+    """Summarize texts with BART, padded into one generate() call"""
     from modules.models import get_tokenizer_and_summarization_model
 
+    tokenizer, model = get_tokenizer_and_summarization_model()
+    with timer("bart.summarize"):
+        inputs = tokenizer(['summarize: ' + text for text in texts], return_tensors="pt",
+                           max_length=1024, truncation=True, padding=True)
+        summary_ids = model.generate(**inputs, max_length=config.get("SUMMARY_MAX_LENGTH", 1000), min_length=50,
+                                     length_penalty=2.0, num_beams=config.get("SUMMARY_NUM_BEAMS", 4),
+                                     early_stopping=True)
+    return tokenizer.batch_decode(summary_ids, skip_special_tokens=True)
+
+def generate_summary(pdf_path):
+    """Generate summary from PDF using BART model"""
     text = ""
     try:
         with open(pdf_path, "rb") as file:
@@ -121,27 +299,23 @@ def generate_summary(pdf_path):
                 if extracted:
                     text += extracted + "\n"
 
-        tokenizer, model = get_tokenizer_and_summarization_model()
-        inputs = tokenizer.encode('summarize: ' + text, return_tensors="pt",
-                                  max_length=1024, truncation=True)
-        summary_ids = model.generate(inputs, max_length=1000, min_length=50,
-                                    length_penalty=2.0, num_beams=4, early_stopping=True)
-        summary = tokenizer.decode(summary_ids[0], skip_special_tokens=True)
-        return summary
+        if config.get("MODEL_SERVER_URL"):
+            return model_server_request("summarize", {"text": text})["summary"]
+        return summarize_texts([text])[0]
     except Exception as e:
         st.error(f"PDF summarization error: {e}")
         return "Error generating summary"
 
-def get_first_aid_response(disaster_type, input_text):
-    """Get first aid response using Google's Gemini model"""
-    try:
-        import google.generativeai as genai
+def get_first_aid_response(disaster_type, input_text, severity=None, entities=None):
+    """Get first aid response from the offline knowledge base and Google's Gemini model"""
+    return "".join(stream_first_aid_response(disaster_type, input_text, severity, entities))
 
-        genai.configure(api_key=config["GEMINI_API_KEY"])
-        model_gen = genai.GenerativeModel(config["GEMINI_MODEL"])
-        prompt = f"What are the first-aid measures for a {disaster_type}? Context provided: {input_text}"
-        response = model_gen.generate_content(prompt)
-        return response.text
+def stream_first_aid_response(disaster_type, input_text, severity=None, entities=None):
+    """Stream a first aid response in chunks, for st.write_stream"""
+    from modules.first_aid import stream_guidance
+
+    try:
+        yield from stream_guidance(disaster_type, input_text, severity, entities)
     except Exception as e:
         st.error(f"First aid response error: {e}")
-        return "Error generating first aid response"
+        yield "Error generating first aid response"
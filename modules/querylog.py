@@ -0,0 +1,146 @@
+"""Slow-query log for execute_query
+
+With QUERY_PROFILING enabled, every statement run through execute_query that
+takes at least SLOW_QUERY_MS is recorded with its text, parameter shape, row
+count, wall time and EXPLAIN QUERY PLAN. Records go to an in-memory ring
+buffer (shown in the admin dashboard) and, as JSON lines, to the rotating log
+file SLOW_QUERY_LOG. Plans that scan a whole table of at least
+FULL_SCAN_MIN_ROWS rows are flagged.
+"""
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+from config import config
+
+_state = {
+    "logger": None
+}
+_lock = threading.Lock()
+_recent = deque(maxlen=int(config.get("SLOW_QUERY_BUFFER", 200)))
+
+# FROM/JOIN clauses, to map plan aliases ("SCAN e") back to table names
+TABLE_REFERENCE = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+SQL_KEYWORDS = {"where", "on", "left", "right", "inner", "outer", "cross", "join", "group", "order",
+                "limit", "using", "natural", "union", "select", "set", "values", "having"}
+
+def is_enabled() -> bool:
+    """Whether execute_query should time statements"""
+    return bool(config.get("QUERY_PROFILING", False))
+
+def _get_logger() -> logging.Logger:
+    """File logger for slow queries, rotated by size"""
+    with _lock:
+        if _state["logger"] is None:
+            logger = logging.getLogger("disaster_management.slow_queries")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = RotatingFileHandler(
+                config.get("SLOW_QUERY_LOG", "slow_queries.log"),
+                maxBytes=int(config.get("SLOW_QUERY_LOG_BYTES", 5 * 1024 * 1024)),
+                backupCount=int(config.get("SLOW_QUERY_LOG_BACKUPS", 3)),
+                encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            _state["logger"] = logger
+        return _state["logger"]
+
+def parameter_shape(params) -> List[str]:
+    """Types (and string lengths) of query parameters, without their values"""
+    if isinstance(params, dict):
+        params = params.values()
+    return [f"str({len(p)})" if isinstance(p, str) else type(p).__name__ for p in params]
+
+def table_aliases(query: str) -> Dict[str, str]:
+    """Map each table alias (and table name) used in a query to its table"""
+    aliases = {}
+    for table, alias in TABLE_REFERENCE.findall(query):
+        aliases[table.lower()] = table
+        if alias and alias.lower() not in SQL_KEYWORDS:
+            aliases[alias.lower()] = table
+    return aliases
+
+def table_rows(conn: sqlite3.Connection, table: str) -> Optional[int]:
+    """Approximate row count from ANALYZE statistics, else the largest rowid"""
+    try:
+        row = conn.execute(
+            "SELECT stat FROM sqlite_stat1 WHERE tbl = ? ORDER BY idx IS NOT NULL LIMIT 1", (table,)
+        ).fetchone()
+        if row:
+            return int(row[0].split()[0])
+    except sqlite3.Error:
+        pass
+    try:
+        return conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+    except sqlite3.Error:
+        return None
+
+def scanned_table(detail: str) -> Optional[str]:
+    """Table (or alias) a query plan step reads in full, or None if the step uses an index"""
+    parts = detail.split()
+    # "SCAN t" or "SCAN t USING COVERING INDEX i" visit every row ("SCAN TABLE t" before SQLite 3.36);
+    # virtual tables use their own index
+    if parts[1:2] == ["TABLE"]:
+        del parts[1]
+    if len(parts) < 2 or parts[0] != "SCAN" or "VIRTUAL TABLE" in detail:
+        return None
+    return parts[1]
+
+def explain(conn: sqlite3.Connection, query: str, params) -> Dict:
+    """EXPLAIN QUERY PLAN of a statement, with full scans of large tables flagged"""
+    try:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()]
+    except sqlite3.Error as e:
+        return {"plan": [f"unavailable: {e}"], "full_scans": []}
+
+    aliases = table_aliases(query)
+    min_rows = int(config.get("FULL_SCAN_MIN_ROWS", 10000))
+    full_scans = []
+    for detail in plan:
+        scanned = scanned_table(detail)
+        table = aliases.get(scanned.lower()) if scanned else None
+        if table is None:
+            continue
+        rows = table_rows(conn, table)
+        if rows is not None and rows >= min_rows:
+            full_scans.append({"table": table, "rows": rows, "detail": detail})
+    return {"plan": plan, "full_scans": full_scans}
+
+def record_query(conn: sqlite3.Connection, query: str, params, rows: int, seconds: float):
+    """Log a statement if it ran for at least SLOW_QUERY_MS"""
+    elapsed_ms = seconds * 1000
+    if elapsed_ms < float(config.get("SLOW_QUERY_MS", 100)):
+        return
+    entry = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        "ms": round(elapsed_ms, 2),
+        "sql": " ".join(query.split())[:2000],
+        "params": parameter_shape(params),
+        "rows": rows,
+        **explain(conn, query, params)
+    }
+    with _lock:
+        _recent.append(entry)
+    try:
+        _get_logger().info(json.dumps(entry))
+    except OSError:
+        pass
+
+def get_slow_queries(full_scans_only: bool = False) -> List[Dict]:
+    """Recently recorded slow queries, newest first"""
+    with _lock:
+        entries = list(_recent)[::-1]
+    if full_scans_only:
+        entries = [e for e in entries if e["full_scans"]]
+    return entries
+
+def clear_slow_queries():
+    """Empty the in-memory buffer (the log file is kept)"""
+    with _lock:
+        _recent.clear()
@@ -0,0 +1,207 @@
+"""Concurrent analysis of the inputs of one emergency report
+
+A report can combine a text description, a voice note and a photo. Each
+input has its own pipeline (transcription, captioning, CLIP classification,
+entity extraction), and the pipelines do not depend on one another, so
+analyze_report runs them on a thread pool and fuses their results. The
+report then takes about as long as its slowest input instead of the sum of
+all of them.
+
+Photos are classified by CLIP directly from their pixels; the BLIP caption
+only adds a description to the report and arrives in the background.
+
+The fused emergency type is the one with the most evidence: each input votes
+for its type with its confidence, so two inputs that agree outweigh a single
+slightly more confident one. Text and photo confidences are both CLIP label
+probabilities, so their votes are on the same scale.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from config import config
+from modules.metrics import timer, increment
+from modules.processing import (
+    transcribe_audio,
+    english_speech_to_text,
+    caption_image,
+    classify_image,
+    process_text,
+    extract_entities
+)
+
+_state = {
+    "caption_pool": None
+}
+_lock = threading.Lock()
+
+# Order in which inputs appear in the fused report text
+SOURCES = ("text", "voice", "image")
+
+# Heading of each input's part of the report text
+TEXT_LABELS = {
+    "text": "Text Description",
+    "voice": "Voice Transcription",
+    "image": "Image Description"
+}
+
+def with_script_context(fn: Callable) -> Callable:
+    """Wrap fn so Streamlit calls it makes from a worker thread reach the current session"""
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    except ImportError:
+        return fn
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return fn
+
+    def run(*args, **kwargs):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+    return run
+
+def classify_and_extract(text: str, extract: bool = True) -> Dict:
+    """Emergency type and entities of a text, with the two model calls overlapped"""
+    if not extract or not config.get("REPORT_PARALLEL", True):
+        emergency_type, confidence = process_text(text)
+        entities = extract_entities(text) if extract else {}
+        return {"emergency_type": emergency_type, "confidence": confidence, "entities": entities}
+    classified = {}
+    thread = threading.Thread(target=with_script_context(lambda: classified.update(result=process_text(text))))
+    thread.start()
+    try:
+        entities = extract_entities(text)
+    finally:
+        thread.join()
+    emergency_type, confidence = classified.get("result", ("unknown", 0.0))
+    return {"emergency_type": emergency_type, "confidence": confidence, "entities": entities}
+
+def analyze_text(text: str) -> Dict:
+    """Classify a typed description and extract its entities"""
+    return {"text": text, **classify_and_extract(text)}
+
+def analyze_voice(audio_path: str) -> Dict:
+    """Transcribe a voice note (remote Whisper, then the local ASR pipeline) and analyze the transcription"""
+    transcription = transcribe_audio(audio_path)
+    if not transcription:
+        transcription = english_speech_to_text(audio_path)
+    if not transcription:
+        return {"text": "", "error": "Transcription failed. Please try again or use a different input method."}
+    return {"text": transcription, **classify_and_extract(transcription)}
+
+def get_caption_pool() -> ThreadPoolExecutor:
+    """Threads that caption photos in the background"""
+    with _lock:
+        if _state["caption_pool"] is None:
+            _state["caption_pool"] = ThreadPoolExecutor(
+                max_workers=config.get("IMAGE_CAPTION_WORKERS", 4), thread_name_prefix="caption"
+            )
+        return _state["caption_pool"]
+
+def analyze_image(image_data: bytes) -> Dict:
+    """Prepare, check for repeats and classify a photo.
+
+    With IMAGE_CLASSIFIER "clip" the type comes from the image itself in one
+    local forward pass, and the BLIP caption (IMAGE_CAPTIONS) is requested in
+    the background: the result's "caption" is a Future of the description,
+    which is not waited for here. With "caption", or when CLIP fails, the
+    type comes from classifying the caption, as before.
+    """
+    prepared, duplicates = None, []
+    if config.get("IMAGE_PREPROCESSING", True):
+        from modules.database import get_recent_image_hashes
+        from modules.imaging import prepare_image, find_duplicates
+
+        try:
+            prepared = prepare_image(image_data)
+            image_data = prepared["model_bytes"]
+        except Exception as e:
+            return {"text": "", "display": image_data, "error": f"Could not read image: {e}"}
+        duplicates = find_duplicates(
+            prepared["phash"],
+            get_recent_image_hashes(config.get("IMAGE_DUPLICATE_WINDOW_HOURS", 72))
+        )
+    result = {"text": "", "display": image_data, "image": prepared, "duplicates": duplicates}
+
+    if config.get("IMAGE_CLASSIFIER", "clip") == "clip":
+        caption = None
+        if config.get("IMAGE_CAPTIONS", True):
+            caption = get_caption_pool().submit(with_script_context(caption_image), image_data)
+        emergency_type, confidence = classify_image(image_data)
+        if emergency_type != "unknown":
+            increment("report.image_clip")
+            result.update(emergency_type=emergency_type, confidence=confidence, caption=caption)
+            if caption is None:
+                result["text"] = f"photo of a {emergency_type}"
+            return result
+        description = caption.result() if caption else caption_image(image_data)
+    else:
+        description = caption_image(image_data)
+
+    increment("report.image_caption")
+    result["text"] = description
+    if not description:
+        result["error"] = "Image processing failed. Please try again or use a different input method."
+        return result
+    # Captions are short and rarely name people or places, so only the type is taken from them
+    return {**result, **classify_and_extract(description, extract=False)}
+
+ANALYZERS = {
+    "text": analyze_text,
+    "voice": analyze_voice,
+    "image": analyze_image
+}
+
+def run_analyzer(source: str, value) -> Dict:
+    """One input's analysis, timed, with failures reported as the result's error"""
+    with timer(f"report.{source}"):
+        try:
+            return ANALYZERS[source](value)
+        except Exception as e:
+            increment("report.analyzer_errors")
+            return {"text": "", "error": f"Could not analyze {source} input: {e}"}
+
+def fuse_type(results: List[Dict]) -> Optional[Dict]:
+    """Emergency type with the highest summed confidence, and its best single confidence"""
+    votes, best = {}, {}
+    for result in results:
+        emergency_type = result.get("emergency_type")
+        if not emergency_type or emergency_type == "unknown":
+            continue
+        confidence = result.get("confidence") or 0.0
+        votes[emergency_type] = votes.get(emergency_type, 0.0) + confidence
+        best[emergency_type] = max(best.get(emergency_type, 0.0), confidence)
+    if not votes:
+        return None
+    emergency_type = max(votes, key=votes.get)
+    return {"emergency_type": emergency_type, "confidence": best[emergency_type]}
+
+def fuse(results: Dict[str, Dict]) -> Dict:
+    """Combine per-input results into report text, entities and one emergency type"""
+    ordered = [(source, results[source]) for source in SOURCES if source in results]
+    text = "".join(f"\n{TEXT_LABELS[source]}: {result['text']}" for source, result in ordered if result.get("text"))
+    entities = {}
+    for _, result in ordered:
+        for entity_type, items in (result.get("entities") or {}).items():
+            merged = entities.setdefault(entity_type, [])
+            merged.extend(item for item in items if item not in merged)
+    fused = {"text": text, "entities": entities, "emergency_type": "", "confidence": None}
+    fused.update(fuse_type([result for _, result in ordered]) or {})
+    return fused
+
+def analyze_report(inputs: Dict[str, object]) -> Dict:
+    """Analyze each given input ("text", "voice" audio path, "image" bytes) and fuse the results.
+
+    Returns the fused "text", "entities", "emergency_type" and "confidence",
+    with each input's own result under "sources". With REPORT_PARALLEL off
+    everything runs one step after another, as a baseline.
+    """
+    inputs = {source: value for source, value in inputs.items() if value}
+    with timer("report.analyze"):
+        if config.get("REPORT_PARALLEL", True) and len(inputs) > 1:
+            with ThreadPoolExecutor(max_workers=len(inputs), thread_name_prefix="report") as pool:
+                futures = {source: pool.submit(with_script_context(run_analyzer), source, value)
+                           for source, value in inputs.items()}
+                results = {source: future.result() for source, future in futures.items()}
+        else:
+            results = {source: run_analyzer(source, value) for source, value in inputs.items()}
+    return {**fuse(results), "sources": results}
@@ -0,0 +1,264 @@
+"""Retention for the SQLite database: archive old reports and compact what remains
+
+Usage:
+    python -m modules.retention run [--force]
+    python -m modules.retention status
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+from config import config
+from modules.database import get_db_connection, prune_change_log, table_exists
+from modules.metrics import timer, increment
+
+_state = {
+    "thread": None
+}
+_lock = threading.Lock()
+
+logger = logging.getLogger("disaster_management.retention")
+
+# Tables whose rows follow an archived report, keyed on its eid (the report itself last)
+ARCHIVED_TABLES = ("emergency_entity", "emergency_image", "incident_member", "emergency")
+
+# Maintenance tasks: config key of the interval in hours, with its default
+TASK_INTERVALS = {
+    "archive": ("RETENTION_INTERVAL_HOURS", 1),
+    "analyze": ("RETENTION_ANALYZE_HOURS", 24),
+    "vacuum": ("RETENTION_VACUUM_HOURS", 168)
+}
+
+def columns(conn, schema: str, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+def ensure_archive_tables(conn):
+    """Create the archived tables in the attached archive database, adding any new columns"""
+    for table in ARCHIVED_TABLES + ("incident",):
+        conn.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+        existing = set(columns(conn, "archive", table))
+        for name in columns(conn, "main", table):
+            if name not in existing:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name}")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_emergency_timestamp ON emergency (timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_emergency_entity_eid ON emergency_entity (eid)")
+
+def move_rows(conn, table: str, where: str, params: tuple = ()) -> int:
+    """Copy matching rows to the archive and delete them from the hot table"""
+    names = ", ".join(columns(conn, "main", table))
+    conn.execute(f"INSERT INTO archive.{table} ({names}) SELECT {names} FROM main.{table} WHERE {where}", params)
+    return conn.execute(f"DELETE FROM main.{table} WHERE {where}", params).rowcount
+
+def archive_old_reports(days: Optional[float] = None, batch_size: Optional[int] = None,
+                        db_path: Optional[str] = None, archive_path: Optional[str] = None) -> Dict:
+    """Move reports older than days (and incidents whose last report is) to the archive database"""
+    days = config.get("RETENTION_DAYS", 90) if days is None else days
+    batch_size = batch_size or config.get("RETENTION_BATCH_SIZE", 5000)
+    cutoff = f"-{float(days)} days"
+    moved = {"emergency": 0, "incident": 0, "batches": 0}
+    conn = get_db_connection(db_path)
+    try:
+        conn.isolation_level = None
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path or config.get("ARCHIVE_DB_PATH", "archive.db"),))
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS retention_batch (eid INTEGER PRIMARY KEY)")
+        ensure_archive_tables(conn)
+        with timer("retention.archive"):
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.execute("DELETE FROM temp.retention_batch")
+                    conn.execute(
+                        '''INSERT INTO temp.retention_batch
+                           SELECT eid FROM main.emergency WHERE timestamp < datetime('now', ?)
+                           ORDER BY timestamp LIMIT ?''',
+                        (cutoff, batch_size)
+                    )
+                    batch = {}
+                    for table in ARCHIVED_TABLES:
+                        batch[table] = move_rows(conn, table, "eid IN (SELECT eid FROM temp.retention_batch)")
+                    # Incidents whose reports have all been archived
+                    batch["incident"] = move_rows(
+                        conn, "incident",
+                        '''last_reported < datetime('now', ?)
+                           AND incident_id NOT IN (SELECT incident_id FROM main.incident_member)''',
+                        (cutoff,)
+                    )
+                    conn.execute("COMMIT")
+                except sqlite3.Error:
+                    conn.execute("ROLLBACK")
+                    raise
+                if not batch["emergency"] and not batch["incident"]:
+                    break
+                moved["emergency"] += batch["emergency"]
+                moved["incident"] += batch["incident"]
+                moved["batches"] += 1
+        conn.execute("DETACH DATABASE archive")
+    finally:
+        conn.close()
+    increment("retention.archived_reports", moved["emergency"])
+    return moved
+
+def free_ratio(conn) -> float:
+    """Share of the database file's pages that are unused"""
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    return conn.execute("PRAGMA freelist_count").fetchone()[0] / pages if pages else 0.0
+
+def analyze(db_path: Optional[str] = None) -> Dict:
+    """Refresh planner statistics and merge the full-text index segments left by deletes"""
+    conn = get_db_connection(db_path)
+    try:
+        with timer("retention.analyze"):
+            conn.execute("ANALYZE")
+            if table_exists(conn.cursor(), "emergency_fts"):
+                conn.execute("INSERT INTO emergency_fts (emergency_fts) VALUES ('optimize')")
+            conn.commit()
+    finally:
+        conn.close()
+    return {"analyzed": True}
+
+def vacuum(db_path: Optional[str] = None, min_free_ratio: Optional[float] = None) -> Dict:
+    """Rebuild the database file when at least min_free_ratio of its pages are free"""
+    min_free_ratio = config.get("RETENTION_VACUUM_FREE_RATIO", 0.2) if min_free_ratio is None else min_free_ratio
+    path = db_path or config["DB_PATH"]
+    conn = get_db_connection(path)
+    try:
+        ratio = free_ratio(conn)
+        if ratio < min_free_ratio:
+            return {"vacuumed": False, "free_ratio": round(ratio, 3)}
+        before = os.path.getsize(path)
+        with timer("retention.vacuum"):
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return {"vacuumed": True, "free_ratio": round(ratio, 3), "bytes_before": before, "bytes_after": os.path.getsize(path)}
+
+def claim_task(task: str, every_hours: float, db_path: Optional[str] = None) -> Optional[str]:
+    """Mark task as run now if it last ran more than every_hours ago; only one caller wins.
+
+    Returns the previous run time for the winner (see release_task), None otherwise.
+    """
+    conn = get_db_connection(db_path)
+    try:
+        # The INSERT takes the write lock, so the read and the update below see no other claim
+        conn.execute("INSERT OR IGNORE INTO maintenance (task, last_run) VALUES (?, '1970-01-01 00:00:00')", (task,))
+        previous = conn.execute("SELECT last_run FROM maintenance WHERE task = ?", (task,)).fetchone()[0]
+        claimed = conn.execute(
+            '''UPDATE maintenance SET last_run = CURRENT_TIMESTAMP
+               WHERE task = ? AND last_run <= datetime('now', ?)''',
+            (task, f"-{float(every_hours)} hours")
+        ).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    return previous if claimed == 1 else None
+
+def release_task(task: str, last_run: str, db_path: Optional[str] = None):
+    """Restore a claimed task's previous run time after it failed, so the next check retries it"""
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute("UPDATE maintenance SET last_run = ? WHERE task = ?", (last_run, task))
+        conn.commit()
+    finally:
+        conn.close()
+
+def run_maintenance(force: bool = False, db_path: Optional[str] = None) -> Dict:
+    """Run every maintenance task that is due (all of them with force)"""
+    results = {}
+    for task, (key, default) in TASK_INTERVALS.items():
+        previous = claim_task(task, 0 if force else config.get(key, default), db_path)
+        if previous is None:
+            continue
+        try:
+            if task == "archive":
+                if config.get("EXPORT_ENABLED", False):
+                    # The snapshot reads the archive database too, so archived reports stay in it
+                    from modules.export import export_snapshots
+
+                    results["export"] = export_snapshots(db_path=db_path)
+                results["archive"] = archive_old_reports(db_path=db_path)
+                prune_change_log(config.get("CHANGE_LOG_KEEP_HOURS", 24), db_path=db_path)
+            elif task == "analyze":
+                results["analyze"] = analyze(db_path)
+            else:
+                results["vacuum"] = vacuum(db_path)
+        except Exception:
+            release_task(task, previous, db_path)
+            raise
+    return results
+
+def status(db_path: Optional[str] = None, archive_path: Optional[str] = None) -> Dict:
+    """Row counts of the hot and archived tables, file sizes and last task runs"""
+    path = db_path or config["DB_PATH"]
+    archive_path = archive_path or config.get("ARCHIVE_DB_PATH", "archive.db")
+    conn = get_db_connection(path)
+    try:
+        hot = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+               for table in ("emergency", "incident")}
+        oldest = conn.execute("SELECT MIN(timestamp) FROM emergency").fetchone()[0]
+        last_runs = dict(conn.execute("SELECT task, last_run FROM maintenance").fetchall())
+        ratio = free_ratio(conn)
+    finally:
+        conn.close()
+    archived = {}
+    if os.path.exists(archive_path):
+        archive = sqlite3.connect(archive_path)
+        try:
+            archived = {table: archive.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                        for table in ("emergency", "incident") if table_exists(archive.cursor(), table)}
+        finally:
+            archive.close()
+    return {
+        "hot": hot,
+        "oldest_hot_report": oldest,
+        "archived": archived,
+        "db_bytes": os.path.getsize(path),
+        "archive_bytes": os.path.getsize(archive_path) if os.path.exists(archive_path) else 0,
+        "free_ratio": round(ratio, 3),
+        "last_runs": last_runs
+    }
+
+def check_maintenance() -> Optional[Dict]:
+    """Run the due maintenance tasks for the scheduler, logging a failure instead of raising it"""
+    try:
+        return run_maintenance()
+    except Exception:
+        # Busy, locked, disk full or a failed export: the task is retried at the next check
+        increment("retention.errors")
+        logger.exception("Maintenance failed")
+        return None
+
+def start_retention_scheduler() -> Optional[threading.Thread]:
+    """Check for due maintenance from a background thread once per process (SQLite only)"""
+    if not config.get("RETENTION_ENABLED", True) or config.get("DB_BACKEND", "sqlite") != "sqlite":
+        return None
+    with _lock:
+        if _state["thread"] is None:
+            def loop():
+                while True:
+                    check_maintenance()
+                    time.sleep(config.get("RETENTION_CHECK_SECONDS", 300))
+
+            _state["thread"] = threading.Thread(target=loop, name="retention", daemon=True)
+            _state["thread"].start()
+        return _state["thread"]
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Archive old reports and compact the database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_command = commands.add_parser("run", help="Run the maintenance tasks that are due")
+    run_command.add_argument("--force", action="store_true", help="Run every task now")
+    commands.add_parser("status", help="Show hot and archived row counts and last runs")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        print(json.dumps(run_maintenance(force=args.force), indent=2))
+    else:
+        print(json.dumps(status(), indent=2))
+
+if __name__ == "__main__":
+    main()
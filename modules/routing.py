@@ -0,0 +1,556 @@
+"""Travel-time routing over a local road graph
+
+`build` turns an OSM extract (.osm.pbf through pyosmium, or .osm / .osm.bz2
+XML) into one compressed NumPy file at ROAD_GRAPH_PATH. The drivable ways
+become a CSR adjacency array (edges sorted by source node, with their target
+node, travel time in milliseconds from the way's maxspeed or highway class,
+and OSM way id), with node coordinates. The file also holds the travel time
+from and to each of ROUTING_LANDMARKS nodes, spread over the map by
+farthest-point selection. These are the ALT heuristic: by the triangle
+inequality, they give A* a lower bound on the remaining time to any target.
+Blocking a road only makes trips longer, so the bound still holds when roads
+are closed at run time. Contraction hierarchies, by contrast, would have to
+be rebuilt whenever a road closes.
+
+Nearest-resource queries keep their straight-line radius, but take
+ROUTING_CANDIDATES times as many candidates from the spatial index. They then
+re-rank them by travel time. The reporter's location is snapped to up to
+ROUTING_SNAP_NODES road nodes within ROUTING_SNAP_M, each seeded with its
+access time at ROUTING_ACCESS_KMH, so one multi-source Dijkstra search covers
+all candidates. A single target is searched with A* instead. Roads within the
+radius of a road_block row, or of a recent flood report when
+ROUTING_FLOOD_BLOCK_M is set, are skipped. Without a graph file, results keep
+their straight-line order.
+
+Usage:
+    python -m modules.routing build region.osm.pbf
+    python -m modules.routing route 19.07 72.87 19.11 72.84
+    python -m modules.routing block 19.08 72.88 --radius-m 150 --reason "Underpass flooded" --hours 12
+    python -m modules.routing unblock 3
+    python -m modules.routing blocks
+    python -m modules.routing stats
+"""
+import argparse
+import bz2
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from operator import itemgetter, sub
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from config import config
+from modules.metrics import timer, timed, increment
+from modules.utils import haversine
+
+_state = {
+    "graph": None,
+    "path": None,
+    "mtime": None,
+    "blocked": frozenset(),
+    "blocks_loaded": 0.0
+}
+_lock = threading.Lock()
+
+# Default speeds (km/h) of the routable highway classes; other ways are not driven on
+SPEEDS_KMH = {
+    "motorway": 100, "motorway_link": 60,
+    "trunk": 80, "trunk_link": 50,
+    "primary": 60, "primary_link": 45,
+    "secondary": 50, "secondary_link": 40,
+    "tertiary": 40, "tertiary_link": 30,
+    "unclassified": 30, "road": 25, "residential": 25,
+    "living_street": 10, "service": 15, "track": 15
+}
+
+# Marks a node that cannot reach, or be reached from, a landmark
+UNREACHABLE = np.iinfo(np.uint32).max
+
+# Nodes are bucketed in cells of this many degrees for snapping points to the road
+CELL_DEGREES = 0.01
+
+def way_speed(tags: Dict[str, str]) -> Optional[float]:
+    """Driving speed of a way in km/h (None when it is not routable)"""
+    highway = tags.get("highway")
+    if highway not in SPEEDS_KMH or tags.get("access") in ("no", "private") or tags.get("area") == "yes":
+        return None
+    match = re.match(r"\s*(\d+(?:\.\d+)?)\s*(mph)?", tags.get("maxspeed", ""))
+    if match:
+        return float(match.group(1)) * (1.609 if match.group(2) else 1)
+    return SPEEDS_KMH[highway]
+
+def way_direction(tags: Dict[str, str]) -> int:
+    """1 for one way along the node order, -1 against it, 0 for both ways"""
+    oneway = tags.get("oneway")
+    if oneway == "-1":
+        return -1
+    if oneway in ("yes", "true", "1") or tags.get("junction") == "roundabout":
+        return 1
+    if oneway in ("no", "false", "0"):
+        return 0
+    return 1 if tags.get("highway") in ("motorway", "motorway_link") else 0
+
+def read_osm_xml(path: str) -> Iterator[Tuple[int, Dict[str, str], List[Tuple[int, float, float]]]]:
+    """Stream highway ways with their node coordinates from OSM XML (plain, .bz2 or .gz)"""
+    opener = bz2.open if path.endswith(".bz2") else gzip.open if path.endswith(".gz") else open
+    coordinates = {}
+    with opener(path, "rb") as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag == "node":
+                coordinates[int(elem.get("id"))] = (float(elem.get("lat")), float(elem.get("lon")))
+                elem.clear()
+            elif elem.tag == "way":
+                tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+                if "highway" in tags:
+                    refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+                    yield (int(elem.get("id")), tags,
+                           [(ref, *coordinates[ref]) for ref in refs if ref in coordinates])
+                elem.clear()
+            elif elem.tag == "relation":
+                elem.clear()
+
+def read_osm_pbf(path: str) -> Iterator[Tuple[int, Dict[str, str], List[Tuple[int, float, float]]]]:
+    """Stream highway ways with their node coordinates from an OSM PBF extract (requires pyosmium)"""
+    import osmium
+
+    ways = []
+
+    class HighwayHandler(osmium.SimpleHandler):
+        def way(self, w):
+            if "highway" in w.tags:
+                ways.append((w.id, dict(w.tags),
+                             [(nd.ref, nd.lat, nd.lon) for nd in w.nodes if nd.location.valid()]))
+
+    HighwayHandler().apply_file(path, locations=True)
+    yield from ways
+
+def read_ways(path: str):
+    return read_osm_pbf(path) if path.endswith(".pbf") else read_osm_xml(path)
+
+def graph_arrays(ways: Iterable[Tuple[int, Dict[str, str], List[Tuple[int, float, float]]]]) -> Dict[str, np.ndarray]:
+    """CSR adjacency (indptr, target, travel ms, way id) and node coordinates of routable ways"""
+    node_index, lats, lons = {}, [], []
+    sources, targets, times, way_ids = [], [], [], []
+
+    def index(ref, lat, lon):
+        if ref not in node_index:
+            node_index[ref] = len(lats)
+            lats.append(lat)
+            lons.append(lon)
+        return node_index[ref]
+
+    for way_id, tags, nodes in ways:
+        speed = way_speed(tags)
+        if not speed:
+            continue
+        direction = way_direction(tags)
+        for (a, a_lat, a_lon), (b, b_lat, b_lon) in zip(nodes, nodes[1:]):
+            if a == b:
+                continue
+            u, v = index(a, a_lat, a_lon), index(b, b_lat, b_lon)
+            ms = max(1, round(haversine(a_lat, a_lon, b_lat, b_lon) / speed * 3600000))
+            if direction >= 0:
+                sources.append(u)
+                targets.append(v)
+                times.append(ms)
+                way_ids.append(way_id)
+            if direction <= 0:
+                sources.append(v)
+                targets.append(u)
+                times.append(ms)
+                way_ids.append(way_id)
+
+    sources = np.array(sources, dtype=np.int64)
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(len(lats) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(lats)), out=indptr[1:])
+    return {
+        "indptr": indptr,
+        "target": np.array(targets, dtype=np.int32)[order],
+        "ms": np.array(times, dtype=np.uint32)[order],
+        "way": np.array(way_ids, dtype=np.int64)[order],
+        "lat": np.array(lats, dtype=np.float64),
+        "lon": np.array(lons, dtype=np.float64)
+    }
+
+def reverse_arrays(indptr: np.ndarray, target: np.ndarray, ms: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """The CSR adjacency of the graph with every edge turned around"""
+    nodes = len(indptr) - 1
+    sources = np.repeat(np.arange(nodes, dtype=np.int32), np.diff(indptr))
+    order = np.argsort(target, kind="stable")
+    reverse_indptr = np.zeros(nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(target, minlength=nodes), out=reverse_indptr[1:])
+    return reverse_indptr, sources[order], ms[order]
+
+def search(adjacency: Tuple[list, list, list], seeds: Dict[int, int], targets: Optional[Iterable[int]] = None,
+           heuristic=None, max_ms: Optional[float] = None, blocked=frozenset()) -> Tuple[Dict[int, int], Dict[int, int]]:
+    """Dijkstra from seed nodes (node -> starting ms), or A* when heuristic(node) is given.
+
+    Stops once every target is settled, or when the next node is further than
+    max_ms. Returns the settled travel times and each reached node's parent.
+    """
+    indptr, target, ms = adjacency
+    settled, parent = {}, {}
+    best = dict(seeds)
+    # Ties on the estimate go to the node furthest along, which A* then follows straight to the target
+    heap = [((heuristic(node) if heuristic else 0) + start, -start, node) for node, start in seeds.items()]
+    heapq.heapify(heap)
+    remaining = set(targets) if targets is not None else None
+    while heap:
+        estimate, elapsed, node = heapq.heappop(heap)
+        elapsed = -elapsed
+        if node in settled:
+            continue
+        if max_ms is not None and estimate > max_ms:
+            break
+        settled[node] = elapsed
+        if remaining is not None:
+            remaining.discard(node)
+            if not remaining:
+                break
+        for edge in range(indptr[node], indptr[node + 1]):
+            if blocked and edge in blocked:
+                continue
+            neighbor = target[edge]
+            if neighbor in settled:
+                continue
+            arrival = elapsed + ms[edge]
+            if arrival < best.get(neighbor, math.inf):
+                remaining_estimate = heuristic(neighbor) if heuristic else 0
+                if remaining_estimate == math.inf:
+                    continue
+                best[neighbor] = arrival
+                parent[neighbor] = node
+                heapq.heappush(heap, (arrival + remaining_estimate, -arrival, neighbor))
+    return settled, parent
+
+def select_landmarks(adjacency: Tuple[list, list, list], lat: np.ndarray, lon: np.ndarray,
+                     count: int) -> Tuple[List[int], np.ndarray]:
+    """Pick landmarks far from each other (farthest-point) with their travel times to every node"""
+    nodes = len(lat)
+    # Start from the node nearest the middle of the map; its farthest node is the first landmark
+    start = int(np.argmin((lat - lat.mean()) ** 2 + (lon - lon.mean()) ** 2))
+    reached, _ = search(adjacency, {start: 0})
+    landmarks, tables = [], []
+    component = np.fromiter(reached, dtype=np.int64)
+    nearest = np.full(nodes, UNREACHABLE, dtype=np.int64)
+    candidate = max(reached, key=reached.get)
+    for _ in range(min(count, len(component))):
+        landmarks.append(candidate)
+        times, _ = search(adjacency, {candidate: 0})
+        table = np.full(nodes, UNREACHABLE, dtype=np.uint32)
+        table[list(times)] = list(times.values())
+        tables.append(table)
+        nearest = np.minimum(nearest, table)
+        # Next: the node of the start's component farthest from every landmark so far
+        spread = np.where(nearest[component] == UNREACHABLE, -1, nearest[component])
+        if spread.max() <= 0:
+            break
+        candidate = int(component[np.argmax(spread)])
+    return landmarks, np.stack(tables, axis=1) if tables else np.zeros((nodes, 0), dtype=np.uint32)
+
+def write_graph(ways: Iterable, out_path: Optional[str] = None, landmarks: Optional[int] = None) -> Dict:
+    """Build the graph file from routable ways and precompute its landmark tables"""
+    out_path = out_path or config.get("ROAD_GRAPH_PATH", "roads.npz")
+    landmarks = config.get("ROUTING_LANDMARKS", 16) if landmarks is None else landmarks
+    started = time.perf_counter()
+    arrays = graph_arrays(ways)
+    if not len(arrays["lat"]):
+        raise ValueError("No routable ways in the extract")
+    forward = (arrays["indptr"].tolist(), arrays["target"].tolist(), arrays["ms"].tolist())
+    reverse = tuple(a.tolist() for a in reverse_arrays(arrays["indptr"], arrays["target"], arrays["ms"]))
+    parsed = time.perf_counter()
+
+    # Landmarks are chosen on the forward graph; the reverse graph gives times into them
+    chosen, from_landmark = select_landmarks(forward, arrays["lat"], arrays["lon"], landmarks)
+    to_landmark = np.full(from_landmark.shape, UNREACHABLE, dtype=np.uint32)
+    for i, landmark in enumerate(chosen):
+        times, _ = search(reverse, {landmark: 0})
+        to_landmark[list(times), i] = list(times.values())
+
+    staging = f"{out_path}.tmp.npz"
+    np.savez_compressed(staging, landmarks=np.array(chosen, dtype=np.int32), from_landmark=from_landmark,
+                        to_landmark=to_landmark, **arrays)
+    os.replace(staging, out_path)
+    return {
+        "nodes": len(arrays["lat"]),
+        "edges": len(arrays["target"]),
+        "landmarks": len(chosen),
+        "parse_seconds": round(parsed - started, 3),
+        "landmark_seconds": round(time.perf_counter() - parsed, 3),
+        "file_bytes": os.path.getsize(out_path)
+    }
+
+def build_road_graph(source_path: str, out_path: Optional[str] = None, landmarks: Optional[int] = None) -> Dict:
+    """Build the graph file from an OSM extract"""
+    return write_graph(read_ways(source_path), out_path, landmarks)
+
+def cell_keys(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    rows = np.floor(np.asarray(lat) / CELL_DEGREES).astype(np.int64) + 9000
+    cols = np.floor(np.asarray(lon) / CELL_DEGREES).astype(np.int64) + 18000
+    return rows * 40000 + cols
+
+class RoadGraph:
+    """A graph file loaded for searching: adjacency lists, node grid and landmark tables"""
+
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            self.lat, self.lon = data["lat"], data["lon"]
+            self.way = data["way"]
+            self.target_array = data["target"]
+            self.indptr_array = data["indptr"]
+            self.landmarks = data["landmarks"].tolist()
+            # One row per node (times from each landmark, then to each) so the bound reads a single row
+            self.landmark_ms = np.concatenate([data["from_landmark"], data["to_landmark"]], axis=1)
+            # Plain lists: indexing them is several times faster than NumPy scalars in the search loop
+            self.forward = (data["indptr"].tolist(), data["target"].tolist(), data["ms"].tolist())
+        keys = cell_keys(self.lat, self.lon)
+        self.cell_order = np.argsort(keys, kind="stable")
+        self.cells = keys[self.cell_order]
+
+    @property
+    def nodes(self) -> int:
+        return len(self.lat)
+
+    @property
+    def edges(self) -> int:
+        return len(self.target_array)
+
+    def nodes_within(self, lat: float, lon: float, radius_m: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Nodes within radius_m of a point, nearest first, with their distances in metres"""
+        dlat = radius_m / 111320
+        dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+        rows = range(int(math.floor((lat - dlat) / CELL_DEGREES)), int(math.floor((lat + dlat) / CELL_DEGREES)) + 1)
+        first_col, last_col = int(math.floor((lon - dlon) / CELL_DEGREES)), int(math.floor((lon + dlon) / CELL_DEGREES))
+        spans = []
+        for row in rows:
+            # Cells of one row are consecutive keys
+            low = (row + 9000) * 40000 + first_col + 18000
+            start = np.searchsorted(self.cells, low, side="left")
+            stop = np.searchsorted(self.cells, low + last_col - first_col, side="right")
+            spans.append(self.cell_order[start:stop])
+        candidates = np.concatenate(spans) if spans else np.zeros(0, dtype=np.int64)
+        # Equirectangular distance: exact enough at snapping range
+        dy = (self.lat[candidates] - lat) * 111320
+        dx = (self.lon[candidates] - lon) * 111320 * math.cos(math.radians(lat))
+        meters = np.hypot(dx, dy)
+        keep = meters <= radius_m
+        candidates, meters = candidates[keep], meters[keep]
+        order = np.argsort(meters, kind="stable")
+        return candidates[order], meters[order]
+
+    def snap(self, lat: float, lon: float, count: int = 1) -> Dict[int, int]:
+        """Up to count nearby road nodes with the ms it takes to reach each from the point"""
+        nodes, meters = self.nodes_within(lat, lon, config.get("ROUTING_SNAP_M", 500))
+        speed = config.get("ROUTING_ACCESS_KMH", 10) / 3.6
+        return {int(node): round(m / speed * 1000) for node, m in zip(nodes[:count], meters[:count])}
+
+    def blocked_edges(self, blocks: Iterable[Tuple[float, float, float]]) -> frozenset:
+        """Edges leaving or entering a node within any (lat, lon, radius_m) block"""
+        closed = set()
+        for lat, lon, radius_m in blocks:
+            closed.update(self.nodes_within(lat, lon, radius_m)[0].tolist())
+        if not closed:
+            return frozenset()
+        nodes = np.fromiter(closed, dtype=np.int64)
+        entering = np.flatnonzero(np.isin(self.target_array, nodes))
+        leaving = [np.arange(self.indptr_array[n], self.indptr_array[n + 1]) for n in nodes]
+        return frozenset(np.concatenate([entering] + leaving).tolist())
+
+    def heuristic(self, target: int):
+        """ALT lower bound on the ms from any node to target"""
+        count = len(self.landmarks)
+        landmark_ms = self.landmark_ms
+        row = landmark_ms[target].tolist()
+        # Landmarks that cannot reach target, or that target cannot reach, give no bound
+        usable = [i for i in range(count) if row[i] != UNREACHABLE and row[count + i] != UNREACHABLE]
+        if not usable:
+            return lambda node: 0
+
+        from_target = [row[i] for i in usable]
+        to_target = [row[count + i] for i in usable]
+        from_columns = itemgetter(*usable) if len(usable) > 1 else lambda times: (times[usable[0]],)
+        to_columns = itemgetter(*(count + i for i in usable)) if len(usable) > 1 else \
+            lambda times: (times[count + usable[0]],)
+        unreachable = UNREACHABLE // 2
+
+        def estimate(node):
+            # A node a landmark cannot reach gives a hugely negative term; one that cannot reach a
+            # landmark the target reaches gives a term past UNREACHABLE / 2 (it cannot reach target)
+            times = landmark_ms[node].tolist()
+            bound = max(max(map(sub, from_target, from_columns(times))), max(map(sub, to_columns(times), to_target)))
+            if bound >= unreachable:
+                return math.inf
+            return bound if bound > 0 else 0
+
+        return estimate
+
+    def path(self, parent: Dict[int, int], node: int) -> List[List[float]]:
+        """Coordinates from the search's seed to node"""
+        nodes = [node]
+        while nodes[-1] in parent:
+            nodes.append(parent[nodes[-1]])
+        nodes.reverse()
+        return [[float(self.lat[n]), float(self.lon[n])] for n in nodes]
+
+def get_road_graph() -> Optional[RoadGraph]:
+    """The road graph, loaded once per process and again when the file is rebuilt"""
+    path = config.get("ROAD_GRAPH_PATH", "roads.npz")
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    with _lock:
+        if _state["graph"] is None or _state["path"] != path or _state["mtime"] != mtime:
+            with timer("routing.load"):
+                graph = RoadGraph(path)
+            _state.update(graph=graph, path=path, mtime=mtime, blocked=frozenset(), blocks_loaded=0.0)
+        return _state["graph"]
+
+def current_blocks() -> List[Tuple[float, float, float]]:
+    """(lat, lon, radius_m) of road blocks and, with ROUTING_FLOOD_BLOCK_M, recent flood reports"""
+    from modules.database import get_road_blocks, query_emergencies
+
+    blocks = [(b["latitude"], b["longitude"], b["radius_m"]) for b in get_road_blocks()]
+    flood_radius = config.get("ROUTING_FLOOD_BLOCK_M", 0)
+    if flood_radius:
+        floods = query_emergencies(emergency_types=["flood"], since_hours=config.get("ROUTING_FLOOD_BLOCK_HOURS", 12))
+        blocks.extend((e["latitude"], e["longitude"], flood_radius) for e in floods
+                      if e["latitude"] is not None and e["longitude"] is not None)
+    return blocks
+
+def closed_edges(graph: RoadGraph) -> frozenset:
+    """Closed edges, re-read from the database at most every ROUTING_BLOCKS_SECONDS"""
+    with _lock:
+        if time.monotonic() - _state["blocks_loaded"] < config.get("ROUTING_BLOCKS_SECONDS", 30):
+            return _state["blocked"]
+        # Claim the refresh so concurrent callers keep using the previous set meanwhile
+        _state["blocks_loaded"] = time.monotonic()
+    blocked = graph.blocked_edges(current_blocks())
+    with _lock:
+        _state["blocked"] = blocked
+    return blocked
+
+def refresh_blocks():
+    """Apply road block changes at the next search instead of after ROUTING_BLOCKS_SECONDS"""
+    with _lock:
+        _state["blocks_loaded"] = 0.0
+
+@timed("routing.travel_times")
+def travel_times(lat: float, lon: float, places: List[Dict]) -> List[Optional[Dict]]:
+    """Travel time (ms) and route from a point to each place (None when it cannot be reached)"""
+    graph = get_road_graph()
+    if graph is None or not places:
+        return [None] * len(places)
+    seeds = graph.snap(lat, lon, config.get("ROUTING_SNAP_NODES", 3))
+    ends = [graph.snap(p["latitude"], p["longitude"]) for p in places]
+    targets = {node for end in ends for node in end}
+    if not seeds or not targets:
+        return [None] * len(places)
+
+    blocked = closed_edges(graph)
+    max_ms = config.get("ROUTING_MAX_MINUTES", 120) * 60000
+    if len(targets) == 1:
+        # One destination: A* with the landmark bound settles far fewer nodes than Dijkstra
+        settled, parent = search(graph.forward, seeds, targets, graph.heuristic(next(iter(targets))), max_ms, blocked)
+    else:
+        # Several: one Dijkstra search until the last of them is settled
+        settled, parent = search(graph.forward, seeds, targets, None, max_ms, blocked)
+    increment("routing.settled_nodes", len(settled))
+
+    results = []
+    for place, end in zip(places, ends):
+        node, access_ms = next(iter(end.items()), (None, 0))
+        if node not in settled:
+            results.append(None)
+            continue
+        results.append({
+            "travel_ms": settled[node] + access_ms,
+            "route": [[lat, lon]] + graph.path(parent, node) + [[place["latitude"], place["longitude"]]]
+        })
+    return results
+
+def with_routes(lat: float, lon: float, places: List[Dict]) -> List[Dict]:
+    """Copies of places with travel_ms and route added where a road route exists"""
+    return [{**place, **(found or {})} for place, found in zip(places, travel_times(lat, lon, places))]
+
+def rerank_by_travel_time(lat: float, lon: float, candidates: List[Dict], limit: Optional[int] = None) -> List[Dict]:
+    """Order straight-line candidates by travel time; unreachable ones follow, by distance"""
+    routed = with_routes(lat, lon, candidates)
+    routed.sort(key=lambda place: (place.get("travel_ms") is None, place.get("travel_ms") or 0,
+                                   place.get("distance") or 0))
+    return routed[:limit] if limit else routed
+
+def nearest_resources(lat: float, lon: float, max_km=10, limit=10) -> List[Dict]:
+    """Nearest resources by travel time with a road graph installed, otherwise by straight-line distance"""
+    from modules.database import get_nearest_resources
+
+    if get_road_graph() is None:
+        return get_nearest_resources(lat, lon, max_km=max_km, limit=limit)
+    candidates = get_nearest_resources(lat, lon, max_km=max_km, limit=limit * config.get("ROUTING_CANDIDATES", 3))
+    return rerank_by_travel_time(lat, lon, candidates, limit)
+
+def route(from_lat: float, from_lon: float, to_lat: float, to_lon: float) -> Optional[Dict]:
+    """Travel time and route between two points"""
+    return travel_times(from_lat, from_lon, [{"latitude": to_lat, "longitude": to_lon}])[0]
+
+def stats() -> Dict:
+    graph = get_road_graph()
+    if graph is None:
+        return {"installed": False, "path": config.get("ROAD_GRAPH_PATH", "roads.npz")}
+    return {
+        "installed": True,
+        "path": _state["path"],
+        "nodes": graph.nodes,
+        "edges": graph.edges,
+        "landmarks": len(graph.landmarks),
+        "blocked_edges": len(closed_edges(graph)),
+        "file_bytes": os.path.getsize(_state["path"])
+    }
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Road graph for travel-time routing")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_command = commands.add_parser("build", help="Build the graph file from an OSM extract")
+    build_command.add_argument("source", help="OSM extract (.osm.pbf, .osm, .osm.bz2)")
+    build_command.add_argument("--out", help="Graph file (default ROAD_GRAPH_PATH)")
+    build_command.add_argument("--landmarks", type=int, help="Landmark count (default ROUTING_LANDMARKS)")
+    route_command = commands.add_parser("route", help="Travel time between two points")
+    for name in ("from_lat", "from_lon", "to_lat", "to_lon"):
+        route_command.add_argument(name, type=float)
+    block_command = commands.add_parser("block", help="Close the roads around a point")
+    block_command.add_argument("lat", type=float)
+    block_command.add_argument("lon", type=float)
+    block_command.add_argument("--radius-m", type=float, default=100)
+    block_command.add_argument("--reason", default="Flooded")
+    block_command.add_argument("--hours", type=float, help="Reopen automatically after this many hours")
+    unblock_command = commands.add_parser("unblock", help="Reopen the roads of a block")
+    unblock_command.add_argument("block_id", type=int)
+    commands.add_parser("blocks", help="List the active road blocks")
+    commands.add_parser("stats", help="Show the loaded graph's size and blocked edges")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        print(json.dumps(build_road_graph(args.source, args.out, args.landmarks), indent=2))
+    elif args.command == "route":
+        found = route(args.from_lat, args.from_lon, args.to_lat, args.to_lon)
+        print(json.dumps({"travel_ms": found["travel_ms"], "points": len(found["route"])} if found else None))
+    elif args.command in ("block", "unblock", "blocks"):
+        from modules.database import add_road_block, get_road_blocks, remove_road_block
+
+        if args.command == "block":
+            print(add_road_block(args.lat, args.lon, args.radius_m, args.reason, hours=args.hours))
+        elif args.command == "unblock":
+            remove_road_block(args.block_id)
+        else:
+            print(json.dumps(get_road_blocks(), indent=2))
+    else:
+        print(json.dumps(stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,655 @@
+"""Storage backends behind the functions in modules.database
+
+DB_BACKEND selects the implementation:
+    "sqlite"    the built-in single-file database (default)
+    "postgres"  PostgreSQL with PostGIS, shared by several app replicas (needs psycopg2)
+"""
+import datetime
+import decimal
+import threading
+import streamlit as st
+from typing import Dict, List, Optional
+from config import config
+from modules.database import STORAGE_CONTRACT, VOLUNTEER_COLUMNS, entity_rows
+
+_state = {
+    "storage": None
+}
+_lock = threading.Lock()
+
+class Storage:
+    """A storage backend: one method per name in STORAGE_CONTRACT.
+
+    Methods take the same arguments as the functions of the same name in
+    modules.database and return the same shapes: lists of row dicts keyed by
+    the SQLite column names, with timestamps as "YYYY-MM-DD HH:MM:SS" UTC text.
+    """
+
+    def missing_methods(self) -> List[str]:
+        """Names of contract functions this backend does not implement"""
+        return [name for name in STORAGE_CONTRACT if not callable(getattr(self, name, None))]
+
+class SQLiteStorage(Storage):
+    """The built-in SQLite implementation (R*Tree, FTS5 and trigger-based change feed)"""
+
+    def __init__(self):
+        from modules import database
+        for name in STORAGE_CONTRACT:
+            setattr(self, name, getattr(database, name).__wrapped__)
+
+POSTGRES_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS postgis",
+    '''CREATE TABLE IF NOT EXISTS emergency
+       (eid BIGSERIAL PRIMARY KEY,
+        location TEXT,
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        text TEXT,
+        timestamp TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'),
+        emergency_type TEXT,
+        confidence REAL,
+        severity TEXT,
+        geom GEOGRAPHY(Point, 4326) GENERATED ALWAYS AS
+            (ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography) STORED,
+        search TSVECTOR GENERATED ALWAYS AS
+            (to_tsvector('english', coalesce(text, '') || ' ' || coalesce(location, ''))) STORED)''',
+    '''CREATE TABLE IF NOT EXISTS emergency_entity
+       (eid BIGINT,
+        label TEXT,
+        value TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS emergency_image
+       (image_id BIGSERIAL PRIMARY KEY,
+        eid BIGINT,
+        phash BIGINT,
+        width INTEGER,
+        height INTEGER,
+        original_bytes INTEGER,
+        thumbnail BYTEA,
+        timestamp TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'))''',
+    '''CREATE TABLE IF NOT EXISTS road_block
+       (block_id BIGSERIAL PRIMARY KEY,
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        radius_m REAL,
+        reason TEXT,
+        created_by BIGINT,
+        timestamp TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'),
+        expires TIMESTAMP)''',
+    '''CREATE TABLE IF NOT EXISTS resource
+       (resourceid BIGSERIAL PRIMARY KEY,
+        amenity TEXT,
+        name TEXT,
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        created_by INTEGER,
+        timestamp TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'),
+        geom GEOGRAPHY(Point, 4326) GENERATED ALWAYS AS
+            (ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography) STORED)''',
+    '''CREATE TABLE IF NOT EXISTS volunteer
+       (id SERIAL PRIMARY KEY,
+        name TEXT,
+        email TEXT UNIQUE,
+        password_hash TEXT,
+        location TEXT,
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        speciality TEXT,
+        phone TEXT,
+        timestamp TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'))''',
+    '''CREATE TABLE IF NOT EXISTS incident
+       (incident_id BIGSERIAL PRIMARY KEY,
+        location TEXT,
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        report_count INTEGER DEFAULT 1,
+        first_reported TIMESTAMP,
+        last_reported TIMESTAMP,
+        geom GEOGRAPHY(Point, 4326) GENERATED ALWAYS AS
+            (ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography) STORED)''',
+    '''CREATE TABLE IF NOT EXISTS incident_member
+       (eid BIGINT PRIMARY KEY,
+        incident_id BIGINT)''',
+    '''CREATE TABLE IF NOT EXISTS change_log
+       (seq BIGSERIAL PRIMARY KEY,
+        table_name TEXT,
+        row_id BIGINT,
+        op TEXT,
+        timestamp TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'))''',
+    '''CREATE TABLE IF NOT EXISTS geocode_cache
+       (query TEXT PRIMARY KEY,
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        timestamp TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'))''',
+    '''CREATE TABLE IF NOT EXISTS first_aid_guidance
+       (disaster_type TEXT,
+        severity TEXT,
+        guidance TEXT,
+        timestamp TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'),
+        PRIMARY KEY (disaster_type, severity))''',
+    "CREATE INDEX IF NOT EXISTS idx_emergency_geom ON emergency USING GIST (geom)",
+    "CREATE INDEX IF NOT EXISTS idx_emergency_search ON emergency USING GIN (search)",
+    "CREATE INDEX IF NOT EXISTS idx_emergency_timestamp ON emergency (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_emergency_type_time ON emergency (emergency_type, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_emergency_severity_time ON emergency (severity, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_emergency_entity_eid ON emergency_entity (eid)",
+    "CREATE INDEX IF NOT EXISTS idx_emergency_entity_value ON emergency_entity (label, value)",
+    "CREATE INDEX IF NOT EXISTS idx_emergency_image_eid ON emergency_image (eid)",
+    "CREATE INDEX IF NOT EXISTS idx_emergency_image_timestamp ON emergency_image (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_resource_geom ON resource USING GIST (geom)",
+    "CREATE INDEX IF NOT EXISTS idx_resource_created_by ON resource (created_by)",
+    "CREATE INDEX IF NOT EXISTS idx_incident_geom ON incident USING GIST (geom)",
+    "CREATE INDEX IF NOT EXISTS idx_incident_last_reported ON incident (last_reported)",
+    "CREATE INDEX IF NOT EXISTS idx_incident_member_incident ON incident_member (incident_id)",
+    '''CREATE OR REPLACE FUNCTION log_change() RETURNS trigger AS $$
+       BEGIN
+           IF TG_OP = 'DELETE' THEN
+               INSERT INTO change_log (table_name, row_id, op)
+               VALUES (TG_TABLE_NAME, (to_jsonb(OLD) ->> TG_ARGV[0])::bigint, 'delete');
+               RETURN OLD;
+           END IF;
+           INSERT INTO change_log (table_name, row_id, op)
+           VALUES (TG_TABLE_NAME, (to_jsonb(NEW) ->> TG_ARGV[0])::bigint, lower(TG_OP));
+           RETURN NEW;
+       END
+       $$ LANGUAGE plpgsql'''
+] + [
+    statement
+    for table, key in (("emergency", "eid"), ("resource", "resourceid"), ("incident", "incident_id"), ("volunteer", "id"))
+    for statement in (
+        f"DROP TRIGGER IF EXISTS {table}_changes ON {table}",
+        f'''CREATE TRIGGER {table}_changes AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION log_change('{key}')'''
+    )
+]
+
+# Same shape as modules.database.INCIDENT_COLUMNS
+POSTGRES_INCIDENT_COLUMNS = '''i.*,
+    i.last_reported AS timestamp,
+    (SELECT e.text FROM incident_member m JOIN emergency e ON e.eid = m.eid
+     WHERE m.incident_id = i.incident_id ORDER BY e.eid DESC LIMIT 1) AS text'''
+
+POSTGRES_CHANGE_TABLES = {
+    "emergency": ("eid", "SELECT * FROM emergency"),
+    "resource": ("resourceid", "SELECT * FROM resource"),
+    "incident": ("incident_id", f"SELECT {POSTGRES_INCIDENT_COLUMNS} FROM incident i"),
+    "volunteer": ("id", f"SELECT {VOLUNTEER_COLUMNS} FROM volunteer")
+}
+
+def _clean_row(row: Dict) -> Dict:
+    """Give a PostgreSQL row the same shape as its SQLite counterpart"""
+    cleaned = {}
+    for key, value in row.items():
+        if key in ("geom", "search"):
+            continue
+        if isinstance(value, datetime.datetime):
+            value = value.strftime("%Y-%m-%d %H:%M:%S")
+        elif isinstance(value, datetime.date):
+            value = value.isoformat()
+        elif isinstance(value, decimal.Decimal):
+            value = float(value)
+        elif isinstance(value, memoryview):
+            value = value.tobytes()
+        cleaned[key] = value
+    return cleaned
+
+class PostgresStorage(Storage):
+    """PostgreSQL/PostGIS implementation with geography columns, GiST and GIN indexes"""
+
+    def __init__(self, dsn: str, pool_size: int = 10):
+        import psycopg2
+        from psycopg2.pool import ThreadedConnectionPool
+        from psycopg2.extras import RealDictCursor
+
+        self.errors = psycopg2.Error
+        self.cursor_factory = RealDictCursor
+        self.pool = ThreadedConnectionPool(1, pool_size, dsn)
+
+    def _transaction(self, work, default=None):
+        """Run work(cursor) in one transaction, reporting errors like execute_query"""
+        conn = self.pool.getconn()
+        try:
+            with conn:
+                with conn.cursor(cursor_factory=self.cursor_factory) as cur:
+                    return work(cur)
+        except self.errors as e:
+            st.error(f"Database error: {e}")
+            return default
+        finally:
+            self.pool.putconn(conn)
+
+    def _query(self, query: str, params: tuple = ()) -> List[Dict]:
+        """Run one statement and return its rows (if any) as cleaned dicts"""
+        def work(cur):
+            cur.execute(query, params)
+            return [_clean_row(row) for row in cur.fetchall()] if cur.description else []
+        return self._transaction(work, default=[])
+
+    def init_db(self, db_path: str = None):
+        def work(cur):
+            for statement in POSTGRES_SCHEMA:
+                cur.execute(statement)
+        self._transaction(work)
+
+    @staticmethod
+    def _candidate_incidents(cur, lat: float, lon: float, reported_at, radius_m: float,
+                             window_hours: float) -> List[Dict]:
+        """Same rows as clustering.find_candidate_incidents (reported_at None means now)"""
+        cur.execute(
+            '''SELECT i.incident_id, i.latitude, i.longitude, i.report_count,
+                (SELECT e.text FROM incident_member m JOIN emergency e ON e.eid = m.eid
+                 WHERE m.incident_id = i.incident_id ORDER BY e.eid DESC LIMIT 1) AS text,
+                ST_Distance(i.geom, ST_MakePoint(%s, %s)::geography) / 1000 AS distance
+               FROM incident i
+               WHERE ST_DWithin(i.geom, ST_MakePoint(%s, %s)::geography, %s)
+                 AND i.last_reported >= COALESCE(%s, now() AT TIME ZONE 'utc') - make_interval(secs => %s)
+               ORDER BY distance''',
+            (lon, lat, lon, lat, radius_m, reported_at, float(window_hours) * 3600)
+        )
+        return [dict(row) for row in cur.fetchall()]
+
+    def add_emergency(self, location: str, lat: float, lon: float, text: str,
+                      emergency_type: Optional[str] = None, confidence: Optional[float] = None,
+                      severity: Optional[str] = None, entities: Optional[Dict[str, List[str]]] = None,
+                      cluster: bool = True):
+        from modules.clustering import _incident_label, choose_incident, score_candidates, text_similarity
+
+        radius_m = config.get("INCIDENT_RADIUS_KM", 1.0) * 1000
+        window_hours = config.get("INCIDENT_WINDOW_HOURS", 6)
+        scores, label = {}, location
+        if cluster:
+            # Score the tie-break and label a possible new incident before taking the clustering lock
+            candidates = self._transaction(
+                lambda cur: self._candidate_incidents(cur, lat, lon, None, radius_m, window_hours), default=[]
+            )
+            scores = score_candidates(candidates, text, text_similarity)
+            label = _incident_label(location, lat, lon)
+
+        def work(cur):
+            cur.execute(
+                '''INSERT INTO emergency (location, latitude, longitude, text, emergency_type, confidence, severity)
+                   VALUES (%s, %s, %s, %s, %s, %s, %s)
+                   RETURNING eid, timestamp''',
+                (location, lat, lon, text, emergency_type, confidence, severity)
+            )
+            row = cur.fetchone()
+            eid, reported_at = row["eid"], row["timestamp"]
+            if entities:
+                cur.executemany(
+                    "INSERT INTO emergency_entity (eid, label, value) VALUES (%s, %s, %s)",
+                    entity_rows({eid: entities})
+                )
+            if cluster:
+                # Serialize clustering across replicas so two reports cannot open twin incidents
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext('incident_clustering'))")
+                candidates = self._candidate_incidents(cur, lat, lon, reported_at, radius_m, window_hours)
+                best = choose_incident(candidates, text, text_similarity, scores)
+                if best is None:
+                    cur.execute(
+                        '''INSERT INTO incident (location, latitude, longitude, report_count, first_reported, last_reported)
+                           VALUES (%s, %s, %s, 1, %s, %s) RETURNING incident_id''',
+                        (label, lat, lon, reported_at, reported_at)
+                    )
+                    incident_id = cur.fetchone()["incident_id"]
+                else:
+                    n = best["report_count"]
+                    incident_id = best["incident_id"]
+                    cur.execute(
+                        '''UPDATE incident
+                           SET latitude = %s, longitude = %s, report_count = report_count + 1,
+                               last_reported = GREATEST(last_reported, %s)
+                           WHERE incident_id = %s''',
+                        ((best["latitude"] * n + lat) / (n + 1), (best["longitude"] * n + lon) / (n + 1),
+                         reported_at, incident_id)
+                    )
+                cur.execute("INSERT INTO incident_member (eid, incident_id) VALUES (%s, %s)", (eid, incident_id))
+            return eid
+
+        return self._transaction(work)
+
+    def get_cached_locations(self, queries: List[str]) -> Dict[str, tuple]:
+        rows = self._query(
+            "SELECT query, latitude, longitude FROM geocode_cache WHERE query = ANY(%s)",
+            (list(queries),)
+        )
+        return {row["query"]: (row["latitude"], row["longitude"]) for row in rows}
+
+    def cache_locations(self, locations: Dict[str, tuple]):
+        if not locations:
+            return
+        self._transaction(lambda cur: cur.executemany(
+            '''INSERT INTO geocode_cache (query, latitude, longitude) VALUES (%s, %s, %s)
+               ON CONFLICT (query) DO UPDATE
+               SET latitude = EXCLUDED.latitude, longitude = EXCLUDED.longitude,
+                   timestamp = EXCLUDED.timestamp''',
+            [(query, lat, lon) for query, (lat, lon) in locations.items()]
+        ))
+
+    def get_cached_guidance(self, disaster_type: str, severity: str, max_age_hours: float) -> Optional[str]:
+        rows = self._query(
+            '''SELECT guidance FROM first_aid_guidance
+               WHERE disaster_type = %s AND severity = %s
+                 AND timestamp >= (now() AT TIME ZONE 'utc') - make_interval(secs => %s)''',
+            (disaster_type, severity, int(max_age_hours * 3600))
+        )
+        return rows[0]["guidance"] if rows else None
+
+    def cache_guidance(self, disaster_type: str, severity: str, guidance: str):
+        self._query(
+            '''INSERT INTO first_aid_guidance (disaster_type, severity, guidance) VALUES (%s, %s, %s)
+               ON CONFLICT (disaster_type, severity) DO UPDATE
+               SET guidance = EXCLUDED.guidance, timestamp = EXCLUDED.timestamp''',
+            (disaster_type, severity, guidance)
+        )
+
+    def store_emergency_entities(self, entities_by_eid: Dict[int, Dict[str, List[str]]]):
+        def work(cur):
+            cur.execute("DELETE FROM emergency_entity WHERE eid = ANY(%s)", (list(entities_by_eid),))
+            cur.executemany("INSERT INTO emergency_entity (eid, label, value) VALUES (%s, %s, %s)",
+                            entity_rows(entities_by_eid))
+        self._transaction(work)
+
+    def get_unclassified_emergencies(self, after_eid: int = 0, limit: int = 64) -> List[Dict]:
+        return self._query(
+            '''SELECT eid, text FROM emergency
+               WHERE emergency_type IS NULL AND eid > %s
+               ORDER BY eid LIMIT %s''',
+            (after_eid, limit)
+        )
+
+    def update_emergency_classification(self, rows: List[tuple]):
+        self._transaction(lambda cur: cur.executemany(
+            '''UPDATE emergency SET emergency_type = %s, confidence = %s, severity = %s
+               WHERE eid = %s''',
+            rows
+        ))
+
+    def append_emergency_text(self, eid: int, text: str):
+        self._query("UPDATE emergency SET text = COALESCE(text, '') || %s WHERE eid = %s", (text, eid))
+
+    def add_emergency_image(self, eid: int, phash: int, width: int, height: int, original_bytes: int,
+                            thumbnail: bytes):
+        import psycopg2
+
+        rows = self._query(
+            '''INSERT INTO emergency_image (eid, phash, width, height, original_bytes, thumbnail)
+               VALUES (%s, %s, %s, %s, %s, %s)
+               RETURNING image_id''',
+            (eid, phash, width, height, original_bytes, psycopg2.Binary(thumbnail))
+        )
+        return rows[0]["image_id"] if rows else None
+
+    def get_recent_image_hashes(self, hours: float = 72):
+        return self._query(
+            '''SELECT i.eid, i.phash, e.location, e.timestamp
+               FROM emergency_image i JOIN emergency e ON e.eid = i.eid
+               WHERE i.timestamp >= (now() AT TIME ZONE 'utc') - make_interval(secs => %s)''',
+            (hours * 3600,)
+        )
+
+    def get_emergency_images(self, limit: int = 12):
+        return self._query(
+            '''SELECT i.image_id, i.eid, i.thumbnail, i.timestamp, e.location, e.emergency_type
+               FROM emergency_image i JOIN emergency e ON e.eid = i.eid
+               ORDER BY i.image_id DESC LIMIT %s''',
+            (limit,)
+        )
+
+    def query_emergencies(self, emergency_types: Optional[List[str]] = None, severities: Optional[List[str]] = None,
+                          since_hours: Optional[float] = None, entity: Optional[tuple] = None,
+                          limit: int = 1000):
+        clauses, params = [], []
+        if emergency_types:
+            clauses.append("emergency_type = ANY(%s)")
+            params.append(list(emergency_types))
+        if severities:
+            clauses.append("severity = ANY(%s)")
+            params.append(list(severities))
+        if since_hours is not None:
+            clauses.append("timestamp >= (now() AT TIME ZONE 'utc') - make_interval(secs => %s)")
+            params.append(float(since_hours) * 3600)
+        if entity:
+            clauses.append("eid IN (SELECT eid FROM emergency_entity WHERE label = %s AND value = %s)")
+            params.extend([entity[0], entity[1].lower()])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            f"SELECT * FROM emergency {where} ORDER BY timestamp DESC LIMIT %s",
+            tuple(params) + (limit,)
+        )
+
+    def search_emergencies(self, text: str, limit: int = 20, offset: int = 0):
+        if not text.strip():
+            return []
+        return self._query(
+            '''SELECT e.*,
+                ts_headline('english', coalesce(e.text, '') || ' ' || coalesce(e.location, ''), q,
+                            'StartSel=**, StopSel=**, MaxWords=16, MinWords=6') AS snippet,
+                -ts_rank(e.search, q) AS rank
+               FROM emergency e, websearch_to_tsquery('english', %s) q
+               WHERE e.search @@ q
+               ORDER BY rank
+               LIMIT %s OFFSET %s''',
+            (text, limit, offset)
+        )
+
+    def get_emergency_type_counts(self):
+        return self._query(
+            '''SELECT COALESCE(emergency_type, 'unclassified') AS emergency_type, COUNT(*) AS count
+               FROM emergency
+               GROUP BY emergency_type
+               ORDER BY count DESC'''
+        )
+
+    def _nearest(self, columns: str, table: str, table_alias: str, user_lat: float, user_lon: float, max_km, limit,
+                 since_column: Optional[str] = None, since_hours: Optional[float] = None):
+        """Rows of a geography-indexed table within max_km of a point, nearest first"""
+        since, since_params = "", ()
+        if since_hours is not None:
+            since = f"AND {table_alias}.{since_column} >= (now() AT TIME ZONE 'utc') - make_interval(secs => %s)"
+            since_params = (since_hours * 3600,)
+        return self._query(
+            f'''SELECT {columns},
+                ST_Distance({table_alias}.geom, ST_MakePoint(%s, %s)::geography) / 1000 AS distance
+                FROM {table} {table_alias}
+                WHERE ST_DWithin({table_alias}.geom, ST_MakePoint(%s, %s)::geography, %s)
+                {since}
+                ORDER BY {table_alias}.geom <-> ST_MakePoint(%s, %s)::geography
+                LIMIT %s''',
+            (user_lon, user_lat, user_lon, user_lat, max_km * 1000, *since_params, user_lon, user_lat, limit)
+        )
+
+    def get_nearest_emergencies(self, user_lat: float, user_lon: float, max_km=10, limit=10,
+                                since_hours: Optional[float] = None):
+        return self._nearest("e.*", "emergency", "e", user_lat, user_lon, max_km, limit,
+                             "timestamp", since_hours)
+
+    def get_nearest_incidents(self, user_lat: float, user_lon: float, max_km=10, limit=10,
+                              since_hours: Optional[float] = None):
+        return self._nearest(POSTGRES_INCIDENT_COLUMNS, "incident", "i",
+                             user_lat, user_lon, max_km, limit, "last_reported", since_hours)
+
+    def get_incidents(self, limit: int = None):
+        return self._query(
+            f'''SELECT {POSTGRES_INCIDENT_COLUMNS}
+                FROM incident i
+                ORDER BY i.last_reported DESC
+                LIMIT %s''',
+            (limit,)
+        )
+
+    def get_latest_change_seq(self) -> int:
+        rows = self._query("SELECT COALESCE(MAX(seq), 0) AS seq FROM change_log")
+        return rows[0]["seq"] if rows else 0
+
+    def get_changes_since(self, seq: int, tables: Optional[List[str]] = None, limit: int = 1000) -> Dict:
+        tables = tables or list(POSTGRES_CHANGE_TABLES)
+        log = self._query(
+            '''SELECT seq, table_name, row_id, op FROM change_log
+               WHERE seq > %s AND table_name = ANY(%s)
+               ORDER BY seq
+               LIMIT %s''',
+            (seq, list(tables), limit + 1)
+        )
+        if not log:
+            return {"seq": seq, "changes": [], "reset": False}
+        if len(log) > limit or any(entry["op"] == "bulk" for entry in log):
+            return {"seq": self.get_latest_change_seq(), "changes": [], "reset": True}
+
+        latest, inserted = {}, set()
+        for entry in log:
+            latest[(entry["table_name"], entry["row_id"])] = entry
+            if entry["op"] == "insert":
+                inserted.add((entry["table_name"], entry["row_id"]))
+
+        rows = {}
+        for table in tables:
+            ids = [row_id for (t, row_id), entry in latest.items() if t == table and entry["op"] != "delete"]
+            if ids:
+                key, select = POSTGRES_CHANGE_TABLES[table]
+                for row in self._query(f"SELECT * FROM ({select}) changed WHERE {key} = ANY(%s)", (ids,)):
+                    rows[(table, row[key])] = row
+
+        changes = []
+        for (table, row_id), entry in sorted(latest.items(), key=lambda item: item[1]["seq"]):
+            row = rows.get((table, row_id))
+            if row is None and (table, row_id) in inserted:
+                continue
+            if row is None:
+                op = "delete"
+            elif (table, row_id) in inserted:
+                op = "insert"
+            else:
+                op = "update"
+            changes.append({"seq": entry["seq"], "table": table, "op": op, "row_id": row_id, "row": row})
+        return {"seq": log[-1]["seq"], "changes": changes, "reset": False}
+
+    def prune_change_log(self, keep_hours: float = 24, db_path: Optional[str] = None):
+        self._query(
+            "DELETE FROM change_log WHERE timestamp < (now() AT TIME ZONE 'utc') - make_interval(secs => %s)",
+            (float(keep_hours) * 3600,)
+        )
+
+    def add_resource(self, amenity: str, name: str, lat: float, lon: float, created_by: int):
+        rows = self._query(
+            '''INSERT INTO resource (amenity, name, latitude, longitude, created_by)
+               VALUES (%s, %s, %s, %s, %s)
+               RETURNING resourceid''',
+            (amenity, name, lat, lon, created_by)
+        )
+        return rows[0]["resourceid"] if rows else None
+
+    def get_nearest_resources(self, user_lat: float, user_lon: float, max_km=10, limit=10):
+        return self._nearest("r.*", "resource", "r", user_lat, user_lon, max_km, limit)
+
+    def add_road_block(self, lat: float, lon: float, radius_m: float, reason: str, created_by: Optional[int] = None,
+                       hours: Optional[float] = None):
+        rows = self._query(
+            '''INSERT INTO road_block (latitude, longitude, radius_m, reason, created_by, expires)
+               VALUES (%s, %s, %s, %s, %s,
+                       (now() AT TIME ZONE 'utc') + make_interval(secs => %s::double precision))
+               RETURNING block_id''',
+            (lat, lon, radius_m, reason, created_by, None if hours is None else hours * 3600)
+        )
+        return rows[0]["block_id"] if rows else None
+
+    def get_road_blocks(self):
+        return self._query(
+            '''SELECT * FROM road_block
+               WHERE expires IS NULL OR expires > (now() AT TIME ZONE 'utc')
+               ORDER BY block_id'''
+        )
+
+    def remove_road_block(self, block_id: int):
+        self._query("DELETE FROM road_block WHERE block_id = %s", (block_id,))
+
+    def register_volunteer(self, name: str, email: str, password: str, location: str,
+                           lat: float, lon: float, speciality: str, phone: str):
+        from modules.utils import hash_password
+
+        rows = self._query(
+            '''INSERT INTO volunteer
+               (name, email, password_hash, location, latitude, longitude, speciality, phone)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+               ON CONFLICT (email) DO NOTHING
+               RETURNING id''',
+            (name, email, hash_password(password), location, lat, lon, speciality, phone)
+        )
+        if rows:
+            return True, rows[0]["id"]
+        if self._query("SELECT id FROM volunteer WHERE email = %s", (email,)):
+            return False, "Email already registered"
+        return False, "Registration failed"
+
+    def volunteer_login(self, email: str, password: str):
+        from modules.utils import hash_password
+
+        volunteers = self._query(
+            "SELECT * FROM volunteer WHERE email = %s AND password_hash = %s",
+            (email, hash_password(password))
+        )
+        if not volunteers:
+            return False, "Invalid email or password"
+        return True, volunteers[0]
+
+    def get_volunteer_dashboard(self, volunteer_id: int):
+        volunteer = self._query("SELECT * FROM volunteer WHERE id = %s", (volunteer_id,))[0]
+        resources = self.get_nearest_resources(volunteer["latitude"], volunteer["longitude"])
+        my_resources = self._query("SELECT * FROM resource WHERE created_by = %s", (volunteer_id,))
+        return volunteer, resources, my_resources
+
+    def count_rows(self, table: str) -> int:
+        if table not in ("emergency", "resource", "volunteer", "incident"):
+            raise ValueError(f"Unknown table: {table}")
+        rows = self._query(f"SELECT COUNT(*) AS count FROM {table}")
+        return rows[0]["count"] if rows else 0
+
+    def get_emergency_trend(self):
+        return self._query(
+            '''SELECT to_char(timestamp, 'YYYY-MM-DD') AS date, COUNT(*) AS count
+               FROM emergency
+               GROUP BY 1
+               ORDER BY 1'''
+        )
+
+    def get_resources(self, with_creator: bool = False):
+        if not with_creator:
+            return self._query("SELECT * FROM resource ORDER BY timestamp DESC")
+        return self._query(
+            '''SELECT r.*, v.name AS added_by
+               FROM resource r
+               LEFT JOIN volunteer v ON r.created_by = v.id
+               ORDER BY r.timestamp DESC'''
+        )
+
+    def get_volunteers(self):
+        return self._query(
+            '''SELECT id, name, email, location, latitude, longitude, speciality, phone, timestamp
+               FROM volunteer
+               ORDER BY timestamp DESC'''
+        )
+
+    def get_resource_counts_by_volunteer(self, limit: int = 10):
+        return self._query(
+            '''SELECT v.name, COUNT(r.resourceid) AS resource_count
+               FROM volunteer v
+               LEFT JOIN resource r ON v.id = r.created_by
+               GROUP BY v.id
+               ORDER BY resource_count DESC
+               LIMIT %s''',
+            (limit,)
+        )
+
+def create_storage(backend: Optional[str] = None) -> Storage:
+    """Build a storage backend by name"""
+    backend = backend or config.get("DB_BACKEND", "sqlite")
+    if backend == "sqlite":
+        return SQLiteStorage()
+    if backend == "postgres":
+        return PostgresStorage(config["POSTGRES_DSN"], config.get("POSTGRES_POOL_SIZE", 10))
+    raise ValueError(f"Unknown DB_BACKEND: {backend}")
+
+def get_storage() -> Storage:
+    """Get the process-wide storage backend selected by DB_BACKEND"""
+    with _lock:
+        if _state["storage"] is None:
+            _state["storage"] = create_storage()
+        return _state["storage"]
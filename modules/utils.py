@@ -24,3 +24,36 @@ def haversine(lat1, lon1, lat2, lon2):
 def hash_password(password):
     """Create a secure password hash"""
     return hashlib.sha256(password.encode()).hexdigest()
+
+def bounding_box(lat, lon, radius_km):
+    """Get the (min_lat, max_lat, min_lon, max_lon) box enclosing a circle around a point"""
+    lat, lon, radius_km = map(float, (lat, lon, radius_km))
+    R = 6371  # Earth's radius in km
+    dlat = math.degrees(radius_km / R)
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+
+    # Near the poles, or across the antimeridian, fall back to every longitude
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat <= 1e-9:
+        return min_lat, max_lat, -180.0, 180.0
+    dlon = math.degrees(radius_km / (R * cos_lat))
+    if dlon >= 180 or lon - dlon < -180 or lon + dlon > 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, lon - dlon, lon + dlon
+
+def apply_changes(rows, changes, table, key, keep=None):
+    """Patch a list of row dicts with change feed entries for one table.
+
+    Inserted and updated rows replace their previous version (or are added)
+    when keep(row) is true, and are dropped otherwise; deleted rows are removed.
+    """
+    by_key = {row[key]: row for row in rows}
+    for change in changes:
+        if change["table"] != table:
+            continue
+        row = change["row"]
+        if row is not None and (keep is None or keep(row)):
+            by_key[change["row_id"]] = row
+        else:
+            by_key.pop(change["row_id"], None)
+    return list(by_key.values())
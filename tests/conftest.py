@@ -0,0 +1,87 @@
+import os
+import re
+import sys
+import types
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# config.py holds deployment secrets and is not committed; tests run on an empty one
+try:
+    import config as _config_module
+except ImportError:
+    _config_module = types.ModuleType("config")
+    _config_module.config = {}
+    _config_module.headers = {}
+    sys.modules["config"] = _config_module
+
+BACKENDS = ["sqlite", "postgres"]
+
+def word_overlap(text_a: str, text_b: str) -> float:
+    """Deterministic stand-in for spaCy similarity"""
+    words_a = set(re.findall(r"\w+", text_a.lower()))
+    words_b = set(re.findall(r"\w+", text_b.lower()))
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+@pytest.fixture
+def config(monkeypatch, tmp_path):
+    """The app config, pointed at a fresh SQLite file and restored after the test"""
+    from config import config
+
+    monkeypatch.setitem(config, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setitem(config, "DB_BACKEND", "sqlite")
+    monkeypatch.setitem(config, "WRITE_BATCHING", False)
+    monkeypatch.setitem(config, "QUERY_PROFILING", False)
+    return config
+
+@pytest.fixture
+def offline_clustering(monkeypatch):
+    """Cluster reports by word overlap and reported location, without spaCy or the gazetteer"""
+    from modules import clustering, gazetteer
+
+    monkeypatch.setattr(clustering, "text_similarity", word_overlap)
+    monkeypatch.setattr(gazetteer, "reverse_geocode", lambda lat, lon: None)
+
+@pytest.fixture
+def no_db_errors(monkeypatch):
+    """Fail the test on any st.error (database code reports errors there and returns a default)"""
+    import streamlit
+
+    def fail(message, *args, **kwargs):
+        pytest.fail(f"st.error: {message}")
+
+    monkeypatch.setattr(streamlit, "error", fail)
+
+@pytest.fixture(params=BACKENDS)
+def storage(request, config, monkeypatch, offline_clustering, no_db_errors):
+    """An empty database behind each storage backend.
+
+    PostgreSQL runs only when POSTGRES_TEST_DSN points at a server with
+    PostGIS; every table in that database is emptied before each test.
+    """
+    from modules import storage as storage_module
+
+    if request.param == "sqlite":
+        backend = storage_module.SQLiteStorage()
+        backend.init_db(config["DB_PATH"])
+        yield backend
+        return
+
+    dsn = os.environ.get("POSTGRES_TEST_DSN")
+    if not dsn:
+        pytest.skip("POSTGRES_TEST_DSN is not set")
+    pytest.importorskip("psycopg2")
+    monkeypatch.setitem(config, "DB_BACKEND", "postgres")
+    monkeypatch.setitem(config, "POSTGRES_DSN", dsn)
+    backend = storage_module.PostgresStorage(dsn, pool_size=2)
+    backend.init_db()
+    tables = [row["tablename"] for row in backend._query(
+        "SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename <> 'spatial_ref_sys'"
+    )]
+    backend._query(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY")
+    monkeypatch.setitem(storage_module._state, "storage", backend)
+    yield backend
+    backend.pool.closeall()
@@ -0,0 +1,132 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+LAT, LON = 19.0, 72.8
+
+@pytest.fixture
+def database(config, tmp_path, monkeypatch, offline_clustering, no_db_errors):
+    from modules.database import init_db
+
+    monkeypatch.setitem(config, "EXPORT_DIR", str(tmp_path / "exports"))
+    monkeypatch.setitem(config, "ARCHIVE_DB_PATH", str(tmp_path / "archive.db"))
+    init_db(config["DB_PATH"])
+
+def snapshot(table):
+    from modules.export import open_snapshot
+
+    return sorted(open_snapshot(table).to_table().to_pylist(), key=lambda row: tuple(str(v) for v in row.values()))
+
+@pytest.mark.parametrize("value, partition", [
+    ("2024-07-01 08:30:00", "month=2024-07"),
+    ("2024-07-01T08:30:00Z", "month=2024-07"),
+    (1719822600, "month=2024-07"),
+    ("07/01/2024", "month=unknown"),
+    ("", "month=unknown"),
+    (None, "month=unknown"),
+])
+def test_partition_of(value, partition):
+    from modules.export import partition_of
+
+    assert partition_of(value) == partition
+
+def test_unreadable_times_are_exported_as_null_under_unknown(database):
+    from modules.database import execute_query
+    from modules.export import export_snapshots
+
+    for text, timestamp in (("iso", "2024-07-01T08:30:00"), ("epoch", 1719822600), ("slashed", "07/01/2024")):
+        execute_query("INSERT INTO emergency (location, latitude, longitude, text, timestamp) VALUES ('A', ?, ?, ?, ?)",
+                      (LAT, LON, text, timestamp))
+    export_snapshots(["emergency"])
+    rows = {row["text"]: row for row in snapshot("emergency")}
+    assert str(rows["iso"]["timestamp"]) == str(rows["epoch"]["timestamp"]) == "2024-07-01 08:30:00"
+    assert rows["iso"]["month"] == "2024-07"
+    assert rows["slashed"]["timestamp"] is None and rows["slashed"]["month"] == "unknown"
+
+def test_changed_rows_are_rewritten(database):
+    from modules.database import (add_emergency, execute_query, store_emergency_entities,
+                                  update_emergency_classification)
+    from modules.export import export_snapshots
+
+    first = add_emergency("A", LAT, LON, "Fire in a building", "fire", 0.9, entities={"GPE": ["Mumbai"]})
+    unclassified = add_emergency("B", LAT + 0.5, LON, "Old report", cluster=False)
+    removed = add_emergency("C", LAT + 1, LON, "Archived report", cluster=False)
+    assert export_snapshots()["emergency"]["rewritten_files"] == 0
+
+    # An incident gains a report, a backfill classifies an old one, another is deleted
+    add_emergency("A", LAT, LON, "Fire spreading")
+    update_emergency_classification([("flood", 0.6, "low", unclassified)])
+    store_emergency_entities({unclassified: {"GPE": ["Thane"]}})
+    execute_query("DELETE FROM emergency WHERE eid = ?", (removed,))
+    results = export_snapshots()
+    assert results["emergency"]["rewritten_files"] >= 1
+
+    emergencies = {row["eid"]: row for row in snapshot("emergency")}
+    assert sorted(emergencies) == [first, unclassified, first + 3]
+    assert emergencies[unclassified]["emergency_type"] == "flood"
+    assert [(row["eid"], row["value"]) for row in snapshot("emergency_entity")] == \
+        [(first, "mumbai"), (unclassified, "thane")]
+    assert [row["report_count"] for row in snapshot("incident")] == [2]
+
+    # Nothing changed: nothing is rewritten or appended
+    results = export_snapshots()
+    assert all(r["rewritten_files"] == 0 and r["rows"] == 0 for r in results.values())
+
+def test_pruned_change_feed_exports_again_in_full(database):
+    from modules.database import add_emergency, prune_change_log
+    from modules.export import export_snapshots, read_manifest
+
+    add_emergency("A", LAT, LON, "Fire")
+    export_snapshots(["incident"])
+    add_emergency("A", LAT, LON, "Fire again")
+    prune_change_log(-1)
+    add_emergency("B", LAT + 1, LON, "Flood")
+    export_snapshots(["incident"])
+    assert sorted(row["report_count"] for row in snapshot("incident")) == [1, 2]
+    assert read_manifest()["tables"]["incident"]["rows"] == 2
+
+@pytest.mark.parametrize("later", [False, True])
+def test_entities_added_to_exported_reports_are_exported(database, later):
+    from modules.database import add_emergency, store_emergency_entities, update_emergency_classification
+    from modules.export import export_snapshots
+
+    # The report gaining entities is either below or inside the range of the exported entity part file
+    first = add_emergency("A", LAT, LON, "Old report", cluster=False)
+    second = add_emergency("B", LAT + 1, LON, "Fire in Pune", "fire", 0.9, entities={"GPE": ["Pune"]}, cluster=False)
+    third = add_emergency("C", LAT + 2, LON, "Flood in Thane", "flood", 0.8, entities={"GPE": ["Thane"]}, cluster=False)
+    export_snapshots()
+
+    backfilled = first
+    if later:
+        backfilled = add_emergency("D", LAT + 3, LON, "Old report", cluster=False)
+        add_emergency("E", LAT + 4, LON, "Storm in Nashik", "cyclone", 0.7, entities={"GPE": ["Nashik"]}, cluster=False)
+        export_snapshots()
+    update_emergency_classification([("flood", 0.6, "low", backfilled)])
+    store_emergency_entities({backfilled: {"GPE": ["Mumbai"]}})
+    export_snapshots()
+
+    values = {(row["eid"], row["value"]) for row in snapshot("emergency_entity")}
+    assert (backfilled, "mumbai") in values
+    assert {(second, "pune"), (third, "thane")} <= values
+
+def test_archived_reports_stay_in_the_snapshot(database, config):
+    from modules.database import add_emergency, execute_query
+    from modules.export import export_snapshots
+    from modules.retention import archive_old_reports
+
+    old = add_emergency("A", LAT, LON, "Fire last year", "fire", 0.9, entities={"GPE": ["Pune"]})
+    recent = add_emergency("B", LAT + 1, LON, "Flood today", "flood", 0.8, entities={"GPE": ["Thane"]})
+    execute_query("UPDATE emergency SET timestamp = '2023-07-01 08:30:00' WHERE eid = ?", (old,))
+    execute_query("UPDATE incident SET first_reported = '2023-07-01 08:30:00', last_reported = '2023-07-01 08:30:00' "
+                  "WHERE incident_id IN (SELECT incident_id FROM incident_member WHERE eid = ?)", (old,))
+    export_snapshots()
+    assert archive_old_reports(days=30)["emergency"] == 1
+
+    results = export_snapshots()
+    assert results["emergency"]["rewritten_files"] >= 1
+    assert [row["eid"] for row in snapshot("emergency")] == [old, recent]
+    assert [row["eid"] for row in snapshot("emergency_entity")] == [old, recent]
+    assert len(snapshot("incident")) == 2
+    # A full export reads the archive as well
+    export_snapshots(full=True)
+    assert [row["eid"] for row in snapshot("emergency")] == [old, recent]
@@ -0,0 +1,82 @@
+import pytest
+
+pytest.importorskip("PyPDF2")
+
+@pytest.fixture
+def stub_model(config, monkeypatch):
+    """A StubModel as the first-aid model, on a fresh database"""
+    from modules import first_aid
+    from modules.database import init_db
+
+    init_db(config["DB_PATH"])
+    monkeypatch.setitem(config, "FIRST_AID_CACHE_HOURS", 24)
+    model = first_aid.StubModel()
+    first_aid.set_model(model)
+    yield model
+    first_aid.set_model(None)
+
+def test_model_guidance_streams_chunks(stub_model):
+    from modules.first_aid import model_guidance
+
+    chunks = list(model_guidance("Fire", "smoke in the stairwell", "high"))
+    assert len(chunks) > 10
+    assert "".join(chunks).startswith("First-aid guidance (stub model).")
+    assert stub_model.calls == ["What are the first-aid measures for a high fire? "
+                                "Give short, general steps that apply to most people affected."]
+
+def test_canonical_guidance_is_cached_per_type_and_severity(stub_model):
+    from modules.first_aid import model_guidance
+
+    first = "".join(model_guidance("fire", "smoke in the stairwell", "high"))
+    # A miss asks the model and stores the whole answer; a hit answers in one chunk from the cache
+    assert list(model_guidance("wildfire", "a different report", "high")) == [first]
+    assert len(stub_model.calls) == 1
+    "".join(model_guidance("fire", "smoke", "low"))
+    assert len(stub_model.calls) == 2
+
+def test_reports_with_victim_details_skip_the_cache(stub_model):
+    from modules.first_aid import model_guidance
+
+    entities = {"victim_condition": ["trapped"]}
+    "".join(model_guidance("fire", "two people trapped", "high", entities))
+    "".join(model_guidance("fire", "two people trapped", "high", entities))
+    assert len(stub_model.calls) == 2
+    assert "Context provided: two people trapped" in stub_model.calls[0]
+
+def test_stub_model_is_configured_by_name(config, monkeypatch):
+    from modules import first_aid
+
+    monkeypatch.setitem(config, "FIRST_AID_MODEL", "stub")
+    first_aid.set_model(None)
+    try:
+        assert isinstance(first_aid.get_model(), first_aid.StubModel)
+    finally:
+        first_aid.set_model(None)
+
+class FailingModel:
+    def generate_content(self, prompt, stream=False):
+        raise ConnectionError("service unavailable")
+
+@pytest.mark.parametrize("source", ["enrich", "model"])
+def test_offline_guidance_when_the_model_fails(stub_model, config, monkeypatch, source):
+    from modules import first_aid
+    from modules.first_aid_kb import local_guidance
+
+    monkeypatch.setitem(config, "FIRST_AID_SOURCE", source)
+    first_aid.set_model(FailingModel())
+    chunks = list(first_aid.stream_guidance("fire", "smoke in the stairwell", "high"))
+    local = local_guidance("fire", "smoke in the stairwell", "high")
+    if source == "enrich":
+        assert chunks == [local]
+    else:
+        assert chunks == ["_The AI service is unavailable; showing offline guidance._\n\n" + local]
+
+def test_enrich_streams_offline_guidance_before_the_model(stub_model, config, monkeypatch):
+    from modules.first_aid import stream_guidance
+    from modules.first_aid_kb import local_guidance
+
+    monkeypatch.setitem(config, "FIRST_AID_SOURCE", "enrich")
+    chunks = list(stream_guidance("fire", "smoke in the stairwell", "high"))
+    assert chunks[0] == local_guidance("fire", "smoke in the stairwell", "high")
+    assert chunks[1] == "\n\n---\n\n**More guidance**\n\n"
+    assert "".join(chunks[2:]).startswith("First-aid guidance (stub model).")
@@ -0,0 +1,40 @@
+import pytest
+
+# id, name, asciiname, alternatenames, lat, lon, feature class, code, country, ..., population
+PLACES = [
+    (1275339, "Mumbai", "Mumbai", "Bombay", 19.07, 72.87, "IN", 12691836),
+    (1259229, "Pune", "Pune", "Poona", 18.52, 73.86, "IN", 3124458),
+    (1254661, "Thane", "Thane", "", 19.2, 72.96, "IN", 1261517),
+]
+
+@pytest.fixture
+def gazetteer(config, monkeypatch, tmp_path):
+    from modules import gazetteer
+
+    source = tmp_path / "cities.txt"
+    source.write_text("".join(
+        "\t".join([str(place_id), name, ascii_name, alternates, str(lat), str(lon), "P", "PPL", country,
+                   "", "", "", "", "", str(population)]) + "\n"
+        for place_id, name, ascii_name, alternates, lat, lon, country, population in PLACES
+    ), encoding="utf-8")
+    path = str(tmp_path / "gazetteer.db")
+    gazetteer.build_gazetteer(str(source), path)
+    monkeypatch.setitem(config, "GAZETTEER_DB", path)
+    monkeypatch.setitem(gazetteer._state, "conn", None)
+    monkeypatch.setitem(gazetteer._state, "path", None)
+    yield gazetteer
+    gazetteer.offline_geocode.cache_clear()
+
+@pytest.mark.parametrize("query, expected", [
+    ("Mumbai", (19.07, 72.87)),
+    ("Bombay", (19.07, 72.87)),
+    ("Andheri, Pune", (18.52, 73.86)),
+    ("Mumbay", (19.07, 72.87)),
+    ("Atlantis", (None, None)),
+    ("!!!", (None, None)),
+    ("-", (None, None)),
+    (",", (None, None)),
+    ("", (None, None)),
+])
+def test_offline_geocode(gazetteer, query, expected):
+    assert tuple(gazetteer.offline_geocode(query, 0.7)) == expected
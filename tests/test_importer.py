@@ -0,0 +1,70 @@
+import pytest
+from modules.importer import bulk_import, parse_timestamp, read_osm
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-07-01 08:30:00", "2024-07-01 08:30:00"),
+    ("2024-07-01T08:30:00", "2024-07-01 08:30:00"),
+    ("2024-07-01T08:30:00Z", "2024-07-01 08:30:00"),
+    ("2024-07-01T14:00:00+05:30", "2024-07-01 08:30:00"),
+    ("2024-07-01", "2024-07-01 00:00:00"),
+    (1719822600, "2024-07-01 08:30:00"),
+    (1719822600.0, "2024-07-01 08:30:00"),
+    ("1719822600", "2024-07-01 08:30:00"),
+    (1719822600000, "2024-07-01 08:30:00"),
+    (None, None),
+    ("  ", None),
+])
+def test_parse_timestamp(value, expected):
+    assert parse_timestamp(value) == expected
+
+@pytest.mark.parametrize("value", ["07/01/2024", "yesterday", "nan", True, float("inf"), 1e300])
+def test_parse_timestamp_rejects_unreadable_times(value):
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
+
+def test_parse_timestamp_with_date_format():
+    assert parse_timestamp("07/01/2024", "%d/%m/%Y") == "2024-01-07 00:00:00"
+    # ISO 8601 still reads when the pattern does not match
+    assert parse_timestamp("2024-07-01T08:30:00", "%d/%m/%Y") == "2024-07-01 08:30:00"
+
+def test_bulk_import_normalizes_report_times(config, tmp_path):
+    from modules.database import init_db, execute_query
+
+    path = tmp_path / "reports.csv"
+    path.write_text(
+        "lat,lon,text,time\n"
+        "19.0,72.8,iso,2024-07-01T08:30:00Z\n"
+        "19.0,72.8,epoch,1719822600\n"
+        "19.0,72.8,unreadable,07/01/2024\n"
+        "19.0,72.8,missing,\n",
+        encoding="utf-8"
+    )
+    init_db(config["DB_PATH"])
+    stats = bulk_import(str(path), table="emergency")
+    assert (stats["inserted"], stats["skipped"]) == (3, 1)
+
+    times = {row["text"]: row["timestamp"] for row in execute_query("SELECT text, timestamp FROM emergency")}
+    assert times["iso"] == times["epoch"] == "2024-07-01 08:30:00"
+    assert "unreadable" not in times
+    assert len(times["missing"]) == 19
+
+def test_read_osm_streams_amenities(tmp_path):
+    pytest.importorskip("osmium")
+    path = tmp_path / "extract.osm"
+    path.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<osm version="0.6">\n'
+        ' <node id="1" lat="19.0" lon="72.8"><tag k="amenity" v="hospital"/><tag k="name" v="KEM"/></node>\n'
+        ' <node id="2" lat="19.1" lon="72.9"/>\n'
+        ' <node id="3" lat="19.3" lon="73.1"/>\n'
+        ' <way id="10"><nd ref="2"/><nd ref="3"/><tag k="amenity" v="shelter"/></way>\n'
+        ' <way id="11"><nd ref="2"/><nd ref="3"/><tag k="highway" v="primary"/></way>\n'
+        '</osm>\n',
+        encoding="utf-8"
+    )
+    rows = read_osm(str(path))
+    assert next(rows) == {"amenity": "hospital", "name": "KEM", "latitude": 19.0, "longitude": 72.8}
+    shelter = next(rows)
+    assert shelter["amenity"] == "shelter"
+    assert shelter["latitude"] == pytest.approx(19.2) and shelter["longitude"] == pytest.approx(73.0)
+    assert next(rows, None) is None
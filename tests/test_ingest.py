@@ -0,0 +1,103 @@
+import threading
+import time
+import pytest
+import streamlit
+from tests.conftest import word_overlap
+
+LAT, LON = 19.0, 72.8
+
+@pytest.fixture
+def write_queue(config, monkeypatch):
+    """The process-wide write queue, on a fresh database"""
+    from modules import ingest
+    from modules.database import init_db
+
+    init_db(config["DB_PATH"])
+    write_queue = ingest.WriteQueue(config["DB_PATH"])
+    monkeypatch.setitem(ingest._state, "queue", write_queue)
+    yield write_queue
+    write_queue.close(5)
+
+@pytest.fixture
+def errors(monkeypatch):
+    reported = []
+    monkeypatch.setattr(streamlit, "error", reported.append)
+    return reported
+
+def block_writer(write_queue):
+    """Occupy the writer thread until the returned event is set"""
+    release = threading.Event()
+    running = write_queue.submit(lambda cur: release.wait(5))
+    while not running.running():
+        time.sleep(0.001)
+    return release, running
+
+def test_writer_runs_no_similarity_or_geocoding(write_queue, config, monkeypatch, errors):
+    from modules import clustering, gazetteer
+    from modules.database import add_emergency, get_incidents
+
+    threads = []
+
+    def similarity(text_a, text_b):
+        threads.append(threading.current_thread().name)
+        return word_overlap(text_a, text_b)
+
+    def reverse_geocode(lat, lon):
+        threads.append(threading.current_thread().name)
+        return None
+
+    monkeypatch.setattr(clustering, "text_similarity", similarity)
+    monkeypatch.setattr(gazetteer, "reverse_geocode", reverse_geocode)
+    monkeypatch.setitem(config, "WRITE_BATCHING", True)
+    monkeypatch.setitem(config, "INCIDENT_RADIUS_KM", 0.3)
+    add_emergency("West", LAT, LON, "smoke and fire in the market")
+    add_emergency("East", LAT + 0.004, LON, "water rising flood in the street")
+    monkeypatch.setitem(config, "INCIDENT_RADIUS_KM", 1.0)
+    # Nearer to the fire, but reads like the flood
+    assert add_emergency("Middle", LAT + 0.0015, LON, "flood water rising fast")
+
+    assert {i["location"]: i["report_count"] for i in get_incidents()} == {"West": 1, "East": 2}
+    assert threads and "ingest-writer" not in threads
+    assert errors == []
+
+def test_timed_out_write_still_queued_is_never_written(write_queue, config, monkeypatch, errors):
+    from modules.database import add_resource, count_rows
+
+    monkeypatch.setitem(config, "WRITE_BATCHING", True)
+    monkeypatch.setitem(config, "WRITE_RESULT_TIMEOUT", 0.05)
+    release, running = block_writer(write_queue)
+    assert add_resource("hospital", "City Hospital", LAT, LON, 1) is None
+    release.set()
+    running.result(timeout=5)
+
+    write_queue.close(5)
+    assert count_rows("resource") == 0
+    assert errors == ["Saving is taking longer than expected. Please try again."]
+
+def test_timed_out_write_already_running_reports_its_outcome(write_queue, config, monkeypatch, errors):
+    from modules import ingest
+
+    def slow_insert(cur, *args):
+        resource_id = ingest.insert_resource(cur, *args)
+        time.sleep(0.2)
+        return resource_id
+
+    monkeypatch.setitem(config, "WRITE_RESULT_TIMEOUT", 0.05)
+    assert ingest._wait(slow_insert, "hospital", "City Hospital", LAT, LON, 1) == 1
+    assert errors == []
+
+def test_close_gives_up_when_the_queue_stays_full(config):
+    from modules import ingest
+    from modules.database import init_db
+
+    init_db(config["DB_PATH"])
+    write_queue = ingest.WriteQueue(config["DB_PATH"], max_pending=1)
+    release, running = block_writer(write_queue)
+    queued = write_queue.submit(lambda cur: "queued")
+    with pytest.raises(ingest.IngestQueueFull):
+        write_queue.close(0.05)
+
+    release.set()
+    assert queued.result(timeout=5) == "queued"
+    write_queue.close(5)
+    assert write_queue._thread is None
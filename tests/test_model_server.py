@@ -0,0 +1,52 @@
+import base64
+import io
+import json
+import threading
+from http.server import ThreadingHTTPServer
+import pytest
+import requests
+
+pytest.importorskip("PyPDF2")
+Image = pytest.importorskip("PIL.Image")
+
+@pytest.fixture
+def server(monkeypatch):
+    """The inference server on a free port, with CLIP replaced by a labeller that counts batches"""
+    from modules import model_server, processing
+
+    batches = []
+
+    def classify_images(images):
+        batches.append(len(images))
+        return [("fire", 0.9) for _ in images]
+
+    monkeypatch.setattr(processing, "classify_images", classify_images)
+    monkeypatch.setattr(model_server.ModelRequestHandler, "batchers", model_server.create_batchers())
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), model_server.ModelRequestHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", batches
+    httpd.shutdown()
+    httpd.server_close()
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+@pytest.mark.parametrize("image", [
+    "not base64!",
+    base64.b64encode(b"plain text, not an image").decode("ascii")
+])
+def test_bad_upload_fails_only_its_own_request(server, image):
+    url, batches = server
+    response = requests.post(f"{url}/classify_image", data=json.dumps({"image": image}))
+    assert response.status_code == 400
+    assert response.json()["error"].startswith("Invalid image")
+    assert batches == []
+
+    good = base64.b64encode(png_bytes()).decode("ascii")
+    response = requests.post(f"{url}/classify_image", data=json.dumps({"image": good}))
+    assert response.status_code == 200
+    assert response.json() == {"label": "fire", "confidence": 0.9}
+    assert batches == [1]
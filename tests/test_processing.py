@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+import requests
+import streamlit
+
+pytest.importorskip("PyPDF2")
+
+def test_extract_entities_reports_model_server_errors(config, monkeypatch):
+    from modules import processing
+
+    def unreachable(url, **kwargs):
+        raise requests.ConnectionError("connection refused")
+
+    errors = []
+    monkeypatch.setitem(config, "MODEL_SERVER_URL", "http://127.0.0.1:9")
+    monkeypatch.setattr(requests, "post", unreachable)
+    monkeypatch.setattr(streamlit, "error", errors.append)
+    assert processing.extract_entities("fire near the station") == {}
+    assert errors == ["Entity extraction error: connection refused"]
+
+@pytest.fixture
+def clip(monkeypatch):
+    """CLIP encoders returning fixed embeddings: one axis per emergency label"""
+    from modules import models
+    from modules.processing import EMERGENCY_LABELS
+
+    labels = np.eye(len(EMERGENCY_LABELS))
+
+    def embed(cosine):
+        # A unit vector whose cosine with the "fire" label is the given value, and 0 with the rest
+        row = np.zeros((1, len(EMERGENCY_LABELS) + 1))
+        row[0, 0], row[0, -1] = cosine, np.sqrt(1 - cosine ** 2)
+        return row[:, :-1]
+
+    monkeypatch.setattr(models, "get_clip_label_embeddings", lambda names: labels)
+    monkeypatch.setattr(models, "get_clip_logit_scale", lambda: 100.0)
+    return embed
+
+def test_label_probabilities_are_a_softmax_over_labels(monkeypatch):
+    from modules import models
+    from modules.processing import label_probabilities
+
+    monkeypatch.setattr(models, "get_clip_logit_scale", lambda: 100.0)
+    probabilities = label_probabilities(np.array([[0.30, 0.25, 0.20], [0.9, 0.9, 0.9]]))
+    assert probabilities.sum(axis=1) == pytest.approx([1.0, 1.0])
+    assert probabilities[0, 0] == pytest.approx(1 / (1 + np.exp(-5) + np.exp(-10)))
+    assert probabilities[1] == pytest.approx([1 / 3] * 3)
+
+def test_image_and_text_confidences_are_on_one_scale(clip, monkeypatch):
+    from modules import models
+    from modules.processing import classify_images, classify_texts
+    from modules.report import fuse_type
+
+    # Image-text cosines are about 0.25 and text-text cosines about 0.8; both are clear wins
+    monkeypatch.setattr(models, "get_clip_image_encoder", lambda: lambda images: clip(0.25))
+    monkeypatch.setattr(models, "get_clip_text_encoder", lambda: lambda texts: clip(0.8))
+    monkeypatch.setattr("modules.imaging.open_image", lambda data, size: data)
+    (image_label, image_confidence), = classify_images([b"photo"])
+    (text_label, text_confidence), = classify_texts(["smoke everywhere"])
+
+    assert image_label == text_label == "fire"
+    assert 0.9 < image_confidence <= text_confidence <= 1.0
+    # A confident photo now outweighs a weak text vote for another type
+    fused = fuse_type([{"emergency_type": "fire", "confidence": image_confidence},
+                       {"emergency_type": "flood", "confidence": 0.4}])
+    assert fused == {"emergency_type": "fire", "confidence": image_confidence}
+
+def test_batched_calls_load_models_in_the_calling_thread(config, monkeypatch):
+    import threading
+    from modules import batching, models, processing
+
+    class Doc:
+        ents = []
+
+    class NLP:
+        def pipe(self, texts, **kwargs):
+            return [Doc() for _ in texts]
+
+    loads = []
+
+    def get_nlp():
+        # Streamlit's loading message only reaches the session from the caller's thread
+        loads.append(threading.current_thread().name)
+        return NLP()
+
+    monkeypatch.setitem(config, "INFERENCE_BATCHING", True)
+    monkeypatch.setitem(batching._state, "batchers", {})
+    monkeypatch.setattr(models, "get_nlp", get_nlp)
+    assert processing.extract_entities("fire near the station")["emergency_type"] == []
+    assert loads[0] == threading.current_thread().name
+
+def test_transcription_fails_whole_when_a_chunk_fails(config, monkeypatch):
+    from modules import audio, processing
+
+    class Response:
+        def __init__(self, status_code, text=""):
+            self.status_code, self.text = status_code, text
+
+        def json(self):
+            return {"text": self.text}
+
+    replies = {b"0": Response(200, "two people trapped"), b"1": Response(503), b"2": Response(200, "send help")}
+    monkeypatch.setitem(config, "WHISPER_MODEL", "openai/whisper-large-v3")
+    monkeypatch.setattr(processing, "audio_chunks", lambda path: [b"0", b"1", b"2"])
+    monkeypatch.setattr(audio, "wav_bytes", lambda chunk: chunk)
+    monkeypatch.setattr(requests, "post", lambda url, data=None, **kwargs: replies[data])
+    # Empty, so analyze_voice falls back to the local ASR instead of keeping a partial transcript
+    assert processing.transcribe_audio("note.ogg") == ""
+
+    replies[b"1"] = Response(200, "under the bridge")
+    assert processing.transcribe_audio("note.ogg") == "two people trapped under the bridge send help"
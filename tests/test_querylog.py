@@ -0,0 +1,31 @@
+import pytest
+from modules.querylog import explain, scanned_table
+
+@pytest.mark.parametrize("detail, expected", [
+    ("SCAN e", "e"),
+    ("SCAN emergency USING COVERING INDEX idx_emergency_timestamp", "emergency"),
+    # SQLite before 3.36
+    ("SCAN TABLE emergency", "emergency"),
+    ("SCAN TABLE emergency AS e", "emergency"),
+    ("SCAN TABLE emergency USING INDEX idx_emergency_timestamp", "emergency"),
+    ("SEARCH e USING INDEX idx_emergency_timestamp (timestamp>?)", None),
+    ("SEARCH TABLE emergency USING INTEGER PRIMARY KEY (rowid=?)", None),
+    ("SCAN emergency_fts VIRTUAL TABLE INDEX 0:M1", None),
+    ("SCAN TABLE emergency_fts VIRTUAL TABLE INDEX 0:M1", None),
+])
+def test_scanned_table(detail, expected):
+    assert scanned_table(detail) == expected
+
+def test_explain_flags_full_scans_of_large_tables(config, monkeypatch):
+    from modules.database import init_db, get_db_connection
+
+    init_db(config["DB_PATH"])
+    monkeypatch.setitem(config, "FULL_SCAN_MIN_ROWS", 2)
+    conn = get_db_connection()
+    try:
+        conn.executemany("INSERT INTO volunteer (name, phone) VALUES (?, ?)", [("A", "1"), ("B", "2")])
+        result = explain(conn, "SELECT * FROM volunteer v WHERE v.phone = ?", ("1",))
+        assert [scan["table"] for scan in result["full_scans"]] == ["volunteer"]
+        assert explain(conn, "SELECT * FROM volunteer WHERE id = ?", (1,))["full_scans"] == []
+    finally:
+        conn.close()
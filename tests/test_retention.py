@@ -0,0 +1,61 @@
+import sqlite3
+import pytest
+
+@pytest.fixture
+def maintenance_db(config, monkeypatch, tmp_path):
+    """A database other than DB_PATH, with one change feed entry"""
+    from modules.database import init_db, get_db_connection
+
+    path = str(tmp_path / "other.db")
+    init_db(path)
+    init_db(config["DB_PATH"])
+    conn = get_db_connection(path)
+    conn.execute("INSERT INTO resource (amenity, name, latitude, longitude) VALUES ('hospital', 'City Hospital', 19.0, 72.8)")
+    conn.commit()
+    conn.close()
+    monkeypatch.setitem(config, "ARCHIVE_DB_PATH", str(tmp_path / "archive.db"))
+    monkeypatch.setitem(config, "EXPORT_ENABLED", False)
+    return path
+
+def change_count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+    finally:
+        conn.close()
+
+def test_maintenance_prunes_the_given_database(maintenance_db, config, monkeypatch):
+    from modules import retention
+
+    monkeypatch.setitem(config, "CHANGE_LOG_KEEP_HOURS", -1)
+    retention.run_maintenance(force=True, db_path=maintenance_db)
+    assert change_count(maintenance_db) == 0
+
+def test_failed_task_is_retried_at_the_next_check(maintenance_db, monkeypatch):
+    from modules import retention
+
+    def locked(**kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    archive_old_reports = retention.archive_old_reports
+    monkeypatch.setattr(retention, "archive_old_reports", locked)
+    with pytest.raises(sqlite3.OperationalError):
+        retention.run_maintenance(db_path=maintenance_db)
+    assert retention.status(maintenance_db)["last_runs"]["archive"] == "1970-01-01 00:00:00"
+
+    monkeypatch.setattr(retention, "archive_old_reports", archive_old_reports)
+    assert "archive" in retention.run_maintenance(db_path=maintenance_db)
+    # Now it ran, it is not due again within its interval
+    assert "archive" not in retention.run_maintenance(db_path=maintenance_db)
+
+def test_scheduler_check_survives_any_failure(maintenance_db, config, monkeypatch, caplog):
+    from modules import retention
+
+    def disk_full(**kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setitem(config, "DB_PATH", maintenance_db)
+    monkeypatch.setattr(retention, "archive_old_reports", disk_full)
+    assert retention.check_maintenance() is None
+    assert "Maintenance failed" in caplog.text
+    assert retention.status(maintenance_db)["last_runs"]["archive"] == "1970-01-01 00:00:00"
@@ -0,0 +1,246 @@
+"""One behaviour contract for every storage backend (see modules.storage)"""
+import re
+import pytest
+from modules.database import STORAGE_CONTRACT
+
+TIMESTAMP = re.compile(r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d$")
+EMERGENCY_COLUMNS = {"eid", "location", "latitude", "longitude", "text", "timestamp",
+                     "emergency_type", "confidence", "severity"}
+INCIDENT_COLUMNS = {"incident_id", "location", "latitude", "longitude", "report_count",
+                    "first_reported", "last_reported", "timestamp", "text"}
+
+# About 110 m per 0.001 degree of latitude
+LAT, LON = 19.0, 72.8
+
+def test_implements_every_contract_function(storage):
+    assert storage.missing_methods() == []
+    assert "add_emergency" in STORAGE_CONTRACT
+
+def test_emergency_rows_have_sqlite_shape(storage):
+    eid = storage.add_emergency("Dadar", LAT, LON, "Fire in a building", "fire", 0.9, "high")
+    rows = storage.query_emergencies()
+    assert [row["eid"] for row in rows] == [eid]
+    assert set(rows[0]) == EMERGENCY_COLUMNS
+    assert TIMESTAMP.match(rows[0]["timestamp"])
+    assert rows[0]["emergency_type"] == "fire"
+    assert rows[0]["confidence"] == pytest.approx(0.9)
+
+def test_query_emergencies_filters(storage):
+    fire = storage.add_emergency("A", LAT, LON, "Fire", "fire", 0.9, "high",
+                                 entities={"GPE": ["Mumbai", "mumbai "]}, cluster=False)
+    flood = storage.add_emergency("B", LAT, LON, "Flood", "flood", 0.8, "low", cluster=False)
+    assert [r["eid"] for r in storage.query_emergencies(emergency_types=["flood"])] == [flood]
+    assert [r["eid"] for r in storage.query_emergencies(severities=["high"])] == [fire]
+    assert [r["eid"] for r in storage.query_emergencies(entity=("GPE", "Mumbai"))] == [fire]
+    assert len(storage.query_emergencies(since_hours=1)) == 2
+    assert len(storage.query_emergencies(limit=1)) == 1
+
+def test_store_emergency_entities_replaces(storage):
+    eid = storage.add_emergency("A", LAT, LON, "Fire", entities={"GPE": ["Pune"]}, cluster=False)
+    storage.store_emergency_entities({eid: {"GPE": ["Thane"], "ORG": ["NDRF"]}})
+    assert storage.query_emergencies(entity=("GPE", "pune")) == []
+    assert [r["eid"] for r in storage.query_emergencies(entity=("GPE", "thane"))] == [eid]
+    assert [r["eid"] for r in storage.query_emergencies(entity=("ORG", "ndrf"))] == [eid]
+
+def test_backfill_reads_and_updates_classification(storage):
+    first = storage.add_emergency("A", LAT, LON, "Fire", cluster=False)
+    second = storage.add_emergency("B", LAT, LON, "Flood", cluster=False)
+    rows = storage.get_unclassified_emergencies(0, 10)
+    assert [(r["eid"], r["text"]) for r in rows] == [(first, "Fire"), (second, "Flood")]
+    assert [r["eid"] for r in storage.get_unclassified_emergencies(first, 10)] == [second]
+
+    storage.update_emergency_classification([("fire", 0.7, "medium", first)])
+    assert [r["eid"] for r in storage.get_unclassified_emergencies(0, 10)] == [second]
+    counts = {r["emergency_type"]: r["count"] for r in storage.get_emergency_type_counts()}
+    assert counts == {"fire": 1, "unclassified": 1}
+
+def test_append_emergency_text(storage):
+    eid = storage.add_emergency("Andheri", LAT, LON, "Smoke from a shop", cluster=False)
+    storage.append_emergency_text(eid, "\nImage Description: a burning building")
+    assert storage.query_emergencies()[0]["text"] == "Smoke from a shop\nImage Description: a burning building"
+    assert [r["eid"] for r in storage.search_emergencies("burning")] == [eid]
+
+def test_search_emergencies(storage):
+    eid = storage.add_emergency("Andheri", LAT, LON, "Water is flooding the subway", cluster=False)
+    storage.add_emergency("Bandra", LAT, LON, "Smoke from a shop", cluster=False)
+    rows = storage.search_emergencies("flooding")
+    assert [r["eid"] for r in rows] == [eid]
+    assert "snippet" in rows[0]
+    assert storage.search_emergencies("   ") == []
+
+def test_nearest_emergencies_within_radius_nearest_first(storage):
+    far = storage.add_emergency("Far", LAT + 0.02, LON, "x", cluster=False)
+    near = storage.add_emergency("Near", LAT + 0.001, LON, "x", cluster=False)
+    storage.add_emergency("Outside", LAT + 0.5, LON, "x", cluster=False)
+    rows = storage.get_nearest_emergencies(LAT, LON, max_km=5)
+    assert [r["eid"] for r in rows] == [near, far]
+    assert rows[0]["distance"] == pytest.approx(0.111, abs=0.005)
+    assert [r["eid"] for r in storage.get_nearest_emergencies(LAT, LON, max_km=5, limit=1)] == [near]
+
+def test_reports_close_in_space_and_time_share_an_incident(storage):
+    storage.add_emergency("A", LAT, LON, "Building fire", "fire")
+    storage.add_emergency("B", LAT + 0.002, LON, "Fire spreading")
+    storage.add_emergency("C", LAT + 0.1, LON, "Flooded road")
+    incidents = sorted(storage.get_incidents(), key=lambda i: i["incident_id"])
+    assert [i["report_count"] for i in incidents] == [2, 1]
+    assert set(incidents[0]) == INCIDENT_COLUMNS
+    assert incidents[0]["latitude"] == pytest.approx(LAT + 0.001)
+    assert incidents[0]["text"] == "Fire spreading"
+
+def test_clustering_breaks_ties_by_text_similarity(storage, config, monkeypatch):
+    monkeypatch.setitem(config, "INCIDENT_RADIUS_KM", 0.3)
+    storage.add_emergency("West", LAT, LON, "smoke and fire in the market")
+    storage.add_emergency("East", LAT + 0.004, LON, "water rising flood in the street")
+    monkeypatch.setitem(config, "INCIDENT_RADIUS_KM", 1.0)
+    # Nearer to the fire, but reads like the flood
+    storage.add_emergency("Middle", LAT + 0.0015, LON, "flood water rising fast")
+    counts = {i["location"]: i["report_count"] for i in storage.get_incidents()}
+    assert counts == {"West": 1, "East": 2}
+
+def test_clustering_without_text_joins_the_nearest(storage, config, monkeypatch):
+    monkeypatch.setitem(config, "INCIDENT_RADIUS_KM", 0.3)
+    storage.add_emergency("West", LAT, LON, "smoke and fire in the market")
+    storage.add_emergency("East", LAT + 0.004, LON, "water rising flood in the street")
+    monkeypatch.setitem(config, "INCIDENT_RADIUS_KM", 1.0)
+    storage.add_emergency("Middle", LAT + 0.0015, LON, "")
+    counts = {i["location"]: i["report_count"] for i in storage.get_incidents()}
+    assert counts == {"West": 2, "East": 1}
+
+def test_new_incident_is_labelled_by_reverse_geocoding(storage, monkeypatch):
+    from modules import gazetteer
+
+    monkeypatch.setattr(gazetteer, "reverse_geocode", lambda lat, lon: "Dadar West")
+    storage.add_emergency("near the station", LAT, LON, "Fire")
+    assert [i["location"] for i in storage.get_incidents()] == ["Dadar West"]
+
+def test_nearest_incidents(storage):
+    storage.add_emergency("A", LAT, LON, "Fire")
+    rows = storage.get_nearest_incidents(LAT, LON, max_km=1, since_hours=1)
+    assert [r["report_count"] for r in rows] == [1]
+    assert set(rows[0]) == INCIDENT_COLUMNS | {"distance"}
+    assert storage.get_nearest_incidents(LAT + 1, LON, max_km=1) == []
+
+def test_change_feed(storage):
+    start = storage.get_latest_change_seq()
+    resource = storage.add_resource("hospital", "City Hospital", LAT, LON, 1)
+    feed = storage.get_changes_since(start, ["resource"])
+    assert [(c["table"], c["op"], c["row_id"]) for c in feed["changes"]] == [("resource", "insert", resource)]
+    assert feed["changes"][0]["row"]["name"] == "City Hospital"
+    assert feed["reset"] is False
+    assert storage.get_changes_since(feed["seq"], ["resource"])["changes"] == []
+
+    storage.add_emergency("A", LAT, LON, "Fire")
+    storage.add_emergency("B", LAT, LON, "Fire again")
+    feed = storage.get_changes_since(feed["seq"], ["incident"])
+    assert [(c["op"], c["row"]["report_count"]) for c in feed["changes"]] == [("insert", 2)]
+    assert storage.get_changes_since(start, ["resource", "emergency"], limit=1)["reset"] is True
+
+def delete_resource(storage, resource_id):
+    """Delete a resource directly (the contract has no delete), firing the change feed triggers"""
+    if hasattr(storage, "_query"):
+        storage._query("DELETE FROM resource WHERE resourceid = %s", (resource_id,))
+    else:
+        from modules.database import execute_query
+        execute_query("DELETE FROM resource WHERE resourceid = ?", (resource_id,))
+
+def test_change_feed_leaves_out_rows_created_and_deleted(storage):
+    seen = storage.add_resource("hospital", "City Hospital", LAT, LON, 1)
+    start = storage.get_latest_change_seq()
+    kept = storage.add_resource("shelter", "School", LAT, LON, 1)
+    delete_resource(storage, storage.add_resource("shelter", "Hall", LAT, LON, 1))
+    delete_resource(storage, seen)
+    feed = storage.get_changes_since(start, ["resource"])
+    assert [(c["op"], c["row_id"]) for c in feed["changes"]] == [("insert", kept), ("delete", seen)]
+
+def test_change_feed_records_volunteers_without_password(storage):
+    start = storage.get_latest_change_seq()
+    ok, volunteer_id = storage.register_volunteer("Asha", "asha@example.org", "pw", "Dadar", LAT, LON, "medic", "1")
+    changes = storage.get_changes_since(start)["changes"]
+    assert [(c["table"], c["op"], c["row_id"]) for c in changes] == [("volunteer", "insert", volunteer_id)]
+    assert changes[0]["row"]["email"] == "asha@example.org"
+    assert "password_hash" not in changes[0]["row"]
+
+def test_prune_change_log(storage):
+    storage.add_resource("hospital", "City Hospital", LAT, LON, 1)
+    assert storage.get_latest_change_seq() > 0
+    storage.prune_change_log(-1)
+    assert storage.get_latest_change_seq() == 0
+
+def test_geocode_cache(storage):
+    assert storage.get_cached_locations(["dadar"]) == {}
+    storage.cache_locations({"dadar": (19.01, 72.84), "bandra": (19.05, 72.83)})
+    storage.cache_locations({"dadar": (19.02, 72.85)})
+    storage.cache_locations({})
+    assert storage.get_cached_locations(["dadar", "bandra", "thane"]) == {
+        "dadar": (19.02, 72.85), "bandra": (19.05, 72.83)
+    }
+
+def test_guidance_cache(storage):
+    assert storage.get_cached_guidance("flood", "high", 1) is None
+    storage.cache_guidance("flood", "high", "Move to higher ground")
+    storage.cache_guidance("flood", "high", "Move to higher ground now")
+    assert storage.get_cached_guidance("flood", "high", 1) == "Move to higher ground now"
+    assert storage.get_cached_guidance("flood", "low", 1) is None
+
+def test_images(storage):
+    eid = storage.add_emergency("A", LAT, LON, "Fire", "fire", cluster=False)
+    image_id = storage.add_emergency_image(eid, -12345, 640, 480, 2048, b"\xff\xd8thumb")
+    assert image_id is not None
+    images = storage.get_emergency_images()
+    assert [(i["image_id"], i["thumbnail"], i["emergency_type"]) for i in images] == [(image_id, b"\xff\xd8thumb", "fire")]
+    assert [(h["eid"], h["phash"]) for h in storage.get_recent_image_hashes(1)] == [(eid, -12345)]
+
+def test_resources(storage):
+    ok, volunteer_id = storage.register_volunteer("Asha", "asha@example.org", "pw", "Dadar", LAT, LON, "medic", "1")
+    assert ok
+    near = storage.add_resource("hospital", "Near", LAT + 0.001, LON, volunteer_id)
+    storage.add_resource("shelter", "Far", LAT + 0.5, LON, None)
+    assert [r["resourceid"] for r in storage.get_nearest_resources(LAT, LON, max_km=5)] == [near]
+    assert {r["name"]: r["added_by"] for r in storage.get_resources(with_creator=True)} == {"Near": "Asha", "Far": None}
+    assert storage.get_resource_counts_by_volunteer() == [{"name": "Asha", "resource_count": 1}]
+    assert storage.count_rows("resource") == 2
+    with pytest.raises(ValueError):
+        storage.count_rows("sqlite_master")
+
+def test_volunteers(storage):
+    ok, volunteer_id = storage.register_volunteer("Asha", "asha@example.org", "pw", "Dadar", LAT, LON, "medic", "1")
+    assert ok
+    assert storage.register_volunteer("Asha", "asha@example.org", "pw", "Dadar", LAT, LON, "medic", "1") == \
+        (False, "Email already registered")
+    assert storage.volunteer_login("asha@example.org", "wrong") == (False, "Invalid email or password")
+    ok, volunteer = storage.volunteer_login("asha@example.org", "pw")
+    assert ok and volunteer["id"] == volunteer_id
+    assert "password_hash" not in storage.get_volunteers()[0]
+
+    storage.add_resource("hospital", "Mine", LAT, LON, volunteer_id)
+    volunteer, resources, mine = storage.get_volunteer_dashboard(volunteer_id)
+    assert volunteer["name"] == "Asha"
+    assert [r["name"] for r in resources] == [r["name"] for r in mine] == ["Mine"]
+
+def test_road_blocks(storage):
+    kept = storage.add_road_block(LAT, LON, 50, "Flooded underpass")
+    expired = storage.add_road_block(LAT, LON, 50, "Cleared", hours=-1)
+    removed = storage.add_road_block(LAT, LON, 50, "Debris", created_by=1, hours=2)
+    storage.remove_road_block(removed)
+    blocks = storage.get_road_blocks()
+    assert [b["block_id"] for b in blocks] == [kept]
+    assert blocks[0]["expires"] is None and expired != kept
+
+def test_emergency_trend(storage):
+    storage.add_emergency("A", LAT, LON, "Fire", cluster=False)
+    storage.add_emergency("B", LAT, LON, "Fire", cluster=False)
+    trend = storage.get_emergency_trend()
+    assert len(trend) == 1 and trend[0]["count"] == 2
+    assert re.match(r"^\d{4}-\d\d-\d\d$", trend[0]["date"])
+
+def test_database_functions_use_the_configured_backend(storage):
+    from modules import database
+
+    database.cache_locations({"dadar": (19.01, 72.84)})
+    database.cache_guidance("flood", "high", "Move to higher ground")
+    eid = database.add_emergency("A", LAT, LON, "Fire", entities={"GPE": ["Mumbai"]})
+    database.update_emergency_classification([("fire", 0.8, "high", eid)])
+    database.prune_change_log(24)
+    assert storage.get_cached_locations(["dadar"]) == {"dadar": (19.01, 72.84)}
+    assert storage.get_cached_guidance("flood", "high", 1) == "Move to higher ground"
+    assert [r["emergency_type"] for r in storage.query_emergencies(entity=("GPE", "mumbai"))] == ["fire"]
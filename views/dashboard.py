@@ -1,8 +1,25 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from modules.database import execute_query
-from modules.geospatial import create_emergency_map, display_map
+from modules.database import (
+    count_rows,
+    get_emergency_trend,
+    get_resources,
+    get_volunteers,
+    get_resource_counts_by_volunteer,
+    get_incidents,
+    query_emergencies,
+    search_emergencies,
+    get_emergency_type_counts,
+    get_latest_change_seq,
+    get_changes_since,
+    get_emergency_images
+)
+from modules.processing import SEVERITY_LEVELS
+from modules.geospatial import create_emergency_map, display_map, map_html, display_map_html
+from modules.utils import apply_changes
+from modules import metrics, querylog
+from config import config
 
 def admin_dashboard():
     """Administrative dashboard for overview of the system"""
@@ -28,7 +45,7 @@ def admin_dashboard():
         return
 
     # Dashboard tabs
-    tab1, tab2, tab3, tab4 = st.tabs(["Overview", "Emergencies", "Resources", "Volunteers"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Overview", "Emergencies", "Resources", "Volunteers", "Metrics"])
 
     with tab1:
         system_overview()
@@ -42,40 +59,65 @@ def admin_dashboard():
     with tab4:
         volunteer_analysis()
 
+    with tab5:
+        metrics_overview()
+        slow_query_overview()
+
     # Logout button
     if st.sidebar.button("Admin Logout"):
         st.session_state.admin_logged_in = False
         st.sidebar.success("Logged out successfully!")
         st.experimental_rerun()
 
+def load_overview_feed():
+    """Load the overview state (counts, incidents, resources) from scratch"""
+    # Read the high-water mark first so no write falls between it and the queries
+    seq = get_latest_change_seq()
+    return {
+        "seq": seq,
+        "counts": {
+            "emergency": count_rows("emergency"),
+            "resource": count_rows("resource"),
+            "volunteer": count_rows("volunteer"),
+            "incident": count_rows("incident")
+        },
+        "incidents": get_incidents(),
+        "resources": get_resources(),
+        "map_html": None
+    }
+
+def refresh_overview_feed():
+    """Patch the overview state with writes made since it was last refreshed"""
+    feed = st.session_state.get("overview_feed")
+    if feed is None:
+        feed = load_overview_feed()
+    else:
+        delta = get_changes_since(feed["seq"])
+        if delta["reset"]:
+            feed = load_overview_feed()
+        elif delta["changes"]:
+            for change in delta["changes"]:
+                if change["op"] == "insert":
+                    feed["counts"][change["table"]] += 1
+                elif change["op"] == "delete":
+                    feed["counts"][change["table"]] -= 1
+            feed["incidents"] = apply_changes(feed["incidents"], delta["changes"], "incident", "incident_id")
+            feed["resources"] = apply_changes(feed["resources"], delta["changes"], "resource", "resourceid")
+            if any(c["table"] in ("incident", "resource") for c in delta["changes"]):
+                feed["map_html"] = None
+            feed["seq"] = delta["seq"]
+    st.session_state["overview_feed"] = feed
+    return feed
+
 def system_overview():
     """System overview dashboard"""
     st.subheader("System Overview")
 
-    # Get summary statistics
-    emergencies = execute_query("SELECT COUNT(*) as count FROM emergency")[0]["count"]
-    resources = execute_query("SELECT COUNT(*) as count FROM resource")[0]["count"]
-    volunteers = execute_query("SELECT COUNT(*) as count FROM volunteer")[0]["count"]
-
     # Display KPIs
-    col1, col2, col3 = st.columns(3)
-
-    with col1:
-        st.metric("Emergencies Reported", emergencies)
-
-    with col2:
-        st.metric("Resources Available", resources)
-
-    with col3:
-        st.metric("Volunteers Registered", volunteers)
+    live_metrics()
 
     # Get time series data
-    emergency_trend = execute_query('''
-        SELECT date(timestamp) as date, COUNT(*) as count
-        FROM emergency
-        GROUP BY date(timestamp)
-        ORDER BY date
-    ''')
+    emergency_trend = get_emergency_trend()
 
     if emergency_trend:
         # Convert to DataFrame
@@ -87,10 +129,33 @@ def system_overview():
 
     # Map of all emergencies and resources
     st.subheader("System Coverage Map")
+    live_coverage_map()
+
+@st.fragment(run_every=config.get("AUTO_REFRESH_SECONDS", 10))
+def live_metrics():
+    """Summary statistics, kept current from the change feed"""
+    counts = refresh_overview_feed()["counts"]
 
-    # Get all emergencies and resources
-    all_emergencies = execute_query("SELECT * FROM emergency")
-    all_resources = execute_query("SELECT * FROM resource")
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.metric("Emergencies Reported", counts["emergency"])
+
+    with col2:
+        st.metric("Distinct Incidents", counts["incident"])
+
+    with col3:
+        st.metric("Resources Available", counts["resource"])
+
+    with col4:
+        st.metric("Volunteers Registered", counts["volunteer"])
+
+@st.fragment(run_every=config.get("AUTO_REFRESH_SECONDS", 10))
+def live_coverage_map():
+    """Map of all incidents (merged emergency reports) and resources, rebuilt only on change"""
+    feed = refresh_overview_feed()
+    all_emergencies = feed["incidents"]
+    all_resources = feed["resources"]
 
     if all_emergencies or all_resources:
         # Get center coordinates (average of all points)
@@ -106,18 +171,20 @@ def system_overview():
             all_lons.append(resource["longitude"])
 
         if all_lats and all_lons:
-            center_lat = sum(all_lats) / len(all_lats)
-            center_lon = sum(all_lons) / len(all_lons)
-
-            # Create map
-            m = create_emergency_map(
-                center_lat,
-                center_lon,
-                resources=all_resources,
-                emergencies=all_emergencies,
-                center_label="System Center"
-            )
-            display_map(m)
+            if feed["map_html"] is None:
+                center_lat = sum(all_lats) / len(all_lats)
+                center_lon = sum(all_lons) / len(all_lons)
+
+                # Create map
+                m = create_emergency_map(
+                    center_lat,
+                    center_lon,
+                    resources=all_resources,
+                    emergencies=all_emergencies,
+                    center_label="System Center"
+                )
+                feed["map_html"] = map_html(m)
+            display_map_html(feed["map_html"])
         else:
             st.info("No location data available to display on map.")
     else:
@@ -127,57 +194,94 @@ def emergency_analysis():
     """Emergency data analysis dashboard"""
     st.subheader("Emergency Analysis")
 
-    # Get all emergencies
-    emergencies = execute_query("SELECT * FROM emergency ORDER BY timestamp DESC")
+    # Emergency types come from the stored classification of each report
+    type_counts = get_emergency_type_counts()
 
-    if not emergencies:
+    if not type_counts:
         st.info("No emergency data available for analysis.")
         return
 
-    # Convert to DataFrame
-    df = pd.DataFrame(emergencies)
+    # Full-text search over report text and locations
+    search = st.text_input("Search reports (e.g. trapped, a street name)", key="admin_emergency_search")
+    if search:
+        page_size = 20
+        page = st.number_input("Page", min_value=1, value=1, step=1, key="admin_search_page")
+        results = search_emergencies(search, limit=page_size, offset=(page - 1) * page_size)
+        if results:
+            for r in results:
+                st.markdown(f"**{r['location']}** ({r['timestamp']}): {r['snippet']}")
+        else:
+            st.info("No reports match your search.")
 
-    # Display interactive table
-    st.dataframe(df)
+    # Filters are served by the (type, timestamp) and (severity, timestamp) indexes
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        selected_types = st.multiselect(
+            "Emergency Type",
+            [t["emergency_type"] for t in type_counts if t["emergency_type"] != "unclassified"]
+        )
+    with col2:
+        selected_severities = st.multiselect("Severity", SEVERITY_LEVELS[::-1])
+    with col3:
+        since_hours = st.selectbox(
+            "Reported Within",
+            [None, 1, 6, 24, 168],
+            format_func=lambda h: "Any time" if h is None else f"Last {h} hours"
+        )
+
+    emergencies = query_emergencies(selected_types, selected_severities, since_hours)
+
+    if not emergencies:
+        st.info("No emergencies match the selected filters.")
+    else:
+        # Convert to DataFrame
+        df = pd.DataFrame(emergencies)
 
-    # Extract text features (would use NLP in a real implementation)
-    # This is a placeholder - we'd use the NLP functions to extract these
-    emergency_types = ["Earthquake", "Fire", "Flood", "Medical", "Other"]
-    emergency_counts = [10, 15, 7, 12, 5]  # Example data
+        # Display interactive table
+        st.dataframe(df)
 
     # Plot emergency types
-    fig = px.pie(names=emergency_types, values=emergency_counts, title="Emergency Types")
+    df_types = pd.DataFrame(type_counts)
+    fig = px.pie(df_types, names="emergency_type", values="count", title="Emergency Types")
     st.plotly_chart(fig)
 
     # Heatmap of emergencies
     st.subheader("Emergency Location Heatmap")
 
-    # Create map
-    if emergencies:
+    # Create map of incidents, so duplicate reports share one marker
+    incidents = get_incidents()
+    if incidents:
         # Calculate center
-        center_lat = sum(e["latitude"] for e in emergencies) / len(emergencies)
-        center_lon = sum(e["longitude"] for e in emergencies) / len(emergencies)
+        center_lat = sum(i["latitude"] for i in incidents) / len(incidents)
+        center_lon = sum(i["longitude"] for i in incidents) / len(incidents)
 
         # Create map
         m = create_emergency_map(
             center_lat,
             center_lon,
-            emergencies=emergencies,
+            emergencies=incidents,
             center_label="Center"
         )
         display_map(m)
 
+    # Thumbnails are stored at upload, so this grid never loads the original photos
+    images = get_emergency_images(limit=12)
+    if images:
+        st.subheader("Recent Report Photos")
+        columns = st.columns(4)
+        for i, image in enumerate(images):
+            with columns[i % 4]:
+                st.image(
+                    image["thumbnail"],
+                    caption=f"#{image['eid']} {image['emergency_type'] or 'unclassified'}: {image['location']}"
+                )
+
 def resource_analysis():
     """Resource data analysis dashboard"""
     st.subheader("Resource Analysis")
 
     # Get all resources
-    resources = execute_query('''
-        SELECT r.*, v.name as added_by
-        FROM resource r
-        LEFT JOIN volunteer v ON r.created_by = v.id
-        ORDER BY r.timestamp DESC
-    ''')
+    resources = get_resources(with_creator=True)
 
     if not resources:
         st.info("No resource data available for analysis.")
@@ -220,11 +324,7 @@ def volunteer_analysis():
     st.subheader("Volunteer Analysis")
 
     # Get all volunteers (excluding password hash for security)
-    volunteers = execute_query('''
-        SELECT id, name, email, location, latitude, longitude, speciality, phone, timestamp
-        FROM volunteer
-        ORDER BY timestamp DESC
-    ''')
+    volunteers = get_volunteers()
 
     if not volunteers:
         st.info("No volunteer data available for analysis.")
@@ -245,14 +345,7 @@ def volunteer_analysis():
     st.plotly_chart(fig)
 
     # Resources added by volunteers
-    resources_by_volunteer = execute_query('''
-        SELECT v.name, COUNT(r.resourceid) as resource_count
-        FROM volunteer v
-        LEFT JOIN resource r ON v.id = r.created_by
-        GROUP BY v.id
-        ORDER BY resource_count DESC
-        LIMIT 10
-    ''')
+    resources_by_volunteer = get_resource_counts_by_volunteer(limit=10)
 
     if resources_by_volunteer:
         # Convert to DataFrame
@@ -291,3 +384,72 @@ def volunteer_analysis():
             center_label="Center"
         )
         display_map(m)
+
+def metrics_overview():
+    """Latency and call counts of instrumented operations (database, models, external APIs, maps)"""
+    st.subheader("Performance Metrics")
+
+    if not metrics.is_enabled():
+        st.info("Instrumentation is off. Set METRICS_ENABLED to True in config.py to collect metrics.")
+        return
+
+    operations = metrics.snapshot()
+    if not operations:
+        st.info("No operations recorded yet.")
+        return
+
+    # Slowest total time first, so the biggest contributors to page time lead
+    df = pd.DataFrame(operations)
+    st.dataframe(df)
+
+    fig = px.bar(df.head(15), x="operation", y="total_s", title="Time Spent per Operation (s)")
+    st.plotly_chart(fig)
+
+    events = metrics.counters()
+    if events:
+        st.dataframe(pd.DataFrame([{"event": k, "count": v} for k, v in sorted(events.items())]))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Download Prometheus metrics", metrics.prometheus_text(),
+                           file_name="metrics.prom", mime="text/plain")
+    with col2:
+        if st.button("Reset metrics"):
+            metrics.reset()
+            st.rerun()
+
+def slow_query_overview():
+    """Recent slow SQL statements with their query plans"""
+    st.subheader("Slow Queries")
+
+    if not querylog.is_enabled():
+        st.info("Query profiling is off. Set QUERY_PROFILING to True in config.py to log slow queries.")
+        return
+
+    full_scans_only = st.checkbox("Only full scans of large tables")
+    entries = querylog.get_slow_queries(full_scans_only)
+    if not entries:
+        st.info(f"No statements slower than {config.get('SLOW_QUERY_MS', 100)} ms recorded yet.")
+        return
+
+    st.dataframe(pd.DataFrame([
+        {
+            "time": e["timestamp"],
+            "ms": e["ms"],
+            "rows": e["rows"],
+            "full_scan": ", ".join(f"{s['table']} ({s['rows']} rows)" for s in e["full_scans"]),
+            "sql": e["sql"]
+        }
+        for e in entries
+    ]))
+
+    for e in entries[:20]:
+        label = f"{e['ms']} ms: {e['sql'][:80]}"
+        with st.expander(("⚠️ " if e["full_scans"] else "") + label):
+            st.code(e["sql"], language="sql")
+            st.write(f"Parameters: {', '.join(e['params']) or 'none'} | Rows returned: {e['rows']}")
+            st.code("\n".join(e["plan"]))
+
+    if st.button("Clear slow query buffer"):
+        querylog.clear_slow_queries()
+        st.rerun()
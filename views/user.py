@@ -1,16 +1,15 @@
 import streamlit as st
+import hashlib
 import tempfile
 import os
-from modules.database import add_emergency, get_nearest_resources
+from modules.database import add_emergency, add_emergency_image, append_emergency_text
 from modules.geospatial import get_lat_lon, create_emergency_map, display_map
+from modules.report import analyze_report
+from modules.routing import nearest_resources
 from modules.processing import (
-    transcribe_audio,
-    english_speech_to_text,
-    process_image,
-    process_text,
-    extract_entities,
+    classify_severity,
     generate_summary,
-    get_first_aid_response
+    stream_first_aid_response
 )
 
 def user_workflow():
@@ -36,7 +35,9 @@ def report_emergency():
         "latitude": None,
         "longitude": None,
         "text": "",
-        "emergency_type": ""
+        "emergency_type": "",
+        "confidence": None,
+        "entities": {}
     }
 
     # Get location information
@@ -63,140 +64,160 @@ def report_emergency():
     use_voice = st.checkbox("Voice Recording")
     use_image = st.checkbox("Image Upload")
 
-    # Process text input if selected
+    # Collect the inputs first, so that their analyses can run concurrently
+    inputs = {}
+    sections = {}
+    audio = None
+
     if use_text:
         st.subheader("Text Description")
-        text_input = st.text_area("Describe the emergency situation", height=150)
-        if text_input:
-            emergency_info["text"] += f"\nText Description: {text_input}"
-
-            # Process text to identify emergency type
-            emergency_type, confidence = process_text(text_input)
-            if not emergency_info["emergency_type"]:
-                emergency_info["emergency_type"] = emergency_type
-
-            # Extract entities
-            entities = extract_entities(text_input)
-
-            # Display extracted entities if any found
-            if any(entities.values()):
-                with st.expander("Extracted Information from Text"):
-                    st.write(f"Detected emergency type: **{emergency_type}** (Confidence: {confidence:.2f})")
-                    for entity_type, items in entities.items():
-                        if items:
-                            st.write(f"**{entity_type.replace('_', ' ').title()}**: {', '.join(items)}")
-
-    # Process voice input if selected
+        inputs["text"] = st.text_area("Describe the emergency situation", height=150)
+        sections["text"] = st.container()
+
     if use_voice:
         st.subheader("Voice Recording")
         uploaded_audio = st.audio_input("Upload audio file (mp3, wav)", key="audio_upload")
 
         if uploaded_audio is not None:
-            # Save the uploaded file temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_audio.name.split('.')[-1]}") as tmp_file:
-                tmp_file.write(uploaded_audio.getvalue())
-                audio_path = tmp_file.name
-
+            audio = uploaded_audio
             st.audio(uploaded_audio)
+        sections["voice"] = st.container()
 
-            try:
-                # Automatically process audio
-                with st.spinner("Transcribing audio..."):
-                    transcription = transcribe_audio(audio_path)
-                    if not transcription:
-                        transcription = english_speech_to_text(audio_path)
-
-                if transcription:
-                    st.success("Transcription successful")
-                    st.write(transcription)
-                    emergency_info["text"] += f"\nVoice Transcription: {transcription}"
-
-                    # Process transcription to identify emergency type
-                    emergency_type, confidence = process_text(transcription)
-                    if not emergency_info["emergency_type"]:
-                        emergency_info["emergency_type"] = emergency_type
-
-                    # Extract entities
-                    entities = extract_entities(transcription)
-
-                    # Display extracted entities
-                    if any(entities.values()):
-                        with st.expander("Extracted Information from Voice"):
-                            st.write(f"Detected emergency type: **{emergency_type}** (Confidence: {confidence:.2f})")
-                            for entity_type, items in entities.items():
-                                if items:
-                                    st.write(f"**{entity_type.replace('_', ' ').title()}**: {', '.join(items)}")
-                else:
-                    st.error("Transcription failed. Please try again or use a different input method.")
-            finally:
-                # Clean up the temporary file
-                try:
-                    os.unlink(audio_path)
-                except:
-                    pass
-
-    # Process image input if selected
     if use_image:
         st.subheader("Image Upload")
         uploaded_image = st.file_uploader("Upload image file", type=["jpg", "jpeg", "png"], key="image_upload")
-
         if uploaded_image is not None:
-            st.image(uploaded_image, caption="Uploaded Image", use_column_width=True)
-
-            # Save the uploaded file temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_image.name.split('.')[-1]}") as tmp_file:
-                tmp_file.write(uploaded_image.getvalue())
-                image_path = tmp_file.name
-
+            inputs["image"] = uploaded_image.getvalue()
+        sections["image"] = st.container()
+
+    if any(inputs.values()) or audio is not None:
+        # Reruns, the submit click among them, reuse the analysis of unchanged inputs
+        fingerprint = hashlib.sha256()
+        for value in (inputs.get("text") or "", audio.getvalue() if audio else b"", inputs.get("image") or b""):
+            data = value.encode() if isinstance(value, str) else value
+            fingerprint.update(len(data).to_bytes(8, "big") + data)
+        analysis = st.session_state.get("report_analysis")
+        if analysis is not None and analysis["fingerprint"] == fingerprint.hexdigest():
+            report = analysis["report"]
+        else:
+            audio_path = None
             try:
-                # Automatically process image
-                with st.spinner("Processing image..."):
-                    image_description = process_image(image_path)
-
-                if image_description:
-                    st.success("Image processed successfully")
-                    st.write(image_description)
-                    emergency_info["text"] += f"\nImage Description: {image_description}"
-
-                    # Process description to identify emergency type
-                    emergency_type, confidence = process_text(image_description)
-                    if not emergency_info["emergency_type"]:
-                        emergency_info["emergency_type"] = emergency_type
-
-                    with st.expander("Extracted Information from Image"):
-                        st.write(f"Detected emergency type: **{emergency_type}** (Confidence: {confidence:.2f})")
-                else:
-                    st.error("Image processing failed. Please try again or use a different input method.")
+                if audio is not None:
+                    # Save the uploaded file temporarily
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{audio.name.split('.')[-1]}") as tmp_file:
+                        tmp_file.write(audio.getvalue())
+                        audio_path = tmp_file.name
+                    inputs["voice"] = audio_path
+                with st.spinner("Analyzing report..."):
+                    report = analyze_report(inputs)
             finally:
                 # Clean up the temporary file
-                try:
-                    os.unlink(image_path)
-                except:
-                    pass
+                if audio_path:
+                    try:
+                        os.unlink(audio_path)
+                    except:
+                        pass
+            st.session_state["report_analysis"] = {"fingerprint": fingerprint.hexdigest(), "report": report}
+
+        for key in ("text", "entities", "emergency_type", "confidence"):
+            emergency_info[key] = report[key]
+        for source, result in report["sources"].items():
+            with sections[source]:
+                show_source_result(source, result)
+            if source == "image" and result.get("image"):
+                emergency_info["image"] = result["image"]
+
+        # The photo's caption is only a description: it never holds up submitting, and one
+        # still running when the report is submitted is added to the stored report later
+        caption = report["sources"].get("image", {}).get("caption")
+        if caption is not None:
+            with sections["image"]:
+                if caption.done():
+                    if caption.result():
+                        st.write(caption.result())
+                    emergency_info["text"] += image_description(caption, report)
+                else:
+                    st.caption("Describing image... The description is added to your report when it is ready.")
+                    emergency_info["pending_caption"] = caption
 
     # Submit report
     if st.button("Submit Emergency Report"):
         if emergency_info["location"] and emergency_info["text"] and emergency_info["latitude"] and emergency_info["longitude"]:
-            add_emergency(
+            severity = classify_severity(emergency_info["entities"])
+            eid = add_emergency(
                 emergency_info["location"],
                 emergency_info["latitude"],
                 emergency_info["longitude"],
-                emergency_info["text"]
+                emergency_info["text"],
+                emergency_type=emergency_info["emergency_type"] or None,
+                confidence=emergency_info["confidence"],
+                severity=severity,
+                entities=emergency_info["entities"]
             )
-            st.success("Emergency report submitted successfully!")
+            if eid:
+                image = emergency_info.get("image")
+                if image:
+                    add_emergency_image(eid, image["phash"], image["width"], image["height"],
+                                        image["original_bytes"], image["thumbnail"])
+                caption = emergency_info.get("pending_caption")
+                if caption is not None:
+                    caption.add_done_callback(
+                        lambda future: append_emergency_text(eid, image_description(future, report))
+                    )
+                st.success("Emergency report submitted successfully!")
+            else:
+                st.error("Your report could not be saved. Please try again.")
 
             # Show first aid information
             if emergency_info["emergency_type"]:
                 st.subheader("First Aid Information")
-                with st.spinner("Generating first aid response..."):
-                    first_aid_info = get_first_aid_response(emergency_info["emergency_type"], emergency_info["text"])
-                st.markdown(first_aid_info)
+                st.write_stream(stream_first_aid_response(
+                    emergency_info["emergency_type"],
+                    emergency_info["text"],
+                    severity=severity,
+                    entities=emergency_info["entities"]
+                ))
 
                 # Notify about message being sent (simulation)
                 st.success("First aid information sent to your contact number.")
         else:
             st.error("Please provide both location and at least one type of emergency information.")
 
+def image_description(caption, report):
+    """Report text line for a finished photo caption (the CLIP label when captioning gave nothing)"""
+    description = caption.result() or f"photo of a {report['sources']['image']['emergency_type']}"
+    return f"\nImage Description: {description}"
+
+def show_source_result(source, result):
+    """Show what was understood from one input of a report"""
+    if source == "image" and result.get("display"):
+        # The model-sized copy, rather than the full upload
+        st.image(result["display"], caption="Uploaded Image", use_column_width=True)
+        duplicates = result.get("duplicates")
+        if duplicates:
+            reports = ", ".join(f"#{row['eid']} ({row['location']})" for _, row in duplicates[:3])
+            st.info(f"This photo looks like one already attached to report {reports}.")
+
+    if result.get("error"):
+        st.error(result["error"])
+        return
+    if source == "voice":
+        st.success("Transcription successful")
+        st.write(result["text"])
+    elif source == "image":
+        st.success("Image processed successfully")
+        if result.get("caption") is None:
+            st.write(result["text"])
+
+    entities = result.get("entities") or {}
+    if source == "image" or any(entities.values()):
+        title = {"text": "Text", "voice": "Voice", "image": "Image"}[source]
+        with st.expander(f"Extracted Information from {title}"):
+            st.write(f"Detected emergency type: **{result['emergency_type']}** (Confidence: {result['confidence']:.2f})")
+            for entity_type, items in entities.items():
+                if items:
+                    st.write(f"**{entity_type.replace('_', ' ').title()}**: {', '.join(items)}")
+
 def find_resources():
     """Resource finding workflow"""
     st.subheader("Find Nearby Resources")
@@ -211,8 +232,8 @@ def find_resources():
             # Get search radius
             radius = st.slider("Search Radius (km)", 1, 50, 10)
 
-            # Get nearest resources
-            resources = get_nearest_resources(lat, lon, max_km=radius)
+            # Get nearest resources (by travel time when a road graph is installed)
+            resources = nearest_resources(lat, lon, max_km=radius)
 
             if resources:
                 st.subheader(f"Found {len(resources)} resources within {radius} km")
@@ -227,7 +248,8 @@ def find_resources():
                     resources_data.append({
                         "Name": r["name"],
                         "Type": r["amenity"],
-                        "Distance (km)": f"{r['distance']:.2f}"
+                        "Distance (km)": f"{r['distance']:.2f}",
+                        "Travel (min)": f"{r['travel_ms'] / 60000:.0f}" if r.get("travel_ms") is not None else "-"
                     })
 
                 st.table(resources_data)
@@ -1,18 +1,28 @@
 import streamlit as st
+import datetime
 import tempfile
 import os
 from modules.database import (
     volunteer_login,
     register_volunteer,
     get_volunteer_dashboard,
-    add_resource
+    add_resource,
+    add_road_block,
+    search_emergencies,
+    get_nearest_incidents,
+    get_latest_change_seq,
+    get_changes_since
 )
-from modules.geospatial import get_lat_lon, create_emergency_map, display_map
+from modules.geospatial import get_lat_lon, create_emergency_map, display_map, map_html, display_map_html
+from modules.routing import rerank_by_travel_time, with_routes, refresh_blocks
+from modules.utils import haversine, apply_changes
+from config import config
 from modules.processing import (
     generate_summary,
-    get_first_aid_response,
+    stream_first_aid_response,
     process_text,
-    extract_entities
+    extract_entities,
+    classify_severity
 )
 
 def volunteer_login_workflow():
@@ -97,6 +107,74 @@ def volunteer_registration_workflow():
                     else:
                         st.error(result)
 
+@st.fragment(run_every=config.get("AUTO_REFRESH_SECONDS", 10))
+def nearby_emergencies_feed(volunteer, max_km=10, limit=10):
+    """Nearby emergencies, patched in place with changes instead of re-queried"""
+    lat, lon = volunteer['latitude'], volunteer['longitude']
+    max_age_hours = config.get("NEARBY_MAX_AGE_HOURS", 72)
+    oldest = (datetime.datetime.utcnow() - datetime.timedelta(hours=max_age_hours)).strftime("%Y-%m-%d %H:%M:%S")
+
+    def active(row):
+        return row["timestamp"] >= oldest
+
+    def nearby(row):
+        row["distance"] = haversine(lat, lon, row["latitude"], row["longitude"])
+        return row["distance"] <= max_km and active(row)
+
+    feed = st.session_state.get("emergency_feed")
+    if feed is not None and feed["volunteer_id"] == volunteer["id"]:
+        was_full = len(feed["rows"]) >= limit
+        delta = get_changes_since(feed["seq"], tables=["incident"])
+        if delta["reset"]:
+            feed = None
+        elif delta["changes"]:
+            rows = apply_changes(feed["rows"], delta["changes"], "incident", "incident_id", keep=nearby)
+            feed["rows"] = sorted(rows, key=lambda r: r["distance"])[:limit]
+            feed["map_html"] = None
+            feed["seq"] = delta["seq"]
+        # Incidents without new reports age out of the feed
+        if feed is not None and not all(active(row) for row in feed["rows"]):
+            feed["rows"] = [row for row in feed["rows"] if active(row)]
+            feed["map_html"] = None
+        # A full list that lost rows may now leave out incidents past the old limit: re-query
+        if feed is not None and was_full and len(feed["rows"]) < limit:
+            feed = None
+    else:
+        feed = None
+
+    if feed is None:
+        # Read the high-water mark first so no write falls between the two queries
+        seq = get_latest_change_seq()
+        feed = {
+            "volunteer_id": volunteer["id"],
+            "seq": seq,
+            "rows": get_nearest_incidents(lat, lon, max_km=max_km, limit=limit, since_hours=max_age_hours),
+            "map_html": None
+        }
+    st.session_state["emergency_feed"] = feed
+
+    emergencies = feed["rows"]
+    if emergencies:
+        # Show emergencies on map (rebuilt only when the list changed)
+        if feed["map_html"] is None:
+            feed["map_html"] = map_html(create_emergency_map(
+                lat,
+                lon,
+                emergencies=with_routes(lat, lon, emergencies),
+                center_label="Your Location"
+            ))
+        display_map_html(feed["map_html"])
+
+        # Show emergency details
+        for i, emergency in enumerate(emergencies):
+            with st.expander(f"Emergency at {emergency['location']} ({emergency['distance']:.2f} km)"):
+                st.write(f"**Report:** {emergency['text']}")
+                st.write(f"**Reported on:** {emergency['timestamp']}")
+                if emergency.get('report_count', 1) > 1:
+                    st.write(f"**Reports merged:** {emergency['report_count']}")
+    else:
+        st.info("No emergencies reported nearby.")
+
 def volunteer_dashboard():
     """Volunteer dashboard after login"""
     if not st.session_state.logged_in:
@@ -106,7 +184,7 @@ def volunteer_dashboard():
     st.header("Volunteer Dashboard")
 
     # Get dashboard data
-    volunteer, emergencies, resources, my_resources = get_volunteer_dashboard(st.session_state.volunteer_id)
+    volunteer, resources, my_resources = get_volunteer_dashboard(st.session_state.volunteer_id)
 
     # Volunteer info
     st.subheader("Your Information")
@@ -124,27 +202,24 @@ def volunteer_dashboard():
 
     with tab1:
         st.subheader("Nearby Emergencies")
-        if emergencies:
-            # Show emergencies on map
-            m = create_emergency_map(
-                volunteer['latitude'],
-                volunteer['longitude'],
-                emergencies=emergencies,
-                center_label="Your Location"
-            )
-            display_map(m)
-
-            # Show emergency details
-            for i, emergency in enumerate(emergencies):
-                with st.expander(f"Emergency at {emergency['location']} ({emergency['distance']:.2f} km)"):
-                    st.write(f"**Report:** {emergency['text']}")
-                    st.write(f"**Reported on:** {emergency['timestamp']}")
-        else:
-            st.info("No emergencies reported nearby.")
+        nearby_emergencies_feed(volunteer)
+
+        # Search all reports, not only nearby ones
+        search = st.text_input("Search reports", key="volunteer_emergency_search")
+        if search:
+            results = search_emergencies(search, limit=20)
+            if results:
+                for r in results:
+                    st.markdown(f"**{r['location']}** ({r['timestamp']}): {r['snippet']}")
+            else:
+                st.info("No reports match your search.")
 
     with tab2:
         st.subheader("Nearby Resources")
         if resources:
+            # Closest by road first when a road graph is installed
+            resources = rerank_by_travel_time(volunteer['latitude'], volunteer['longitude'], resources)
+
             # Show resources on map
             m = create_emergency_map(
                 volunteer['latitude'],
@@ -160,7 +235,8 @@ def volunteer_dashboard():
                 resources_data.append({
                     "Name": r["name"],
                     "Type": r["amenity"],
-                    "Distance (km)": f"{r['distance']:.2f}"
+                    "Distance (km)": f"{r['distance']:.2f}",
+                    "Travel (min)": f"{r['travel_ms'] / 60000:.0f}" if r.get("travel_ms") is not None else "-"
                 })
 
             st.table(resources_data)
@@ -181,6 +257,22 @@ def volunteer_dashboard():
         else:
             st.info("No resources found nearby.")
 
+        # Closed roads are left out of travel-time routing
+        with st.expander("Report Blocked Road"):
+            block_location = st.text_input("Blocked road location", key="block_location")
+            block_radius = st.slider("Blocked radius (m)", 25, 500, 100, key="block_radius")
+            block_reason = st.text_input("Reason", value="Flooded", key="block_reason")
+            block_hours = st.number_input("Reopen after (hours, 0 = until cleared)", 0, 168, 12, key="block_hours")
+            if st.button("Report Blocked Road") and block_location:
+                block_lat, block_lon = get_lat_lon(block_location)
+                if block_lat and block_lon:
+                    add_road_block(block_lat, block_lon, block_radius, block_reason,
+                                   st.session_state.volunteer_id, block_hours or None)
+                    refresh_blocks()
+                    st.success("Road block reported. Routes will avoid it.")
+                else:
+                    st.error("Location not found. Please try a different location.")
+
     with tab3:
         st.subheader("Add New Resource")
 
@@ -229,15 +321,16 @@ def volunteer_dashboard():
 
         if st.button("Add Resource"):
             if amenity_type and name and location_lat and location_lon:
-                add_resource(
+                resource_id = add_resource(
                     amenity_type,
                     name,
                     location_lat,
                     location_lon,
                     st.session_state.volunteer_id
                 )
-                st.success("Resource added successfully!")
-                st.rerun()
+                if resource_id:
+                    st.success("Resource added successfully!")
+                    st.rerun()
             else:
                 st.error("Please fill all required fields.")
 
@@ -283,9 +376,9 @@ def volunteer_dashboard():
 
                         # Generate first aid response
                         st.subheader("First Aid Information")
-                        with st.spinner("Generating first aid response..."):
-                            first_aid_info = get_first_aid_response(emergency_type, summary)
-                        st.markdown(first_aid_info)
+                        st.write_stream(stream_first_aid_response(
+                            emergency_type, summary, severity=classify_severity(entities), entities=entities
+                        ))
                     else:
                         st.error("Document processing failed. Please try again.")
             finally:
@@ -312,9 +405,9 @@ def volunteer_dashboard():
 
                 # Generate first aid response
                 st.subheader("First Aid Information")
-                with st.spinner("Generating first aid response..."):
-                    first_aid_info = get_first_aid_response(emergency_type, situation_text)
-                st.markdown(first_aid_info)
+                st.write_stream(stream_first_aid_response(
+                    emergency_type, situation_text, severity=classify_severity(entities), entities=entities
+                ))
 
     # Logout button
     if st.sidebar.button("Logout"):